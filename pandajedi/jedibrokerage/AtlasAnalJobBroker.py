@@ -6,6 +6,7 @@ import re
 import sys
 import traceback
 
+import numpy as np
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 
@@ -18,6 +19,7 @@ from pandaserver.taskbuffer import JobUtils
 
 from . import AtlasBrokerUtils
 from .JobBrokerBase import JobBrokerBase
+from .SiteFilter import SiteCriterion
 
 logger = PandaLogger().getLogger(__name__.split(".")[-1])
 
@@ -55,6 +57,111 @@ class AtlasAnalJobBroker(JobBrokerBase):
             logger.error("Failed to load the WN GPU map!!!")
             self.wn_gpu_map = {}
 
+    # filter sites by status
+    def filter_sites_by_status(self, scan_site_list, site_list_pre_assigned, site_pre_assigned, preassigned_site):
+        """
+        Skip offline sites and unified queues. Brokeroff and test sites are skipped unless they are preassigned
+
+        :param scan_site_list: list of site names
+        :param site_list_pre_assigned: True if a list of sites is preassigned
+        :param site_pre_assigned: True if a site is preassigned
+        :param preassigned_site: the preassigned site
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        site_status = site_view.status
+        # check site status
+        skip_mask = site_status == "offline"
+        brokeroff_mask = (site_status == "brokeroff") | (site_status == "test")
+        if site_list_pre_assigned:
+            pass
+        elif not site_pre_assigned:
+            skip_mask |= brokeroff_mask
+        else:
+            skip_mask |= brokeroff_mask & (site_view.site_names != preassigned_site) & (site_view.unified_name != preassigned_site)
+        return site_view.apply(
+            [
+                # skip unified queues
+                SiteCriterion(~site_view.is_unified),
+                SiteCriterion(~skip_mask, lambda v, i: f"  skip site={v.unified_name[i]} due to status={v.status[i]} criteria=-status"),
+            ]
+        )
+
+    # filter sites by core count
+    def filter_sites_by_core_count(self, scan_site_list, use_mp, task_core_count, max_core_count):
+        """
+        Select sites whose core count matches the task. Sites without core count are single-core
+
+        :param scan_site_list: list of site names
+        :param use_mp: only, unuse, or any to use multi-core sites
+        :param task_core_count: core count of the task used in messages
+        :param max_core_count: the max core count of the task. None or 0 not to limit
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        site_core_count = site_view.coreCount
+        # check at the site
+        if use_mp == "only":
+            core_mask = site_core_count > 1
+        elif use_mp == "unuse":
+            core_mask = site_core_count <= 1
+        else:
+            core_mask = np.ones(len(site_view), dtype=bool)
+        if max_core_count:
+            max_core_mask = (site_core_count == 0) | (site_core_count <= max_core_count)
+        else:
+            max_core_mask = np.ones(len(site_view), dtype=bool)
+        return site_view.apply(
+            [
+                SiteCriterion(
+                    core_mask,
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to core mismatch "
+                    f"cores_site={v.get_site(i).coreCount} <> cores_task={task_core_count} criteria=-cpucore",
+                ),
+                SiteCriterion(
+                    max_core_mask,
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to larger core count "
+                    f"site:{v.get_site(i).coreCount} than task_max={max_core_count} criteria=-max_cpucore",
+                ),
+            ]
+        )
+
+    # filter sites by memory
+    def filter_sites_by_memory(self, scan_site_list, orig_min_ram_count, ram_per_core):
+        """
+        Select sites whose memory limits accept the job's memory requirement
+
+        :param scan_site_list: list of site names
+        :param orig_min_ram_count: memory requirement of the job
+        :param ram_per_core: True to scale the requirement by core count of each site
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        # scale RAM by nCores
+        min_ram_count = np.full(len(site_view), orig_min_ram_count, dtype=np.float64)
+        if ram_per_core:
+            site_core_count = site_view.coreCount
+            min_ram_count = np.where(site_core_count != 0, min_ram_count * site_core_count, min_ram_count)
+        min_ram_count = JobUtils.compensate_ram_counts(min_ram_count)
+        site_view.min_ram_count = min_ram_count
+        # site max and min memory requirements
+        site_maxmemory = site_view.maxrss
+        site_minmemory = site_view.minrss
+        return site_view.apply(
+            [
+                SiteCriterion(
+                    (site_maxmemory == 0) | (min_ram_count == 0) | (min_ram_count <= site_maxmemory),
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to insufficient RAM less than job's core-scaled requirement "
+                    f"{int(v.min_ram_count[i])} MB criteria=-lowmemory",
+                ),
+                SiteCriterion(
+                    (site_minmemory == 0) | (min_ram_count == 0) | (min_ram_count >= site_minmemory),
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to RAM lower limit greater than job's core-scaled requirement "
+                    f"{int(v.min_ram_count[i])} MB criteria=-highmemory",
+                ),
+            ]
+        )
+
     # main
     def doBrokerage(self, taskSpec, cloudName, inputChunk, taskParamMap):
         # make logger
@@ -151,12 +258,12 @@ class AtlasAnalJobBroker(JobBrokerBase):
             # not use MCORE
             useMP = "unuse"
         # get statistics of failures
-        timeWindowForFC = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "TW_DONE_JOB_STAT", "jedi", taskSpec.vo)
+        timeWindowForFC = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "TW_DONE_JOB_STAT", "jedi", taskSpec.vo)
         if timeWindowForFC is None:
             timeWindowForFC = 6
 
         # get minimum bad jobs to skip PQ
-        minBadJobsToSkipPQ = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "MIN_BAD_JOBS_TO_SKIP_PQ", "jedi", taskSpec.vo)
+        minBadJobsToSkipPQ = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "MIN_BAD_JOBS_TO_SKIP_PQ", "jedi", taskSpec.vo)
         if minBadJobsToSkipPQ is None:
             minBadJobsToSkipPQ = 5
 
@@ -176,8 +283,8 @@ class AtlasAnalJobBroker(JobBrokerBase):
             else:
                 gdp_token_jobs = "CAP_RUNNING_USER_JOBS"
                 gdp_token_cores = "CAP_RUNNING_USER_CORES"
-            maxNumRunJobs = self.taskBufferIF.getConfigValue("prio_mgr", gdp_token_jobs)
-            maxNumRunCores = self.taskBufferIF.getConfigValue("prio_mgr", gdp_token_cores)
+            maxNumRunJobs = self.get_global_state("getConfigValue", "prio_mgr", gdp_token_jobs)
+            maxNumRunCores = self.get_global_state("getConfigValue", "prio_mgr", gdp_token_cores)
             maxFactor = 2
 
             if maxNumRunJobs:
@@ -239,10 +346,10 @@ class AtlasAnalJobBroker(JobBrokerBase):
             tmpLog.warning("got empty user task evaluation")
 
         # parameters about User Analysis threshold
-        threshold_A = self.taskBufferIF.getConfigValue("analy_eval", "USER_USAGE_THRESHOLD_A", "pandaserver", taskSpec.vo)
+        threshold_A = self.get_global_state("getConfigValue", "analy_eval", "USER_USAGE_THRESHOLD_A", "pandaserver", taskSpec.vo)
         if threshold_A is None:
             threshold_A = 1000
-        threshold_B = self.taskBufferIF.getConfigValue("analy_eval", "USER_USAGE_THRESHOLD_B", "pandaserver", taskSpec.vo)
+        threshold_B = self.get_global_state("getConfigValue", "analy_eval", "USER_USAGE_THRESHOLD_B", "pandaserver", taskSpec.vo)
         if threshold_B is None:
             threshold_B = 10000
         user_analyis_to_throttle_threshold_perc_A = 100
@@ -251,40 +358,40 @@ class AtlasAnalJobBroker(JobBrokerBase):
         user_analyis_throttle_intensity_A = 1.0
 
         # parameters about Analysis Stabilizer
-        base_queue_length_per_pq = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "BASE_QUEUE_LENGTH_PER_PQ", "jedi", taskSpec.vo)
+        base_queue_length_per_pq = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "BASE_QUEUE_LENGTH_PER_PQ", "jedi", taskSpec.vo)
         if base_queue_length_per_pq is None:
             base_queue_length_per_pq = 100
-        base_expected_wait_hour_on_pq = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "BASE_EXPECTED_WAIT_HOUR_ON_PQ", "jedi", taskSpec.vo)
+        base_expected_wait_hour_on_pq = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "BASE_EXPECTED_WAIT_HOUR_ON_PQ", "jedi", taskSpec.vo)
         if base_expected_wait_hour_on_pq is None:
             base_expected_wait_hour_on_pq = 8
-        base_default_queue_length_per_pq_user = self.taskBufferIF.getConfigValue(
-            ANALYSIS_COMPONENT, "BASE_DEFAULT_QUEUE_LENGTH_PER_PQ_USER", "jedi", taskSpec.vo
+        base_default_queue_length_per_pq_user = self.get_global_state(
+            "getConfigValue", ANALYSIS_COMPONENT, "BASE_DEFAULT_QUEUE_LENGTH_PER_PQ_USER", "jedi", taskSpec.vo
         )
         if base_default_queue_length_per_pq_user is None:
             base_default_queue_length_per_pq_user = 5
-        base_queue_ratio_on_pq = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "BASE_QUEUE_RATIO_ON_PQ", "jedi", taskSpec.vo)
+        base_queue_ratio_on_pq = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "BASE_QUEUE_RATIO_ON_PQ", "jedi", taskSpec.vo)
         if base_queue_ratio_on_pq is None:
             base_queue_ratio_on_pq = 0.05
-        static_max_queue_running_ratio = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "STATIC_MAX_QUEUE_RUNNING_RATIO", "jedi", taskSpec.vo)
+        static_max_queue_running_ratio = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "STATIC_MAX_QUEUE_RUNNING_RATIO", "jedi", taskSpec.vo)
         if static_max_queue_running_ratio is None:
             static_max_queue_running_ratio = 2.0
-        max_expected_wait_hour = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "MAX_EXPECTED_WAIT_HOUR", "jedi", taskSpec.vo)
+        max_expected_wait_hour = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "MAX_EXPECTED_WAIT_HOUR", "jedi", taskSpec.vo)
         if max_expected_wait_hour is None:
             max_expected_wait_hour = 12.0
 
-        max_missing_input_files = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "MAX_MISSING_INPUT_FILES", "jedi", taskSpec.vo)
+        max_missing_input_files = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "MAX_MISSING_INPUT_FILES", "jedi", taskSpec.vo)
         if max_missing_input_files is None:
             max_missing_input_files = 10
-        min_input_completeness = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "MIN_INPUT_COMPLETENESS", "jedi", taskSpec.vo)
+        min_input_completeness = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "MIN_INPUT_COMPLETENESS", "jedi", taskSpec.vo)
         if min_input_completeness is None:
             min_input_completeness = 90
 
         # minimum brokerage weight
         min_weight_param = f"MIN_WEIGHT_{taskSpec.prodSourceLabel}_{taskSpec.gshare}"
-        min_weight = self.taskBufferIF.getConfigValue(COMPONENT, min_weight_param, "jedi", taskSpec.vo)
+        min_weight = self.get_global_state("getConfigValue", COMPONENT, min_weight_param, "jedi", taskSpec.vo)
         if min_weight is None:
             min_weight_param = f"MIN_WEIGHT_{taskSpec.prodSourceLabel}"
-            min_weight = self.taskBufferIF.getConfigValue(COMPONENT, min_weight_param, "jedi", taskSpec.vo)
+            min_weight = self.get_global_state("getConfigValue", COMPONENT, min_weight_param, "jedi", taskSpec.vo)
         if min_weight is None:
             min_weight = 0
 
@@ -365,11 +472,11 @@ class AtlasAnalJobBroker(JobBrokerBase):
 
         # IO intensity cutoff in kB/sec to allow input transfers
         io_intensity_key = "IO_INTENSITY_CUTOFF_USER"
-        io_intensity_cutoff = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, io_intensity_key, "jedi", taskSpec.vo)
+        io_intensity_cutoff = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, io_intensity_key, "jedi", taskSpec.vo)
 
         # timelimit for data locality check
         loc_check_timeout_key = "DATA_CHECK_TIMEOUT_USER"
-        loc_check_timeout_val = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, loc_check_timeout_key, "jedi", taskSpec.vo)
+        loc_check_timeout_val = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, loc_check_timeout_key, "jedi", taskSpec.vo)
 
         # check input datasets
         element_map = dict()
@@ -652,30 +759,8 @@ class AtlasAnalJobBroker(JobBrokerBase):
 
             ######################################
             # selection for status
-            newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
-            msg_map = {}
-            for tmpSiteName in scanSiteList:
-                tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-                # skip unified queues
-                if tmpSiteSpec.is_unified:
-                    continue
-                # check site status
-                skipFlag = False
-                if tmpSiteSpec.status in ["offline"]:
-                    skipFlag = True
-                elif tmpSiteSpec.status in ["brokeroff", "test"]:
-                    if siteListPreAssigned:
-                        pass
-                    elif not sitePreAssigned:
-                        skipFlag = True
-                    elif preassignedSite not in [tmpSiteName, tmpSiteSpec.get_unified_name()]:
-                        skipFlag = True
-                if not skipFlag:
-                    newScanSiteList.append(tmpSiteName)
-                else:
-                    tmp_unified_name = tmpSiteSpec.get_unified_name()
-                    msg_map[tmp_unified_name] = f"  skip site={tmp_unified_name} due to status={tmpSiteSpec.status} criteria=-status"
+            newScanSiteList, msg_map = self.filter_sites_by_status(scanSiteList, siteListPreAssigned, sitePreAssigned, preassignedSite)
             scanSiteList = newScanSiteList
             self.add_summary_message(oldScanSiteList, scanSiteList, "status check", tmpLog, msg_map)
             if not scanSiteList:
@@ -708,12 +793,12 @@ class AtlasAnalJobBroker(JobBrokerBase):
             ######################################
             # selection for iointensity limits
             # get default disk IO limit from GDP config
-            max_diskio_per_core_default = self.taskBufferIF.getConfigValue(COMPONENT, "MAX_DISKIO_DEFAULT", APP, VO)
+            max_diskio_per_core_default = self.get_global_state("getConfigValue", COMPONENT, "MAX_DISKIO_DEFAULT", APP, VO)
             if not max_diskio_per_core_default:
                 max_diskio_per_core_default = 10**10
 
             # get the current disk IO usage per site
-            diskio_percore_usage = self.taskBufferIF.getAvgDiskIO_JEDI()
+            diskio_percore_usage = self.get_global_state("getAvgDiskIO_JEDI")
             unified_site_list = self.get_unified_sites(scanSiteList)
             newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
@@ -811,27 +896,9 @@ class AtlasAnalJobBroker(JobBrokerBase):
                     continue
             ######################################
             # selection for MP
-            newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
-            msg_map = {}
             max_core_count = taskSpec.get_max_core_count()
-            for tmpSiteName in scanSiteList:
-                tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-                # check at the site
-                if useMP == "any" or (useMP == "only" and tmpSiteSpec.coreCount > 1) or (useMP == "unuse" and tmpSiteSpec.coreCount in [0, 1, None]):
-                    if max_core_count and tmpSiteSpec.coreCount and tmpSiteSpec.coreCount > max_core_count:
-                        msg_map[tmpSiteSpec.get_unified_name()] = (
-                            f"  skip site={tmpSiteSpec.get_unified_name()} due to larger core count "
-                            f"site:{tmpSiteSpec.coreCount} than task_max={max_core_count} criteria=-max_cpucore"
-                        )
-                    else:
-                        newScanSiteList.append(tmpSiteName)
-                else:
-                    msg_map[tmpSiteSpec.get_unified_name()] = "  skip site=%s due to core mismatch cores_site=%s <> cores_task=%s criteria=-cpucore" % (
-                        tmpSiteSpec.get_unified_name(),
-                        tmpSiteSpec.coreCount,
-                        taskSpec.coreCount,
-                    )
+            newScanSiteList, msg_map = self.filter_sites_by_core_count(scanSiteList, useMP, taskSpec.coreCount, max_core_count)
             scanSiteList = newScanSiteList
             self.add_summary_message(oldScanSiteList, scanSiteList, "CPU core check", tmpLog, msg_map)
             if not scanSiteList:
@@ -1059,36 +1126,8 @@ class AtlasAnalJobBroker(JobBrokerBase):
             # selection for memory
             origMinRamCount = inputChunk.getMaxRamCount()
             if origMinRamCount not in [0, None]:
-                newScanSiteList = []
                 oldScanSiteList = copy.copy(scanSiteList)
-                msg_map = {}
-                for tmpSiteName in scanSiteList:
-                    tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-                    # scale RAM by nCores
-                    minRamCount = origMinRamCount
-                    if taskSpec.ramPerCore() and not inputChunk.isMerging:
-                        if tmpSiteSpec.coreCount not in [None, 0]:
-                            minRamCount = origMinRamCount * tmpSiteSpec.coreCount
-                    minRamCount = JobUtils.compensate_ram_count(minRamCount)
-                    # site max memory requirement
-                    site_maxmemory = 0
-                    if tmpSiteSpec.maxrss not in [0, None]:
-                        site_maxmemory = tmpSiteSpec.maxrss
-                    if site_maxmemory not in [0, None] and minRamCount != 0 and minRamCount > site_maxmemory:
-                        msg_map[tmpSiteSpec.get_unified_name()] = (
-                            f"  skip site={tmpSiteSpec.get_unified_name()} due to insufficient RAM less than job's core-scaled requirement {minRamCount} MB criteria=-lowmemory"
-                        )
-                        continue
-                    # site min memory requirement
-                    site_minmemory = 0
-                    if tmpSiteSpec.minrss not in [0, None]:
-                        site_minmemory = tmpSiteSpec.minrss
-                    if site_minmemory not in [0, None] and minRamCount != 0 and minRamCount < site_minmemory:
-                        msg_map[tmpSiteSpec.get_unified_name()] = (
-                            f"  skip site={tmpSiteSpec.get_unified_name()} due to RAM lower limit greater than job's core-scaled requirement {minRamCount} MB criteria=-highmemory"
-                        )
-                        continue
-                    newScanSiteList.append(tmpSiteName)
+                newScanSiteList, msg_map = self.filter_sites_by_memory(scanSiteList, origMinRamCount, taskSpec.ramPerCore() and not inputChunk.isMerging)
                 scanSiteList = newScanSiteList
                 ramUnit = taskSpec.ramUnit
                 if ramUnit is None:
@@ -1179,11 +1218,11 @@ class AtlasAnalJobBroker(JobBrokerBase):
             oldScanSiteList = copy.copy(scanSiteList)
             msg_map = {}
             # free space
-            diskThreshold_in = self.taskBufferIF.getConfigValue(COMPONENT, "STORAGE_MIN_FREE_SIZE", "jedi", taskSpec.vo)
+            diskThreshold_in = self.get_global_state("getConfigValue", COMPONENT, "STORAGE_MIN_FREE_SIZE", "jedi", taskSpec.vo)
             if not diskThreshold_in:
                 # default to 200GB if not set in config
                 diskThreshold_in = 200
-            diskThreshold_out = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "STORAGE_MIN_FREE_SIZE_OUTPUT", "jedi", taskSpec.vo)
+            diskThreshold_out = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "STORAGE_MIN_FREE_SIZE_OUTPUT", "jedi", taskSpec.vo)
             if not diskThreshold_out:
                 # default to 200GB if not set in config
                 diskThreshold_out = 200
@@ -1371,7 +1410,7 @@ class AtlasAnalJobBroker(JobBrokerBase):
 
             ######################################
             # selection for nPilot
-            nWNmap = self.taskBufferIF.getCurrentSiteData()
+            nWNmap = self.get_global_state("getCurrentSiteData")
             nPilotMap = {}
             newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
@@ -1448,7 +1487,7 @@ class AtlasAnalJobBroker(JobBrokerBase):
             sitesUsedByTask = self.get_unified_sites(sitesUsedByTask)
             ######################################
             # calculate weight
-            tmpSt, jobStatPrioMap = self.taskBufferIF.getJobStatisticsByGlobalShare(taskSpec.vo)
+            tmpSt, jobStatPrioMap = self.get_global_state("getJobStatisticsByGlobalShare", taskSpec.vo)
             if not tmpSt:
                 tmpLog.error("failed to get job statistics with priority")
                 taskSpec.setErrDiag(tmpLog.uploadLog(taskSpec.jediTaskID))
@@ -1546,10 +1585,10 @@ class AtlasAnalJobBroker(JobBrokerBase):
                 msg_map = {}
                 msgList = []
                 msgListVP = []
-                minQueue = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "OVERLOAD_MIN_QUEUE", "jedi", taskSpec.vo)
+                minQueue = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "OVERLOAD_MIN_QUEUE", "jedi", taskSpec.vo)
                 if minQueue is None:
                     minQueue = 20
-                ratioOffset = self.taskBufferIF.getConfigValue(ANALYSIS_COMPONENT, "OVERLOAD_RATIO_OFFSET", "jedi", taskSpec.vo)
+                ratioOffset = self.get_global_state("getConfigValue", ANALYSIS_COMPONENT, "OVERLOAD_RATIO_OFFSET", "jedi", taskSpec.vo)
                 if ratioOffset is None:
                     ratioOffset = 1.2
                 grandRatio = AtlasBrokerUtils.get_total_nq_nr_ratio(jobStatPrioMap, taskSpec.gshare)
@@ -1843,7 +1882,7 @@ class AtlasAnalJobBroker(JobBrokerBase):
         candidateSpecList = []
         preSiteCandidateSpec = None
         basic_weight_compar_map = {}
-        workerStat = self.taskBufferIF.ups_load_worker_stats()
+        workerStat = self.get_global_state("ups_load_worker_stats")
         for tmpPseudoSiteName in scanSiteList:
             tmpSiteSpec = self.siteMapper.getSite(tmpPseudoSiteName)
             tmpSiteName = tmpSiteSpec.get_unified_name()
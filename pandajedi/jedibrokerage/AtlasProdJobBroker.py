@@ -2,6 +2,7 @@ import copy
 import datetime
 import re
 
+import numpy as np
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 
@@ -16,6 +17,7 @@ from pandaserver.taskbuffer.DdmSpec import DOWNTIME_STATUSES
 
 from . import AtlasBrokerUtils
 from .JobBrokerBase import JobBrokerBase
+from .SiteFilter import SiteCriterion
 
 logger = PandaLogger().getLogger(__name__.split(".")[-1])
 
@@ -116,6 +118,105 @@ class AtlasProdJobBroker(JobBrokerBase):
                 return weight
         return 1
 
+    # filter sites by status
+    def filter_sites_by_status(self, scan_site_list):
+        """
+        Select online or standby sites, skipping unified queues
+
+        :param scan_site_list: list of site names
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        site_status = site_view.status
+        return site_view.apply(
+            [
+                # skip unified queues
+                SiteCriterion(~site_view.is_unified),
+                # check site status
+                SiteCriterion(
+                    (site_status == "online") | (site_status == "standby"),
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to status={v.status[i]} criteria=-status",
+                ),
+            ]
+        )
+
+    # filter sites by core count
+    def filter_sites_by_core_count(self, scan_site_list, use_mp, task_core_count, max_core_count):
+        """
+        Select sites whose core count matches the task. Sites without core count are single-core
+
+        :param scan_site_list: list of site names
+        :param use_mp: only, unuse, or any to use multi-core sites
+        :param task_core_count: core count of the task used in messages
+        :param max_core_count: the max core count of the task. None or 0 not to limit
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        site_core_count = site_view.coreCount
+        # check at the site
+        if use_mp == "only":
+            core_mask = site_core_count > 1
+        elif use_mp == "unuse":
+            core_mask = site_core_count <= 1
+        else:
+            core_mask = np.ones(len(site_view), dtype=bool)
+        if max_core_count:
+            max_core_mask = (site_core_count == 0) | (site_core_count <= max_core_count)
+        else:
+            max_core_mask = np.ones(len(site_view), dtype=bool)
+        return site_view.apply(
+            [
+                SiteCriterion(
+                    core_mask,
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to core mismatch site:{v.get_site(i).coreCount} <> task:{task_core_count} criteria=-cpucore",
+                ),
+                SiteCriterion(
+                    max_core_mask,
+                    lambda v, i: f"  skip site={v.unified_name[i]} due to larger core count site:{v.get_site(i).coreCount} "
+                    f"than task_max={max_core_count} criteria=-max_cpucore",
+                ),
+            ]
+        )
+
+    # filter sites by memory
+    def filter_sites_by_memory(self, scan_site_list, orig_min_ram_count, ram_per_core, base_ram_count):
+        """
+        Select sites whose memory limits accept the job's memory requirement
+
+        :param scan_site_list: list of site names
+        :param orig_min_ram_count: memory requirement of the job
+        :param ram_per_core: True to scale the requirement by core count of each site and add base_ram_count
+        :param base_ram_count: base memory requirement added to the scaled requirement
+        :return: list of site names which passed, and map of unified site name to rejection message
+        """
+        site_view = self.get_site_column_view(scan_site_list)
+        # job memory requirement
+        min_ram_count = np.full(len(site_view), orig_min_ram_count, dtype=np.float64)
+        if ram_per_core:
+            site_core_count = site_view.coreCount
+            min_ram_count = np.where(site_core_count != 0, min_ram_count * site_core_count, min_ram_count)
+            min_ram_count += base_ram_count
+        # compensate
+        min_ram_count = JobUtils.compensate_ram_counts(min_ram_count)
+        site_view.min_ram_count = min_ram_count
+        # site max and min memory requirements
+        site_maxmemory = site_view.maxrss
+        site_minmemory = site_view.minrss
+        return site_view.apply(
+            [
+                SiteCriterion(
+                    (site_maxmemory == 0) | (min_ram_count == 0) | (min_ram_count <= site_maxmemory),
+                    lambda v, i: f"  skip site={v.site_names[i]} due to sue to insufficient RAM less than less than job's core-scaled requirement "
+                    f"{int(v.min_ram_count[i])} MB criteria=-lowmemory",
+                ),
+                SiteCriterion(
+                    (site_minmemory == 0) | (min_ram_count == 0) | (min_ram_count >= site_minmemory),
+                    lambda v, i: f"  skip site={v.site_names[i]} due to RAM lower limit greater than than job's core-scaled requirement "
+                    f"{int(v.min_ram_count[i])} MB criteria=-highmemory",
+                ),
+            ]
+        )
+
     # main
     def doBrokerage(self, taskSpec, cloudName, inputChunk, taskParamMap, hintForTB=False, siteListForTB=None, glLog=None):
         # suppress sending log
@@ -148,9 +249,9 @@ class AtlasProdJobBroker(JobBrokerBase):
         newMaxwdir = {}
 
         # short of work
-        work_shortage = self.taskBufferIF.getConfigValue("core", "WORK_SHORTAGE", APP, VO)
+        work_shortage = self.get_global_state("getConfigValue", "core", "WORK_SHORTAGE", APP, VO)
         if work_shortage is True:
-            tmp_status, core_statistics = self.taskBufferIF.get_core_statistics(taskSpec.vo, taskSpec.prodSourceLabel)
+            tmp_status, core_statistics = self.get_global_state("get_core_statistics", taskSpec.vo, taskSpec.prodSourceLabel)
             if not tmp_status:
                 tmpLog.error("failed to get core statistics")
                 taskSpec.setErrDiag(tmpLog.uploadLog(taskSpec.jediTaskID))
@@ -160,19 +261,19 @@ class AtlasProdJobBroker(JobBrokerBase):
             core_statistics = {}
 
         # thresholds for incomplete datasets
-        max_missing_input_files = self.taskBufferIF.getConfigValue("jobbroker", "MAX_MISSING_INPUT_FILES", "jedi", taskSpec.vo)
+        max_missing_input_files = self.get_global_state("getConfigValue", "jobbroker", "MAX_MISSING_INPUT_FILES", "jedi", taskSpec.vo)
         if max_missing_input_files is None:
             max_missing_input_files = 10
-        min_input_completeness = self.taskBufferIF.getConfigValue("jobbroker", "MIN_INPUT_COMPLETENESS", "jedi", taskSpec.vo)
+        min_input_completeness = self.get_global_state("getConfigValue", "jobbroker", "MIN_INPUT_COMPLETENESS", "jedi", taskSpec.vo)
         if min_input_completeness is None:
             min_input_completeness = 90
 
         # minimum brokerage weight
         min_weight_param = f"MIN_WEIGHT_{taskSpec.prodSourceLabel}_{taskSpec.gshare}"
-        min_weight = self.taskBufferIF.getConfigValue("jobbroker", min_weight_param, "jedi", taskSpec.vo)
+        min_weight = self.get_global_state("getConfigValue", "jobbroker", min_weight_param, "jedi", taskSpec.vo)
         if min_weight is None:
             min_weight_param = f"MIN_WEIGHT_{taskSpec.prodSourceLabel}"
-            min_weight = self.taskBufferIF.getConfigValue("jobbroker", min_weight_param, "jedi", taskSpec.vo)
+            min_weight = self.get_global_state("getConfigValue", "jobbroker", min_weight_param, "jedi", taskSpec.vo)
         if min_weight is None:
             min_weight = 0
 
@@ -234,13 +335,13 @@ class AtlasProdJobBroker(JobBrokerBase):
             esHigh = False
 
         # get job statistics
-        tmpSt, jobStatMap = self.taskBufferIF.getJobStatisticsByGlobalShare(taskSpec.vo)
+        tmpSt, jobStatMap = self.get_global_state("getJobStatisticsByGlobalShare", taskSpec.vo)
         if not tmpSt:
             tmpLog.error("failed to get job statistics")
             taskSpec.setErrDiag(tmpLog.uploadLog(taskSpec.jediTaskID))
             return retTmpError
 
-        tmp_st, transferring_job_map = self.taskBufferIF.get_num_jobs_with_status_by_nucleus(taskSpec.vo, "transferring")
+        tmp_st, transferring_job_map = self.get_global_state("get_num_jobs_with_status_by_nucleus", taskSpec.vo, "transferring")
         if not tmp_st:
             tmpLog.error("failed to get transferring job statistics")
             taskSpec.setErrDiag(tmpLog.uploadLog(taskSpec.jediTaskID))
@@ -385,35 +486,9 @@ class AtlasProdJobBroker(JobBrokerBase):
         ######################################
         # selection for status
         if not sitePreAssigned and not siteListPreAssigned:
-            newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
-            msg_map = {}
             tmpLog.set_message_slot()
-            for tmpSiteName in scanSiteList:
-                tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-
-                # skip unified queues
-                if tmpSiteSpec.is_unified:
-                    continue
-                # check site status
-                msgFlag = False
-                skipFlag = False
-
-                if tmpSiteSpec.status in ["online", "standby"]:
-                    newScanSiteList.append(tmpSiteName)
-                else:
-                    msgFlag = True
-                    skipFlag = True
-
-                if msgFlag:
-                    tmpStr = f"  skip site={tmpSiteName} due to status={tmpSiteSpec.status} criteria=-status"
-                    if skipFlag:
-                        msg_map[tmpSiteSpec.get_unified_name()] = (
-                            f"  skip site={tmpSiteSpec.get_unified_name()} due to status={tmpSiteSpec.status} criteria=-status"
-                        )
-                    else:
-                        siteSkippedTmp[tmpSiteName] = tmpStr
-
+            newScanSiteList, msg_map = self.filter_sites_by_status(scanSiteList)
             tmpLog.set_message_slot()
             scanSiteList = newScanSiteList
             self.add_summary_message(oldScanSiteList, scanSiteList, "status check", tmpLog, msg_map)
@@ -426,7 +501,7 @@ class AtlasProdJobBroker(JobBrokerBase):
         #################################################
         # get the nucleus and the network map
         nucleus = taskSpec.nucleus
-        storageMapping = self.taskBufferIF.getPandaSiteToOutputStorageSiteMapping()
+        storageMapping = self.get_global_state("getPandaSiteToOutputStorageSiteMapping")
 
         if nucleus:
             # get connectivity stats to the nucleus
@@ -559,7 +634,7 @@ class AtlasProdJobBroker(JobBrokerBase):
         ):
             # get inactive sites
             inactiveTimeLimit = 2
-            inactiveSites = self.taskBufferIF.getInactiveSites_JEDI("production", inactiveTimeLimit)
+            inactiveSites = self.get_global_state("getInactiveSites_JEDI", "production", inactiveTimeLimit)
             newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
             newSkippedTmp = dict()
@@ -666,12 +741,12 @@ class AtlasProdJobBroker(JobBrokerBase):
         # selection for iointensity limits
 
         # get default disk IO limit from GDP config
-        max_diskio_per_core_default = self.taskBufferIF.getConfigValue(COMPONENT, "MAX_DISKIO_DEFAULT", APP, VO)
+        max_diskio_per_core_default = self.get_global_state("getConfigValue", COMPONENT, "MAX_DISKIO_DEFAULT", APP, VO)
         if not max_diskio_per_core_default:
             max_diskio_per_core_default = 10**10
 
         # get the current disk IO usage per site
-        diskio_percore_usage = self.taskBufferIF.getAvgDiskIO_JEDI()
+        diskio_percore_usage = self.get_global_state("getAvgDiskIO_JEDI")
         unified_site_list = self.get_unified_sites(scanSiteList)
         newScanSiteList = []
         oldScanSiteList = copy.copy(scanSiteList)
@@ -730,27 +805,10 @@ class AtlasProdJobBroker(JobBrokerBase):
         ######################################
         # selection for MP
         if not sitePreAssigned:
-            newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
-            msg_map = {}
             tmpLog.set_message_slot()
             max_core_count = taskSpec.get_max_core_count()
-            for tmpSiteName in scanSiteList:
-                tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-                # check at the site
-                if useMP == "any" or (useMP == "only" and tmpSiteSpec.coreCount > 1) or (useMP == "unuse" and tmpSiteSpec.coreCount in [0, 1, None]):
-                    if max_core_count and tmpSiteSpec.coreCount and tmpSiteSpec.coreCount > max_core_count:
-                        msg_map[tmpSiteSpec.get_unified_name()] = (
-                            f"  skip site={tmpSiteSpec.get_unified_name()} due to larger core count site:{tmpSiteSpec.coreCount} "
-                            f"than task_max={max_core_count} criteria=-max_cpucore"
-                        )
-                    else:
-                        newScanSiteList.append(tmpSiteName)
-                else:
-                    msg_map[tmpSiteSpec.get_unified_name()] = (
-                        f"  skip site={tmpSiteSpec.get_unified_name()} due to core mismatch "
-                        f"site:{tmpSiteSpec.coreCount} <> task:{taskCoreCount} criteria=-cpucore"
-                    )
+            newScanSiteList, msg_map = self.filter_sites_by_core_count(scanSiteList, useMP, taskCoreCount, max_core_count)
             tmpLog.unset_message_slot()
             scanSiteList = newScanSiteList
             self.add_summary_message(oldScanSiteList, scanSiteList, "core count check", tmpLog, msg_map)
@@ -881,40 +939,11 @@ class AtlasProdJobBroker(JobBrokerBase):
                 strMinRamCount = f"{origMinRamCount}({str_ram_unit})"
             if not inputChunk.isMerging and taskSpec.baseRamCount not in [0, None]:
                 strMinRamCount += f"+{taskSpec.baseRamCount}"
-            newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
-            msg_map = {}
             tmpLog.set_message_slot()
-            for tmpSiteName in scanSiteList:
-                tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-                # job memory requirement
-                minRamCount = origMinRamCount
-                if taskSpec.ramPerCore() and not inputChunk.isMerging:
-                    if tmpSiteSpec.coreCount not in [None, 0]:
-                        minRamCount = origMinRamCount * tmpSiteSpec.coreCount
-                    minRamCount += taskSpec.baseRamCount
-                # compensate
-                minRamCount = JobUtils.compensate_ram_count(minRamCount)
-                # site max memory requirement
-                site_maxmemory = 0
-                if tmpSiteSpec.maxrss not in [0, None]:
-                    site_maxmemory = tmpSiteSpec.maxrss
-                # check at the site
-                if site_maxmemory not in [0, None] and minRamCount != 0 and minRamCount > site_maxmemory:
-                    tmp_msg = f"  skip site={tmpSiteName} due to sue to insufficient RAM less than less than job's core-scaled requirement {minRamCount} MB "
-                    tmp_msg += "criteria=-lowmemory"
-                    msg_map[tmpSiteSpec.get_unified_name()] = tmp_msg
-                    continue
-                # site min memory requirement
-                site_minmemory = 0
-                if tmpSiteSpec.minrss not in [0, None]:
-                    site_minmemory = tmpSiteSpec.minrss
-                if site_minmemory not in [0, None] and minRamCount != 0 and minRamCount < site_minmemory:
-                    tmp_msg = f"  skip site={tmpSiteName} due to RAM lower limit greater than than job's core-scaled requirement {minRamCount} MB "
-                    tmp_msg += "criteria=-highmemory"
-                    msg_map[tmpSiteSpec.get_unified_name()] = tmp_msg
-                    continue
-                newScanSiteList.append(tmpSiteName)
+            newScanSiteList, msg_map = self.filter_sites_by_memory(
+                scanSiteList, origMinRamCount, taskSpec.ramPerCore() and not inputChunk.isMerging, taskSpec.baseRamCount
+            )
             tmpLog.unset_message_slot()
             scanSiteList = newScanSiteList
             self.add_summary_message(oldScanSiteList, scanSiteList, "memory check", tmpLog, msg_map)
@@ -993,7 +1022,7 @@ class AtlasProdJobBroker(JobBrokerBase):
         msg_map = {}
         tmpLog.set_message_slot()
         newSkippedTmp = dict()
-        diskThreshold = self.taskBufferIF.getConfigValue(COMPONENT, "STORAGE_MIN_FREE_SIZE", "jedi", taskSpec.vo)
+        diskThreshold = self.get_global_state("getConfigValue", COMPONENT, "STORAGE_MIN_FREE_SIZE", "jedi", taskSpec.vo)
         if not diskThreshold:
             # set default threshold to 200GB if not configured
             diskThreshold = 200
@@ -1483,7 +1512,7 @@ class AtlasProdJobBroker(JobBrokerBase):
         # selection for nPilot
         nPilotMap = {}
         if not sitePreAssigned and not siteListPreAssigned:
-            nWNmap = self.taskBufferIF.getCurrentSiteData()
+            nWNmap = self.get_global_state("getCurrentSiteData")
             newScanSiteList = []
             oldScanSiteList = copy.copy(scanSiteList)
             tmpLog.set_message_slot()
@@ -1613,10 +1642,10 @@ class AtlasProdJobBroker(JobBrokerBase):
 
         ######################################
         # selection for fileSizeToMove
-        moveSizeCutoffGB = self.taskBufferIF.getConfigValue(COMPONENT, "SIZE_CUTOFF_TO_MOVE_INPUT", APP, VO)
+        moveSizeCutoffGB = self.get_global_state("getConfigValue", COMPONENT, "SIZE_CUTOFF_TO_MOVE_INPUT", APP, VO)
         if moveSizeCutoffGB is None:
             moveSizeCutoffGB = 10
-        moveNumFilesCutoff = self.taskBufferIF.getConfigValue(COMPONENT, "NUM_CUTOFF_TO_MOVE_INPUT", APP, VO)
+        moveNumFilesCutoff = self.get_global_state("getConfigValue", COMPONENT, "NUM_CUTOFF_TO_MOVE_INPUT", APP, VO)
         if moveNumFilesCutoff is None:
             moveNumFilesCutoff = 100
         if (
@@ -1706,12 +1735,12 @@ class AtlasProdJobBroker(JobBrokerBase):
         jobStatPrioMapGS = dict()
         jobStatPrioMapGSOnly = dict()
         if workQueue.is_global_share:
-            tmpSt, jobStatPrioMap = self.taskBufferIF.getJobStatisticsByGlobalShare(taskSpec.vo)
+            tmpSt, jobStatPrioMap = self.get_global_state("getJobStatisticsByGlobalShare", taskSpec.vo)
         else:
             tmpSt, jobStatPrioMap = self.taskBufferIF.getJobStatisticsWithWorkQueue_JEDI(taskSpec.vo, taskSpec.prodSourceLabel)
             if tmpSt:
-                tmpSt, jobStatPrioMapGS = self.taskBufferIF.getJobStatisticsByGlobalShare(taskSpec.vo)
-                tmpSt, jobStatPrioMapGSOnly = self.taskBufferIF.getJobStatisticsByGlobalShare(taskSpec.vo, True)
+                tmpSt, jobStatPrioMapGS = self.get_global_state("getJobStatisticsByGlobalShare", taskSpec.vo)
+                tmpSt, jobStatPrioMapGSOnly = self.get_global_state("getJobStatisticsByGlobalShare", taskSpec.vo, True)
         if tmpSt:
             # count jobs per resource type
             tmpSt, tmpStatMapRT = self.taskBufferIF.getJobStatisticsByResourceTypeSite(workQueue)
@@ -1721,11 +1750,11 @@ class AtlasProdJobBroker(JobBrokerBase):
             return retTmpError
         # get resource types per site
         site_resource_type_map = self.taskBufferIF.get_distinct_resource_types_per_site(taskSpec.jediTaskID)
-        workerStat = self.taskBufferIF.ups_load_worker_stats()
-        upsQueues = set(self.taskBufferIF.ups_get_queues())
+        workerStat = self.get_global_state("ups_load_worker_stats")
+        upsQueues = set(self.get_global_state("ups_get_queues"))
         tmpLog.info(f"calculate weight and check cap for {len(scanSiteList)} candidates")
         cutoffName = f"NQUEUELIMITSITE_{taskSpec.gshare}"
-        cutOffValue = self.taskBufferIF.getConfigValue(COMPONENT, cutoffName, APP, VO)
+        cutOffValue = self.get_global_state("getConfigValue", COMPONENT, cutoffName, APP, VO)
         if not cutOffValue:
             cutOffValue = 20
         else:
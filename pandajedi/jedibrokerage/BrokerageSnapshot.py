@@ -0,0 +1,104 @@
+import threading
+import time
+
+from .SiteFilter import SiteColumns
+
+# methods to get global state which doesn't depend on tasks
+SNAPSHOT_METHODS = {
+    "getConfigValue",
+    "get_core_statistics",
+    "getJobStatisticsByGlobalShare",
+    "get_num_jobs_with_status_by_nucleus",
+    "getPandaSiteToOutputStorageSiteMapping",
+    "getInactiveSites_JEDI",
+    "getAvgDiskIO_JEDI",
+    "getCurrentSiteData",
+    "ups_load_worker_stats",
+    "ups_get_queues",
+}
+
+
+# snapshot of global state used by job brokerage
+class BrokerageSnapshot:
+    """
+    Values are fetched on first access and then shared by all brokerage calls using the snapshot,
+    so that brokerage for each input chunk only does task-specific work. Values must not be modified
+    """
+
+    # constructor
+    def __init__(self, task_buffer_if, generation):
+        self.taskBufferIF = task_buffer_if
+        self.generation = generation
+        self.createdAt = time.time()
+        self.lock = threading.Lock()
+        # (method name, args) -> value
+        self.valueMap = {}
+        # (method name, args) -> lock to fetch the value only once
+        self.fetchLockMap = {}
+        self.nFetched = 0
+        self.nHits = 0
+        # columnar site attributes
+        self.siteColumns = None
+        self.siteColumnsLock = threading.Lock()
+
+    # get age in seconds
+    def get_age(self):
+        return time.time() - self.createdAt
+
+    # get a value
+    def get(self, method_name, *args):
+        key = (method_name, args)
+        with self.lock:
+            if key in self.valueMap:
+                self.nHits += 1
+                return self.valueMap[key]
+            fetch_lock = self.fetchLockMap.setdefault(key, threading.Lock())
+        with fetch_lock:
+            with self.lock:
+                if key in self.valueMap:
+                    self.nHits += 1
+                    return self.valueMap[key]
+            value = getattr(self.taskBufferIF, method_name)(*args)
+            # failures are not kept so that the next call retries
+            if not (isinstance(value, tuple) and len(value) > 0 and not value[0]):
+                with self.lock:
+                    self.valueMap[key] = value
+                    self.nFetched += 1
+            return value
+
+    # get SiteMapper
+    def get_site_mapper(self):
+        return self.get("get_site_mapper")
+
+    # get columnar site attributes built from SiteMapper in the snapshot
+    def get_site_columns(self):
+        with self.siteColumnsLock:
+            if self.siteColumns is None:
+                self.siteColumns = SiteColumns(self.get_site_mapper())
+            return self.siteColumns
+
+    # dump statistics
+    def dump(self):
+        return f"generation={self.generation} age={self.get_age():.0f}s fetched={self.nFetched} hits={self.nHits}"
+
+
+# holder of brokerage snapshot shared by JobGeneratorThreads in a cycle
+class BrokerageSnapshotHolder:
+    # constructor
+    def __init__(self, task_buffer_if, max_age):
+        self.taskBufferIF = task_buffer_if
+        # staleness bound in seconds. 0 to disable snapshots
+        self.maxAge = max_age
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.snapshot = None
+
+    # get the current snapshot
+    def get_snapshot(self):
+        if not self.maxAge:
+            return None
+        with self.lock:
+            if self.snapshot is None or self.snapshot.get_age() > self.maxAge:
+                self.generation += 1
+                self.snapshot = BrokerageSnapshot(self.taskBufferIF, self.generation)
+            return self.snapshot
@@ -1,8 +1,13 @@
 import math
 from typing import Any
 
+import numpy as np
+
 from pandajedi.jedicore import Interaction
 
+from .BrokerageSnapshot import SNAPSHOT_METHODS
+from .SiteFilter import SiteColumns
+
 
 # base class for job brokerage
 class JobBrokerBase(object):
@@ -17,6 +22,8 @@ class JobBrokerBase(object):
         self.refresh()
         self.task_common = None
         self.summaryList = None
+        self.snapshot = None
+        self.siteColumns = None
 
     # set task common dictionary
     def set_task_common_dict(self, task_common):
@@ -31,6 +38,29 @@ class JobBrokerBase(object):
     def set_task_common(self, attr_name, attr_value):
         self.task_common[attr_name] = attr_value
 
+    # set snapshot of global state
+    def set_snapshot(self, snapshot):
+        self.snapshot = snapshot
+        # use SiteMapper in the snapshot to share columnar site attributes
+        if snapshot is not None:
+            self.siteMapper = snapshot.get_site_mapper()
+
+    # get global state from the snapshot if available
+    def get_global_state(self, method_name, *args):
+        if self.snapshot is not None and method_name in SNAPSHOT_METHODS:
+            return self.snapshot.get(method_name, *args)
+        return getattr(self.taskBufferIF, method_name)(*args)
+
+    # get view of columnar site attributes for sites to be filtered
+    def get_site_column_view(self, scan_site_list):
+        if self.snapshot is not None:
+            site_columns = self.snapshot.get_site_columns()
+        else:
+            if self.siteColumns is None or self.siteColumns.siteMapper is not self.siteMapper:
+                self.siteColumns = SiteColumns(self.siteMapper)
+            site_columns = self.siteColumns
+        return site_columns.select(scan_site_list)
+
     def refresh(self):
         self.siteMapper = self.taskBufferIF.get_site_mapper()
 
@@ -68,22 +98,12 @@ class JobBrokerBase(object):
 
     # get list of unified sites
     def get_unified_sites(self, scan_site_list):
-        unified_list = set()
-        for tmpSiteName in scan_site_list:
-            tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-            unifiedName = tmpSiteSpec.get_unified_name()
-            unified_list.add(unifiedName)
-        return tuple(unified_list)
+        return tuple(set(self.get_site_column_view(scan_site_list).unified_name))
 
     # get list of pseudo sites
     def get_pseudo_sites(self, unified_list, scan_site_list):
-        unified_list = set(unified_list)
-        pseudo_list = set()
-        for tmpSiteName in scan_site_list:
-            tmpSiteSpec = self.siteMapper.getSite(tmpSiteName)
-            if tmpSiteSpec.get_unified_name() in unified_list:
-                pseudo_list.add(tmpSiteName)
-        return tuple(pseudo_list)
+        site_view = self.get_site_column_view(scan_site_list)
+        return tuple(set(site_view.site_names[np.isin(site_view.unified_name, list(unified_list))]))
 
     # add pseudo sites to skip
     def add_pseudo_sites_to_skip(self, unified_dict, scan_site_list, skipped_dict):
@@ -119,7 +139,8 @@ class JobBrokerBase(object):
         old_list = self.get_unified_sites(old_list)
         new_list = self.get_unified_sites(new_list)
         # get skipped sites
-        skipped = [i for i in old_list if i not in new_list]
+        new_set = set(new_list)
+        skipped = [i for i in old_list if i not in new_set]
         for skipped_site in skipped:
             if skipped_site in msg_map:
                 tmp_log.info(msg_map[skipped_site])
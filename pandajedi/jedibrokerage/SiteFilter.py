@@ -0,0 +1,123 @@
+import itertools
+
+import numpy as np
+
+
+# columnar representation of site attributes used by brokerage
+class SiteColumns:
+    """
+    Attributes of all sites in SiteMapper as arrays indexed by site, so that criteria of brokerage are
+    evaluated as vectorised masks instead of per-site loops. None is stored as 0 in numeric columns.
+    The last row is for unknown sites, to which SiteMapper gives the default SiteSpec
+    """
+
+    # numeric attributes
+    numeric_attributes = ("coreCount", "maxrss", "minrss", "maxwdir", "maxtime", "mintime", "corepower")
+
+    # constructor
+    def __init__(self, site_mapper):
+        self.siteMapper = site_mapper
+        site_names = list(site_mapper.siteSpecList)
+        site_specs = [site_mapper.siteSpecList[site_name] for site_name in site_names]
+        self.index = {site_name: idx for idx, site_name in enumerate(site_names)}
+        # default SiteSpec for unknown sites
+        self.unknown_index = len(site_specs)
+        site_specs.append(site_mapper.getSite(None))
+        self.status = np.array([site_spec.status for site_spec in site_specs], dtype=object)
+        self.is_unified = np.array([bool(site_spec.is_unified) for site_spec in site_specs], dtype=bool)
+        self.unified_name = np.array([site_spec.get_unified_name() for site_spec in site_specs], dtype=object)
+        for attr in self.numeric_attributes:
+            setattr(self, attr, np.array([getattr(site_spec, attr) or 0 for site_spec in site_specs], dtype=np.float64))
+
+    # make a view for a list of sites
+    def select(self, site_names):
+        """
+        Make a view for sites to be filtered
+
+        :param site_names: list of site names
+        :return: SiteColumnView
+        """
+        indices = np.fromiter(map(self.index.get, site_names, itertools.repeat(self.unknown_index)), dtype=np.int64, count=len(site_names))
+        return SiteColumnView(self, site_names, indices)
+
+
+# view of columns for a list of sites
+class SiteColumnView:
+    # constructor
+    def __init__(self, columns, site_names, indices):
+        self.columns = columns
+        self.site_names = np.array(site_names, dtype=object)
+        self.indices = indices
+
+    # get a column for sites in the view. cached since messages access columns repeatedly
+    def __getattr__(self, attr):
+        if attr.startswith("__"):
+            raise AttributeError(attr)
+        value = getattr(self.columns, attr)[self.indices]
+        setattr(self, attr, value)
+        return value
+
+    # number of sites
+    def __len__(self):
+        return len(self.indices)
+
+    # get SiteSpec at a position
+    def get_site(self, pos):
+        return self.columns.siteMapper.getSite(self.site_names[pos])
+
+    # apply criteria
+    def apply(self, criteria):
+        """
+        Apply criteria in order. Messages are made on access only for rejected sites, with the first criterion they failed
+
+        :param criteria: list of SiteCriterion
+        :return: list of site names which passed all criteria, and map of unified site name to rejection message
+        """
+        passed = np.ones(len(self.indices), dtype=bool)
+        failed_at = np.full(len(self.indices), -1, dtype=np.int64)
+        for idx, criterion in enumerate(criteria):
+            newly_failed = passed & ~criterion.mask
+            failed_at[newly_failed] = idx
+            passed &= criterion.mask
+        # messages in the order of sites
+        msg_map = LazyMessageMap()
+        unified_name = self.unified_name
+        for pos in np.flatnonzero(~passed).tolist():
+            criterion = criteria[failed_at[pos]]
+            if criterion.message is not None:
+                dict.__setitem__(msg_map, unified_name[pos], (criterion.message, self, pos))
+        return self.site_names[passed].tolist(), msg_map
+
+
+# map of rejection messages formatted on access, since most of them are not logged
+class LazyMessageMap(dict):
+    def __getitem__(self, key):
+        value = dict.__getitem__(self, key)
+        if isinstance(value, tuple):
+            value = value[0](value[1], value[2])
+            dict.__setitem__(self, key, value)
+        return value
+
+    def get(self, key, default=None):
+        if key in self:
+            return self[key]
+        return default
+
+    def values(self):
+        return [self[key] for key in self]
+
+    def items(self):
+        return [(key, self[key]) for key in self]
+
+
+# criterion of site filter
+class SiteCriterion:
+    """
+    :param mask: bool array over sites in a view. True for sites passing the criterion
+    :param message: function taking the view and position in the view to make a rejection message. None to skip sites silently.
+                    It is called lazily, so values derived for the criterion should be set to the view instead of closure variables
+    """
+
+    def __init__(self, mask, message=None):
+        self.mask = np.asarray(mask, dtype=bool)
+        self.message = message
@@ -1,13 +1,21 @@
 import datetime
+import itertools
 import multiprocessing
 import multiprocessing.reduction
 import os
 import signal
 import sys
+import threading
 import time
 
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 
+from pandajedi.jedicore.ResultCache import (
+    LocalResultCache,
+    ResultCacheClient,
+    ResultCacheServer,
+)
+
 try:
     from multiprocessing.connection import reduce_connection
 except ImportError:
@@ -75,6 +83,13 @@ def dumpStdOut(sender, message):
     print(f"{str(timeNow)} {sender}: INFO    {message}")
 
 
+# request ID counter in each process
+_request_id_counter = itertools.count(1)
+
+# size in bytes of the result cache in a child process when the shared one is unavailable
+DEFAULT_LOCAL_CACHE_SIZE = 64 * 1024 * 1024
+
+
 # object class for command
 class CommandObject(object):
     # constructor
@@ -82,6 +97,8 @@ class CommandObject(object):
         self.methodName = methodName
         self.argList = argList
         self.argMap = argMap
+        # unique among processes sharing child processes
+        self.requestID = (os.getpid() << 32) + next(_request_id_counter)
 
 
 # object class for response
@@ -91,6 +108,39 @@ class ReturnObject(object):
         self.statusCode = None
         self.errorValue = None
         self.returnValue = None
+        self.requestID = None
+
+
+# send commands to a child process and receive responses in the same order
+def exchangeCommands(pipe, commandList, timeoutPeriod, className, pid):
+    if len(commandList) == 1:
+        pipe.send(commandList[0])
+        sender = None
+    else:
+        # send commands in another thread so that the child process is not blocked on sending responses
+        sender = threading.Thread(target=lambda: [pipe.send(commandObj) for commandObj in commandList])
+        sender.daemon = True
+        sender.start()
+    retList = []
+    for commandObj in commandList:
+        timeNow = naive_utcnow()
+        while True:
+            if not pipe.poll(timeoutPeriod):
+                raise JEDITimeoutError(f"did not get response for {timeoutPeriod}sec")
+            ret = pipe.recv()
+            # skip stale responses to commands of callers which gave up
+            if ret.requestID == commandObj.requestID:
+                break
+        regTime = naive_utcnow() - timeNow
+        if regTime > datetime.timedelta(seconds=60):
+            dumpStdOut(
+                className,
+                f"methodName={commandObj.methodName} took {regTime.seconds}.{int(regTime.microseconds / 1000):03d} sec in pid={pid}",
+            )
+        retList.append(ret)
+    if sender is not None:
+        sender.join()
+    return retList
 
 
 # process class
@@ -100,7 +150,9 @@ class ProcessClass(object):
         self.pid = pid
         self.nused = 0
         self.usedMemory = 0
-        self.nMemLookup = 20
+        # interval in seconds to check memory usage
+        self.memCheckInterval = 60
+        self.lastMemCheck = time.time()
         # reduce connection to make it picklable
         self.reduced_pipe = reduce_connection(connection)
 
@@ -115,8 +167,9 @@ class ProcessClass(object):
 
     # get memory usage
     def getMemUsage(self):
-        # update memory info
-        if self.nused % self.nMemLookup == 0:
+        # update memory info periodically
+        if time.time() - self.lastMemCheck > self.memCheckInterval:
+            self.lastMemCheck = time.time()
             try:
                 # read memory info from /proc
                 t = open(f"/proc/{self.pid}/status")
@@ -159,6 +212,8 @@ class MethodClass(object):
             # exceptions
             retException = None
             strException = None
+            child_process = None
+            pipe = None
             try:
                 stepIdx = 0
                 # get child process
@@ -166,80 +221,20 @@ class MethodClass(object):
                 # get pipe
                 stepIdx = 1
                 pipe = child_process.connection()
-                # get ack
-                stepIdx = 2
-                timeoutPeriodACK = 30
-                if not pipe.poll(timeoutPeriodACK):
-                    raise JEDITimeoutError(f"did not get ACK for {timeoutPeriodACK}sec")
-                ack = pipe.recv()
-                # send command
+                # send command and wait response
                 stepIdx = 3
-                pipe.send(commandObj)
-                # wait response
-                stepIdx = 4
-                timeoutPeriod = 600
-                timeNow = naive_utcnow()
-                if not pipe.poll(timeoutPeriod):
-                    raise JEDITimeoutError(f"did not get response for {timeoutPeriod}sec")
-                regTime = naive_utcnow() - timeNow
-                if regTime > datetime.timedelta(seconds=60):
-                    dumpStdOut(
-                        self.className,
-                        f"methodName={self.methodName} took {regTime.seconds}.{int(regTime.microseconds / 1000):03d} sec in pid={child_process.pid}",
-                    )
-                # get response
-                stepIdx = 5
-                ret = pipe.recv()
+                ret = exchangeCommands(pipe, [commandObj], 600, self.className, child_process.pid)[0]
                 # set exception type based on error
                 stepIdx = 6
-                if ret.statusCode == SC_FAILED:
-                    retException = JEDITemporaryError
-                elif ret.statusCode == SC_FATAL:
-                    retException = JEDIFatalError
+                retException = getExceptionType(ret)
             except Exception:
                 errtype, errvalue = sys.exc_info()[:2]
                 retException = errtype
                 argStr = f"args={str(args)} kargs={str(kwargs)}"
                 strException = f"VO={self.vo} type={errtype.__name__} stepIdx={stepIdx} : {self.className}.{self.methodName} {errvalue} {argStr[:200]}"
-            # increment nused
-            child_process.nused += 1
-            # memory check
-            largeMemory = False
-            memUsed = child_process.getMemUsage()
-            if memUsed is not None:
-                memStr = f"pid={child_process.pid} memory={memUsed}MB"
-                if memUsed > 1.5 * 1024:
-                    largeMemory = True
-                    memStr += " exceeds memory limit"
-                    dumpStdOut(self.className, memStr)
-            # kill old or problematic process
-            if child_process.nused > 1000 or retException not in [None, JEDITemporaryError, JEDIFatalError] or largeMemory:
-                dumpStdOut(
-                    self.className,
-                    f"methodName={self.methodName} ret={retException} nused={child_process.nused} {strException} in pid={child_process.pid}",
-                )
-                # close connection
-                try:
-                    pipe.close()
-                except Exception:
-                    pass
-                # terminate child process
-                try:
-                    dumpStdOut(self.className, f"killing pid={child_process.pid}")
-                    os.kill(child_process.pid, signal.SIGKILL)
-                    dumpStdOut(self.className, f"waiting pid={child_process.pid}")
-                    os.waitpid(child_process.pid, 0)
-                    dumpStdOut(self.className, f"terminated pid={child_process.pid}")
-                except Exception:
-                    errtype, errvalue = sys.exc_info()[:2]
-                    if "No child processes" not in str(errvalue):
-                        dumpStdOut(self.className, f"failed to terminate {child_process.pid} with {errtype}:{errvalue}")
-                # make new child process
-                self.voIF.launchChild()
-            else:
-                # reduce process object to avoid deadlock due to rebuilding of connection
-                child_process.reduceConnection(pipe)
-                self.connectionQueue.put(child_process)
+            # put back or replace the child process if acquired
+            if child_process is not None:
+                self.voIF.releaseChild(child_process, pipe, 1, retException, strException, self.methodName)
             # success, fatal error, or maximally attempted
             if retException in [None, JEDIFatalError] or (iTry + 1 == nTry):
                 break
@@ -257,20 +252,123 @@ class MethodClass(object):
             raise retException(f"VO={self.vo} {ret.errorValue}")
 
 
+# get exception type for response
+def getExceptionType(ret):
+    if ret.statusCode == SC_FAILED:
+        return JEDITemporaryError
+    elif ret.statusCode == SC_FATAL:
+        return JEDIFatalError
+    return None
+
+
 # interface class to send command
 class CommandSendInterface(object):
     # constructor
-    def __init__(self, vo, maxChild, moduleName, className):
+    def __init__(self, vo, maxChild, moduleName, className, resultCacheSize=None):
         self.vo = vo
         self.maxChild = maxChild
         self.connectionQueue = multiprocessing.Queue(maxChild)
         self.moduleName = moduleName
         self.className = className
+        # size in bytes of the result cache shared by child processes
+        self.resultCacheSize = resultCacheSize
+        self.resultCacheServer = None
 
     # factory method
     def __getattr__(self, attrName):
         return MethodClass(self.className, attrName, self.vo, self.connectionQueue, self)
 
+    # put back a child process, or replace it if it is old or problematic
+    def releaseChild(self, child_process, pipe, nCommands, retException, strException, methodName):
+        # increment nused
+        child_process.nused += nCommands
+        # memory check
+        largeMemory = False
+        memUsed = child_process.getMemUsage()
+        if memUsed is not None:
+            memStr = f"pid={child_process.pid} memory={memUsed}MB"
+            if memUsed > 1.5 * 1024:
+                largeMemory = True
+                memStr += " exceeds memory limit"
+                dumpStdOut(self.className, memStr)
+        # kill old or problematic process, or process without connection
+        if child_process.nused > 1000 or retException not in [None, JEDITemporaryError, JEDIFatalError] or largeMemory or pipe is None:
+            dumpStdOut(
+                self.className,
+                f"methodName={methodName} ret={retException} nused={child_process.nused} {strException} in pid={child_process.pid}",
+            )
+            # close connection
+            try:
+                pipe.close()
+            except Exception:
+                pass
+            # terminate child process
+            try:
+                dumpStdOut(self.className, f"killing pid={child_process.pid}")
+                os.kill(child_process.pid, signal.SIGKILL)
+                dumpStdOut(self.className, f"waiting pid={child_process.pid}")
+                os.waitpid(child_process.pid, 0)
+                dumpStdOut(self.className, f"terminated pid={child_process.pid}")
+            except Exception:
+                errtype, errvalue = sys.exc_info()[:2]
+                if "No child processes" not in str(errvalue):
+                    dumpStdOut(self.className, f"failed to terminate {child_process.pid} with {errtype}:{errvalue}")
+            # make new child process
+            self.launchChild()
+        else:
+            # reduce process object to avoid deadlock due to rebuilding of connection
+            child_process.reduceConnection(pipe)
+            self.connectionQueue.put(child_process)
+
+    # pipeline independent calls to one child process
+    def pipeline(self, calls):
+        """
+        Send multiple independent calls to one child process without waiting for each response
+
+        :param calls: list of (method name, args, kwargs)
+        :return: list of return values in the same order. errors are returned as exception instances instead of being raised
+        """
+        commandList = [CommandObject(methodName, args, kwargs) for methodName, args, kwargs in calls]
+        retException = None
+        strException = None
+        stepIdx = 0
+        child_process = None
+        pipe = None
+        try:
+            # get child process
+            child_process = self.connectionQueue.get()
+            # get pipe
+            stepIdx = 1
+            pipe = child_process.connection()
+            # send commands and wait responses
+            stepIdx = 3
+            retList = exchangeCommands(pipe, commandList, 600, self.className, child_process.pid)
+        except Exception:
+            errtype, errvalue = sys.exc_info()[:2]
+            retException = errtype
+            strException = f"VO={self.vo} type={errtype.__name__} stepIdx={stepIdx} : {self.className}.pipeline {errvalue}"
+        # put back or replace the child process if acquired
+        if child_process is not None:
+            self.releaseChild(child_process, pipe, len(commandList), retException, strException, "pipeline")
+        # retry one by one when the pipeline failed as a whole
+        if retException is not None:
+            retList = []
+            for methodName, args, kwargs in calls:
+                try:
+                    retList.append(getattr(self, methodName)(*args, **kwargs))
+                except Exception as e:
+                    retList.append(e)
+            return retList
+        # convert responses
+        valueList = []
+        for ret in retList:
+            tmpException = getExceptionType(ret)
+            if tmpException is None:
+                valueList.append(ret.returnValue)
+            else:
+                valueList.append(tmpException(f"VO={self.vo} {ret.errorValue}"))
+        return valueList
+
     # launcher for child processe
     def launcher(self, channel):
         # import module
@@ -284,7 +382,15 @@ class CommandSendInterface(object):
         dumpStdOut(self.moduleName, msg)
         timeNow = naive_utcnow()
         try:
-            cls(channel).start()
+            obj = cls(channel)
+            # attach to the shared result cache
+            if self.resultCacheServer is not None:
+                try:
+                    obj.resultCache = ResultCacheClient(self.resultCacheServer.address, self.resultCacheServer.authkey)
+                except Exception:
+                    errtype, errvalue = sys.exc_info()[:2]
+                    dumpStdOut(self.className, f"failed to attach result cache with {errtype}:{errvalue}")
+            obj.start()
         except Exception:
             errtype, errvalue = sys.exc_info()[:2]
             dumpStdOut(self.className, f"launcher crashed with {errtype}:{errvalue}")
@@ -309,16 +415,31 @@ class CommandSendInterface(object):
 
     # initialize
     def initialize(self):
+        # start the shared result cache before child processes
+        if self.resultCacheSize:
+            self.resultCacheServer = ResultCacheServer(self.resultCacheSize)
+            self.resultCacheServer.start()
         for i in range(self.maxChild):
             self.launchChild()
 
+    # get metrics of the shared result cache
+    def getResultCacheMetrics(self):
+        if self.resultCacheServer is None:
+            return None
+        client = ResultCacheClient(self.resultCacheServer.address, self.resultCacheServer.authkey)
+        try:
+            return client.getMetrics()
+        finally:
+            client.conn.close()
+
 
 # interface class to receive command
 class CommandReceiveInterface(object):
     # constructor
     def __init__(self, con):
         self.con = con
-        self.cacheMap = {}
+        # cache of results. replaced with the shared one by the launcher
+        self.resultCache = None
 
     # make key for cache
     def makeKey(self, className, methodName, argList, argMap):
@@ -335,16 +456,18 @@ class CommandReceiveInterface(object):
 
     # main loop
     def start(self):
+        # use a cache in this process if the shared one is unavailable
+        if self.resultCache is None:
+            self.resultCache = LocalResultCache(DEFAULT_LOCAL_CACHE_SIZE)
         # sync
         self.con.send("ready")
         # main loop
         while True:
-            # send ACK
-            self.con.send("ack")
             # get command
             commandObj = self.con.recv()
             # make return
             retObj = ReturnObject()
+            retObj.requestID = commandObj.requestID
             # get class name
             className = self.__class__.__name__
             # check method name
@@ -365,11 +488,15 @@ class CommandReceiveInterface(object):
                         # make key for cache
                         tmpCacheKey = self.makeKey(className, commandObj.methodName, commandObj.argList, commandObj.argMap)
                         if tmpCacheKey is not None:
-                            useCache = True
-                            # cache is fresh
-                            if tmpCacheKey in self.cacheMap and self.cacheMap[tmpCacheKey]["utime"] + datetime.timedelta(seconds=timeRange) > naive_utcnow():
-                                tmpRet = self.cacheMap[tmpCacheKey]["value"]
-                                doExec = False
+                            # fresh result or result of a concurrent identical call
+                            try:
+                                isHit, tmpRet = self.resultCache.get(tmpCacheKey, commandObj.methodName)
+                                useCache = True
+                                if isHit:
+                                    doExec = False
+                            except Exception:
+                                errtype, errvalue = sys.exc_info()[:2]
+                                dumpStdOut(className, f"failed to look up cache for {commandObj.methodName} with {errtype}:{errvalue}")
                     # exec
                     if doExec:
                         # get function
@@ -401,9 +528,20 @@ class CommandReceiveInterface(object):
                     # failed
                     retObj.statusCode = self.SC_FATAL
                     retObj.errorValue = f"type={errtype.__name__} : {className}.{commandObj.methodName} : {errvalue}"
-                # cache
-                if useCache and doExec and retObj.statusCode == self.SC_SUCCEEDED:
-                    self.cacheMap[tmpCacheKey] = {"utime": naive_utcnow(), "value": tmpRet}
+                # cache. zero time range is used only to share results with concurrent identical calls
+                if useCache and doExec:
+                    try:
+                        if retObj.statusCode == self.SC_SUCCEEDED:
+                            self.resultCache.put(tmpCacheKey, commandObj.methodName, timeRange, tmpRet)
+                        else:
+                            self.resultCache.abort(tmpCacheKey)
+                    except Exception:
+                        errtype, errvalue = sys.exc_info()[:2]
+                        dumpStdOut(className, f"failed to cache {commandObj.methodName} with {errtype}:{errvalue}")
+                        try:
+                            self.resultCache.abort(tmpCacheKey)
+                        except Exception:
+                            pass
             # return
             self.con.send(retObj)
 
@@ -14,7 +14,12 @@ class JediTaskBufferInterface:
         maxSize = max_size if max_size is not None else jedi_config.db.nWorkers
         moduleName = "pandajedi.jedicore.JediTaskBuffer"
         className = "JediTaskBuffer"
-        self.interface = Interaction.CommandSendInterface(vo, maxSize, moduleName, className)
+        # size of the result cache shared by JediTaskBuffer instances
+        if hasattr(jedi_config.db, "resultCacheSize"):
+            resultCacheSize = jedi_config.db.resultCacheSize * 1024 * 1024
+        else:
+            resultCacheSize = 256 * 1024 * 1024
+        self.interface = Interaction.CommandSendInterface(vo, maxSize, moduleName, className, resultCacheSize)
         self.interface.initialize()
 
     # method emulation
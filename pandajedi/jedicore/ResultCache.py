@@ -0,0 +1,240 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from multiprocessing.connection import Client, Listener
+
+# timeout in seconds to wait for a concurrent identical call. shorter than the timeout of the caller to avoid killing the child process
+COALESCE_TIMEOUT = 300
+
+
+# record of a call being executed
+class InFlightCall:
+    def __init__(self, owner):
+        self.owner = owner
+        self.event = threading.Event()
+        self.blob = None
+
+
+# cache of results with TTL and LRU eviction
+class ResultCache:
+    # constructor
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        # key -> (methodName, expiry, blob)
+        self.entries = OrderedDict()
+        self.totalSize = 0
+        # key -> InFlightCall
+        self.inFlight = {}
+        # methodName -> {"hits", "misses", "coalesced"}
+        self.stats = {}
+
+    # count an event for a method
+    def countStat(self, methodName, statName):
+        self.stats.setdefault(methodName, {"hits": 0, "misses": 0, "coalesced": 0})
+        self.stats[methodName][statName] += 1
+
+    # remove an entry
+    def removeEntry(self, key):
+        methodName, expiry, blob = self.entries.pop(key)
+        self.totalSize -= len(blob)
+
+    # look up. return a pickled result, or None after registering the caller as the one executing the call
+    def get(self, key, methodName, owner, timeout=COALESCE_TIMEOUT):
+        deadline = time.time() + timeout
+        while True:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is not None:
+                    if entry[1] > time.time():
+                        self.entries.move_to_end(key)
+                        self.countStat(methodName, "hits")
+                        return entry[2]
+                    self.removeEntry(key)
+                call = self.inFlight.get(key)
+                if call is None:
+                    # execute it
+                    self.inFlight[key] = InFlightCall(owner)
+                    self.countStat(methodName, "misses")
+                    return None
+            # wait for the identical call
+            if not call.event.wait(max(deadline - time.time(), 0)):
+                with self.lock:
+                    self.countStat(methodName, "misses")
+                return None
+            if call.blob is not None:
+                with self.lock:
+                    self.countStat(methodName, "coalesced")
+                return call.blob
+
+    # put a pickled result and release callers waiting for it
+    def put(self, key, methodName, ttl, blob):
+        with self.lock:
+            call = self.inFlight.pop(key, None)
+            if call is not None:
+                call.blob = blob
+                call.event.set()
+            if ttl <= 0 or len(blob) > self.maxSize:
+                return
+            if key in self.entries:
+                self.removeEntry(key)
+            self.entries[key] = (methodName, time.time() + ttl, blob)
+            self.totalSize += len(blob)
+            # evict least recently used entries
+            while self.totalSize > self.maxSize:
+                self.removeEntry(next(iter(self.entries)))
+
+    # give up execution and release callers waiting for it
+    def abort(self, key):
+        with self.lock:
+            call = self.inFlight.pop(key, None)
+            if call is not None:
+                call.event.set()
+
+    # remove entries with string keys starting with a prefix
+    def invalidatePrefix(self, prefix):
+        with self.lock:
+            for key in [key for key in self.entries if isinstance(key, str) and key.startswith(prefix)]:
+                self.removeEntry(key)
+
+    # give up all executions by an owner
+    def abortOwner(self, owner):
+        with self.lock:
+            for key, call in list(self.inFlight.items()):
+                if call.owner == owner:
+                    del self.inFlight[key]
+                    call.event.set()
+
+    # get metrics
+    def getMetrics(self):
+        with self.lock:
+            methodStats = {}
+            for methodName, stat in self.stats.items():
+                nCalls = stat["hits"] + stat["misses"] + stat["coalesced"]
+                methodStats[methodName] = dict(stat, hit_rate=(stat["hits"] + stat["coalesced"]) / nCalls if nCalls else 0)
+            return {
+                "n_entries": len(self.entries),
+                "total_size": self.totalSize,
+                "max_size": self.maxSize,
+                "n_in_flight": len(self.inFlight),
+                "methods": methodStats,
+            }
+
+
+# cache in a separate process shared by child processes of CommandSendInterface
+class ResultCacheServer:
+    # constructor
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.authkey = os.urandom(16)
+        self.listener = Listener(family="AF_UNIX", authkey=self.authkey)
+        self.address = self.listener.address
+
+    # serve a child process
+    def serve(self, cache, conn):
+        owner = id(conn)
+        try:
+            while True:
+                command = conn.recv()
+                if command[0] == "get":
+                    _, key, methodName = command
+                    conn.send(cache.get(key, methodName, owner))
+                elif command[0] == "put":
+                    _, key, methodName, ttl, blob = command
+                    cache.put(key, methodName, ttl, blob)
+                elif command[0] == "abort":
+                    cache.abort(command[1])
+                elif command[0] == "invalidate_prefix":
+                    cache.invalidatePrefix(command[1])
+                elif command[0] == "metrics":
+                    conn.send(cache.getMetrics())
+        except (EOFError, OSError):
+            pass
+        finally:
+            # release callers waiting for results which will never come
+            cache.abortOwner(owner)
+            conn.close()
+
+    # main loop
+    def run(self):
+        cache = ResultCache(self.maxSize)
+        while True:
+            try:
+                conn = self.listener.accept()
+            except Exception:
+                continue
+            thr = threading.Thread(target=self.serve, args=(cache, conn))
+            thr.daemon = True
+            thr.start()
+
+    # start the server process
+    def start(self):
+        proc = multiprocessing.Process(target=self.run)
+        proc.daemon = True
+        proc.start()
+        return proc
+
+
+# client in child processes
+class ResultCacheClient:
+    # constructor
+    def __init__(self, address, authkey):
+        self.conn = Client(address, family="AF_UNIX", authkey=authkey)
+
+    # look up
+    def get(self, key, methodName):
+        self.conn.send(("get", key, methodName))
+        blob = self.conn.recv()
+        if blob is None:
+            return False, None
+        return True, pickle.loads(blob)
+
+    # put a result
+    def put(self, key, methodName, ttl, value):
+        self.conn.send(("put", key, methodName, ttl, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+
+    # give up execution
+    def abort(self, key):
+        self.conn.send(("abort", key))
+
+    # remove entries with keys starting with a prefix
+    def invalidatePrefix(self, prefix):
+        self.conn.send(("invalidate_prefix", prefix))
+
+    # get metrics
+    def getMetrics(self):
+        self.conn.send(("metrics",))
+        return self.conn.recv()
+
+
+# cache in a process used when the shared cache is unavailable
+class LocalResultCache:
+    # constructor
+    def __init__(self, maxSize):
+        self.cache = ResultCache(maxSize)
+
+    # look up
+    def get(self, key, methodName):
+        blob = self.cache.get(key, methodName, None)
+        if blob is None:
+            return False, None
+        return True, pickle.loads(blob)
+
+    # put a result
+    def put(self, key, methodName, ttl, value):
+        self.cache.put(key, methodName, ttl, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+    # give up execution
+    def abort(self, key):
+        self.cache.abort(key)
+
+    # remove entries with keys starting with a prefix
+    def invalidatePrefix(self, prefix):
+        self.cache.invalidatePrefix(prefix)
+
+    # get metrics
+    def getMetrics(self):
+        return self.cache.getMetrics()
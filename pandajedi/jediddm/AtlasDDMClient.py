@@ -4,7 +4,9 @@ import math
 import os
 import re
 import sys
+import threading
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 
 import requests
@@ -35,6 +37,7 @@ from pandajedi.jedicore.Interaction import StatusCode
 from pandajedi.jedicore.MsgWrapper import MsgWrapper
 from pandaserver.dataservice import DataServiceUtils, ddm
 
+from .DDMCache import TTLCache, cached_lookup, invalidating_lookup
 from .DDMClientBase import DDMClientBase
 
 logger = PandaLogger().getLogger(__name__.split(".")[-1])
@@ -58,6 +61,23 @@ class AtlasDDMClient(DDMClientBase):
         self.timeIntervalEP = datetime.timedelta(seconds=60 * 10)
         # pid
         self.pid = os.getpid()
+        # number of threads for concurrent file replica lookup
+        if hasattr(jedi_config.ddm, "nReplicaLookupThreads"):
+            self.nReplicaLookupThreads = jedi_config.ddm.nReplicaLookupThreads
+        else:
+            self.nReplicaLookupThreads = 4
+        # cache of file replicas shared by all tasks in the process
+        if hasattr(jedi_config.ddm, "fileReplicaCacheTTL"):
+            tmp_ttl = jedi_config.ddm.fileReplicaCacheTTL
+        else:
+            tmp_ttl = 120
+        if hasattr(jedi_config.ddm, "fileReplicaCacheSize"):
+            tmp_size = jedi_config.ddm.fileReplicaCacheSize
+        else:
+            tmp_size = 1000000
+        self.fileReplicaCache = TTLCache(tmp_size, tmp_ttl)
+        # Rucio client for each lookup thread
+        self.threadLocal = threading.local()
 
     # get files in dataset
     def getFilesInDataset(self, datasetName, getNumEvents=False, skipDuplicate=True, ignoreUnknown=False, longFormat=False, lfn_only=False):
@@ -144,6 +164,7 @@ class AtlasDDMClient(DDMClientBase):
         return errCode, f"{methodName} : {errMsg}"
 
     # list dataset replicas
+    @cached_lookup
     def listDatasetReplicas(self, datasetName, use_vp=False, detailed=False, skip_incomplete_element=False, use_deep=False, element_list=None):
         methodName = "listDatasetReplicas"
         methodName += f" pid={self.pid}"
@@ -435,6 +456,8 @@ class AtlasDDMClient(DDMClientBase):
             # initialize the return map and add complete/cached replicas
             return_map = {}
             checked_dst = set()
+            # (site, storage type) -> set of files already added, to avoid list lookups
+            added_file_map = {}
             for site_name, tmp_endpoints in site_endpoint_map.items():
                 return_map.setdefault(site_name, {"localdisk": [], "localtape": [], "cache": [], "remote": []})
                 tmp_site_spec = site_mapper.getSite(site_name)
@@ -450,19 +473,35 @@ class AtlasDDMClient(DDMClientBase):
                         if tmp_endpoint in complete_replica_map:
                             storage_type = complete_replica_map[tmp_endpoint]
                             return_map[site_name][storage_type] += dataset_spec.Files
+                            added_file_map.setdefault((site_name, storage_type), set()).update(dataset_spec.Files)
                             checked_dst.add(site_name)
 
-            # loop over all available LFNs
+            # endpoints with file lookup for each site, and sites for each endpoint
+            site_scanned_endpoints = {}
+            endpoint_site_map = {}
+            for site, tmp_endpoints in site_endpoint_map.items():
+                for endpoint in tmp_endpoints:
+                    if endpoint in endpoint_storagetype_map:
+                        site_scanned_endpoints.setdefault(site, []).append((endpoint, endpoint_storagetype_map[endpoint]))
+                        endpoint_site_map.setdefault(endpoint, []).append(site)
+
+            # loop over all available LFNs, only visiting sites associated with RSEs of each LFN
             available_lfns = sorted(rucio_lfn_to_rse_map.keys())
             for tmp_lfn in available_lfns:
                 tmp_filespec_list = lfn_filespec_map[tmp_lfn]
                 tmp_filespec = lfn_filespec_map[tmp_lfn][0]
-                for site in site_endpoint_map:
-                    for endpoint in site_endpoint_map[site]:
-                        if endpoint in rucio_lfn_to_rse_map[tmp_lfn] and endpoint in endpoint_storagetype_map:
-                            storage_type = endpoint_storagetype_map[endpoint]
-                            if tmp_filespec not in return_map[site][storage_type]:
+                tmp_rses = rucio_lfn_to_rse_map[tmp_lfn]
+                tmp_sites = set()
+                for tmp_rse in tmp_rses:
+                    tmp_sites.update(endpoint_site_map.get(tmp_rse, []))
+                for site in tmp_sites:
+                    # the first endpoint of the site with the replica
+                    for endpoint, storage_type in site_scanned_endpoints[site]:
+                        if endpoint in tmp_rses:
+                            added_files = added_file_map.setdefault((site, storage_type), set())
+                            if tmp_filespec not in added_files:
                                 return_map[site][storage_type] += tmp_filespec_list
+                                added_files.update(tmp_filespec_list)
                             checked_dst.add(site)
                             break
 
@@ -470,8 +509,7 @@ class AtlasDDMClient(DDMClientBase):
             for site, storage_type_files in return_map.items():
                 site_all_file_list = set()
                 for storage_type, file_list in storage_type_files.items():
-                    for tmp_file_spec in file_list:
-                        site_all_file_list.add(tmp_file_spec)
+                    site_all_file_list.update(file_list)
                 storage_type_files["all"] = site_all_file_list
 
             # dump for logging
@@ -495,41 +533,55 @@ class AtlasDDMClient(DDMClientBase):
             tmp_log.error(error_message)
             return self.SC_FAILED, f"{self.__class__.__name__}.{method_name} {error_message}"
 
+    # get Rucio client for the current thread
+    def get_thread_client(self):
+        client = getattr(self.threadLocal, "client", None)
+        if client is None:
+            client = RucioClient()
+            self.threadLocal.client = client
+        return client
+
+    # look up a chunk of files in Rucio
+    def list_replicas_in_chunk(self, dids, i_loop, tmp_log):
+        loopStart = naive_utcnow()
+        lfn_to_rses_map = {}
+        for tmp_dict in self.get_thread_client().list_replicas(dids, resolve_archives=True):
+            try:
+                lfn_to_rses_map[(str(tmp_dict["scope"]), str(tmp_dict["name"]))] = frozenset(tmp_dict["rses"])
+            except Exception:
+                pass
+        regTime = naive_utcnow() - loopStart
+        tmp_log.info(f"rucio.list_replicas took {regTime.seconds} sec for {len(dids)} files in lookup {i_loop}")
+        return lfn_to_rses_map
+
+    # list file replicas. return a map of LFN to the set of RSEs
     def jedi_list_replicas(self, files, storages, scopes={}):
         try:
             method_name = "jedi_list_replicas"
             method_name += f" pid={self.pid}"
             tmp_log = MsgWrapper(logger, method_name)
-            client = RucioClient()
-            i_guid = 0
             max_guid = 1000  # do 1000 guids in each Rucio call
-            lfn_to_rses_map = {}
-            dids = []
-            i_loop = 0
             startTime = naive_utcnow()
             tmp_log.debug("start")
-            for guid, lfn in files.items():
-                i_guid += 1
-                scope = scopes[lfn]
-                dids.append({"scope": scope, "name": lfn})
-                if len(dids) % max_guid == 0 or i_guid == len(files):
-                    i_loop += 1
-                    tmp_log.debug(f"lookup {i_loop} start")
-                    loopStart = naive_utcnow()
-                    x = client.list_replicas(dids, resolve_archives=True)
-                    regTime = naive_utcnow() - loopStart
-                    tmp_log.info(f"rucio.list_replicas took {regTime.seconds} sec for {len(dids)} files")
-                    loopStart = naive_utcnow()
-                    for tmp_dict in x:
-                        try:
-                            tmp_LFN = str(tmp_dict["name"])
-                            lfn_to_rses_map[tmp_LFN] = tmp_dict["rses"]
-                        except Exception:
-                            pass
-                    # reset the dids list for the next bulk for Rucio
-                    dids = []
-                    regTime = naive_utcnow() - loopStart
-                    tmp_log.debug(f"lookup {i_loop} end in {regTime.seconds} sec")
+            # use cached replicas which were looked up recently
+            did_keys = [(scopes[lfn], lfn) for lfn in files.values()]
+            cached_map, missing_keys = self.fileReplicaCache.get_many(did_keys)
+            lfn_to_rses_map = {lfn: rses for (scope, lfn), rses in cached_map.items() if rses is not None}
+            # look up the rest concurrently in chunks
+            chunks = []
+            for i in range(0, len(missing_keys), max_guid):
+                chunks.append([{"scope": scope, "name": lfn} for scope, lfn in missing_keys[i : i + max_guid]])
+            tmp_log.debug(f"{len(cached_map)} files in cache, {len(missing_keys)} files to look up in {len(chunks)} chunks")
+            if chunks:
+                with ThreadPoolExecutor(max_workers=max(1, min(self.nReplicaLookupThreads, len(chunks)))) as pool:
+                    results = list(pool.map(self.list_replicas_in_chunk, chunks, range(1, len(chunks) + 1), [tmp_log] * len(chunks)))
+                found_map = {}
+                for tmp_map in results:
+                    found_map.update(tmp_map)
+                for (scope, lfn), rses in found_map.items():
+                    lfn_to_rses_map[lfn] = rses
+                # cache missing files as well to avoid repeated lookups
+                self.fileReplicaCache.put_many([(key, found_map.get(key)) for key in missing_keys])
             regTime = naive_utcnow() - startTime
             tmp_log.debug(f"end in {regTime.seconds} sec")
         except Exception as e:
@@ -558,6 +610,7 @@ class AtlasDDMClient(DDMClientBase):
         return self.SC_SUCCEEDED, lfn_to_rses_map
 
     # get dataset metadata
+    @cached_lookup
     def getDatasetMetaData(self, datasetName, ignore_missing=False):
         # make logger
         methodName = "getDatasetMetaData"
@@ -644,6 +697,7 @@ class AtlasDDMClient(DDMClientBase):
             return errCode, f"{methodName} : {errMsg}"
 
     # register new dataset/container
+    @invalidating_lookup
     def registerNewDataset(self, datasetName, backEnd="rucio", location=None, lifetime=None, metaData=None, resurrect=False):
         methodName = "registerNewDataset"
         methodName += f" pid={self.pid}"
@@ -706,6 +760,7 @@ class AtlasDDMClient(DDMClientBase):
         return retList
 
     # list datasets in container
+    @cached_lookup
     def listDatasetsInContainer(self, containerName):
         methodName = "listDatasetsInContainer"
         methodName += f" pid={self.pid}"
@@ -783,6 +838,7 @@ class AtlasDDMClient(DDMClientBase):
             return errCode, f"{methodName} : {errMsg}"
 
     # add dataset to container
+    @invalidating_lookup
     def addDatasetsToContainer(self, containerName, datasetNames, backEnd="rucio"):
         methodName = "addDatasetsToContainer"
         methodName += f" pid={self.pid}"
@@ -909,6 +965,7 @@ class AtlasDDMClient(DDMClientBase):
         return self.SC_SUCCEEDED, latestDBR
 
     # freeze dataset
+    @invalidating_lookup
     def freezeDataset(self, datasetName, ignoreUnknown=False):
         methodName = "freezeDataset"
         methodName += f" pid={self.pid}"
@@ -963,6 +1020,7 @@ class AtlasDDMClient(DDMClientBase):
             return self.SC_FAILED, err_msg
 
     # set dataset metadata
+    @invalidating_lookup
     def setDatasetMetadata(self, datasetName, metadataName, metadaValue):
         methodName = "setDatasetMetadata"
         methodName += f" pid={self.pid}"
@@ -987,6 +1045,7 @@ class AtlasDDMClient(DDMClientBase):
         return self.SC_SUCCEEDED, True
 
     # register location
+    @invalidating_lookup
     def registerDatasetLocation(
         self, datasetName, location, lifetime=None, owner=None, backEnd="rucio", activity=None, grouping=None, weight=None, copies=1, ignore_availability=True
     ):
@@ -1045,6 +1104,7 @@ class AtlasDDMClient(DDMClientBase):
         return self.SC_SUCCEEDED, True
 
     # delete dataset
+    @invalidating_lookup
     def deleteDataset(self, datasetName, emptyOnly, ignoreUnknown=False):
         methodName = "deleteDataset"
         methodName += f" pid={self.pid}"
@@ -1191,6 +1251,7 @@ class AtlasDDMClient(DDMClientBase):
         return retMap
 
     # delete files from dataset
+    @invalidating_lookup
     def deleteFilesFromDataset(self, datasetName, filesToDelete):
         methodName = "deleteFilesFromDataset"
         methodName += f" pid={self.pid}"
@@ -1236,7 +1297,15 @@ class AtlasDDMClient(DDMClientBase):
         scope, name = self.extract_scope(raw_name)
         return f"{scope}:{name}"
 
+    # normalize DID to be used as a key of the lookup cache
+    def normalize_did(self, did):
+        try:
+            return self.get_did_str(did)
+        except Exception:
+            return did
+
     # open dataset
+    @invalidating_lookup
     def openDataset(self, datasetName):
         methodName = "openDataset"
         methodName += f" pid={self.pid}"
@@ -0,0 +1,271 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from pandajedi.jedicore.ResultCache import ResultCacheClient
+
+# max lifetime in seconds of entries in the per-process tier when the shared tier is available,
+# since invalidation in a process doesn't reach the per-process tiers of other processes
+LOCAL_TTL_WITH_SHARED_TIER = 30
+
+# default lifetime in seconds for each call type
+DEFAULT_LOOKUP_TTL = "getDatasetMetaData:60,listDatasetReplicas:120,listDatasetsInContainer:120"
+
+
+# in-memory cache with TTL and LRU eviction
+class TTLCache:
+    """
+    Thread-safe cache with TTL and a bound on the number of entries. Values must not be modified by callers
+    since they are shared
+    """
+
+    # constructor
+    def __init__(self, max_entries, ttl):
+        self.maxEntries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # key -> (expiry, value)
+        self.entries = OrderedDict()
+        self.nHits = 0
+        self.nMisses = 0
+
+    # look up a key. return (True, value) if found, or (False, None)
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    # look up without lock
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self.entries.move_to_end(key)
+                self.nHits += 1
+                return True, entry[1]
+            del self.entries[key]
+        self.nMisses += 1
+        return False, None
+
+    # look up keys. return a map of found keys to values and the list of missing keys
+    def get_many(self, keys):
+        found_map = {}
+        missing_list = []
+        with self.lock:
+            for key in keys:
+                is_found, value = self._get(key)
+                if is_found:
+                    found_map[key] = value
+                else:
+                    missing_list.append(key)
+        return found_map, missing_list
+
+    # put a value
+    def put(self, key, value, ttl=None):
+        self.put_many([(key, value)], ttl)
+
+    # put values
+    def put_many(self, items, ttl=None):
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0 or self.maxEntries <= 0:
+            return
+        expiry = time.monotonic() + ttl
+        with self.lock:
+            for key, value in items:
+                self.entries[key] = (expiry, value)
+                self.entries.move_to_end(key)
+            # evict least recently used entries
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    # remove a key
+    def invalidate(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    # remove keys for which a function returns True
+    def invalidate_matching(self, func):
+        with self.lock:
+            for key in [key for key in self.entries if func(key)]:
+                del self.entries[key]
+
+    # remove all keys
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    # get metrics
+    def get_metrics(self):
+        with self.lock:
+            n_calls = self.nHits + self.nMisses
+            return {
+                "n_entries": len(self.entries),
+                "max_entries": self.maxEntries,
+                "hits": self.nHits,
+                "misses": self.nMisses,
+                "hit_rate": self.nHits / n_calls if n_calls else 0,
+            }
+
+
+# parse a string of call_type:ttl,call_type:ttl,...
+def parse_ttl_map(ttl_str):
+    ttl_map = {}
+    for item in ttl_str.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        call_type, ttl = item.split(":")
+        ttl_map[call_type.strip()] = int(ttl)
+    return ttl_map
+
+
+# cache of DDM lookups keyed by DID
+class DDMLookupCache:
+    """
+    Two-tier cache of DDM lookups. The per-process tier is an LRU with TTL in each DDM client process.
+    The shared tier is the result cache of CommandSendInterface shared by all DDM client processes for the VO,
+    which also coalesces concurrent identical lookups. Only successful results are cached
+    """
+
+    # constructor
+    def __init__(self, ttl_map, max_entries):
+        # call type -> lifetime in seconds
+        self.ttlMap = ttl_map
+        self.localCache = TTLCache(max_entries, 0)
+        self.lock = threading.Lock()
+        # call type -> {"local_hits", "shared_hits", "misses"}
+        self.stats = {}
+
+    # count an event
+    def count_stat(self, call_type, stat_name):
+        with self.lock:
+            self.stats.setdefault(call_type, {"local_hits": 0, "shared_hits": 0, "misses": 0})
+            self.stats[call_type][stat_name] += 1
+
+    # make key in the shared tier. the DID comes first for invalidation by prefix
+    def make_shared_key(self, did, call_type, args, kwargs):
+        return f"ddm|{did}|{call_type}|{repr(args)}|{repr(sorted(kwargs.items()))}"
+
+    # call a function with caching
+    def call(self, call_type, did, func, args, kwargs, is_success, shared_cache=None):
+        """
+        Call a DDM lookup through the cache
+
+        :param call_type: name of the lookup
+        :param did: DID as scope:name
+        :param func: function without arguments to call on a cache miss
+        :param args: list of arguments of the lookup other than the DID, to make the key
+        :param kwargs: dict of keyword arguments of the lookup, to make the key
+        :param is_success: function to check if a result can be cached
+        :param shared_cache: ResultCacheClient for the shared tier, or None
+        :return: result of the function
+        """
+        ttl = self.ttlMap.get(call_type, 0)
+        if ttl <= 0:
+            return func()
+        # per-process tier
+        local_key = (did, call_type, repr(args), repr(sorted(kwargs.items())))
+        is_hit, value = self.localCache.get(local_key)
+        if is_hit:
+            self.count_stat(call_type, "local_hits")
+            return value
+        local_ttl = ttl
+        shared_key = None
+        if shared_cache is not None:
+            local_ttl = min(ttl, LOCAL_TTL_WITH_SHARED_TIER)
+            # shared tier. the caller has to execute the lookup on a miss
+            try:
+                shared_key = self.make_shared_key(did, call_type, args, kwargs)
+                is_hit, value = shared_cache.get(shared_key, f"ddm.{call_type}")
+                if is_hit:
+                    self.count_stat(call_type, "shared_hits")
+                    self.localCache.put(local_key, value, local_ttl)
+                    return value
+            except Exception:
+                shared_key = None
+        self.count_stat(call_type, "misses")
+        value = None
+        try:
+            value = func()
+        finally:
+            succeeded = value is not None and is_success(value)
+            if shared_key is not None:
+                try:
+                    if succeeded:
+                        shared_cache.put(shared_key, f"ddm.{call_type}", ttl, value)
+                    else:
+                        shared_cache.abort(shared_key)
+                except Exception:
+                    pass
+        if succeeded:
+            self.localCache.put(local_key, value, local_ttl)
+        return value
+
+    # remove all cached lookups for a DID
+    def invalidate(self, did, shared_cache=None):
+        self.localCache.invalidate_matching(lambda key: key[0] == did)
+        if shared_cache is not None:
+            try:
+                shared_cache.invalidatePrefix(f"ddm|{did}|")
+            except Exception:
+                pass
+
+    # get metrics
+    def get_metrics(self, shared_cache=None):
+        with self.lock:
+            call_stats = {}
+            for call_type, stat in self.stats.items():
+                n_calls = stat["local_hits"] + stat["shared_hits"] + stat["misses"]
+                call_stats[call_type] = dict(stat, hit_rate=(stat["local_hits"] + stat["shared_hits"]) / n_calls if n_calls else 0)
+        metrics = {"local": self.localCache.get_metrics(), "calls": call_stats}
+        if shared_cache is not None:
+            try:
+                shared_metrics = shared_cache.getMetrics()
+                metrics["shared"] = {k: v for k, v in shared_metrics["methods"].items() if k.startswith("ddm.")}
+            except Exception:
+                pass
+        return metrics
+
+
+# get the shared tier if the result cache of the process is shared with other processes
+def get_shared_tier(ddm_client):
+    result_cache = getattr(ddm_client, "resultCache", None)
+    if isinstance(result_cache, ResultCacheClient):
+        return result_cache
+    return None
+
+
+# decorator of DDM client methods to cache lookups. the first argument of the method must be a DID
+def cached_lookup(method):
+    call_type = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, did, *args, **kwargs):
+        ddm_cache = getattr(self, "ddmCache", None)
+        if ddm_cache is None:
+            return method(self, did, *args, **kwargs)
+        return ddm_cache.call(
+            call_type,
+            self.normalize_did(did),
+            functools.partial(method, self, did, *args, **kwargs),
+            args,
+            kwargs,
+            lambda value: value[0] == self.SC_SUCCEEDED,
+            get_shared_tier(self),
+        )
+
+    return wrapper
+
+
+# decorator of DDM client methods to invalidate cached lookups of a DID which the method changes.
+# the first argument of the method must be a DID
+def invalidating_lookup(method):
+    @functools.wraps(method)
+    def wrapper(self, did, *args, **kwargs):
+        try:
+            return method(self, did, *args, **kwargs)
+        finally:
+            self.invalidate_ddm_cache(did)
+
+    return wrapper
@@ -1,11 +1,24 @@
+from pandajedi.jediconfig import jedi_config
 from pandajedi.jedicore.Interaction import CommandReceiveInterface
 
+from .DDMCache import DEFAULT_LOOKUP_TTL, DDMLookupCache, get_shared_tier, parse_ttl_map
+
 
 # base class to interact with DDM
 class DDMClientBase(CommandReceiveInterface):
     # constructor
     def __init__(self, con):
         CommandReceiveInterface.__init__(self, con)
+        # cache of DDM lookups
+        if hasattr(jedi_config.ddm, "lookupCacheTTL"):
+            tmp_ttl_str = jedi_config.ddm.lookupCacheTTL
+        else:
+            tmp_ttl_str = DEFAULT_LOOKUP_TTL
+        if hasattr(jedi_config.ddm, "lookupCacheSize"):
+            tmp_size = jedi_config.ddm.lookupCacheSize
+        else:
+            tmp_size = 10000
+        self.ddmCache = DDMLookupCache(parse_ttl_map(tmp_ttl_str or ""), tmp_size)
 
     # list dataset/container
     def listDatasets(self, datasetName, ignorePandaDS=True):
@@ -14,3 +27,16 @@ class DDMClientBase(CommandReceiveInterface):
     # check endpoint
     def check_endpoint(self, rse):
         return self.SC_SUCCEEDED, (True, None)
+
+    # normalize DID to be used as a key of the lookup cache
+    def normalize_did(self, did):
+        return did
+
+    # invalidate cached lookups for a DID. to be called when JEDI changes the DID or its replicas
+    def invalidate_ddm_cache(self, did):
+        self.ddmCache.invalidate(self.normalize_did(did), get_shared_tier(self))
+        return self.SC_SUCCEEDED, True
+
+    # get metrics of the lookup cache
+    def get_ddm_cache_metrics(self):
+        return self.SC_SUCCEEDED, self.ddmCache.get_metrics(get_shared_tier(self))
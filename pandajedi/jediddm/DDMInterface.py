@@ -10,6 +10,11 @@ class DDMInterface:
 
     # setup interface
     def setupInterface(self):
+        # size of the result cache shared by DDM client processes for each VO, used as the shared tier of the lookup cache. 0 to disable
+        if hasattr(jedi_config.ddm, "resultCacheSize"):
+            resultCacheSize = jedi_config.ddm.resultCacheSize * 1024 * 1024
+        else:
+            resultCacheSize = 0
         # parse config
         for configStr in jedi_config.ddm.modConfig.split(","):
             configStr = configStr.strip()
@@ -34,7 +39,7 @@ class DDMInterface:
                 continue
             # add VO interface
             if active:
-                voIF = Interaction.CommandSendInterface(vo, maxSize, moduleName, className)
+                voIF = Interaction.CommandSendInterface(vo, maxSize, moduleName, className, resultCacheSize)
                 voIF.initialize()
             else:
                 voIF = None
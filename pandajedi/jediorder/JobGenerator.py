@@ -9,11 +9,11 @@ import sys
 import time
 import traceback
 from typing import Any
-from urllib.parse import unquote
 
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 
+from pandajedi.jedibrokerage.BrokerageSnapshot import BrokerageSnapshotHolder
 from pandajedi.jediconfig import jedi_config
 from pandajedi.jedicore import Interaction
 from pandajedi.jedicore.MsgWrapper import MsgWrapper
@@ -35,6 +35,7 @@ from pandaserver.userinterface import Client as PandaClient
 
 from .JediKnight import JediKnight
 from .JobBroker import JobBroker
+from .JobParamsTemplate import compile_template
 from .JobSplitter import JobSplitter
 from .JobThrottler import JobThrottler
 from .TaskSetupper import TaskSetupper
@@ -192,6 +193,12 @@ class JobGenerator(JediKnight):
         except AttributeError:
             inactive_poll_probability = 0.25
 
+        # staleness bound in seconds of the snapshot of global state used by brokerage. 0 to disable
+        try:
+            brokerage_snapshot_lifetime = jedi_config.jobgen.brokerageSnapshotLifetime
+        except AttributeError:
+            brokerage_snapshot_lifetime = 60
+
         # go into main loop
         while True:
             startTime = naive_utcnow()
@@ -216,6 +223,8 @@ class JobGenerator(JediKnight):
                 # get TaskSetupper
                 taskSetupper = TaskSetupper(self.vos, self.prodSourceLabels)
                 taskSetupper.initializeMods(self.taskBufferIF, self.ddmIF)
+                # snapshot of global state shared by brokerage in this cycle
+                brokerage_snapshot_holder = BrokerageSnapshotHolder(self.taskBufferIF, brokerage_snapshot_lifetime)
                 # loop over all vos
                 tmpLog.debug("go into loop")
                 for vo in self.vos:
@@ -408,6 +417,7 @@ class JobGenerator(JediKnight):
                                                     lackOfJobs,
                                                     resource_types,
                                                     test_mode=self.test_mode,
+                                                    brokerage_snapshot_holder=brokerage_snapshot_holder,
                                                 )
                                                 globalThreadPool.add(thr)
                                                 thr.start()
@@ -525,6 +535,7 @@ class JobGeneratorThread(WorkerThread):
         lackOfJobs,
         resource_types,
         test_mode=False,
+        brokerage_snapshot_holder=None,
     ):
         # initialize worker with no semaphore
         WorkerThread.__init__(self, None, threadPool, logger)
@@ -550,6 +561,7 @@ class JobGeneratorThread(WorkerThread):
         self.resource_types = resource_types
         self.time_profile_level = TIME_PROFILE_OFF
         self.test_mode = test_mode
+        self.brokerage_snapshot_holder = brokerage_snapshot_holder
 
     # main
     def runImpl(self):
@@ -630,6 +642,12 @@ class JobGeneratorThread(WorkerThread):
                             jobBrokerCore.setLockID(self.pid, self.ident)
                             # set common dict
                             jobBrokerCore.set_task_common_dict(task_common_dict)
+                            # set snapshot of global state
+                            if self.brokerage_snapshot_holder is not None:
+                                brokerage_snapshot = self.brokerage_snapshot_holder.get_snapshot()
+                            else:
+                                brokerage_snapshot = None
+                            jobBrokerCore.set_snapshot(brokerage_snapshot)
                         # read task params if necessary
                         if taskSpec.useLimitedSites():
                             tmpStat, taskParamMap = self.readTaskParams(taskSpec, taskParamMap, tmpLog)
@@ -649,12 +667,19 @@ class JobGeneratorThread(WorkerThread):
                                 lockCounter = True
                             tmpLog.debug(main_stop_watch.get_elapsed_time("brokerage"))
                             tmpLog.debug(f"run brokerage with {jobBroker.getClassName(taskSpec.vo, taskSpec.prodSourceLabel)}")
+                            brokerage_start_time = time.monotonic()
                             try:
                                 tmpStat, inputChunk = jobBroker.doBrokerage(taskSpec, cloudName, inputChunk, taskParamMap)
                             except Exception:
                                 errtype, errvalue = sys.exc_info()[:2]
                                 tmpLog.error(f"brokerage crashed with {errtype.__name__}:{errvalue} {traceback.format_exc()}")
                                 tmpStat = Interaction.SC_FAILED
+                            # latency per chunk to compare with and without snapshot
+                            if brokerage_snapshot is not None:
+                                tmpMsg = f"with snapshot {brokerage_snapshot.dump()}"
+                            else:
+                                tmpMsg = "without snapshot"
+                            tmpLog.debug(f"brokerage took {time.monotonic() - brokerage_start_time:.3f} sec {tmpMsg}")
                             if tmpStat != Interaction.SC_SUCCEEDED:
                                 nBrokergeFailed += 1
                                 if inputChunk is not None and inputChunk.hasCandidatesForJumbo():
@@ -2260,19 +2285,6 @@ class JobGeneratorThread(WorkerThread):
             streamName = streamName.split("|")[0]
             streamLFNsMap.setdefault(streamName, [])
             streamLFNsMap[streamName].append(tmpFileSpec.lfn)
-        # extract placeholders with range expression, e.g., IN[0:2]
-        for tmpMatch in re.finditer("\$\{([^\}]+)\}", parTemplate):
-            tmpPatt = tmpMatch.group(1)
-            # split to stream name and range expression
-            tmpStRaMatch = re.search("([^\[]+)(.*)", tmpPatt)
-            if tmpStRaMatch is not None:
-                tmpStream = tmpStRaMatch.group(1)
-                tmpRange = tmpStRaMatch.group(2)
-                if tmpPatt != tmpStream and tmpStream in streamLFNsMap:
-                    try:
-                        exec(f"streamLFNsMap['{tmpPatt}']=streamLFNsMap['{tmpStream}']{tmpRange}", globals())
-                    except Exception:
-                        pass
         # loop over all streams to collect transient and final steams
         transientStreamCombo = {}
         streamToDelete = {}
@@ -2301,116 +2313,7 @@ class JobGeneratorThread(WorkerThread):
                 del streamLFNsMap[streamName]
             except Exception:
                 pass
-        # loop over all placeholders
-        if self.time_profile_level >= TIME_PROFILE_DEEP:
-            tmp_log.debug(stop_watch.get_elapsed_time("placeholders"))
-        for tmpMatch in re.finditer("\$\{([^\}]+)\}", parTemplate):
-            placeHolder = tmpMatch.group(1)
-            # remove decorators
-            streamNames = placeHolder.split("/")[0]
-            streamNameList = streamNames.split(",")
-            listLFN = []
-            for streamName in streamNameList:
-                if streamName in streamLFNsMap:
-                    listLFN += streamLFNsMap[streamName]
-            if listLFN != []:
-                decorators = re.sub("^" + streamNames, "", placeHolder)
-                # long format
-                if "/L" in decorators:
-                    longLFNs = ""
-                    for tmpLFN in listLFN:
-                        if "/A" in decorators:
-                            longLFNs += "'"
-                        longLFNs += tmpLFN
-                        if "/A" in decorators:
-                            longLFNs += "'"
-                        if "/S" in decorators:
-                            # use white-space as separator
-                            longLFNs += " "
-                        else:
-                            longLFNs += ","
-                    if taskSpec.usingJumboJobs():
-                        parTemplate = parTemplate.replace("${" + placeHolder + "}", "tmpin__cnt_" + streamDsMap[streamName])
-                    else:
-                        longLFNs = longLFNs[:-1]
-                        parTemplate = parTemplate.replace("${" + placeHolder + "}", longLFNs)
-                    continue
-                # list to string
-                if "/T" in decorators:
-                    parTemplate = parTemplate.replace("${" + placeHolder + "}", str(listLFN))
-                    continue
-                # write to file
-                if "/F" in decorators:
-                    parTemplate = parTemplate.replace("${" + placeHolder + "}", "tmpin_" + streamDsMap[streamName])
-                # single file
-                if len(listLFN) == 1:
-                    # just replace with the original file name
-                    replaceStr = listLFN[0]
-                    parTemplate = parTemplate.replace("${" + streamNames + "}", replaceStr)
-                    # encoded
-                    encStreamName = streamNames + "/E"
-                    replaceStr = unquote(replaceStr)
-                    parTemplate = parTemplate.replace("${" + encStreamName + "}", replaceStr)
-                    # mathematics
-                    if "/M" in decorators:
-                        tmp_m = re.search(r"/M\[([^\]]+)\]", decorators)
-                        if tmp_m:
-                            tmp_formula = tmp_m.group(1).replace("#", listLFN[0])
-                            replaceStr = str(eval(tmp_formula))
-                            parTemplate = parTemplate.replace("${" + placeHolder + "}", replaceStr)
-                else:
-                    # compact format
-                    compactLFNs = []
-                    # remove attempt numbers
-                    fullLFNList = ""
-                    for tmpLFN in listLFN:
-                        # keep full LFNs
-                        fullLFNList += f"{tmpLFN},"
-                        compactLFNs.append(re.sub("\.\d+$", "", tmpLFN))
-                    fullLFNList = fullLFNList[:-1]
-                    # find head and tail to convert file.1.pool,file.2.pool,file.4.pool to file.[1,2,4].pool
-                    tmpHead = ""
-                    tmpTail = ""
-                    tmpLFN0 = compactLFNs[0]
-                    tmpLFN1 = compactLFNs[1]
-                    i = 0
-                    for s1, s2 in zip(tmpLFN0, tmpLFN1):
-                        if s1 != s2:
-                            break
-                        i += 1
-                        tmpHead = tmpLFN0[:i]
-                    i = 0
-                    for s1, s2 in zip(tmpLFN0[::-1], tmpLFN1[::-1]):
-                        if s1 != s2:
-                            break
-                        i += 1
-                        tmpTail = tmpLFN0[-i:]
-                    # remove numbers : ABC_00,00_XYZ -> ABC_,_XYZ
-                    tmpHead = re.sub("\d*$", "", tmpHead)
-                    tmpTail = re.sub("^\d*", "", tmpTail)
-                    # create compact parameter
-                    compactPar = f"{tmpHead}["
-                    for tmpLFN in compactLFNs:
-                        # extract number
-                        tmpLFN = re.sub(f"^{tmpHead}", "", tmpLFN)
-                        tmpLFN = re.sub(f"{tmpTail}$", "", tmpLFN)
-                        compactPar += f"{tmpLFN},"
-                    compactPar = compactPar[:-1]
-                    compactPar += f"]{tmpTail}"
-                    # check contents in []
-                    conMatch = re.search("\[([^\]]+)\]", compactPar)
-                    if conMatch is not None and re.search("^[\d,]+$", conMatch.group(1)) is not None:
-                        # replace with compact format
-                        replaceStr = compactPar
-                    else:
-                        # replace with full format since [] contains non digits
-                        replaceStr = fullLFNList
-                    parTemplate = parTemplate.replace("${" + streamNames + "}", replaceStr)
-                    # encoded
-                    encStreamName = streamNames + "/E"
-                    replaceStr = unquote(fullLFNList)
-                    parTemplate = parTemplate.replace("${" + encStreamName + "}", replaceStr)
-        # replace params related to transient files
+        # make params related to transient files
         if self.time_profile_level >= TIME_PROFILE_DEEP:
             tmp_log.debug(stop_watch.get_elapsed_time("transient files"))
         replaceStrMap = {}
@@ -2437,37 +2340,11 @@ class JobGeneratorThread(WorkerThread):
             if streamNameBase not in replaceStrMap:
                 replaceStrMap[streamNameBase] = ""
             replaceStrMap[streamNameBase] += f"{replaceStr} "
-        for streamNameBase, replaceStr in replaceStrMap.items():
-            targetName = "${TRN_" + streamNameBase + ":" + streamNameBase + "}"
-            if targetName in parTemplate:
-                parTemplate = parTemplate.replace(targetName, replaceStr)
-                # remove outputs with empty input files
-                for emptyStream in emptyStreamMap[streamNameBase]:
-                    tmpFileIdx = 0
-                    for tmpJobFileSpec in jobFileList:
-                        if tmpJobFileSpec.lfn in streamLFNsMap[emptyStream]:
-                            jobFileList.pop(tmpFileIdx)
-                            break
-                        tmpFileIdx += 1
-        # remove outputs and params for deleted streams
-        for streamName, deletedLFNs in streamToDelete.items():
-            # remove params
-            parTemplate = re.sub("--[^=]+=\$\{" + streamName + "\}", "", parTemplate)
-            # remove output files
-            if deletedLFNs == []:
-                continue
-            tmpFileIdx = 0
-            for tmpJobFileSpec in jobFileList:
-                if tmpJobFileSpec.lfn in deletedLFNs:
-                    jobFileList.pop(tmpFileIdx)
-                    break
-                tmpFileIdx += 1
-        # replace placeholders for numbers
-        if self.time_profile_level >= TIME_PROFILE_DEEP:
-            tmp_log.debug(stop_watch.get_elapsed_time("numbers"))
+        transientParams = [("TRN_" + streamNameBase + ":" + streamNameBase, replaceStr) for streamNameBase, replaceStr in replaceStrMap.items()]
+        # params for numbers
         if serialNr is None:
             serialNr = 0
-        for streamName, parVal in [
+        numberParams = [
             ("SN", serialNr),
             ("SN/P", f"{serialNr:06d}"),
             ("RNDMSEED", rndmSeed),
@@ -2476,12 +2353,55 @@ class JobGeneratorThread(WorkerThread):
             ("FIRSTEVENT", firstEvent),
             ("SURL", sourceURL),
             ("ATTEMPTNR", jobSpec.attemptNr),
-        ] + paramList:
-            # ignore undefined
-            if parVal is None:
+        ] + paramList
+        # replace placeholders for streams, transient files, and numbers in one pass using the template compiled once
+        if self.time_profile_level >= TIME_PROFILE_DEEP:
+            tmp_log.debug(stop_watch.get_elapsed_time("placeholders"))
+        compiledTemplate = compile_template(parTemplate)
+        rendered = None
+        # params for deleted streams are removed with regular expressions before numbers are replaced
+        if not streamToDelete:
+            rendered = compiledTemplate.render_with_values(streamLFNsMap, streamDsMap, taskSpec.usingJumboJobs(), transientParams + numberParams)
+        if rendered is not None:
+            parTemplate, replacedNames = rendered
+        else:
+            # replace sequentially
+            parTemplate = compiledTemplate.render(streamLFNsMap, streamDsMap, taskSpec.usingJumboJobs())
+            replacedNames = set()
+            for targetName, replaceStr in transientParams:
+                if "${" + targetName + "}" in parTemplate:
+                    parTemplate = parTemplate.replace("${" + targetName + "}", replaceStr)
+                    replacedNames.add(targetName)
+            # remove params for deleted streams
+            for streamName in streamToDelete:
+                parTemplate = re.sub("--[^=]+=\$\{" + streamName + "\}", "", parTemplate)
+            for streamName, parVal in numberParams:
+                # ignore undefined
+                if parVal is None:
+                    continue
+                # replace
+                parTemplate = parTemplate.replace("${" + streamName + "}", str(parVal))
+        # remove outputs with empty input files
+        for streamNameBase in replaceStrMap:
+            if "TRN_" + streamNameBase + ":" + streamNameBase not in replacedNames:
                 continue
-            # replace
-            parTemplate = parTemplate.replace("${" + streamName + "}", str(parVal))
+            for emptyStream in emptyStreamMap[streamNameBase]:
+                tmpFileIdx = 0
+                for tmpJobFileSpec in jobFileList:
+                    if tmpJobFileSpec.lfn in streamLFNsMap[emptyStream]:
+                        jobFileList.pop(tmpFileIdx)
+                        break
+                    tmpFileIdx += 1
+        # remove outputs for deleted streams
+        for streamName, deletedLFNs in streamToDelete.items():
+            if deletedLFNs == []:
+                continue
+            tmpFileIdx = 0
+            for tmpJobFileSpec in jobFileList:
+                if tmpJobFileSpec.lfn in deletedLFNs:
+                    jobFileList.pop(tmpFileIdx)
+                    break
+                tmpFileIdx += 1
         # replace unmerge files
         for jobFileSpec in jobFileList:
             if jobFileSpec.isUnMergedOutput():
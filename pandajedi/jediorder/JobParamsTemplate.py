@@ -0,0 +1,384 @@
+"""
+templates of job parameters compiled into literal and placeholder segments
+
+"""
+
+import ast
+import re
+from functools import lru_cache
+from urllib.parse import unquote
+
+# placeholders, e.g. ${IN/L}
+PLACEHOLDER_PATTERN = re.compile(r"\$\{([^\}]+)\}")
+
+# characters in values which could make new placeholders with adjacent text when substituted sequentially
+UNSAFE_CHARS = ("$", "{", "}")
+
+
+# name bound to the LFN in compiled formulas of /M
+FORMULA_LFN = "__lfn__"
+
+# LFNs which are bound to compiled formulas as integers, i.e. decimal literals
+FORMULA_INTEGER_PATTERN = re.compile(r"^(0+|[1-9]\d*)$")
+
+
+# compile a formula of /M
+def compile_formula(formula):
+    """
+    Compile a formula of /M once, where # is bound to the LFN instead of being replaced with the LFN in the text.
+    Used only for formulas where both give the same result
+
+    :param formula: formula where # stands for the LFN
+    :return: code object to be evaluated with FORMULA_LFN, or None if the formula needs to be evaluated as text
+    """
+    # the LFN followed by . is parsed as a float or invalid literal in the text
+    if FORMULA_LFN in formula or "#." in formula:
+        return None
+    expression = formula.replace("#", FORMULA_LFN)
+    try:
+        tree = ast.parse(expression, mode="eval")
+    except SyntaxError:
+        return None
+    # all # have to be names, e.g. not in string literals or attribute names
+    n_names = len([node for node in ast.walk(tree) if isinstance(node, ast.Name) and node.id == FORMULA_LFN])
+    if n_names != formula.count("#"):
+        return None
+    return compile(tree, "<formula>", "eval")
+
+
+# make the compact format of LFNs, e.g. file.1.pool,file.2.pool,file.4.pool to file.[1,2,4].pool
+def make_compact_lfns(list_lfn):
+    """
+    Make the compact and full formats of a list of LFNs
+
+    :param list_lfn: list of two or more LFNs
+    :return: tuple of (compact format, or full format if the compact format contains non digits in [], full format)
+    """
+    compactLFNs = []
+    # remove attempt numbers
+    fullLFNList = ""
+    for tmpLFN in list_lfn:
+        # keep full LFNs
+        fullLFNList += f"{tmpLFN},"
+        compactLFNs.append(re.sub(r"\.\d+$", "", tmpLFN))
+    fullLFNList = fullLFNList[:-1]
+    # find head and tail to convert file.1.pool,file.2.pool,file.4.pool to file.[1,2,4].pool
+    tmpHead = ""
+    tmpTail = ""
+    tmpLFN0 = compactLFNs[0]
+    tmpLFN1 = compactLFNs[1]
+    i = 0
+    for s1, s2 in zip(tmpLFN0, tmpLFN1):
+        if s1 != s2:
+            break
+        i += 1
+        tmpHead = tmpLFN0[:i]
+    i = 0
+    for s1, s2 in zip(tmpLFN0[::-1], tmpLFN1[::-1]):
+        if s1 != s2:
+            break
+        i += 1
+        tmpTail = tmpLFN0[-i:]
+    # remove numbers : ABC_00,00_XYZ -> ABC_,_XYZ
+    tmpHead = re.sub(r"\d*$", "", tmpHead)
+    tmpTail = re.sub(r"^\d*", "", tmpTail)
+    # create compact parameter
+    compactPar = f"{tmpHead}["
+    for tmpLFN in compactLFNs:
+        # extract number
+        tmpLFN = re.sub(f"^{tmpHead}", "", tmpLFN)
+        tmpLFN = re.sub(f"{tmpTail}$", "", tmpLFN)
+        compactPar += f"{tmpLFN},"
+    compactPar = compactPar[:-1]
+    compactPar += f"]{tmpTail}"
+    # check contents in []
+    conMatch = re.search(r"\[([^\]]+)\]", compactPar)
+    if conMatch is not None and re.search(r"^[\d,]+$", conMatch.group(1)) is not None:
+        # replace with compact format
+        return compactPar, fullLFNList
+    # replace with full format since [] contains non digits
+    return fullLFNList, fullLFNList
+
+
+# replace placeholders for streams one by one
+def substitute_placeholders(parTemplate, streamLFNsMap, streamDsMap, using_jumbo):
+    """
+    Replace placeholders for streams in the template by scanning and replacing each placeholder in the whole template.
+    Used for templates which cannot be compiled
+
+    :param parTemplate: template of job parameters
+    :param streamLFNsMap: map of stream name to list of LFNs
+    :param streamDsMap: map of stream name to dataset name
+    :param using_jumbo: True if the task uses jumbo jobs
+    :return: template with placeholders replaced
+    """
+    for tmpMatch in PLACEHOLDER_PATTERN.finditer(parTemplate):
+        placeHolder = tmpMatch.group(1)
+        # remove decorators
+        streamNames = placeHolder.split("/")[0]
+        streamNameList = streamNames.split(",")
+        listLFN = []
+        for streamName in streamNameList:
+            if streamName in streamLFNsMap:
+                listLFN += streamLFNsMap[streamName]
+        if listLFN != []:
+            decorators = re.sub("^" + streamNames, "", placeHolder)
+            # long format
+            if "/L" in decorators:
+                longLFNs = ""
+                for tmpLFN in listLFN:
+                    if "/A" in decorators:
+                        longLFNs += "'"
+                    longLFNs += tmpLFN
+                    if "/A" in decorators:
+                        longLFNs += "'"
+                    if "/S" in decorators:
+                        # use white-space as separator
+                        longLFNs += " "
+                    else:
+                        longLFNs += ","
+                if using_jumbo:
+                    parTemplate = parTemplate.replace("${" + placeHolder + "}", "tmpin__cnt_" + streamDsMap[streamName])
+                else:
+                    longLFNs = longLFNs[:-1]
+                    parTemplate = parTemplate.replace("${" + placeHolder + "}", longLFNs)
+                continue
+            # list to string
+            if "/T" in decorators:
+                parTemplate = parTemplate.replace("${" + placeHolder + "}", str(listLFN))
+                continue
+            # write to file
+            if "/F" in decorators:
+                parTemplate = parTemplate.replace("${" + placeHolder + "}", "tmpin_" + streamDsMap[streamName])
+            # single file
+            if len(listLFN) == 1:
+                # just replace with the original file name
+                replaceStr = listLFN[0]
+                parTemplate = parTemplate.replace("${" + streamNames + "}", replaceStr)
+                # encoded
+                encStreamName = streamNames + "/E"
+                replaceStr = unquote(replaceStr)
+                parTemplate = parTemplate.replace("${" + encStreamName + "}", replaceStr)
+                # mathematics
+                if "/M" in decorators:
+                    tmp_m = re.search(r"/M\[([^\]]+)\]", decorators)
+                    if tmp_m:
+                        tmp_formula = tmp_m.group(1).replace("#", listLFN[0])
+                        replaceStr = str(eval(tmp_formula))
+                        parTemplate = parTemplate.replace("${" + placeHolder + "}", replaceStr)
+            else:
+                # compact format
+                replaceStr, fullLFNList = make_compact_lfns(listLFN)
+                parTemplate = parTemplate.replace("${" + streamNames + "}", replaceStr)
+                # encoded
+                encStreamName = streamNames + "/E"
+                replaceStr = unquote(fullLFNList)
+                parTemplate = parTemplate.replace("${" + encStreamName + "}", replaceStr)
+    return parTemplate
+
+
+# placeholder parsed from a template
+class Placeholder:
+    # constructor
+    def __init__(self, name):
+        self.name = name
+        self.token = "${" + name + "}"
+        # stream names without decorators
+        self.stream_names = name.split("/")[0]
+        self.stream_name_list = self.stream_names.split(",")
+        # stream names are used as a regular expression as the template was substituted sequentially, which raises re.error
+        # for invalid expressions
+        decorators = re.sub("^" + self.stream_names, "", name)
+        self.is_long = "/L" in decorators
+        self.is_quoted = "/A" in decorators
+        self.is_space_separated = "/S" in decorators
+        self.is_string_list = "/T" in decorators
+        self.is_file = "/F" in decorators
+        self.is_plain = name == self.stream_names
+        self.is_encoded = name == self.stream_names + "/E"
+        self.formula = None
+        self.formula_code = None
+        if "/M" in decorators:
+            tmp_m = re.search(r"/M\[([^\]]+)\]", decorators)
+            if tmp_m:
+                self.formula = tmp_m.group(1)
+                self.formula_code = compile_formula(self.formula)
+
+    # evaluate the formula of /M for an LFN
+    def evaluate_formula(self, lfn):
+        if self.formula_code is not None and FORMULA_INTEGER_PATTERN.search(lfn):
+            return str(eval(self.formula_code, globals(), {FORMULA_LFN: int(lfn)}))
+        return str(eval(self.formula.replace("#", lfn)))
+
+    # get the value for streams. None if unresolved
+    def resolve(self, stream_lfns_map, stream_ds_map, using_jumbo):
+        list_lfn = []
+        for stream_name in self.stream_name_list:
+            if stream_name in stream_lfns_map:
+                list_lfn += stream_lfns_map[stream_name]
+        if not list_lfn:
+            return None
+        # the dataset name of the last stream is used
+        stream_name = self.stream_name_list[-1]
+        # long format
+        if self.is_long:
+            if using_jumbo:
+                return "tmpin__cnt_" + stream_ds_map[stream_name]
+            quote = "'" if self.is_quoted else ""
+            separator = " " if self.is_space_separated else ","
+            return separator.join(f"{quote}{lfn}{quote}" for lfn in list_lfn)
+        # list to string
+        if self.is_string_list:
+            return str(list_lfn)
+        value = None
+        # write to file
+        if self.is_file:
+            value = "tmpin_" + stream_ds_map[stream_name]
+        if len(list_lfn) == 1:
+            # single file
+            if self.is_plain:
+                value = list_lfn[0]
+            elif self.is_encoded:
+                value = unquote(list_lfn[0])
+            # mathematics, which is evaluated even if the placeholder is for a file
+            if self.formula is not None:
+                math_value = self.evaluate_formula(list_lfn[0])
+                if value is None:
+                    value = math_value
+        else:
+            # compact format
+            compact_lfns, full_lfns = make_compact_lfns(list_lfn)
+            if self.is_plain:
+                value = compact_lfns
+            elif self.is_encoded:
+                value = unquote(full_lfns)
+        return value
+
+
+# template compiled into segments
+class CompiledTemplate:
+    """
+    Template of job parameters split into literal strings and placeholders. Rendering gives the same result as substitute_placeholders,
+    which is used instead for templates where placeholders overlap other text
+    """
+
+    # constructor
+    def __init__(self, template):
+        self.template = template
+        # list of literal strings and placeholders
+        self.segments = []
+        # unique placeholders in order of appearance
+        self.placeholders = []
+        self.is_compiled = False
+        # number of occurrences of each placeholder
+        self.token_counts = token_counts = {}
+        self.placeholder_map = placeholder_map = {}
+        # cache of names checked with is_exact_placeholder
+        self.exact_names = {}
+        last_end = 0
+        for tmp_match in PLACEHOLDER_PATTERN.finditer(template):
+            name = tmp_match.group(1)
+            if tmp_match.start() > last_end:
+                self.segments.append(template[last_end : tmp_match.start()])
+            if name not in placeholder_map:
+                try:
+                    placeholder_map[name] = Placeholder(name)
+                except re.error:
+                    return
+                self.placeholders.append(placeholder_map[name])
+            self.segments.append(placeholder_map[name])
+            token_counts[placeholder_map[name].token] = token_counts.get(placeholder_map[name].token, 0) + 1
+            last_end = tmp_match.end()
+        if last_end < len(template):
+            self.segments.append(template[last_end:])
+        # all occurrences of strings to be replaced have to be placeholders to be substituted independently
+        for placeholder in self.placeholders:
+            for token in [placeholder.token, "${" + placeholder.stream_names + "}", "${" + placeholder.stream_names + "/E}"]:
+                if template.count(token) != token_counts.get(token, 0):
+                    return
+        self.is_compiled = True
+
+    # check if all occurrences of the text of a placeholder are the placeholder itself
+    def is_exact_placeholder(self, name):
+        if name not in self.exact_names:
+            token = "${" + name + "}"
+            self.exact_names[name] = self.template.count(token) == self.token_counts.get(token, 0)
+        return self.exact_names[name]
+
+    # resolve placeholders for streams. None if values could make new placeholders
+    def resolve_streams(self, stream_lfns_map, stream_ds_map, using_jumbo):
+        value_map = {}
+        for placeholder in self.placeholders:
+            value = placeholder.resolve(stream_lfns_map, stream_ds_map, using_jumbo)
+            if value is not None:
+                if any(c in value for c in UNSAFE_CHARS):
+                    return None
+                value_map[placeholder] = value
+        return value_map
+
+    # join segments with values
+    def join_segments(self, value_map):
+        return "".join(value_map.get(segment, segment.token) if isinstance(segment, Placeholder) else segment for segment in self.segments)
+
+    # render the template with values for streams
+    def render(self, stream_lfns_map, stream_ds_map, using_jumbo):
+        """
+        Replace placeholders for streams in the template
+
+        :param stream_lfns_map: map of stream name to list of LFNs
+        :param stream_ds_map: map of stream name to dataset name
+        :param using_jumbo: True if the task uses jumbo jobs
+        :return: template with placeholders replaced
+        """
+        value_map = None
+        if self.is_compiled:
+            value_map = self.resolve_streams(stream_lfns_map, stream_ds_map, using_jumbo)
+        if value_map is None:
+            return substitute_placeholders(self.template, stream_lfns_map, stream_ds_map, using_jumbo)
+        return self.join_segments(value_map)
+
+    # render the template with values for streams and other placeholders
+    def render_with_values(self, stream_lfns_map, stream_ds_map, using_jumbo, values):
+        """
+        Replace placeholders for streams, and then other placeholders with values, in one pass. The result is the same as
+        replacing placeholders for streams and then each of the other placeholders with str.replace, as long as no value
+        contains $, { or }, which is checked
+
+        :param stream_lfns_map: map of stream name to list of LFNs
+        :param stream_ds_map: map of stream name to dataset name
+        :param using_jumbo: True if the task uses jumbo jobs
+        :param values: list of tuples of placeholder name and value for placeholders not resolved with streams.
+                       The first value is used for duplicated names, and None values are ignored
+        :return: tuple of the template with placeholders replaced and set of names replaced with values,
+                 or None if the placeholders need to be replaced sequentially
+        """
+        if not self.is_compiled:
+            return None
+        value_map = self.resolve_streams(stream_lfns_map, stream_ds_map, using_jumbo)
+        if value_map is None:
+            return None
+        replaced_names = set()
+        checked_names = set()
+        for name, value in values:
+            # ignore undefined
+            if value is None or name in checked_names:
+                continue
+            checked_names.add(name)
+            if not self.is_exact_placeholder(name):
+                return None
+            placeholder = self.placeholder_map.get(name)
+            # not in the template or already replaced with a value for streams
+            if placeholder is None or placeholder in value_map:
+                continue
+            value = str(value)
+            if any(c in value for c in UNSAFE_CHARS):
+                return None
+            value_map[placeholder] = value
+            replaced_names.add(name)
+        return self.join_segments(value_map), replaced_names
+
+
+# compile a template once and reuse for jobs of the task
+@lru_cache(maxsize=1000)
+def compile_template(template):
+    return CompiledTemplate(template)
@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+
+from pandajedi.jediddm import AtlasDDMClient as atlas_ddm_client_module
+from pandajedi.jediddm.AtlasDDMClient import AtlasDDMClient
+from pandaserver.taskbuffer.JediDatasetSpec import JediDatasetSpec
+from pandaserver.taskbuffer.JediFileSpec import JediFileSpec
+from pandaserver.taskbuffer.SiteSpec import SiteSpec
+
+
+# Rucio client returning replicas after latency proportional to the number of DIDs
+class StubRucioClient:
+    # RSEs with replicas for each LFN
+    replica_map = {}
+    # latency in seconds for each call and for each DID
+    latency = (0.2, 0.0002)
+
+    def list_replicas(self, dids, resolve_archives=False):
+        time.sleep(self.latency[0] + self.latency[1] * len(dids))
+        for did in dids:
+            if did["name"] in self.replica_map:
+                yield {"scope": did["scope"], "name": did["name"], "rses": {rse: [] for rse in self.replica_map[did["name"]]}}
+
+
+# SiteMapper without cached files
+class StubSiteMapper:
+    def getSite(self, site_name):
+        return SiteSpec()
+
+
+# make a dataset with files spread over endpoints
+def make_dataset(n_files, endpoints):
+    dataset_spec = JediDatasetSpec()
+    dataset_spec.jediTaskID = 1
+    dataset_spec.datasetID = 1
+    dataset_spec.datasetName = "mc:mc.DAOD.benchmark"
+    dataset_spec.attributes = None
+    dataset_spec.Files = []
+    StubRucioClient.replica_map = {}
+    for i in range(n_files):
+        file_spec = JediFileSpec()
+        file_spec.lfn = f"DAOD.{i:08d}.pool.root"
+        file_spec.GUID = f"guid-{i}"
+        file_spec.scope = "mc"
+        dataset_spec.Files.append(file_spec)
+        StubRucioClient.replica_map[file_spec.lfn] = random.sample(endpoints, 3)
+    return dataset_spec
+
+
+# make a DDM client with stubs for DDM calls other than file replica lookup
+def make_ddm_client(n_threads, endpoints):
+    ddm_client = AtlasDDMClient(None)
+    ddm_client.nReplicaLookupThreads = n_threads
+    ddm_client.updateEndPointDict = lambda: None
+    ddm_client.getDatasetMetaData = lambda *args, **kwargs: (ddm_client.SC_SUCCEEDED, {"length": None, "did_type": "DATASET"})
+    incomplete_replica_map = {endpoint: [{"total": 10, "found": 1}] for endpoint in endpoints}
+    ddm_client.listDatasetReplicas = lambda *args, **kwargs: (ddm_client.SC_SUCCEEDED, incomplete_replica_map, {})
+    ddm_client.getSiteProperty = lambda *args: (ddm_client.SC_SUCCEEDED, False)
+    return ddm_client
+
+
+if __name__ == "__main__":
+    """
+    Measure getAvailableFiles with a stub Rucio client, comparing sequential lookups without cache,
+    concurrent lookups, and lookups with the replica cache warmed by a preceding call.
+    No Rucio server is needed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_files", type=int, default=100000, help="the number of files in the dataset")
+    parser.add_argument("--n_sites", type=int, default=200, help="the number of sites")
+    parser.add_argument("--n_threads", type=int, default=8, help="the number of lookup threads")
+    args = parser.parse_args()
+
+    atlas_ddm_client_module.RucioClient = StubRucioClient
+    endpoints = [f"ENDPOINT_{i}_DATADISK" for i in range(args.n_sites)]
+    site_endpoint_map = {f"SITE_{i}": [endpoint] for i, endpoint in enumerate(endpoints)}
+    dataset_spec = make_dataset(args.n_files, endpoints)
+
+    results = []
+    for label, n_threads, cache_ttl in [("sequential", 1, 0), ("concurrent", args.n_threads, 0), ("cached", args.n_threads, 120)]:
+        ddm_client = make_ddm_client(n_threads, endpoints)
+        ddm_client.fileReplicaCache.ttl = cache_ttl
+        if cache_ttl:
+            ddm_client.getAvailableFiles(dataset_spec, site_endpoint_map, StubSiteMapper())
+        t_start = time.time()
+        tmp_status, tmp_output = ddm_client.getAvailableFiles(dataset_spec, site_endpoint_map, StubSiteMapper())
+        t_total = time.time() - t_start
+        assert tmp_status == ddm_client.SC_SUCCEEDED, tmp_output
+        results.append({site: {k: len(v) for k, v in storage_type_files.items()} for site, storage_type_files in tmp_output.items()})
+        print(f"{label:10s}: {t_total:.2f} sec, cache {ddm_client.fileReplicaCache.get_metrics()}")
+    assert all(result == results[0] for result in results), "results are different"
@@ -0,0 +1,285 @@
+import argparse
+import random
+import time
+
+from pandajedi.jedibrokerage.AtlasAnalJobBroker import AtlasAnalJobBroker
+from pandajedi.jedibrokerage.AtlasProdJobBroker import AtlasProdJobBroker
+from pandajedi.jedibrokerage.JobBrokerBase import JobBrokerBase
+from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.taskbuffer import JobUtils
+from pandaserver.taskbuffer.SiteSpec import SiteSpec
+
+
+# SiteMapper with synthetic sites, which is not read from the database
+def make_site_mapper(n_sites):
+    site_mapper = SiteMapper.__new__(SiteMapper)
+    site_mapper.siteSpecList = {}
+    site_mapper.nuclei = {}
+    site_mapper.satellites = {}
+    for i in range(n_sites):
+        site_spec = SiteSpec()
+        site_spec.sitename = f"SITE_{i}"
+        # most sites pass most criteria as in production
+        site_spec.status = random.choices(["online", "standby", "brokeroff", "offline", "test"], weights=[86, 4, 4, 4, 2])[0]
+        site_spec.coreCount = random.choices([None, 0, 1, 8, 16, 64], weights=[2, 2, 30, 56, 8, 2])[0]
+        site_spec.maxrss = random.choices([None, 0, 2000, 16000, 64000], weights=[5, 5, 30, 50, 10])[0]
+        site_spec.minrss = random.choices([None, 0, 16000], weights=[10, 85, 5])[0]
+        # pseudo queues of unified queues
+        site_spec.is_unified = i % 10 == 0
+        site_spec.unified_name = random.choice([None, f"SITE_{i - i % 3}"])
+        site_mapper.siteSpecList[site_spec.sitename] = site_spec
+    return site_mapper
+
+
+# task buffer giving the SiteMapper to brokers
+class StubTaskBuffer:
+    def __init__(self, site_mapper):
+        self.site_mapper = site_mapper
+
+    def get_site_mapper(self):
+        return self.site_mapper
+
+
+# make a broker without loading maps from the database, since the site filters only need SiteMapper
+def make_broker(broker_class, task_buffer):
+    broker = broker_class.__new__(broker_class)
+    JobBrokerBase.__init__(broker, None, task_buffer)
+    return broker
+
+
+# loops of AtlasProdJobBroker before vectorisation
+def prod_status_loop(site_mapper, scanSiteList):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # skip unified queues
+        if tmpSiteSpec.is_unified:
+            continue
+        if tmpSiteSpec.status in ["online", "standby"]:
+            newScanSiteList.append(tmpSiteName)
+        else:
+            msg_map[tmpSiteSpec.get_unified_name()] = f"  skip site={tmpSiteSpec.get_unified_name()} due to status={tmpSiteSpec.status} criteria=-status"
+    return newScanSiteList, msg_map
+
+
+def prod_core_count_loop(site_mapper, scanSiteList, useMP, taskCoreCount, max_core_count):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # check at the site
+        if useMP == "any" or (useMP == "only" and tmpSiteSpec.coreCount > 1) or (useMP == "unuse" and tmpSiteSpec.coreCount in [0, 1, None]):
+            if max_core_count and tmpSiteSpec.coreCount and tmpSiteSpec.coreCount > max_core_count:
+                msg_map[tmpSiteSpec.get_unified_name()] = (
+                    f"  skip site={tmpSiteSpec.get_unified_name()} due to larger core count site:{tmpSiteSpec.coreCount} "
+                    f"than task_max={max_core_count} criteria=-max_cpucore"
+                )
+            else:
+                newScanSiteList.append(tmpSiteName)
+        else:
+            msg_map[tmpSiteSpec.get_unified_name()] = (
+                f"  skip site={tmpSiteSpec.get_unified_name()} due to core mismatch site:{tmpSiteSpec.coreCount} <> task:{taskCoreCount} criteria=-cpucore"
+            )
+    return newScanSiteList, msg_map
+
+
+def prod_memory_loop(site_mapper, scanSiteList, origMinRamCount, ramPerCore, baseRamCount):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # job memory requirement
+        minRamCount = origMinRamCount
+        if ramPerCore:
+            if tmpSiteSpec.coreCount not in [None, 0]:
+                minRamCount = origMinRamCount * tmpSiteSpec.coreCount
+            minRamCount += baseRamCount
+        # compensate
+        minRamCount = JobUtils.compensate_ram_count(minRamCount)
+        # site max memory requirement
+        site_maxmemory = 0
+        if tmpSiteSpec.maxrss not in [0, None]:
+            site_maxmemory = tmpSiteSpec.maxrss
+        # check at the site
+        if site_maxmemory not in [0, None] and minRamCount != 0 and minRamCount > site_maxmemory:
+            tmp_msg = f"  skip site={tmpSiteName} due to sue to insufficient RAM less than less than job's core-scaled requirement {minRamCount} MB "
+            tmp_msg += "criteria=-lowmemory"
+            msg_map[tmpSiteSpec.get_unified_name()] = tmp_msg
+            continue
+        # site min memory requirement
+        site_minmemory = 0
+        if tmpSiteSpec.minrss not in [0, None]:
+            site_minmemory = tmpSiteSpec.minrss
+        if site_minmemory not in [0, None] and minRamCount != 0 and minRamCount < site_minmemory:
+            tmp_msg = f"  skip site={tmpSiteName} due to RAM lower limit greater than than job's core-scaled requirement {minRamCount} MB "
+            tmp_msg += "criteria=-highmemory"
+            msg_map[tmpSiteSpec.get_unified_name()] = tmp_msg
+            continue
+        newScanSiteList.append(tmpSiteName)
+    return newScanSiteList, msg_map
+
+
+# loops of AtlasAnalJobBroker before vectorisation
+def anal_status_loop(site_mapper, scanSiteList, siteListPreAssigned, sitePreAssigned, preassignedSite):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # skip unified queues
+        if tmpSiteSpec.is_unified:
+            continue
+        # check site status
+        skipFlag = False
+        if tmpSiteSpec.status in ["offline"]:
+            skipFlag = True
+        elif tmpSiteSpec.status in ["brokeroff", "test"]:
+            if siteListPreAssigned:
+                pass
+            elif not sitePreAssigned:
+                skipFlag = True
+            elif preassignedSite not in [tmpSiteName, tmpSiteSpec.get_unified_name()]:
+                skipFlag = True
+        if not skipFlag:
+            newScanSiteList.append(tmpSiteName)
+        else:
+            tmp_unified_name = tmpSiteSpec.get_unified_name()
+            msg_map[tmp_unified_name] = f"  skip site={tmp_unified_name} due to status={tmpSiteSpec.status} criteria=-status"
+    return newScanSiteList, msg_map
+
+
+def anal_core_count_loop(site_mapper, scanSiteList, useMP, taskCoreCount, max_core_count):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # check at the site
+        if useMP == "any" or (useMP == "only" and tmpSiteSpec.coreCount > 1) or (useMP == "unuse" and tmpSiteSpec.coreCount in [0, 1, None]):
+            if max_core_count and tmpSiteSpec.coreCount and tmpSiteSpec.coreCount > max_core_count:
+                msg_map[tmpSiteSpec.get_unified_name()] = (
+                    f"  skip site={tmpSiteSpec.get_unified_name()} due to larger core count "
+                    f"site:{tmpSiteSpec.coreCount} than task_max={max_core_count} criteria=-max_cpucore"
+                )
+            else:
+                newScanSiteList.append(tmpSiteName)
+        else:
+            msg_map[tmpSiteSpec.get_unified_name()] = "  skip site=%s due to core mismatch cores_site=%s <> cores_task=%s criteria=-cpucore" % (
+                tmpSiteSpec.get_unified_name(),
+                tmpSiteSpec.coreCount,
+                taskCoreCount,
+            )
+    return newScanSiteList, msg_map
+
+
+def anal_memory_loop(site_mapper, scanSiteList, origMinRamCount, ramPerCore):
+    newScanSiteList = []
+    msg_map = {}
+    for tmpSiteName in scanSiteList:
+        tmpSiteSpec = site_mapper.getSite(tmpSiteName)
+        # scale RAM by nCores
+        minRamCount = origMinRamCount
+        if ramPerCore:
+            if tmpSiteSpec.coreCount not in [None, 0]:
+                minRamCount = origMinRamCount * tmpSiteSpec.coreCount
+        minRamCount = JobUtils.compensate_ram_count(minRamCount)
+        # site max memory requirement
+        site_maxmemory = 0
+        if tmpSiteSpec.maxrss not in [0, None]:
+            site_maxmemory = tmpSiteSpec.maxrss
+        if site_maxmemory not in [0, None] and minRamCount != 0 and minRamCount > site_maxmemory:
+            msg_map[tmpSiteSpec.get_unified_name()] = (
+                f"  skip site={tmpSiteSpec.get_unified_name()} due to insufficient RAM less than job's core-scaled requirement {minRamCount} MB criteria=-lowmemory"
+            )
+            continue
+        # site min memory requirement
+        site_minmemory = 0
+        if tmpSiteSpec.minrss not in [0, None]:
+            site_minmemory = tmpSiteSpec.minrss
+        if site_minmemory not in [0, None] and minRamCount != 0 and minRamCount < site_minmemory:
+            msg_map[tmpSiteSpec.get_unified_name()] = (
+                f"  skip site={tmpSiteSpec.get_unified_name()} due to RAM lower limit greater than job's core-scaled requirement {minRamCount} MB criteria=-highmemory"
+            )
+            continue
+        newScanSiteList.append(tmpSiteName)
+    return newScanSiteList, msg_map
+
+
+# make cases of site filters with the loop, the filter of the broker, and arguments
+def make_cases(site_mapper, prod_broker, anal_broker, scan_site_list, n_chunks):
+    # the loops compare None with 1 for useMP=only and raise TypeError, while the brokers reject sites without core count
+    scan_site_list_with_cores = [site_name for site_name in scan_site_list if site_mapper.getSite(site_name).coreCount is not None]
+    cases = []
+    for i in range(n_chunks):
+        use_mp = random.choice(["only", "unuse", "any"])
+        core_args = (
+            scan_site_list_with_cores if use_mp == "only" else scan_site_list,
+            use_mp,
+            random.choice([None, 0, 1, 8]),
+            random.choice([None, 0, 8, 16]),
+        )
+        ram_per_core = random.choice([True, False])
+        orig_min_ram_count = random.choice([500, 1000, 1999.5, 2000, 4000])
+        base_ram_count = random.choice([0, 500, 250.5])
+        site_list_pre_assigned = random.choice([True, False])
+        site_pre_assigned = random.choice([True, False])
+        preassigned_site = site_mapper.getSite(random.choice(scan_site_list)).get_unified_name() if random.random() < 0.5 else random.choice(scan_site_list)
+        cases += [
+            ("prod status", prod_status_loop, prod_broker.filter_sites_by_status, (scan_site_list,)),
+            ("prod core count", prod_core_count_loop, prod_broker.filter_sites_by_core_count, core_args),
+            ("prod memory", prod_memory_loop, prod_broker.filter_sites_by_memory, (scan_site_list, orig_min_ram_count, ram_per_core, base_ram_count)),
+            (
+                "anal status",
+                anal_status_loop,
+                anal_broker.filter_sites_by_status,
+                (scan_site_list, site_list_pre_assigned, site_pre_assigned, preassigned_site),
+            ),
+            ("anal core count", anal_core_count_loop, anal_broker.filter_sites_by_core_count, core_args),
+            ("anal memory", anal_memory_loop, anal_broker.filter_sites_by_memory, (scan_site_list, orig_min_ram_count, ram_per_core)),
+        ]
+    return cases
+
+
+if __name__ == "__main__":
+    """
+    Compare the site filters of AtlasProdJobBroker and AtlasAnalJobBroker with their per-site loops before vectorisation
+    on a synthetic SiteMapper, checking candidate lists and rejection messages. No database is needed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_sites", type=int, default=1000, help="the number of sites")
+    parser.add_argument("--n_chunks", type=int, default=200, help="the number of input chunks to broker")
+    args = parser.parse_args()
+
+    site_mapper = make_site_mapper(args.n_sites)
+    # include unknown sites to which SiteMapper gives the default SiteSpec
+    scan_site_list = list(site_mapper.siteSpecList) + ["UNKNOWN_SITE"]
+    task_buffer = StubTaskBuffer(site_mapper)
+    prod_broker = make_broker(AtlasProdJobBroker, task_buffer)
+    anal_broker = make_broker(AtlasAnalJobBroker, task_buffer)
+    cases = make_cases(site_mapper, prod_broker, anal_broker, scan_site_list, args.n_chunks)
+
+    t_start = time.time()
+    loop_results = [loop_func(site_mapper, *loop_args) for _, loop_func, _, loop_args in cases]
+    t_loop = time.time() - t_start
+
+    t_start = time.time()
+    broker_results = [filter_func(*filter_args) for _, _, filter_func, filter_args in cases]
+    t_broker = time.time() - t_start
+
+    n_diffs = 0
+    for (name, _, _, filter_args), (loop_site_list, loop_msg_map), (broker_site_list, broker_msg_map) in zip(cases, loop_results, broker_results):
+        # format all messages
+        broker_msg_map = dict(broker_msg_map.items())
+        if loop_site_list != broker_site_list or loop_msg_map != broker_msg_map:
+            n_diffs += 1
+            print(f"{name} is different for {filter_args[1:]}")
+            print(f"  candidates only in loop={set(loop_site_list) - set(broker_site_list)} only in broker={set(broker_site_list) - set(loop_site_list)}")
+            for key in set(loop_msg_map) | set(broker_msg_map):
+                if loop_msg_map.get(key) != broker_msg_map.get(key):
+                    print(f"  loop   : {loop_msg_map.get(key)}\n  broker : {broker_msg_map.get(key)}")
+    # sites without core count for useMP=only
+    for broker in [prod_broker, anal_broker]:
+        broker_site_list, _ = broker.filter_sites_by_core_count(scan_site_list, "only", 8, None)
+        assert not [site_name for site_name in broker_site_list if site_mapper.getSite(site_name).coreCount is None], "sites without core count for useMP=only"
+    assert n_diffs == 0, f"{n_diffs} results are different"
+    print(f"loop   : {t_loop / args.n_chunks * 1000:.2f} ms/chunk")
+    print(f"broker : {t_broker / args.n_chunks * 1000:.2f} ms/chunk including building columns once")
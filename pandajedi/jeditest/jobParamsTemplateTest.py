@@ -0,0 +1,325 @@
+import sys
+
+from pandajedi.jediorder import JobParamsTemplate
+from pandajedi.jediorder.JobGenerator import JobGeneratorThread
+from pandaserver.taskbuffer.FileSpec import FileSpec
+from pandaserver.taskbuffer.JediDatasetSpec import JediDatasetSpec
+from pandaserver.taskbuffer.JediFileSpec import JediFileSpec
+from pandaserver.taskbuffer.JediTaskSpec import JediTaskSpec
+from pandaserver.taskbuffer.JobSpec import JobSpec
+
+
+# make input datasets with files
+def make_in_sub_chunk(stream_lfns_list):
+    in_sub_chunk = []
+    for i, (stream_name, lfns) in enumerate(stream_lfns_list):
+        dataset_spec = JediDatasetSpec()
+        dataset_spec.datasetName = f"mc:mc.input{i}/"
+        dataset_spec.containerName = None
+        dataset_spec.streamName = stream_name
+        dataset_spec.type = "input" if i == 0 else "pseudo_input"
+        dataset_spec.masterID = None if i == 0 else 1
+        file_spec_list = []
+        for j, lfn in enumerate(lfns):
+            file_spec = JediFileSpec()
+            file_spec.lfn = lfn
+            file_spec.fsize = 100 - j
+            file_spec.startEvent = 10 * j
+            file_spec.endEvent = 10 * j + 9
+            file_spec.firstEvent = 1000 + 10 * j
+            file_spec_list.append(file_spec)
+        in_sub_chunk.append((dataset_spec, file_spec_list))
+    return in_sub_chunk
+
+
+# make output files
+def make_out_sub_chunk(stream_lfn_list):
+    out_sub_chunk = {}
+    job_file_list = []
+    for stream_name, lfn, to_merge in stream_lfn_list:
+        file_spec = FileSpec()
+        file_spec.lfn = lfn
+        file_spec.type = "log" if stream_name.startswith("LOG") else "output"
+        if to_merge:
+            file_spec.destinationDBlockToken = "TOMERGE"
+        out_sub_chunk[stream_name] = file_spec
+        job_file_list.append(file_spec)
+    return out_sub_chunk, job_file_list
+
+
+# cases of templates, input streams, output streams, and options
+IN_LFNS = ["EVNT.01234._000001.pool.root.1", "EVNT.01234._000002.pool.root.2", "EVNT.01234._000004.pool.root.1"]
+CASES = {
+    "single": (
+        "--inputFile=${IN} --enc=${IN/E} --len=${IN/M[len('#')+1]} --out=${OUTPUT0} --log=${LOG} --sn=${SN} --snp=${SN/P} "
+        "--skip=${SKIPEVENTS} --max=${MAXEVENTS} --first=${FIRSTEVENT} --attempt=${ATTEMPTNR} --surl=${SURL} --seq=${SEQNUMBER}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [("OUTPUT0", "HITS.01234._000001.pool.root", False), ("LOG", "log.01234._000001.job.log.tgz", False)],
+        {},
+    ),
+    "multi": (
+        "--inputFile=${IN} --enc=${IN/E} --long=${IN/L} --quoted=${IN/L/A} --spaced=${IN/L/S} --qs=${IN/L/A/S} --list=${IN/T} "
+        "--file=${IN/F} --both=${IN,IN2} --both_long=${IN,IN2/L} "
+        "--minbias=${IN2} --unknown=${NOSUCH}",
+        [("IN", IN_LFNS), ("IN2", ["minbias.A.1", "minbias.B.1"])],
+        [("OUTPUT0", "AOD.01234._000001.pool.root", False)],
+        {},
+    ),
+    "non_digit": (
+        "${IN} ${IN/E}",
+        [("IN", ["user.a.file_A.root", "user.a.file_B.root"])],
+        [],
+        {},
+    ),
+    "duplicated": (
+        "${IN} ${IN} ${IN/L} ${IN/F} ${IN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1", "EVNT.01234._000001.pool.root.1", "EVNT.01234._000003.pool.root.1"])],
+        [],
+        {},
+    ),
+    "unmerged_es": (
+        "--out=HITS.01234._000001.pool.root <PANDA_ES_ONLY>--eventService=True</PANDA_ES_ONLY> --in=${IN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [("OUTPUT0", "panda.um.HITS.01234._000001.pool.root", True)],
+        {"useEventService": False},
+    ),
+    "es": (
+        "--out=${OUTPUT0} <PANDA_ES_ONLY>--eventService=True</PANDA_ES_ONLY> --in=${IN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [("OUTPUT0", "HITS.01234._000001.pool.root", False)],
+        {"useEventService": True},
+    ),
+    "jumbo": (
+        "--inputFile=${IN/L} --outputFile=${OUTPUT0}",
+        [("IN", IN_LFNS)],
+        [("OUTPUT0", "HITS.01234._000001.pool.root", False)],
+        {"useJumbo": "W"},
+    ),
+    "merging": (
+        "--inputHITSFile=${TRN_OUTPUT:OUTPUT} --inputLogsFile=${TRN_LOG_MERGE:LOG_MERGE} --outputAODFile=${OUTPUT2} --skipped=${OUTPUT3}",
+        [("TRN_OUTPUT0", ["HITS.1._000001.pool.root.1", "HITS.1._000002.pool.root.1"]), ("TRN_OUTPUT1", []), ("TRN_LOG0", ["log.1._000001.tgz.1"])],
+        [
+            ("OUTPUT0", "HITS.1._000010.pool.root", False),
+            ("OUTPUT1", "RDO.1._000010.pool.root", False),
+            ("OUTPUT2", "AOD.1._000010.pool.root", False),
+            ("LOG_MERGE", "log.1._000010.tgz", False),
+        ],
+        {"isMerging": True},
+    ),
+    "multi_step": (
+        "--inputFile=${IN} --seq=${SEQNUMBER}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {"multiStepExec": {"preprocess": {"command": "${TRF}", "args": "--pre"}, "main": {"command": "${TRF}", "args": "${TRF_ARGS} --x"}}},
+    ),
+    "unresolved": (
+        "--inputFile=${IN/X}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {},
+    ),
+    "range": (
+        "--inputFile=${IN} --outputFile=${OUTPUT0[0:1]} --first=${OUTPUT0[0]}",
+        [("IN", IN_LFNS)],
+        [("OUTPUT0", "AOD.01234._000001.pool.root", False)],
+        {},
+    ),
+    "unresolved_range": (
+        "--inputFile=${IN[0:2]}",
+        [("IN", IN_LFNS)],
+        [],
+        {},
+    ),
+    "unresolved_math": (
+        "--inputFile=${IN/M[len('#')]}",
+        [("IN", IN_LFNS)],
+        [],
+        {},
+    ),
+    "nested": (
+        "--a=${A${IN}} --b=${IN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {},
+    ),
+    "numbers": (
+        "--sn=${SN} --snp=${SN/P} --seed=${RNDMSEED} --a=${A} --b=${B} --c=${C} --d=${D} --surl=${SURL} --in=${IN} --sn2=${SN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {"paramList": [("A", None), ("A", 1), ("A", 2), ("B", "x y"), ("C", 3.5), ("D", None)]},
+    ),
+    "number_in_value": (
+        "--a=${A} --sn=${SN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {"paramList": [("A", "${SN}")]},
+    ),
+    "number_in_other_placeholder": (
+        "--a=${X${SN}} --sn=${SN}",
+        [("IN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {},
+    ),
+    "stream_like_number": (
+        "--sn=${SN} --max=${MAXEVENTS}",
+        [("SN", ["EVNT.01234._000001.pool.root.1"])],
+        [],
+        {},
+    ),
+    "merging_transient": (
+        "--inputHITSFile=${TRN_OUTPUT:OUTPUT} --inputLogsFile=${TRN_LOG_MERGE:LOG_MERGE} --sn=${SN} --attempt=${ATTEMPTNR}",
+        [("TRN_OUTPUT0", ["HITS.1._000001.pool.root.1", "HITS.1._000002.pool.root.1"]), ("TRN_OUTPUT1", []), ("TRN_LOG0", ["log.1._000001.tgz.1"])],
+        [
+            ("OUTPUT0", "HITS.1._000010.pool.root", False),
+            ("OUTPUT1", "RDO.1._000010.pool.root", False),
+            ("LOG_MERGE", "log.1._000010.tgz", False),
+        ],
+        {"isMerging": True},
+    ),
+    "math": (
+        "--a=${IN/M[#*2+1]} --b=${IN/M[int('#')+1]} --c=${IN/M[-#**2]} --d=${IN/M[# .real]} --e=${IN/M[str(#)+'#']}",
+        [("IN", ["21"])],
+        [],
+        {},
+    ),
+    "math_zeros": (
+        "--a=${IN/M[#*2]}",
+        [("IN", ["000"])],
+        [],
+        {},
+    ),
+    "math_leading_zero": (
+        "--a=${IN/M[#*2]}",
+        [("IN", ["0021"])],
+        [],
+        {},
+    ),
+}
+
+# job parameters, multi-step exec, and output files left, made by the implementation which substituted placeholders one by one
+# before templates were compiled
+GOLDEN = {
+    "single": (
+        "--inputFile=EVNT.01234._000001.pool.root.1 --enc=EVNT.01234._000001.pool.root.1 --len=31 --out=HITS.01234._000001.pool.root --log=log.01234._000001.job.log.tgz --sn=123 --snp=000123 --skip=0 --max=10 --first=1000 --attempt=2 --surl=https://example.com --seq=7",
+        None,
+        ["HITS.01234._000001.pool.root", "log.01234._000001.job.log.tgz"],
+    ),
+    "multi": (
+        "--inputFile=EVNT.01234._[000001,000002,000004].pool.root --enc=EVNT.01234._000001.pool.root.1,EVNT.01234._000002.pool.root.2,EVNT.01234._000004.pool.root.1 --long=EVNT.01234._000001.pool.root.1,EVNT.01234._000002.pool.root.2,EVNT.01234._000004.pool.root.1 --quoted='EVNT.01234._000001.pool.root.1','EVNT.01234._000002.pool.root.2','EVNT.01234._000004.pool.root.1' --spaced=EVNT.01234._000001.pool.root.1 EVNT.01234._000002.pool.root.2 EVNT.01234._000004.pool.root.1 --qs='EVNT.01234._000001.pool.root.1' 'EVNT.01234._000002.pool.root.2' 'EVNT.01234._000004.pool.root.1' --list=['EVNT.01234._000001.pool.root.1', 'EVNT.01234._000002.pool.root.2', 'EVNT.01234._000004.pool.root.1'] --file=tmpin_mc.input0 --both=EVNT.01234._000001.pool.root.1,EVNT.01234._000002.pool.root.2,EVNT.01234._000004.pool.root.1,minbias.A.1,minbias.B.1 --both_long=EVNT.01234._000001.pool.root.1,EVNT.01234._000002.pool.root.2,EVNT.01234._000004.pool.root.1,minbias.A.1,minbias.B.1 --minbias=minbias.A.1,minbias.B.1 --unknown=${NOSUCH}",
+        None,
+        ["AOD.01234._000001.pool.root"],
+    ),
+    "non_digit": ("user.a.file_A.root,user.a.file_B.root user.a.file_A.root,user.a.file_B.root", None, []),
+    "duplicated": (
+        "EVNT.01234._[000001,000003].pool.root EVNT.01234._[000001,000003].pool.root EVNT.01234._000001.pool.root.1,EVNT.01234._000003.pool.root.1 tmpin_mc.input0 EVNT.01234._[000001,000003].pool.root",
+        None,
+        [],
+    ),
+    "unmerged_es": ("--out=panda.um.HITS.01234._000001.pool.root  --in=EVNT.01234._000001.pool.root.1", None, ["panda.um.HITS.01234._000001.pool.root"]),
+    "es": ("--out=HITS.01234._000001.pool.root --eventService=True --in=EVNT.01234._000001.pool.root.1", None, ["HITS.01234._000001.pool.root"]),
+    "jumbo": ("--inputFile=tmpin__cnt_mc.input0 --outputFile=HITS.01234._000001.pool.root", None, ["HITS.01234._000001.pool.root"]),
+    "merging": (
+        "--inputHITSFile=HITS.1._000001.pool.root.1,HITS.1._000002.pool.root.1:HITS.1._000010.pool.root   --inputLogsFile=log.1._000001.tgz.1:log.1._000010.tgz   --skipped=${OUTPUT3}",
+        None,
+        ["HITS.1._000010.pool.root", "log.1._000010.tgz"],
+    ),
+    "multi_step": (
+        "--inputFile=EVNT.01234._000001.pool.root.1 --seq=7",
+        {
+            "main": {"args": "--inputFile=EVNT.01234._000001.pool.root.1 --seq=7 --x", "command": "Sim_tf.py"},
+            "preprocess": {"args": "--pre", "command": "Sim_tf.py"},
+        },
+        [],
+    ),
+    "unresolved": ("UnresolvedParam", None, []),
+    "range": (
+        "--inputFile=EVNT.01234._[000001,000002,000004].pool.root --outputFile=${OUTPUT0[0:1]} --first=${OUTPUT0[0]}",
+        None,
+        ["AOD.01234._000001.pool.root"],
+    ),
+    "unresolved_range": ("UnresolvedParam", None, []),
+    "unresolved_math": ("UnresolvedParam", None, []),
+    "nested": ("--a=${AEVNT.01234._000001.pool.root.1} --b=EVNT.01234._000001.pool.root.1", None, []),
+    "numbers": (
+        "--sn=123 --snp=000123 --seed=${RNDMSEED} --a=1 --b=x y --c=3.5 --d=${D} --surl=https://example.com --in=EVNT.01234._000001.pool.root.1 --sn2=123",
+        None,
+        [],
+    ),
+    "number_in_value": ("--a=${SN} --sn=123", None, []),
+    "number_in_other_placeholder": ("--a=${X123} --sn=123", None, []),
+    "stream_like_number": ("--sn=EVNT.01234._000001.pool.root.1 --max=10", None, []),
+    "merging_transient": (
+        "--inputHITSFile=HITS.1._000001.pool.root.1,HITS.1._000002.pool.root.1:HITS.1._000010.pool.root   --inputLogsFile=log.1._000001.tgz.1:log.1._000010.tgz  --sn=123 --attempt=2",
+        None,
+        ["HITS.1._000010.pool.root", "log.1._000010.tgz"],
+    ),
+    "math": ("--a=43 --b=22 --c=-441 --d=21 --e=2121", None, []),
+    "math_zeros": ("--a=0", None, []),
+    "math_leading_zero": ("SyntaxError", None, []),
+}
+
+
+# make job parameters for a case
+def make_job_parameters(thread, case_name):
+    template, stream_lfns_list, out_stream_lfn_list, options = CASES[case_name]
+    task_spec = JediTaskSpec()
+    task_spec.jediTaskID = 1
+    task_spec.splitRule = None
+    task_spec.useJumbo = options.get("useJumbo")
+    is_merging = options.get("isMerging", False)
+    task_param_map = {"sourceURL": "https://example.com"}
+    if is_merging:
+        task_spec.jobParamsTemplate = None
+        task_param_map["mergeSpec"] = {"jobParameters": template}
+    else:
+        task_spec.jobParamsTemplate = template
+    if "multiStepExec" in options:
+        task_spec.setSplitRule("multiStepExec", "1")
+        task_param_map["multiStepExec"] = options["multiStepExec"]
+    job_spec = JobSpec()
+    job_spec.attemptNr = 2
+    job_spec.transformation = "Sim_tf.py"
+    out_sub_chunk, job_file_list = make_out_sub_chunk(out_stream_lfn_list)
+    try:
+        job_params, multi_exec_spec = thread.makeJobParameters(
+            task_spec,
+            make_in_sub_chunk(stream_lfns_list),
+            out_sub_chunk,
+            123,
+            options.get("paramList", [("SEQNUMBER", 7)]),
+            job_spec,
+            False,
+            task_param_map,
+            is_merging,
+            job_file_list,
+            options.get("useEventService", False),
+            [],
+            None,
+            None,
+        )
+    except Exception as e:
+        job_params, multi_exec_spec = type(e).__name__, None
+    # output files which are left
+    return job_params, multi_exec_spec, [file_spec.lfn for file_spec in job_file_list]
+
+
+if __name__ == "__main__":
+    """
+    Golden test of job parameters made from templates with the placeholder syntax, checking that the outputs are exactly the same
+    as those of the implementation before templates were compiled. No database is needed.
+    """
+    thread = JobGeneratorThread.__new__(JobGeneratorThread)
+    thread.time_profile_level = 0
+    results = []
+    for case_name in CASES:
+        JobParamsTemplate.compile_template.cache_clear()
+        output = make_job_parameters(thread, case_name)
+        # twice to use the compiled template
+        output_cached = make_job_parameters(thread, case_name)
+        ok = output == GOLDEN[case_name] and output_cached == output
+        results.append(ok)
+        print(f"{'OK' if ok else 'NG'} : {case_name}")
+        if not ok:
+            print(f"  expected {GOLDEN[case_name]}\n  got      {output}")
+    print(f"{results.count(True)}/{len(results)} passed")
+    sys.exit(0 if all(results) else 1)
@@ -238,11 +238,12 @@ class JobThrottlerBase(object):
 
         # params
         nBunch = 4
-        work_shortage = self.taskBufferIF.getConfigValue("core", "WORK_SHORTAGE", self.app, vo)
+        # zero time range to share results with throttlers running concurrently
+        work_shortage = self.taskBufferIF.getConfigValue("core", "WORK_SHORTAGE", self.app, vo, useResultCache=0)
         if work_shortage is True:
-            threshold = self.taskBufferIF.getConfigValue(self.comp_name, "THROTTLE_THRESHOLD_FOR_WORK_SHORTAGE", self.app, vo)
+            threshold = self.taskBufferIF.getConfigValue(self.comp_name, "THROTTLE_THRESHOLD_FOR_WORK_SHORTAGE", self.app, vo, useResultCache=0)
         else:
-            threshold = self.taskBufferIF.getConfigValue(self.comp_name, "THROTTLE_THRESHOLD", self.app, vo)
+            threshold = self.taskBufferIF.getConfigValue(self.comp_name, "THROTTLE_THRESHOLD", self.app, vo, useResultCache=0)
         if threshold is None:
             threshold = 2.0
         nJobsInBunchMax = 600
@@ -40,7 +40,9 @@ def init_task_buffer(task_buffer: TaskBuffer) -> None:
         global_task_buffer = task_buffer
 
         global global_dispatch_parameter_cache
-        global_dispatch_parameter_cache = CoreUtils.CachedObject("dispatcher_params", 60 * 10, task_buffer.get_special_dispatch_params, _logger)
+        global_dispatch_parameter_cache = CoreUtils.CachedObject(
+            "dispatcher_params", 60 * 10, task_buffer.get_special_dispatch_params, _logger, stale_while_revalidate=True, jitter=0.1
+        )
 
 
 def _is_authorized_with_allowlist(req):
@@ -1,10 +1,9 @@
 import datetime
 import gc
-import gzip
+import io
 import json
 import os
 import re
-import struct
 import sys
 import traceback
 import uuid
@@ -26,8 +25,9 @@ from pandaserver.api.v1.common import (
 )
 from pandaserver.config import panda_config
 from pandaserver.jobdispatcher import Protocol
-from pandaserver.srvcore import CoreUtils
+from pandaserver.srvcore import CoreUtils, cache_store
 from pandaserver.srvcore.panda_request import PandaRequest
+from pandaserver.srvcore.response_utils import FileResponse, parse_range_header
 from pandaserver.taskbuffer.TaskBuffer import TaskBuffer
 from pandaserver.userinterface import Client
 
@@ -44,6 +44,9 @@ CHECKPOINT_LIMIT = 500 * MB
 SANDBOX_NO_BUILD_LIMIT = 10 * MB
 SANDBOX_LIMIT = 768 * MB
 
+# Size of chunks to stream uploaded files
+UPLOAD_CHUNK_SIZE = 1 * MB
+
 # Error messages
 ERROR_NOT_SECURE = "ERROR : no HTTPS"
 ERROR_LIMITED_PROXY = "ERROR: rejected due to the usage of limited proxy"
@@ -86,6 +89,29 @@ def _get_content_length(req: PandaRequest, tmp_logger: LogWrapper) -> int:
     return content_length
 
 
+def _get_size_limit_message(content_length: int | None, size_limit: int, no_build: bool) -> str:
+    """
+    Get the error message for sandbox files exceeding the size limit.
+
+    Args:
+        content_length(int): content length of the request, or None if the limit was exceeded while reading the file.
+        size_limit(int): size limit.
+        no_build(bool): whether the size limit for the no build case is applied.
+
+    Returns:
+        str: error message.
+    """
+    if content_length is None:
+        error_message = f"{ERROR_SIZE_LIMIT} more than {size_limit // MB} MB."
+    else:
+        error_message = f"{ERROR_SIZE_LIMIT} {content_length // MB} MB > {size_limit // MB} MB."
+    if no_build:
+        error_message += " Please submit the job without --noBuild/--libDS since those options impose a tighter size limit"
+    else:
+        error_message += " Please remove redundant files from your work area"
+    return error_message
+
+
 @request_validation(_logger, secure=True, production=True, request_method="POST")
 def upload_jedi_log(req: PandaRequest, file: FileStorage) -> Dict:
     """
@@ -202,11 +228,12 @@ def update_jedi_log(req: PandaRequest, file: FileStorage) -> Dict:
 
 
 @request_validation(_logger, request_method="GET")
-def download_jedi_log(req: PandaRequest, log_name: str, offset: int = 0) -> str:
+def download_jedi_log(req: PandaRequest, log_name: str, offset: int = 0) -> str | FileResponse:
     """
     Download JEDI log file
 
-    Downloads the JEDI log file, if required at a particular offset.
+    Downloads the JEDI log file, if required at a particular offset. When the request has a Range header with a single byte range,
+    the range is returned as a partial content without the leading dummy character and the offset is ignored.
 
     API details:
         HTTP Method: POST
@@ -218,28 +245,59 @@ def download_jedi_log(req: PandaRequest, log_name: str, offset: int = 0) -> str:
         offset(int): offset in the file
 
     Returns:
-        str: The content of the log file or an error message.
+        str | FileResponse: The content of the log file streamed from the file, or an error message.
     """
 
     tmp_logger = LogWrapper(_logger, f"download_jedi_log <{log_name}>")
-    tmp_logger.debug(f"Start offset={offset}")
+    tmp_logger.debug(f"Start offset={offset} range={req.subprocess_env.get('HTTP_RANGE')}")
 
     # put dummy char to avoid Internal Server Error
     return_string = " "
+    file_object = None
     try:
         # stdout name
         full_log_name = f"{panda_config.cache_dir}/{log_name.split('/')[-1]}"
 
+        # the file is read when the response is sent
+        file_object = open(full_log_name, "rb")
+        file_size = os.fstat(file_object.fileno()).st_size
+        byte_range = parse_range_header(req.subprocess_env.get("HTTP_RANGE"), file_size)
+
+        # unsatisfiable range
+        if byte_range is False:
+            file_object.close()
+            tmp_logger.debug(f"Range not satisfiable for {file_size} bytes")
+            tmp_logger.debug("Done")
+            return FileResponse(io.BytesIO(), 0, 0, status="416 Range Not Satisfiable", headers=[("Content-Range", f"bytes */{file_size}")])
+
+        # partial content
+        if byte_range:
+            first_byte, n_bytes = byte_range
+            tmp_logger.debug(f"Send {n_bytes} bytes from {first_byte}")
+            tmp_logger.debug("Done")
+            return FileResponse(
+                file_object,
+                first_byte,
+                n_bytes,
+                status="206 Partial Content",
+                headers=[("Content-Range", f"bytes {first_byte}-{first_byte + n_bytes - 1}/{file_size}")],
+            )
+
         # read at offset of the file
-        with open(full_log_name, "r") as file_object:
-            file_object.seek(int(offset))
-            return_string += file_object.read()
+        offset = int(offset)
+        if offset < 0:
+            raise ValueError(f"negative offset {offset}")
+        offset = min(offset, file_size)
+        tmp_logger.debug(f"Send {file_size - offset} bytes")
+        tmp_logger.debug("Done")
+        return FileResponse(file_object, offset, file_size - offset, prefix=return_string.encode())
 
     except Exception:
         error_type, error_value, _ = sys.exc_info()
         tmp_logger.error(f"Failed with: {error_type} {error_value}")
+        if file_object is not None:
+            file_object.close()
 
-    tmp_logger.debug(f"Read {len(return_string)} bytes")
     tmp_logger.debug("Done")
     return return_string
 
@@ -251,7 +309,8 @@ def upload_cache_file(req: PandaRequest, file: FileStorage) -> Dict:
 
     Uploads a file to the cache. When not touched, cache files are expired after some time.
     User caches will get registered in the PanDA database and will account towards user limits.
-    PanDA log files will be stored in gzip format. Requires a secure connection.
+    PanDA log files will be stored in gzip format. The file is streamed to the cache directory in chunks, and identical sandbox
+    files are stored once when cache_file_dedup is enabled. Requires a secure connection.
 
     API details:
         HTTP Method: POST
@@ -305,11 +364,7 @@ def upload_cache_file(req: PandaRequest, file: FileStorage) -> Dict:
 
     # check if we are above the size limit
     if content_length > size_limit:
-        error_message = f"{ERROR_SIZE_LIMIT} {content_length // MB} MB > {size_limit // MB} MB."
-        if no_build:
-            error_message += " Please submit the job without --noBuild/--libDS since those options impose a tighter size limit"
-        else:
-            error_message += " Please remove redundant files from your work area"
+        error_message = _get_size_limit_message(content_length, size_limit, no_build)
         tmp_logger.error(error_message)
         tmp_logger.debug("Triggering garbage collection...")
         gc.collect()
@@ -331,37 +386,46 @@ def upload_cache_file(req: PandaRequest, file: FileStorage) -> Dict:
             tmp_logger.debug("end")
             return generate_response(False, error_message)
 
-        # write the file to the cache directory
-        with open(full_path, "wb") as file_object:
-            file_content = file.read()
-            if hasattr(panda_config, "compress_file_names") and [
-                True for patt in panda_config.compress_file_names.split(",") if re.search(patt, file_name) is not None
-            ]:
-                file_content = gzip.compress(file_content)
-            file_object.write(file_content)
+        # stream the file to the cache directory
+        to_compress = hasattr(panda_config, "compress_file_names") and [
+            True for patt in panda_config.compress_file_names.split(",") if re.search(patt, file_name) is not None
+        ]
+        # log files may be appended, so that only sandbox files share contents
+        to_deduplicate = getattr(panda_config, "cache_file_dedup", False) and not any(file.filename.endswith(suffix) for suffix in IGNORED_SUFFIX)
+        stored_file = cache_store.store_file(
+            file.stream, full_path, compress=bool(to_compress), size_limit=size_limit, deduplicate=to_deduplicate, chunk_size=UPLOAD_CHUNK_SIZE
+        )
+
+    except cache_store.SizeLimitExceeded:
+        error_message = _get_size_limit_message(None, size_limit, no_build)
+        tmp_logger.error(error_message)
+        tmp_logger.debug("Triggering garbage collection...")
+        gc.collect()
+        tmp_logger.debug("Done")
+        return generate_response(False, error_message)
 
     except Exception:
+        error_type, error_value = sys.exc_info()[:2]
         error_message = ERROR_WRITE
-        tmp_logger.error(error_message)
+        tmp_logger.error(f"{error_message} with {error_type.__name__}:{error_value}")
         tmp_logger.debug("Triggering garbage collection...")
         gc.collect()
         tmp_logger.debug("Done")
         return generate_response(False, error_message)
 
-    # calculate the checksum
-    try:
-        # decode Footer
-        footer = file_content[-8:]
-        checksum, _ = struct.unpack("II", footer)
-        checksum = str(checksum)
+    # checksum from the gzip footer
+    if stored_file["crc"] is not None:
+        checksum = str(stored_file["crc"])
         tmp_logger.debug(f"CRC from gzip Footer {checksum}")
-    except Exception:
+    else:
         # use None to avoid delay for now
         checksum = None
         tmp_logger.debug(f"No CRC calculated {checksum}")
 
-    # calculate the file size
-    file_size = len(file_content)
+    # file size
+    file_size = stored_file["size"]
+    if stored_file["deduplicated"]:
+        tmp_logger.debug(f"content {stored_file['digest']} already stored")
 
     # log the full file information
     tmp_logger.debug(f"Written dn={user_name}, file={full_path}, size={file_size // MB} MB, crc={checksum}")
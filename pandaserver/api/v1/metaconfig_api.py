@@ -6,7 +6,7 @@ from pandaserver.api.v1.common import (
     generate_response,
     request_validation,
 )
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.srvcore.panda_request import PandaRequest
 from pandaserver.taskbuffer.TaskBuffer import TaskBuffer
 
@@ -75,7 +75,7 @@ def get_site_specs(req: PandaRequest, type: str = "analysis") -> dict:
     tmp_logger.debug("Start")
 
     site_specs = {}
-    site_mapper = SiteMapper(global_task_buffer)
+    site_mapper = get_site_mapper(global_task_buffer)
 
     excluded_attrs = {"ddm_endpoints_input", "ddm_endpoints_output", "ddm_input", "ddm_output", "setokens_input", "num_slots_map"}
 
@@ -16,7 +16,7 @@ from pandaserver.api.v1.common import (
     has_production_role,
     request_validation,
 )
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
 from pandaserver.dataservice.adder_gen import AdderGen
 from pandaserver.jobdispatcher import Protocol
@@ -43,11 +43,11 @@ def init_task_buffer(task_buffer: TaskBuffer) -> None:
     global_task_buffer = task_buffer
 
     global global_site_mapper_cache
-    global_site_mapper_cache = CoreUtils.CachedObject("site_mapper", 60 * 10, _get_site_mapper, _logger)
+    global_site_mapper_cache = CoreUtils.CachedObject("site_mapper", 60 * 10, _get_site_mapper, _logger, stale_while_revalidate=True, jitter=0.1)
 
 
 def _get_site_mapper():
-    return True, SiteMapper(global_task_buffer)
+    return True, get_site_mapper(global_task_buffer)
 
 
 @request_validation(_logger, secure=True, request_method="POST")
@@ -0,0 +1,180 @@
+"""
+read-only snapshot of SiteMapper shared by processes on the same host through a memory-mapped file.
+A builder periodically serializes SiteMapper into the file and replaces it atomically, and readers attach to
+it lazily instead of building their own SiteMapper. SiteSpecs are serialized individually and deserialized
+on first access, so that processes only hold sites they actually use.
+
+"""
+
+import copy
+import mmap
+import os
+import pickle
+import struct
+import time
+from collections.abc import Mapping
+from threading import Lock
+
+from pandacommon.pandalogger.PandaLogger import PandaLogger
+
+from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.config import panda_config
+
+_logger = PandaLogger().getLogger("site_mapper_snapshot")
+
+# header: magic, format version, generation, creation time, offset and length of the base SiteMapper, and offset and length of the index
+SNAPSHOT_MAGIC = b"PSMS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("!4sBQdQQQQ")
+
+
+# mapping of site name to SiteSpec deserialized lazily from the snapshot
+class LazySiteSpecMap(Mapping):
+    # constructor
+    def __init__(self, buffer, index):
+        self.buffer = buffer
+        self.index = index
+        self.cache = {}
+
+    def __getitem__(self, site_name):
+        site_spec = self.cache.get(site_name)
+        if site_spec is None:
+            offset, length = self.index[site_name]
+            site_spec = pickle.loads(self.buffer[offset : offset + length])
+            self.cache[site_name] = site_spec
+        return site_spec
+
+    def __contains__(self, site_name):
+        return site_name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    # pickled as a plain dict since the memory map cannot be sent to other processes
+    def __reduce__(self):
+        return dict, (dict(self.items()),)
+
+
+# get generation of an existing snapshot
+def read_generation(path):
+    try:
+        with open(path, "rb") as f:
+            magic, version, generation = SNAPSHOT_HEADER.unpack(f.read(SNAPSHOT_HEADER.size))[:3]
+        if magic == SNAPSHOT_MAGIC:
+            return generation
+    except Exception:
+        pass
+    return 0
+
+
+# write snapshot
+def write_snapshot(site_mapper, path):
+    """
+    Serialize SiteMapper and replace the snapshot atomically
+
+    :param site_mapper: SiteMapper built from the database
+    :param path: snapshot file
+    :return: generation of the new snapshot
+    """
+    generation = read_generation(path) + 1
+    # SiteSpecs one by one
+    index = {}
+    blobs = []
+    offset = SNAPSHOT_HEADER.size
+    for site_name, site_spec in site_mapper.siteSpecList.items():
+        blob = pickle.dumps(site_spec, protocol=pickle.HIGHEST_PROTOCOL)
+        index[site_name] = (offset, len(blob))
+        blobs.append(blob)
+        offset += len(blob)
+    # the rest of SiteMapper
+    base = copy.copy(site_mapper)
+    base.siteSpecList = {}
+    base_blob = pickle.dumps(base, protocol=pickle.HIGHEST_PROTOCOL)
+    base_offset = offset
+    index_blob = pickle.dumps(index, protocol=pickle.HIGHEST_PROTOCOL)
+    index_offset = base_offset + len(base_blob)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, generation, time.time(), base_offset, len(base_blob), index_offset, len(index_blob))
+    # write into a temporary file and rename it so that readers never see a partial snapshot
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for blob in blobs:
+            f.write(blob)
+        f.write(base_blob)
+        f.write(index_blob)
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, path)
+    return generation
+
+
+# reader of snapshot
+class SiteMapperSnapshotReader:
+    # constructor
+    def __init__(self, path, max_age):
+        self.path = path
+        self.max_age = max_age
+        self.lock = Lock()
+        self.file_id = None
+        self.generation = None
+        self.created_at = None
+        self.site_mapper = None
+
+    # attach to a new snapshot
+    def attach(self, file_id):
+        with open(self.path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, generation, created_at, base_offset, base_length, index_offset, index_length = SNAPSHOT_HEADER.unpack(buffer[: SNAPSHOT_HEADER.size])
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError(f"unknown snapshot format in {self.path}")
+        site_mapper = pickle.loads(buffer[base_offset : base_offset + base_length])
+        site_mapper.siteSpecList = LazySiteSpecMap(buffer, pickle.loads(buffer[index_offset : index_offset + index_length]))
+        # swap everything at once
+        self.file_id, self.generation, self.created_at, self.site_mapper = file_id, generation, created_at, site_mapper
+        _logger.debug(f"PID={os.getpid()} attached generation={generation} with {len(site_mapper.siteSpecList)} sites")
+
+    # get SiteMapper
+    def get(self):
+        """
+        Get SiteMapper from the latest snapshot
+
+        :return: SiteMapper, or None if the snapshot is unavailable or too old
+        """
+        try:
+            stat = os.stat(self.path)
+            file_id = (stat.st_ino, stat.st_mtime_ns)
+            if file_id != self.file_id:
+                with self.lock:
+                    if file_id != self.file_id:
+                        self.attach(file_id)
+            if time.time() - self.created_at > self.max_age:
+                _logger.debug(f"PID={os.getpid()} generation={self.generation} is too old")
+                return None
+            return self.site_mapper
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            _logger.error(f"PID={os.getpid()} failed to attach {self.path} : {str(e)}")
+            return None
+
+
+# reader in this process
+snapshot_reader = SiteMapperSnapshotReader(panda_config.site_mapper_snapshot, panda_config.site_mapper_snapshot_max_age)
+
+
+# get SiteMapper
+def get_site_mapper(task_buffer, verbose=False):
+    """
+    Get SiteMapper from the shared snapshot if available, otherwise build it from the database
+
+    :param task_buffer: TaskBuffer
+    :param verbose: verbose flag for SiteMapper
+    :return: SiteMapper
+    """
+    if panda_config.site_mapper_snapshot:
+        site_mapper = snapshot_reader.get()
+        if site_mapper is not None:
+            return site_mapper
+    return SiteMapper(task_buffer, verbose)
@@ -175,6 +175,62 @@ if "disable_file_aggregation" not in tmpSelf.__dict__:
 if "disable_file_dispatch" not in tmpSelf.__dict__:
     tmpSelf.__dict__["disable_file_dispatch"] = False
 
+# claim multiple jobs with bulk queries in getJobs
+if "bulk_get_jobs" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["bulk_get_jobs"] = False
+
+# elastic DB proxy pool. the pool size is fixed to nDBConnection when min size is 0
+if "db_pool_min_size" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["db_pool_min_size"] = 0
+# wait time in seconds for a free proxy before growing the pool
+if "db_pool_grow_wait" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["db_pool_grow_wait"] = 0.5
+# idle time in seconds before shrinking the pool
+if "db_pool_shrink_idle" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["db_pool_shrink_idle"] = 600
+# interval in seconds to dump wait time histogram
+if "db_pool_stats_interval" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["db_pool_stats_interval"] = 600
+
+# UNIX socket of the shared ConBridge worker pool. ConBridge forks its own child when empty
+if "dbbridge_pool_socket" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["dbbridge_pool_socket"] = ""
+# the number of workers in the shared ConBridge worker pool
+if "dbbridge_pool_size" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["dbbridge_pool_size"] = 10
+# max time in seconds for the shared ConBridge worker pool to wait for a free worker
+if "dbbridge_pool_lease_timeout" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["dbbridge_pool_lease_timeout"] = 60
+# the max number of translated SQL statements cached in each process for postgres
+if "sql_translation_cache_size" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["sql_translation_cache_size"] = 10000
+# file of SQL translation table built at startup for postgres. disabled when empty
+if "sql_translation_table" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["sql_translation_table"] = ""
+
+# max size in bytes of request body kept in memory. larger bodies are spooled to disk
+if "request_body_spool_size" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["request_body_spool_size"] = 16 * 1024 * 1024
+# min size in bytes of JSON request body to be parsed as a stream with ijson. 0 to disable
+if "json_stream_threshold" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["json_stream_threshold"] = 0
+# JSON encoder for responses. "orjson" to use orjson if installed, or "json"
+if "json_encoder" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["json_encoder"] = "json"
+# min size in bytes of responses to be compressed when clients accept gzip or zstd. 0 to disable
+if "response_compress_threshold" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["response_compress_threshold"] = 64 * 1024
+
+# file of SiteMapper snapshot shared by processes on the host, e.g. in /dev/shm. disabled when empty
+if "site_mapper_snapshot" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["site_mapper_snapshot"] = ""
+# max age in seconds of SiteMapper snapshot. processes build their own SiteMapper when the snapshot is older
+if "site_mapper_snapshot_max_age" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["site_mapper_snapshot_max_age"] = 1800
+
+# transport of TaskBufferInterface. "socket" to use socketpairs or "manager" to use multiprocessing.Manager
+if "tbif_transport" not in tmpSelf.__dict__:
+    tmpSelf.__dict__["tbif_transport"] = "socket"
 
 # dict for plugins
 g_pluginMap = {}
@@ -1,5 +1,6 @@
 import datetime
 import multiprocessing
+import queue
 import random
 import sys
 import time
@@ -10,7 +11,7 @@ from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 from pandacommon.pandautils.thread_utils import GenericThread, WeightedLists
 
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
 from pandaserver.dataservice.adder_gen import AdderGen
 from pandaserver.taskbuffer.TaskBuffer import TaskBuffer
@@ -75,25 +76,45 @@ def main(argv=tuple(), tbuf=None, lock_pool=None, **kwargs):
         taskBuffer = tbuf
 
     # instantiate sitemapper
-    aSiteMapper = SiteMapper(taskBuffer)
+    aSiteMapper = get_site_mapper(taskBuffer)
 
-    # thread for adder
-    class AdderThread(GenericThread):
-        def __init__(self, taskBuffer, aSiteMapper, job_output_reports, lock_pool):
+    # the number of reports to lock with a single statement
+    lock_batch_size = 20
+
+    # max number of reports queued or being processed, to apply backpressure to listing
+    max_in_flight = 200 * nThr
+
+    # lifetime in seconds of the worker pool. the pool is recreated in the next daemon loop
+    pool_lifetime = 500
+
+    # interval in seconds to dump stats
+    stats_interval = 60
+
+    # worker of adder
+    class AdderWorker(GenericThread):
+        def __init__(self, taskBuffer, aSiteMapper, report_queue, done_queue, lock_pool):
             GenericThread.__init__(self)
             self.taskBuffer = taskBuffer
             self.aSiteMapper = aSiteMapper
-            self.job_output_reports = job_output_reports
+            self.report_queue = report_queue
+            self.done_queue = done_queue
             self.lock_pool = lock_pool
 
+        # get a batch of reports. None in the batch means the end of stream
+        def get_batch(self):
+            batch = [self.report_queue.get()]
+            while batch[-1] is not None and len(batch) < lock_batch_size:
+                try:
+                    batch.append(self.report_queue.get_nowait())
+                except queue.Empty:
+                    break
+            return batch
+
         # main loop
         def run(self):
             # initialize
             taskBuffer = self.taskBuffer
             aSiteMapper = self.aSiteMapper
-            # get file list
-            timeNow = naive_utcnow()
-            timeInt = naive_utcnow()
             # unique pid
             GenericThread.__init__(self)
             uniq_pid = self.get_pid()
@@ -102,55 +123,79 @@ def main(argv=tuple(), tbuf=None, lock_pool=None, **kwargs):
             # stats
             n_processed = 0
             # loop
-            while True:
-                # get report
-                one_jor = self.job_output_reports.pop()
-                if not one_jor:
-                    break
-                # lock
-                panda_id, job_status, attempt_nr, time_stamp = one_jor
-                token_str = f"pid={uniq_pid} : job={panda_id}.{attempt_nr}"
-                tmpLog.debug(f"{token_str} to lock timestamp={time_stamp}")
-                got_lock = taskBuffer.lockJobOutputReport(
-                    panda_id=panda_id,
-                    attempt_nr=attempt_nr,
-                    pid=uniq_pid,
-                    time_limit=lock_interval,
-                )
-                if not got_lock:
-                    tmpLog.debug(f"{token_str} skipped")
+            is_done = False
+            while not is_done:
+                # get reports
+                batch = self.get_batch()
+                if batch[-1] is None:
+                    is_done = True
+                    batch = batch[:-1]
+                if not batch:
                     continue
-                # add
-                try:
-                    modTime = time_stamp
-                    if (timeNow - modTime) > datetime.timedelta(hours=24):
-                        # last add
-                        tmpLog.debug(f"{token_str} last add st={job_status}")
-                        ignoreTmpError = False
-                    else:
-                        # usual add
-                        tmpLog.debug(f"{token_str} add st={job_status}")
-                        ignoreTmpError = True
-                    # get adder
-                    adder_gen = AdderGen(
-                        taskBuffer,
-                        panda_id,
-                        job_status,
-                        attempt_nr,
-                        ignore_tmp_error=ignoreTmpError,
-                        siteMapper=aSiteMapper,
+                # lock
+                stage_start = time.monotonic()
+                locked_set = set(
+                    taskBuffer.lockJobOutputReports(
+                        reports=[(panda_id, attempt_nr) for panda_id, _, attempt_nr, _ in batch],
                         pid=uniq_pid,
-                        prelock_pid=uniq_pid,
-                        lock_offset=lock_interval - retry_interval,
-                        lock_pool=lock_pool,
+                        time_limit=lock_interval,
                     )
-                    n_processed += 1
-                    # execute
-                    adder_gen.run()
-                    tmpLog.debug(f"{token_str} done")
-                    del adder_gen
-                except Exception as e:
-                    tmpLog.error(f"pid={uniq_pid} : failed to run with {str(e)} {traceback.format_exc()}")
+                )
+                locked_time = time.monotonic()
+                lock_time = locked_time - stage_start
+                tmpLog.debug(f"pid={uniq_pid} : locked {len(locked_set)}/{len(batch)} in {lock_time:.3f} sec")
+                # share the lock time among locked reports, or among all reports if none was locked
+                lock_time_share = lock_time / (len(locked_set) or len(batch))
+                for one_jor in batch:
+                    panda_id, job_status, attempt_nr, time_stamp = one_jor
+                    token_str = f"pid={uniq_pid} : job={panda_id}.{attempt_nr}"
+                    if (panda_id, attempt_nr) not in locked_set:
+                        tmpLog.debug(f"{token_str} skipped")
+                        self.done_queue.put(((panda_id, attempt_nr), False, {"lock": lock_time_share if not locked_set else 0.0}))
+                        continue
+                    stage_times = {"lock": lock_time_share}
+                    # renew the lock if preceding reports took long, so that the report is not taken over by others while being added
+                    if time.monotonic() - locked_time > retry_interval * 60:
+                        stage_start = time.monotonic()
+                        is_locked = taskBuffer.lockJobOutputReport(panda_id=panda_id, attempt_nr=attempt_nr, pid=uniq_pid, time_limit=lock_interval)
+                        stage_times["lock"] += time.monotonic() - stage_start
+                        if not is_locked:
+                            tmpLog.debug(f"{token_str} skipped since lock was not renewed")
+                            self.done_queue.put(((panda_id, attempt_nr), False, stage_times))
+                            continue
+                    # add
+                    try:
+                        modTime = time_stamp
+                        if (naive_utcnow() - modTime) > datetime.timedelta(hours=24):
+                            # last add
+                            tmpLog.debug(f"{token_str} last add st={job_status}")
+                            ignoreTmpError = False
+                        else:
+                            # usual add
+                            tmpLog.debug(f"{token_str} add st={job_status}")
+                            ignoreTmpError = True
+                        # get adder
+                        adder_gen = AdderGen(
+                            taskBuffer,
+                            panda_id,
+                            job_status,
+                            attempt_nr,
+                            ignore_tmp_error=ignoreTmpError,
+                            siteMapper=aSiteMapper,
+                            pid=uniq_pid,
+                            prelock_pid=uniq_pid,
+                            lock_offset=lock_interval - retry_interval,
+                            lock_pool=self.lock_pool,
+                        )
+                        n_processed += 1
+                        # execute
+                        adder_gen.run()
+                        stage_times.update(adder_gen.stage_times)
+                        tmpLog.debug(f"{token_str} done")
+                        del adder_gen
+                    except Exception as e:
+                        tmpLog.error(f"pid={uniq_pid} : failed to run with {str(e)} {traceback.format_exc()}")
+                    self.done_queue.put(((panda_id, attempt_nr), True, stage_times))
             # stats
             tmpLog.debug(f"pid={uniq_pid} : processed {n_processed}")
 
@@ -179,75 +224,102 @@ def main(argv=tuple(), tbuf=None, lock_pool=None, **kwargs):
     taskBufferIF.launch(_tbuf)
 
     # add files
-    tmpLog.debug("run Adder")
+    tmpLog.debug(f"run Adder with {nThr} workers")
+
+    # long-lived workers consuming a stream of reports
+    report_queue = multiprocessing.Queue()
+    done_queue = multiprocessing.Queue()
+    adderWorkerList = []
+    for i in range(nThr):
+        worker = AdderWorker(taskBufferIF.getInterface(), aSiteMapper, report_queue, done_queue, lock_pool)
+        worker.proc_launch()
+        adderWorkerList.append(worker)
 
     interval = 10
-    nLoop = 50
     recover_dataset_update = False
-    for iLoop in range(nLoop):
-        tmpLog.debug(f"start iLoop={iLoop}/{nLoop} with {nThr} threads")
-        start_time = naive_utcnow()
-        adderThrList = []
-        # nThr = 10
-
-        n_jors_per_batch = 200
-
-        jor_lists = WeightedLists(multiprocessing.Lock())
-
-        # get some job output reports
-        jor_list_others = taskBuffer.listJobOutputReport(
-            only_unlocked=True,
-            time_limit=lock_interval,
-            limit=random.randint(int(n_jors_per_batch * 0.5), int(n_jors_per_batch * 1.5)) * nThr,
-            grace_period=gracePeriod,
-            anti_labels=["user"],
-        )
-        jor_lists.add(3, jor_list_others)
-        jor_list_user = taskBuffer.listJobOutputReport(
-            only_unlocked=True,
-            time_limit=lock_interval,
-            limit=random.randint(int(n_jors_per_batch * 0.5), int(n_jors_per_batch * 1.5)) * nThr,
-            grace_period=gracePeriod,
-            labels=["user"],
-        )
-        jor_lists.add(7, jor_list_user)
-
-        # adder consumer processes
-        _n_thr_with_tbuf = 0
-        tbuf_list = []
-        tmpLog.debug(f"got {len(jor_lists)} job reports")
-        for i in range(nThr):
-            if i < _n_thr_with_tbuf:
-                tbuf = TaskBuffer()
-                tbuf_list.append(tbuf)
-                tbuf.init(
-                    panda_config.dbhost,
-                    panda_config.dbpasswd,
-                    nDBConnection=1,
-                    useTimeout=True,
-                    requester=requester_id,
-                )
-                thr = AdderThread(tbuf, aSiteMapper, jor_lists, lock_pool)
-            else:
-                thr = AdderThread(taskBufferIF.getInterface(), aSiteMapper, jor_lists, lock_pool)
-            adderThrList.append(thr)
-        # start all threads
-        for thr in adderThrList:
-            # thr.start()
-            thr.proc_launch()
-            time.sleep(0.25)
-
-        # join all threads
-        for thr in adderThrList:
-            # thr.join()
-            thr.proc_join()
-        [tbuf.cleanup(requester=requester_id) for tbuf in tbuf_list]
-        end_time = naive_utcnow()
-        sleep_time = interval - (end_time - start_time).seconds
-        if sleep_time > 0 and iLoop + 1 < nLoop:
-            sleep_time = random.randint(1, sleep_time)
-            tmpLog.debug(f"sleep {sleep_time} sec")
-            time.sleep(sleep_time)
+    # reports queued or being processed, with the time when they were queued
+    in_flight_map = {}
+    # stats
+    stage_time_sums = {}
+    n_done = 0
+    n_skipped = 0
+    pool_start = time.monotonic()
+    last_stats = pool_start
+    last_listing = pool_start - interval
+    n_last_listed = 0
+    while time.monotonic() - pool_start < pool_lifetime:
+        # collect finished reports
+        try:
+            key, processed, stage_times = done_queue.get(timeout=1)
+            while True:
+                in_flight_map.pop(key, None)
+                if processed:
+                    n_done += 1
+                else:
+                    n_skipped += 1
+                for stage_name, stage_time in stage_times.items():
+                    stage_time_sums[stage_name] = stage_time_sums.get(stage_name, 0.0) + stage_time
+                key, processed, stage_times = done_queue.get_nowait()
+        except queue.Empty:
+            pass
+
+        # forget reports which were lost with dead workers, since their locks are expired
+        for key in [key for key, queued_time in in_flight_map.items() if time.monotonic() - queued_time > lock_interval * 60]:
+            del in_flight_map[key]
+
+        # replace dead workers
+        for i_worker, worker in enumerate(adderWorkerList):
+            if not worker.process.is_alive():
+                tmpLog.warning(f"worker with pid={worker.process.pid} died with exitcode={worker.process.exitcode}; restarting")
+                worker = AdderWorker(taskBufferIF.getInterface(), aSiteMapper, report_queue, done_queue, lock_pool)
+                worker.proc_launch()
+                adderWorkerList[i_worker] = worker
+
+        # list reports when workers run short of them
+        # wait for the interval when the last listing found nothing
+        if len(in_flight_map) <= max_in_flight // 2 and (n_last_listed > 0 or time.monotonic() - last_listing > interval):
+            last_listing = time.monotonic()
+            # reports in flight are listed again unless they are already locked
+            n_room = max_in_flight - len(in_flight_map)
+            jor_lists = WeightedLists(multiprocessing.Lock())
+            # get some job output reports
+            jor_list_others = taskBuffer.listJobOutputReport(
+                only_unlocked=True,
+                time_limit=lock_interval,
+                limit=random.randint(int(n_room * 0.5), n_room) + len(in_flight_map),
+                grace_period=gracePeriod,
+                anti_labels=["user"],
+            )
+            jor_lists.add(3, [jor for jor in jor_list_others or [] if (jor[0], jor[2]) not in in_flight_map])
+            jor_list_user = taskBuffer.listJobOutputReport(
+                only_unlocked=True,
+                time_limit=lock_interval,
+                limit=random.randint(int(n_room * 0.5), n_room) + len(in_flight_map),
+                grace_period=gracePeriod,
+                labels=["user"],
+            )
+            jor_lists.add(7, [jor for jor in jor_list_user or [] if (jor[0], jor[2]) not in in_flight_map])
+            n_last_listed = len(jor_lists)
+            tmpLog.debug(f"got {n_last_listed} job reports with {len(in_flight_map)} in flight")
+            # feed workers in the weighted order
+            while len(in_flight_map) < max_in_flight:
+                one_jor = jor_lists.pop()
+                if not one_jor:
+                    break
+                key = (one_jor[0], one_jor[2])
+                if key in in_flight_map:
+                    continue
+                in_flight_map[key] = time.monotonic()
+                report_queue.put(one_jor)
+
+        # dump stats
+        if time.monotonic() - last_stats > stats_interval:
+            time_str = " ".join(f"{stage_name}={stage_time / max(n_done, 1):.3f}" for stage_name, stage_time in sorted(stage_time_sums.items()))
+            tmpLog.debug(
+                f"stats: done={n_done} skipped={n_skipped} in_flight={len(in_flight_map)} "
+                f"rate={n_done / (time.monotonic() - pool_start):.2f}/sec avg_sec_per_report: {time_str}"
+            )
+            last_stats = time.monotonic()
 
         # recovery
         if naive_utcnow() - last_recovery > datetime.timedelta(minutes=2):
@@ -255,6 +327,14 @@ def main(argv=tuple(), tbuf=None, lock_pool=None, **kwargs):
             last_recovery = naive_utcnow()
             recover_dataset_update = True
 
+    # stop workers after they drain the queue
+    tmpLog.debug(f"stop workers with {len(in_flight_map)} reports in flight")
+    for worker in adderWorkerList:
+        report_queue.put(None)
+    for worker in adderWorkerList:
+        worker.proc_join()
+    tmpLog.debug(f"processed {n_done} reports and skipped {n_skipped} in {time.monotonic() - pool_start:.1f} sec")
+
     # recovery
     if not recover_dataset_update:
         taskBuffer.async_update_datasets(None)
@@ -14,7 +14,7 @@ from pandacommon.pandautils.thread_utils import GenericThread
 
 import pandaserver.taskbuffer.ErrorCode
 import pandaserver.userinterface.Client as Client
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
 from pandaserver.srvcore.CoreUtils import commands_get_status_output
 
@@ -47,7 +47,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         taskBuffer = tbuf
 
     # instantiate sitemapper
-    aSiteMapper = SiteMapper(taskBuffer)
+    aSiteMapper = get_site_mapper(taskBuffer)
 
     # count # of getJob/updateJob in dispatcher's log
     try:
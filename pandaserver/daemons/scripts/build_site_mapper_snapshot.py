@@ -0,0 +1,61 @@
+import sys
+import time
+import traceback
+
+from pandacommon.pandalogger.PandaLogger import PandaLogger
+from pandacommon.pandautils.thread_utils import GenericThread
+
+from pandaserver.brokerage.site_mapper_snapshot import write_snapshot
+from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.config import panda_config
+
+# logger
+_logger = PandaLogger().getLogger("build_site_mapper_snapshot")
+
+
+# main
+def main(tbuf=None, **kwargs):
+    _logger.debug("===================== start =====================")
+
+    if not panda_config.site_mapper_snapshot:
+        _logger.debug("skip since site_mapper_snapshot is not set")
+        _logger.debug("===================== end =====================")
+        return
+
+    requester_id = GenericThread().get_full_id(__name__, sys.modules[__name__].__file__)
+
+    # instantiate TB
+    if tbuf is None:
+        from pandaserver.taskbuffer.TaskBuffer import taskBuffer
+
+        taskBuffer.init(
+            panda_config.dbhost,
+            panda_config.dbpasswd,
+            nDBConnection=1,
+            useTimeout=True,
+            requester=requester_id,
+        )
+    else:
+        taskBuffer = tbuf
+
+    try:
+        start_time = time.time()
+        # build SiteMapper directly from the database and write it
+        site_mapper = SiteMapper(taskBuffer)
+        generation = write_snapshot(site_mapper, panda_config.site_mapper_snapshot)
+        _logger.debug(
+            f"wrote generation={generation} with {len(site_mapper.siteSpecList)} sites to {panda_config.site_mapper_snapshot} in {time.time() - start_time:.1f} sec"
+        )
+    except Exception as e:
+        _logger.error(f"failed with {str(e)} {traceback.format_exc()}")
+
+    # stop taskBuffer if created inside this script
+    if tbuf is None:
+        taskBuffer.cleanup(requester=requester_id)
+
+    _logger.debug("===================== end =====================")
+
+
+# run
+if __name__ == "__main__":
+    main()
@@ -14,9 +14,10 @@ from pandacommon.pandautils.thread_utils import GenericThread
 from urllib3.exceptions import InsecureRequestWarning
 
 import pandaserver.userinterface.Client as Client
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
-from pandaserver.jobdispatcher.Watcher import Watcher
+from pandaserver.jobdispatcher.Watcher import HeartbeatSweeper
+from pandaserver.srvcore import cache_store
 from pandaserver.taskbuffer import EventServiceUtils
 
 # logger
@@ -77,7 +78,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
     )
 
     # instantiate sitemapper
-    siteMapper = SiteMapper(taskBuffer)
+    siteMapper = get_site_mapper(taskBuffer)
 
     # kick merging jobs
     _logger.debug("Kick merging session")
@@ -273,6 +274,9 @@ def main(argv=tuple(), tbuf=None, **kwargs):
 
     _logger.debug("Watcher session")
 
+    # sweeper to fail jobs with lost heartbeats in batches
+    sweeper = HeartbeatSweeper(taskBuffer, sitemapper=siteMapper)
+
     # get the list of workflows
     sql = "SELECT /* use_json_type */ DISTINCT scj.data.workflow FROM ATLAS_PANDA.schedconfig_json scj WHERE scj.data.status='online' "
     status, res = taskBuffer.querySQLS(sql, {})
@@ -305,11 +309,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of Anal Watcher : {res}")
     else:
         _logger.debug(f"# of Anal Watcher : {len(res)}")
-        for (id,) in res:
-            _logger.debug(f"Anal Watcher {id}")
-            thr = Watcher(taskBuffer, id, single=True, sleepTime=60, sitemapper=siteMapper)
-            thr.start()
-            thr.join()
+        sweeper.sweep([id for id, in res], 60)
 
     # check heartbeat for analysis jobs in transferring
     timeLimit = naive_utcnow() - datetime.timedelta(hours=workflow_timeout_map["analysis"])
@@ -325,11 +325,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of Transferring Anal Watcher : {res}")
     else:
         _logger.debug(f"# of Transferring Anal Watcher : {len(res)}")
-        for (id,) in res:
-            _logger.debug(f"Trans Anal Watcher {id}")
-            thr = Watcher(taskBuffer, id, single=True, sleepTime=60, sitemapper=siteMapper)
-            thr.start()
-            thr.join()
+        sweeper.sweep([id for id, in res], 60)
 
     # check heartbeat for sent jobs
     timeLimit = naive_utcnow() - datetime.timedelta(minutes=30)
@@ -344,11 +340,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of Sent Watcher : {res}")
     else:
         _logger.debug(f"# of Sent Watcher : {len(res)}")
-        for (id,) in res:
-            _logger.debug(f"Sent Watcher {id}")
-            thr = Watcher(taskBuffer, id, single=True, sleepTime=30, sitemapper=siteMapper)
-            thr.start()
-            thr.join()
+        sweeper.sweep([id for id, in res], 30)
 
     # check heartbeat for 'holding' analysis/ddm jobs
     timeLimit = naive_utcnow() - datetime.timedelta(hours=3)
@@ -377,14 +369,13 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of Holding Anal/DDM Watcher : {res}")
     else:
         _logger.debug(f"# of Holding Anal/DDM Watcher : {len(res)} - XMLs : {len(xmlIDs)}")
+        ids = []
         for (id,) in res:
-            _logger.debug(f"Holding Anal/DDM Watcher {id}")
             if int(id) in xmlIDs:
                 _logger.debug(f"   found XML -> skip {id}")
                 continue
-            thr = Watcher(taskBuffer, id, single=True, sleepTime=180, sitemapper=siteMapper)
-            thr.start()
-            thr.join()
+            ids.append(id)
+        sweeper.sweep(ids, 180)
 
     # check heartbeat for high prio production jobs
     timeOutVal = 3
@@ -401,17 +392,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of High prio Holding Watcher : {res}")
     else:
         _logger.debug(f"# of High prio Holding Watcher : {len(res)}")
-        for (id,) in res:
-            _logger.debug(f"High prio Holding Watcher {id}")
-            thr = Watcher(
-                taskBuffer,
-                id,
-                single=True,
-                sleepTime=60 * timeOutVal,
-                sitemapper=siteMapper,
-            )
-            thr.start()
-            thr.join()
+        sweeper.sweep([id for id, in res], 60 * timeOutVal)
 
     # check heartbeat for production jobs
     timeOutVal = taskBuffer.getConfigValue("job_timeout", "TIMEOUT_holding", "pandaserver")
@@ -429,11 +410,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         _logger.debug(f"# of Holding Watcher with timeout {timeOutVal}min: {str(res)}")
     else:
         _logger.debug(f"# of Holding Watcher with timeout {timeOutVal}min: {len(res)}")
-        for (id,) in res:
-            _logger.debug(f"Holding Watcher {id}")
-            thr = Watcher(taskBuffer, id, single=True, sleepTime=timeOutVal, sitemapper=siteMapper)
-            thr.start()
-            thr.join()
+        sweeper.sweep([id for id, in res], timeOutVal)
 
     # check heartbeat for production jobs
     sql = (
@@ -468,20 +445,13 @@ def main(argv=tuple(), tbuf=None, **kwargs):
             _logger.debug(f"# of General Watcher with workflow={workflow}: {res}")
         else:
             _logger.debug(f"# of General Watcher with workflow={workflow}: {len(res)}")
+            ids = []
             for pandaID, jobStatus, computingSite in res:
                 if computingSite in sitesToSkipTO:
                     _logger.debug(f"skip General Watcher for PandaID={pandaID} at {computingSite} since timeout is disabled for {jobStatus}")
                     continue
-                _logger.debug(f"General Watcher {pandaID}")
-                thr = Watcher(
-                    taskBuffer,
-                    pandaID,
-                    single=True,
-                    sleepTime=60 * timeOutVal,
-                    sitemapper=siteMapper,
-                )
-                thr.start()
-                thr.join()
+                ids.append(pandaID)
+            sweeper.sweep(ids, 60 * timeOutVal)
 
     _memoryCheck("reassign")
 
@@ -1216,17 +1186,7 @@ def main(argv=tuple(), tbuf=None, **kwargs):
             _logger.debug(f"killJobs for Running ({jobs[iJob:iJob + nJob]})")
             Client.kill_jobs(jobs[iJob : iJob + nJob], 2)
             # run watcher
-            for id in jobs[iJob : iJob + nJob]:
-                thr = Watcher(
-                    taskBuffer,
-                    id,
-                    single=True,
-                    sitemapper=siteMapper,
-                    sleepTime=60 * 24 * 21,
-                )
-                thr.start()
-                thr.join()
-                time.sleep(1)
+            sweeper.sweep(jobs[iJob : iJob + nJob], 60 * 24 * 21)
             iJob += nJob
             time.sleep(10)
 
@@ -1300,6 +1260,13 @@ def main(argv=tuple(), tbuf=None, **kwargs):
         except Exception:
             pass
 
+    # delete contents no longer used by files in DA cache
+    try:
+        n_deleted = cache_store.cleanup_store(panda_config.cache_dir)
+        _logger.debug(f"deleted {n_deleted} unused contents in DA cache")
+    except Exception as e:
+        _logger.error(f"failed to clean up contents in DA cache with {str(e)}")
+
     _memoryCheck("delete core")
 
     # delete core
@@ -11,7 +11,7 @@ from pandacommon.pandautils.PandaUtils import naive_utcnow
 from pandacommon.pandautils.thread_utils import GenericThread
 
 import pandaserver.taskbuffer.ErrorCode
-from pandaserver.brokerage.SiteMapper import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
 from pandaserver.dataservice import DataServiceUtils
 from pandaserver.dataservice.closer import Closer
@@ -76,7 +76,7 @@ def main(tbuf=None, **kwargs):
     #     taskBuffer = tbuf
 
     # instantiate sitemapper
-    siteMapper = SiteMapper(taskBuffer)
+    siteMapper = get_site_mapper(taskBuffer)
 
     # list with lock
     class ListWithLock:
@@ -10,7 +10,7 @@ from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 from pandacommon.pandautils.thread_utils import GenericThread
 
-from pandaserver.brokerage import SiteMapper
+from pandaserver.brokerage.site_mapper_snapshot import get_site_mapper
 from pandaserver.config import panda_config
 from pandaserver.dataservice.event_picker import EventPicker
 
@@ -42,7 +42,7 @@ def main(tbuf=None, **kwargs):
         useTimeout=True,
         requester=requester_id,
     )
-    siteMapper = SiteMapper.SiteMapper(taskBuffer)
+    siteMapper = get_site_mapper(taskBuffer)
 
     # thread pool
     class ThreadPool:
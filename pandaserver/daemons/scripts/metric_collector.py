@@ -11,7 +11,11 @@ from zlib import adler32
 import numpy as np
 from pandacommon.pandalogger import logger_utils
 from pandacommon.pandalogger.PandaLogger import PandaLogger
-from pandacommon.pandautils.PandaUtils import naive_utcnow
+from pandacommon.pandautils.PandaUtils import (
+    batched,
+    get_sql_IN_bind_variables,
+    naive_utcnow,
+)
 from pandacommon.pandautils.thread_utils import GenericThread
 from scipy import stats
 
@@ -35,6 +39,13 @@ metric_list = [
 # constant maps
 class_value_rank_map = {1: "A_sites", 0: "B_sites", -1: "C_sites"}
 
+# times when jobs were activated and started running, kept between cycles in the process since they don't change once
+# both are recorded. PandaID -> (activated time, running time)
+pmerge_transition_cache = {}
+
+# the number of PandaIDs to look up status logs in a query
+status_log_batch_size = 1000
+
 
 def get_now_time_str():
     """
@@ -332,8 +343,12 @@ class FetchData(object):
             "AND (processingType='pmerge' OR prodUserName='gangarbt') "
             "AND modificationTime>:modificationTime "
         )
-        sql_get_latest_job_mtime_status = (
-            "SELECT jobStatus, MIN(modificationTime) " "FROM ATLAS_PANDA.jobs_StatusLog " "WHERE pandaID=:pandaID " "GROUP BY jobStatus "
+        sql_get_job_mtime_status_template = (
+            "SELECT pandaID, jobStatus, MIN(modificationTime) "
+            "FROM ATLAS_PANDA.jobs_StatusLog "
+            "WHERE pandaID IN ({panda_id_var_names_str}) "
+            "AND jobStatus IN ('activated', 'running') "
+            "GROUP BY pandaID, jobStatus "
         )
         sql_get_site_workflow = "SELECT /* use_json_type */ scj.data.workflow " "FROM ATLAS_PANDA.schedconfig_json scj " "WHERE scj.panda_queue=:computingSite "
         sql_get_long_queuing_job_wait_time_template = (
@@ -362,33 +377,47 @@ class FetchData(object):
             all_jobs_set.update(active4_jobs_list)
             n_tot_jobs = len(all_jobs_set)
             tmp_log.debug(f"got total {n_tot_jobs} jobs")
-            # loop over jobs to get modificationTime when activated and running
-            cc = 0
-            for pandaID, site in all_jobs_set:
-                if not site:
-                    continue
-                varMap = {":pandaID": pandaID}
-                status_mtime_list = self.tbuf.querySQL(sql_get_latest_job_mtime_status, varMap)
-                status_mtime_dict = dict(status_mtime_list)
-                if "activated" not in status_mtime_dict or "running" not in status_mtime_dict:
-                    continue
-                wait_time = status_mtime_dict["running"] - status_mtime_dict["activated"]
-                wait_time_sec = wait_time.total_seconds()
-                if wait_time_sec < 0:
-                    tmp_log.warning(f"job {pandaID} has negative wait time")
-                    continue
-                run_age_sec = int((now_time - status_mtime_dict["running"]).total_seconds())
-                if run_age_sec < 0:
-                    tmp_log.warning(f"job {pandaID} has negative run age")
-                    continue
-                tmp_site_dict.setdefault(site, {"wait_time": [], "run_age": []})
-                tmp_site_dict[site]["wait_time"].append(wait_time_sec)
-                tmp_site_dict[site]["run_age"].append(run_age_sec)
-                # log message
-                if cc > 0 and cc % 5000 == 0:
-                    tmp_log.debug(f"... queried {cc:9d} jobs ...")
-                cc += 1
-            tmp_log.debug(f"queried {cc} jobs")
+            # drop jobs which are no longer in the window from the transition cache
+            job_list = [(pandaID, site) for pandaID, site in all_jobs_set if site]
+            panda_id_set = {pandaID for pandaID, site in job_list}
+            for pandaID in set(pmerge_transition_cache) - panda_id_set:
+                del pmerge_transition_cache[pandaID]
+            # get modificationTime when activated and running for jobs without both transitions in the cache
+            new_panda_ids = sorted(panda_id_set - set(pmerge_transition_cache))
+            tmp_log.debug(f"{len(panda_id_set) - len(new_panda_ids)} jobs in cache, querying status logs of {len(new_panda_ids)} jobs")
+            for tmp_panda_ids in batched(new_panda_ids, status_log_batch_size):
+                panda_id_var_names_str, varMap = get_sql_IN_bind_variables(tmp_panda_ids, prefix=":pandaID")
+                sql_get_job_mtime_status = sql_get_job_mtime_status_template.format(panda_id_var_names_str=panda_id_var_names_str)
+                status_mtime_map = {}
+                for pandaID, job_status, mtime in self.tbuf.querySQL(sql_get_job_mtime_status, varMap):
+                    status_mtime_map.setdefault(pandaID, {})[job_status] = mtime
+                for pandaID, status_mtime_dict in status_mtime_map.items():
+                    if "activated" in status_mtime_dict and "running" in status_mtime_dict:
+                        pmerge_transition_cache[pandaID] = (status_mtime_dict["activated"], status_mtime_dict["running"])
+            # wait time and run age in a vectorised pass
+            job_list = [(pandaID, site) for pandaID, site in job_list if pandaID in pmerge_transition_cache]
+            tmp_log.debug(f"got transitions of {len(job_list)} jobs")
+            now_time_64 = np.datetime64(now_time, "us")
+            activated_array = np.array([pmerge_transition_cache[pandaID][0] for pandaID, site in job_list], dtype="datetime64[us]")
+            running_array = np.array([pmerge_transition_cache[pandaID][1] for pandaID, site in job_list], dtype="datetime64[us]")
+            all_wait_time_array = (running_array - activated_array) / np.timedelta64(1, "s")
+            all_run_age_array = ((now_time_64 - running_array) / np.timedelta64(1, "s")).astype(np.int64)
+            site_array = np.array([site for pandaID, site in job_list], dtype=str)
+            # skip jobs with negative values
+            bad_mask = (all_wait_time_array < 0) | (all_run_age_array < 0)
+            if np.any(bad_mask):
+                tmp_log.warning(f"{np.count_nonzero(bad_mask)} jobs have negative wait time or run age")
+            good_mask = ~bad_mask
+            # group by site
+            tmp_site_dict = dict()
+            if np.any(good_mask):
+                site_names, site_index_array = np.unique(site_array[good_mask], return_inverse=True)
+                order = np.argsort(site_index_array, kind="stable")
+                split_points = np.cumsum(np.bincount(site_index_array, minlength=len(site_names)))[:-1]
+                wait_time_groups = np.split(all_wait_time_array[good_mask][order], split_points)
+                run_age_groups = np.split(all_run_age_array[good_mask][order], split_points)
+                for site, wait_time_group, run_age_group in zip(site_names, wait_time_groups, run_age_groups):
+                    tmp_site_dict[str(site)] = {"wait_time": wait_time_group, "run_age": run_age_group}
             # evaluate stats
             site_dict = dict()
             for site, data_dict in tmp_site_dict.items():
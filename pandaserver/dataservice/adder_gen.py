@@ -75,6 +75,8 @@ class AdderGen:
         self.adder_plugin = None
         self.add_result = None
         self.adder_plugin_class = None
+        # time in seconds spent in each stage
+        self.stage_times = {"parse": 0.0, "plugin": 0.0, "db_update": 0.0}
         # logger
         self.logger = LogWrapper(_logger, str(self.job_id))
 
@@ -398,11 +400,15 @@ class AdderGen:
         self.adder_plugin = None
 
         # parse Job Output Report JSON
+        stage_start = time.monotonic()
         parse_result = self.parse_job_output_report()
+        self.stage_times["parse"] += time.monotonic() - stage_start
 
         # If the parse_result is less than 2, it means that the parsing either succeeded or encountered a harmless error
         if parse_result < 2:
+            stage_start = time.monotonic()
             self.execute_plugin()
+            self.stage_times["plugin"] += time.monotonic() - stage_start
 
             # ignore temporary errors
             if self.ignore_tmp_error and self.add_result is not None and self.add_result.is_temporary():
@@ -449,6 +455,7 @@ class AdderGen:
             pass
         else:
             self.logger.debug("updating DB")
+            stage_start = time.monotonic()
             update_result = self.taskBuffer.updateJobs(
                 [self.job],
                 False,
@@ -456,6 +463,7 @@ class AdderGen:
                 extraInfo=self.extra_info,
                 async_dataset_update=True,
             )
+            self.stage_times["db_update"] += time.monotonic() - stage_start
             self.logger.debug(f"retU: {update_result}")
 
             # failed
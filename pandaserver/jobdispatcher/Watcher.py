@@ -10,7 +10,7 @@ import traceback
 
 from pandacommon.pandalogger.LogWrapper import LogWrapper
 from pandacommon.pandalogger.PandaLogger import PandaLogger
-from pandacommon.pandautils.PandaUtils import naive_utcnow
+from pandacommon.pandautils.PandaUtils import batched, naive_utcnow
 
 from pandaserver.dataservice.closer import Closer
 from pandaserver.jobdispatcher import ErrorCode
@@ -22,6 +22,154 @@ from pandaserver.taskbuffer.SupErrors import SupErrors
 _logger = PandaLogger().getLogger("Watcher")
 
 
+# statuses of jobs to be watched
+watched_statuses = ["running", "sent", "starting", "holding", "stagein", "stageout"]
+
+
+# check if the job is in a status to be watched
+def is_watched_job(job):
+    if job.jobStatus in watched_statuses:
+        return True
+    if job.jobStatus == "transferring" and (job.prodSourceLabel in ["user", "panda"] or job.jobSubStatus not in [None, "NULL", ""]):
+        return True
+    return False
+
+
+# check if the job lost heartbeats
+def is_timed_out(job, sleep_time):
+    time_limit = naive_utcnow() - datetime.timedelta(minutes=sleep_time)
+    return job.modificationTime < time_limit or (job.endTime != "NULL" and job.endTime < time_limit)
+
+
+# set error codes, status and file status for a job which lost heartbeats
+def fail_timed_out_job(job, sleep_time, get_workers, get_event_stat):
+    """
+    Apply the decision of the watcher to a job in memory
+
+    :param job: JobSpec
+    :param sleep_time: timeout in minutes
+    :param get_workers: function to get the list of WorkerSpecs for PandaID
+    :param get_event_stat: function to get the event stat for jediTaskID and PandaID
+    :return: list of destinationDBlocks of output and log files
+    """
+    destDBList = []
+    if job.jobStatus == "sent":
+        # sent job didn't receive reply from pilot within 30 min
+        job.jobDispatcherErrorCode = ErrorCode.EC_SendError
+        job.jobDispatcherErrorDiag = "Sent job didn't receive reply from pilot within 30 min"
+    elif job.exeErrorDiag == "NULL" and job.pilotErrorDiag == "NULL":
+        # lost heartbeat
+        if job.jobDispatcherErrorDiag == "NULL":
+            if job.endTime == "NULL":
+                # normal lost heartbeat
+                job.jobDispatcherErrorCode = ErrorCode.EC_Watcher
+                job.jobDispatcherErrorDiag = f"lost heartbeat : {str(job.modificationTime)}"
+            else:
+                if job.jobStatus == "holding":
+                    job.jobDispatcherErrorCode = ErrorCode.EC_Holding
+                elif job.jobStatus == "transferring":
+                    job.jobDispatcherErrorCode = ErrorCode.EC_Transferring
+                else:
+                    job.jobDispatcherErrorCode = ErrorCode.EC_Timeout
+                job.jobDispatcherErrorDiag = f"timeout in {job.jobStatus} : last heartbeat at {str(job.endTime)}"
+            # get worker
+            workerSpecs = get_workers(job.PandaID)
+            if len(workerSpecs) > 0:
+                workerSpec = workerSpecs[0]
+                if workerSpec.status in [
+                    "finished",
+                    "failed",
+                    "cancelled",
+                    "missed",
+                ]:
+                    job.supErrorCode = SupErrors.error_codes["WORKER_ALREADY_DONE"]
+                    job.supErrorDiag = f"worker already {workerSpec.status} at {str(workerSpec.endTime)} with {workerSpec.diagMessage}"
+                    job.supErrorDiag = JobSpec.truncateStringAttr("supErrorDiag", job.supErrorDiag)
+    else:
+        # job recovery failed
+        job.jobDispatcherErrorCode = ErrorCode.EC_Recovery
+        job.jobDispatcherErrorDiag = f"job recovery failed for {sleep_time / 60} hours"
+    # set job status
+    job.jobStatus = "failed"
+    # set endTime for lost heartbeat
+    if job.endTime == "NULL":
+        # normal lost heartbeat
+        job.endTime = job.modificationTime
+    # set files status
+    for file in job.Files:
+        if file.type == "output" or file.type == "log":
+            file.status = "failed"
+            if file.destinationDBlock not in destDBList:
+                destDBList.append(file.destinationDBlock)
+    # event service
+    if EventServiceUtils.isEventServiceJob(job) and not EventServiceUtils.isJobCloningJob(job):
+        eventStat = get_event_stat(job.jediTaskID, job.PandaID)
+        # set sub status when no successful events
+        if EventServiceUtils.ST_finished not in eventStat:
+            job.jobSubStatus = "es_heartbeat"
+    return destDBList
+
+
+# run retry module and closer for a job failed by the watcher
+def post_process_failed_job(taskBuffer, job, destDBList, logger, archived_job_map=None):
+    """
+    :param archived_job_map: dictionary of PandaID and JobSpec already read from jobsArchived4. The job is read from the database if None
+    """
+    if job.jobStatus != "failed":
+        return
+    source = "jobDispatcherErrorCode"
+    error_code = job.jobDispatcherErrorCode
+    error_diag = job.jobDispatcherErrorDiag
+    errors = [
+        {
+            "source": source,
+            "error_code": error_code,
+            "error_diag": error_diag,
+        }
+    ]
+
+    try:
+        logger.debug("Watcher will call job_failure_postprocessing")
+        retryModule.job_failure_postprocessing(taskBuffer, job.PandaID, errors, job.attemptNr)
+        logger.debug("job_failure_postprocessing is back")
+    except Exception as e:
+        logger.debug(f"job_failure_postprocessing excepted and needs to be investigated ({e}): {traceback.format_exc()}")
+
+    # updateJobs was successful and it failed a job with taskBufferErrorCode
+    try:
+        if archived_job_map is None:
+            logger.debug("Watcher.run will peek the job")
+            job_tmp = taskBuffer.peekJobs(
+                [job.PandaID],
+                fromDefined=False,
+                fromArchived=True,
+                fromWaiting=False,
+            )[0]
+        else:
+            job_tmp = archived_job_map.get(job.PandaID)
+        if job_tmp is not None and job_tmp.taskBufferErrorCode:
+            source = "taskBufferErrorCode"
+            error_code = job_tmp.taskBufferErrorCode
+            error_diag = job_tmp.taskBufferErrorDiag
+            logger.debug("Watcher.run 2 will call job_failure_postprocessing")
+            retryModule.job_failure_postprocessing(
+                taskBuffer,
+                job_tmp.PandaID,
+                source,
+                error_code,
+                error_diag,
+                job_tmp.attemptNr,
+            )
+            logger.debug("job_failure_postprocessing 2 is back")
+    except IndexError:
+        pass
+    except Exception as e:
+        logger.error(f"job_failure_postprocessing 2 excepted and needs to be investigated ({e}): {traceback.format_exc()}")
+
+    cThr = Closer(taskBuffer, destDBList, job)
+    cThr.run()
+
+
 class Watcher(threading.Thread):
     # constructor
     def __init__(self, taskBuffer, pandaID, single=False, sleepTime=360, sitemapper=None):
@@ -50,130 +198,17 @@ class Watcher(threading.Thread):
                     self.logger.debug("escape : not found")
                     return
                 self.logger.debug(f"in {job.jobStatus}")
-                if job.jobStatus not in [
-                    "running",
-                    "sent",
-                    "starting",
-                    "holding",
-                    "stagein",
-                    "stageout",
-                ]:
-                    if job.jobStatus == "transferring" and (job.prodSourceLabel in ["user", "panda"] or job.jobSubStatus not in [None, "NULL", ""]):
-                        pass
-                    else:
-                        self.logger.debug(f"escape : wrong status {job.jobStatus}")
-                        return
+                if not is_watched_job(job):
+                    self.logger.debug(f"escape : wrong status {job.jobStatus}")
+                    return
                 # time limit
-                timeLimit = naive_utcnow() - datetime.timedelta(minutes=self.sleepTime)
-                if job.modificationTime < timeLimit or (job.endTime != "NULL" and job.endTime < timeLimit):
+                if is_timed_out(job, self.sleepTime):
                     self.logger.debug(f"{job.jobStatus} lastmod:{str(job.modificationTime)} endtime:{str(job.endTime)}")
-                    destDBList = []
-                    if job.jobStatus == "sent":
-                        # sent job didn't receive reply from pilot within 30 min
-                        job.jobDispatcherErrorCode = ErrorCode.EC_SendError
-                        job.jobDispatcherErrorDiag = "Sent job didn't receive reply from pilot within 30 min"
-                    elif job.exeErrorDiag == "NULL" and job.pilotErrorDiag == "NULL":
-                        # lost heartbeat
-                        if job.jobDispatcherErrorDiag == "NULL":
-                            if job.endTime == "NULL":
-                                # normal lost heartbeat
-                                job.jobDispatcherErrorCode = ErrorCode.EC_Watcher
-                                job.jobDispatcherErrorDiag = f"lost heartbeat : {str(job.modificationTime)}"
-                            else:
-                                if job.jobStatus == "holding":
-                                    job.jobDispatcherErrorCode = ErrorCode.EC_Holding
-                                elif job.jobStatus == "transferring":
-                                    job.jobDispatcherErrorCode = ErrorCode.EC_Transferring
-                                else:
-                                    job.jobDispatcherErrorCode = ErrorCode.EC_Timeout
-                                job.jobDispatcherErrorDiag = f"timeout in {job.jobStatus} : last heartbeat at {str(job.endTime)}"
-                            # get worker
-                            workerSpecs = self.taskBuffer.getWorkersForJob(job.PandaID)
-                            if len(workerSpecs) > 0:
-                                workerSpec = workerSpecs[0]
-                                if workerSpec.status in [
-                                    "finished",
-                                    "failed",
-                                    "cancelled",
-                                    "missed",
-                                ]:
-                                    job.supErrorCode = SupErrors.error_codes["WORKER_ALREADY_DONE"]
-                                    job.supErrorDiag = f"worker already {workerSpec.status} at {str(workerSpec.endTime)} with {workerSpec.diagMessage}"
-                                    job.supErrorDiag = JobSpec.truncateStringAttr("supErrorDiag", job.supErrorDiag)
-                    else:
-                        # job recovery failed
-                        job.jobDispatcherErrorCode = ErrorCode.EC_Recovery
-                        job.jobDispatcherErrorDiag = f"job recovery failed for {self.sleepTime / 60} hours"
-                    # set job status
-                    job.jobStatus = "failed"
-                    # set endTime for lost heartbeat
-                    if job.endTime == "NULL":
-                        # normal lost heartbeat
-                        job.endTime = job.modificationTime
-                    # set files status
-                    for file in job.Files:
-                        if file.type == "output" or file.type == "log":
-                            file.status = "failed"
-                            if file.destinationDBlock not in destDBList:
-                                destDBList.append(file.destinationDBlock)
-                    # event service
-                    if EventServiceUtils.isEventServiceJob(job) and not EventServiceUtils.isJobCloningJob(job):
-                        eventStat = self.taskBuffer.getEventStat(job.jediTaskID, job.PandaID)
-                        # set sub status when no successful events
-                        if EventServiceUtils.ST_finished not in eventStat:
-                            job.jobSubStatus = "es_heartbeat"
+                    destDBList = fail_timed_out_job(job, self.sleepTime, self.taskBuffer.getWorkersForJob, self.taskBuffer.getEventStat)
                     # update job
                     self.taskBuffer.updateJobs([job], False)
                     # start closer
-                    if job.jobStatus == "failed":
-                        source = "jobDispatcherErrorCode"
-                        error_code = job.jobDispatcherErrorCode
-                        error_diag = job.jobDispatcherErrorDiag
-                        errors = [
-                            {
-                                "source": source,
-                                "error_code": error_code,
-                                "error_diag": error_diag,
-                            }
-                        ]
-
-                        try:
-                            self.logger.debug("Watcher will call job_failure_postprocessing")
-                            retryModule.job_failure_postprocessing(self.taskBuffer, job.PandaID, errors, job.attemptNr)
-                            self.logger.debug("job_failure_postprocessing is back")
-                        except Exception as e:
-                            self.logger.debug(f"job_failure_postprocessing excepted and needs to be investigated ({e}): {traceback.format_exc()}")
-
-                        # updateJobs was successful and it failed a job with taskBufferErrorCode
-                        try:
-                            self.logger.debug("Watcher.run will peek the job")
-                            job_tmp = self.taskBuffer.peekJobs(
-                                [job.PandaID],
-                                fromDefined=False,
-                                fromArchived=True,
-                                fromWaiting=False,
-                            )[0]
-                            if job_tmp.taskBufferErrorCode:
-                                source = "taskBufferErrorCode"
-                                error_code = job_tmp.taskBufferErrorCode
-                                error_diag = job_tmp.taskBufferErrorDiag
-                                self.logger.debug("Watcher.run 2 will call job_failure_postprocessing")
-                                retryModule.job_failure_postprocessing(
-                                    self.taskBuffer,
-                                    job_tmp.PandaID,
-                                    source,
-                                    error_code,
-                                    error_diag,
-                                    job_tmp.attemptNr,
-                                )
-                                self.logger.debug("job_failure_postprocessing 2 is back")
-                        except IndexError:
-                            pass
-                        except Exception as e:
-                            self.logger.error(f"job_failure_postprocessing 2 excepted and needs to be investigated ({e}): {traceback.format_exc()}")
-
-                        cThr = Closer(self.taskBuffer, destDBList, job)
-                        cThr.run()
+                    post_process_failed_job(self.taskBuffer, job, destDBList, self.logger)
                     self.logger.debug("done")
                     return
                 # single action
@@ -184,3 +219,79 @@ class Watcher(threading.Thread):
         except Exception as e:
             self.logger.error(f"run() : {str(e)} {traceback.format_exc()}")
             return
+
+
+# sweeper to fail jobs which lost heartbeats in bounded batches
+class HeartbeatSweeper:
+    """
+    Bulk version of Watcher for many jobs. Jobs and their workers are loaded with array-bound queries for each batch,
+    the decision of Watcher is applied in memory, and the jobs are updated with a single updateJobs call. Archived jobs
+    are read back with one array-bound query for post-processing, while archiving, the retry module, and Closer still
+    run for each job
+    """
+
+    # constructor
+    def __init__(self, taskBuffer, sitemapper=None, batch_size=500):
+        self.taskBuffer = taskBuffer
+        self.siteMapper = sitemapper
+        self.batchSize = batch_size
+        self.logger = LogWrapper(_logger, "HeartbeatSweeper")
+
+    # sweep jobs
+    def sweep(self, panda_ids, sleep_time):
+        """
+        :param panda_ids: list of PandaIDs to check
+        :param sleep_time: timeout in minutes
+        :return: the number of failed jobs
+        """
+        n_failed = 0
+        t_start = time.monotonic()
+        for tmp_panda_ids in batched(panda_ids, self.batchSize):
+            try:
+                n_failed += self.sweep_batch(list(tmp_panda_ids), sleep_time)
+            except Exception as e:
+                self.logger.error(f"sweep_batch : {str(e)} {traceback.format_exc()}")
+        duration = time.monotonic() - t_start
+        self.logger.debug(f"failed {n_failed}/{len(panda_ids)} jobs with timeout={sleep_time}min in {duration:.1f} sec")
+        return n_failed
+
+    # sweep a batch of jobs
+    def sweep_batch(self, panda_ids, sleep_time):
+        # query jobs
+        jobs = self.taskBuffer.peek_active_jobs_in_bulk(panda_ids)
+        if jobs is None:
+            self.logger.error(f"failed to get {len(panda_ids)} jobs")
+            return 0
+        # check status and heartbeat
+        timed_out_jobs = []
+        for job in jobs:
+            if not is_watched_job(job):
+                self.logger.debug(f"PandaID={job.PandaID} escape : wrong status {job.jobStatus}")
+                continue
+            if not is_timed_out(job, sleep_time):
+                continue
+            self.logger.debug(f"PandaID={job.PandaID} {job.jobStatus} lastmod:{str(job.modificationTime)} endtime:{str(job.endTime)}")
+            timed_out_jobs.append(job)
+        if not timed_out_jobs:
+            return 0
+        # get workers for jobs with lost heartbeats
+        worker_map = self.taskBuffer.get_workers_for_jobs([job.PandaID for job in timed_out_jobs if job.jobStatus != "sent"])
+        # apply the decision
+        dest_map = {}
+        for job in timed_out_jobs:
+            dest_map[job.PandaID] = fail_timed_out_job(job, sleep_time, lambda panda_id: worker_map.get(panda_id, []), self.taskBuffer.getEventStat)
+        # update jobs
+        self.taskBuffer.updateJobs(timed_out_jobs, False)
+        # read archived jobs to check errors set in archiving
+        archived_job_map = self.taskBuffer.peek_archived_jobs_in_bulk([job.PandaID for job in timed_out_jobs if job.jobStatus == "failed"])
+        if archived_job_map is None:
+            self.logger.error(f"failed to get {len(timed_out_jobs)} archived jobs")
+            archived_job_map = {}
+        # retry module and closer
+        for job in timed_out_jobs:
+            tmp_logger = LogWrapper(_logger, str(job.PandaID))
+            try:
+                post_process_failed_job(self.taskBuffer, job, dest_map[job.PandaID], tmp_logger, archived_job_map)
+            except Exception as e:
+                tmp_logger.error(f"post-processing : {str(e)} {traceback.format_exc()}")
+        return len(timed_out_jobs)
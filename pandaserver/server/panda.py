@@ -5,8 +5,6 @@ entry point
 
 """
 
-import datetime
-import decimal
 import gzip
 import io
 import json
@@ -49,12 +47,22 @@ from pandaserver.srvcore import CoreUtils
 # IMPORTANT: Add any new methods here to allow them to be called from the web I/F
 from pandaserver.srvcore.allowed_methods import allowed_methods
 from pandaserver.srvcore.panda_request import PandaRequest
+from pandaserver.srvcore.response_utils import (
+    FileResponse,
+    compress_response,
+    dump_json,
+)
 from pandaserver.taskbuffer.Initializer import initializer
 from pandaserver.taskbuffer.TaskBuffer import taskBuffer
 from pandaserver.userinterface import Client
 
 # pylint: disable=W0611
 # Leftovers from old API
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
 from pandaserver.userinterface.UserIF import (
     delete_checkpoint,
     execute_idds_workflow_command,
@@ -120,10 +128,10 @@ if panda_config.nDBConnection != 0:
 # ban list
 if panda_config.nDBConnection != 0:
     # get ban list directly from the database
-    ban_user_list = CoreUtils.CachedObject("ban_list", 600, taskBuffer.get_ban_users, _logger)
+    ban_user_list = CoreUtils.CachedObject("ban_list", 600, taskBuffer.get_ban_users, _logger, stale_while_revalidate=True, jitter=0.1)
 else:
     # get ban list from remote
-    ban_user_list = CoreUtils.CachedObject("ban_list", 600, Client.get_banned_users, _logger)
+    ban_user_list = CoreUtils.CachedObject("ban_list", 600, Client.get_banned_users, _logger, stale_while_revalidate=True, jitter=0.1)
 
 
 def pre_validate_request(panda_request):
@@ -144,25 +152,58 @@ def pre_validate_request(panda_request):
 
 
 def read_body(environ, content_length):
-    # read body contents
-    body = b""
+    # read body contents into a file object without re-copying chunks. large bodies are spooled to disk
+    body = tempfile.SpooledTemporaryFile(max_size=panda_config.request_body_spool_size)
     while content_length > 0:
         chunk = environ["wsgi.input"].read(min(content_length, 1024 * 1024))
         if not chunk:
             break
         content_length -= len(chunk)
-        body += chunk
+        body.write(chunk)
     if content_length > 0:
+        body.close()
         # OSError is caught in the main function and forces killing the process
         raise OSError(f"partial read from client. {content_length} bytes remaining")
+    body.seek(0)
+
+    return body
+
+
+def get_body_size(body):
+    # get the size of the body without reading it
+    size = body.seek(0, io.SEEK_END)
+    body.seek(0)
+    return size
+
 
+def get_body_bytes(body):
+    # get the whole body for dump
+    body.seek(0)
+    return body.read()
+
+
+def open_body_stream(body, decompress):
+    # decompress the body incrementally while reading
+    body.seek(0)
+    if decompress:
+        return gzip.GzipFile(fileobj=body, mode="rb")
     return body
 
 
+def load_json_stream(stream, size):
+    # parse large bodies as a stream to avoid holding the decompressed text in memory together with the objects
+    if ijson is not None and 0 < panda_config.json_stream_threshold <= size:
+        try:
+            return next(ijson.items(stream, "", use_float=True))
+        except (ijson.JSONError, StopIteration) as e:
+            raise json.JSONDecodeError(f"{e.__class__.__name__}: {str(e)}", "", 0)
+    return json.load(stream)
+
+
 def parse_qsl_parameters(environ, body, request_method):
     # parse parameters for non-json requests
-    environ["wsgi.input"] = io.BytesIO(body)
-    environ["CONTENT_LENGTH"] = str(len(body))
+    environ["CONTENT_LENGTH"] = str(get_body_size(body))
+    environ["wsgi.input"] = body
     environ["wsgi.headers"] = EnvironHeaders(environ)
 
     # In the case of GET, HEAD methods we need to parse the query string list in the URL looking for parameters
@@ -188,10 +229,10 @@ def parse_qsl_parameters(environ, body, request_method):
 def parse_json_parameters_legacy(body):
     # parse parameters for json requests
     # decompress the body, this was done without checking the content encoding
-    body = gzip.decompress(body)
+    stream = open_body_stream(body, True)
 
     # de-serialize the body and patch for True/False
-    params = json.loads(body)
+    params = load_json_stream(stream, get_body_size(body))
     for key in list(params):
         if params[key] is True:
             params[key] = "True"
@@ -203,11 +244,11 @@ def parse_json_parameters_legacy(body):
 def parse_json_parameters(body, content_encoding):
     # parse parameters for json requests
     # decompress the body if necessary
-    if content_encoding == "gzip":
-        body = gzip.decompress(body)
+    size = get_body_size(body)
+    stream = open_body_stream(body, content_encoding == "gzip")
 
     # de-serialize the body
-    params = json.loads(body)
+    params = load_json_stream(stream, size)
 
     return params
 
@@ -299,18 +340,6 @@ def validate_method(method_name, api_module, version):
     return False
 
 
-# Encoder: convert datetime → ISO string with a marker
-def encode_special_cases(obj):
-    if isinstance(obj, datetime.datetime):
-        return {"__datetime__": obj.isoformat()}
-    if isinstance(obj, decimal.Decimal):
-        if obj == obj.to_integral_value():
-            return int(obj)
-        else:
-            return float(obj)
-    raise TypeError(f"Type not serializable for {obj} ({type(obj)})")
-
-
 # This is the starting point for all WSGI requests
 def application(environ, start_response):
     # Parse the script name to retrieve method, module and version
@@ -379,7 +408,7 @@ def application(environ, start_response):
             params = parse_parameters(api_module, json_app, json_body, content_encoding, environ, body, request_method)
         except json.JSONDecodeError as e:
             error_message = f"received invalid JSON : {str(e)}"
-            tmp_log.error(error_message + (f" with {body}" if panda_config.entryVerbose else ""))
+            tmp_log.error(error_message + (f" with {get_body_bytes(body)}" if panda_config.entryVerbose else ""))
             start_response("500 INTERNAL SERVER ERROR", [("Content-Type", "text/plain")])
             return [f"ERROR : {error_message}".encode()]
 
@@ -390,6 +419,14 @@ def application(environ, start_response):
         param_list = [panda_request]
         exec_result = tmp_method(*param_list, **params)
 
+        # send a file without loading it into memory
+        if isinstance(exec_result, FileResponse):
+            duration = naive_utcnow() - start_time
+            tmp_log.info(
+                f"exec_time={duration.seconds}.{duration.microseconds // 1000:03d} sec, return_type=file status={exec_result.status} len={exec_result.get_content_length()} B"
+            )
+            return exec_result.serve(environ, start_response)
+
         # extract return type
         if isinstance(exec_result, dict) and "type" in exec_result and "content" in exec_result:
             return_type = exec_result["type"]
@@ -402,7 +439,7 @@ def application(environ, start_response):
         # convert the response to JSON or str depending on HTTP_ACCEPT and CONTENT_TYPE
         if new_api:
             if json_app:
-                exec_result = json.dumps(exec_result, default=encode_special_cases)
+                exec_result = dump_json(exec_result, panda_config.json_encoder)
             elif not isinstance(exec_result, str):
                 exec_result = str(exec_result)
 
@@ -412,7 +449,7 @@ def application(environ, start_response):
             try:
                 with tempfile.NamedTemporaryFile(delete=False, prefix="req_dump_") as file_object:
                     environ["WSGI_INPUT_DUMP"] = file_object.name
-                    file_object.write(body)
+                    file_object.write(get_body_bytes(body))
                     os.chmod(file_object.name, 0o775)
             except Exception:
                 tmp_log.error(traceback.format_exc())
@@ -432,27 +469,44 @@ def application(environ, start_response):
     if panda_config.entryVerbose:
         tmp_log.debug("done")
 
-    # log execution time and return length
+    # log execution time and return type
     duration = naive_utcnow() - start_time
-    tmp_log.info(
-        f"exec_time={duration.seconds}.{duration.microseconds // 1000:03d} sec, return_type={return_type} real_type={type(exec_result).__name__} len={len(str(exec_result))} B"
-    )
+    real_type = type(exec_result).__name__
 
     # start the response and return result
     if exec_result == pandaserver.taskbuffer.ErrorCode.EC_NotFound:
+        tmp_log.info(f"exec_time={duration.seconds}.{duration.microseconds // 1000:03d} sec, return_type={return_type} real_type={real_type} not found")
         start_response("404 Not Found", [("Content-Type", "text/plain")])
         return ["not found".encode()]
 
     if exec_result == pandaserver.taskbuffer.ErrorCode.EC_Forbidden:
+        tmp_log.info(f"exec_time={duration.seconds}.{duration.microseconds // 1000:03d} sec, return_type={return_type} real_type={real_type} forbidden")
         start_response("403 Forbidden", [("Content-Type", "text/plain")])
         return ["forbidden".encode()]
 
+    if isinstance(exec_result, str):
+        exec_result = exec_result.encode()
+    elif not isinstance(exec_result, bytes):
+        exec_result = str(exec_result).encode()
+
     if return_type == "json":
-        start_response("200 OK", [("Content-Type", "application/json")])
+        headers = [("Content-Type", "application/json")]
     else:
-        start_response("200 OK", [("Content-Type", "text/plain")])
+        headers = [("Content-Type", "text/plain")]
 
-    if isinstance(exec_result, str):
-        exec_result = exec_result.encode()
+    # compress the response if the client accepts it
+    raw_length = len(exec_result)
+    content_encoding = None
+    if new_api:
+        exec_result, content_encoding = compress_response(exec_result, environ.get("HTTP_ACCEPT_ENCODING"), panda_config.response_compress_threshold)
+        headers.append(("Vary", "Accept-Encoding"))
+        if content_encoding:
+            headers.append(("Content-Encoding", content_encoding))
+
+    tmp_log.info(
+        f"exec_time={duration.seconds}.{duration.microseconds // 1000:03d} sec, return_type={return_type} real_type={real_type} len={raw_length} B"
+        + (f" {content_encoding}={len(exec_result)} B" if content_encoding else "")
+    )
 
+    start_response("200 OK", headers)
     return [exec_result]
@@ -3,9 +3,11 @@ import datetime
 import json
 import math
 import os
+import random
 import re
 import subprocess
-from threading import Lock
+import time
+from threading import Event, Lock, Thread
 from typing import Generator
 
 from pandacommon.pandautils.PandaUtils import naive_utcnow
@@ -156,7 +158,7 @@ def resolve_bool(param):
 # cached object
 class CachedObject:
     # constructor
-    def __init__(self, name, time_interval, update_func, log_stream):
+    def __init__(self, name, time_interval, update_func, log_stream, stale_while_revalidate=False, jitter=0.0):
         # name
         self.name = name
         # cached object
@@ -165,35 +167,107 @@ class CachedObject:
         self.lastUpdated = naive_utcnow()
         # update frequency
         self.timeInterval = datetime.timedelta(seconds=time_interval)
+        # fraction of random jitter added to the update frequency to avoid synchronized updates across processes
+        self.jitter = jitter
+        # datetime when the object expires
+        self.expiry = self.lastUpdated
         # lock
         self.lock = Lock()
         # function to update object
         self.updateFunc = update_func
         # log
         self.log_stream = log_stream
+        # return the previous object while one background thread is updating it, instead of blocking readers
+        self.stale_while_revalidate = stale_while_revalidate
+        self.refreshing = False
+        self.refresh_lock = Lock()
+        # metrics
+        self.n_refreshes = 0
+        self.n_failed_refreshes = 0
+        self.refresh_time_sum = 0.0
+        self.refresh_time_max = 0.0
+
+    # get the next expiry with jitter
+    def get_next_expiry(self, current):
+        return current + get_jittered_interval(self.timeInterval, self.jitter)
+
+    # call update function
+    def call_update_func(self):
+        self.log_stream.debug(f"PID={os.getpid()} renewing {self.name} cache")
+        start_time = time.monotonic()
+        tmp_stat, tmp_out = False, None
+        try:
+            tmp_stat, tmp_out = self.updateFunc()
+            self.log_stream.debug(f"PID={os.getpid()} got for {self.name} {tmp_stat}")
+        except Exception as e:
+            self.log_stream.error(f"PID={os.getpid()} failed to renew {self.name} due to {str(e)}")
+        duration = time.monotonic() - start_time
+        self.n_refreshes += 1
+        if not tmp_stat:
+            self.n_failed_refreshes += 1
+        self.refresh_time_sum += duration
+        self.refresh_time_max = max(self.refresh_time_max, duration)
+        self.log_stream.debug(f"PID={os.getpid()} renewed {self.name} in {duration:.3f} sec")
+        return tmp_stat, tmp_out
+
+    # update obj in background
+    def refresh_in_background(self):
+        try:
+            current = naive_utcnow()
+            tmp_stat, tmp_out = self.call_update_func()
+            with self.lock:
+                if tmp_stat:
+                    self.cachedObj = tmp_out
+                self.lastUpdated = current
+                self.expiry = self.get_next_expiry(current)
+        finally:
+            with self.refresh_lock:
+                self.refreshing = False
 
     # update obj
     def update(self):
+        # stale-while-revalidate once the object is available
+        if self.stale_while_revalidate and self.cachedObj is not None:
+            if naive_utcnow() <= self.expiry:
+                return
+            with self.refresh_lock:
+                if self.refreshing:
+                    return
+                self.refreshing = True
+            thr = Thread(target=self.refresh_in_background)
+            thr.daemon = True
+            thr.start()
+            return
         # lock
         self.lock.acquire()
         # get current datetime
         current = naive_utcnow()
         # update if old
-        if self.cachedObj is None or current - self.lastUpdated > self.timeInterval:
-            self.log_stream.debug(f"PID={os.getpid()} renewing {self.name} cache")
-            try:
-                tmp_stat, tmp_out = self.updateFunc()
-                self.log_stream.debug(f"PID={os.getpid()} got for {self.name} {tmp_stat}")
-                if tmp_stat:
-                    self.cachedObj = tmp_out
-            except Exception as e:
-                self.log_stream.error(f"PID={os.getpid()} failed to renew {self.name} due to {str(e)}")
+        if self.cachedObj is None or current > self.expiry:
+            tmp_stat, tmp_out = self.call_update_func()
+            if tmp_stat:
+                self.cachedObj = tmp_out
             self.lastUpdated = current
+            self.expiry = self.get_next_expiry(current)
         # release
         self.lock.release()
         # return
         return
 
+    # get metrics
+    def get_metrics(self):
+        """
+        Get metrics of updates
+
+        :return: a dictionary of the number of updates, the number of failed updates, and the total and max update durations in seconds
+        """
+        return {
+            "n_refreshes": self.n_refreshes,
+            "n_failed_refreshes": self.n_failed_refreshes,
+            "refresh_time_sum": self.refresh_time_sum,
+            "refresh_time_max": self.refresh_time_max,
+        }
+
     # contains
     def __contains__(self, item):
         self.update()
@@ -223,6 +297,13 @@ class CachedObject:
         self.lock.release()
 
 
+# get interval with random jitter
+def get_jittered_interval(interval, jitter):
+    if jitter <= 0:
+        return interval
+    return interval * (1 + random.uniform(-jitter, jitter))
+
+
 # dictionary of caches
 class CacheDict:
     """
@@ -230,13 +311,21 @@ class CacheDict:
     """
 
     # constructor
-    def __init__(self, update_interval=10, cleanup_interval=60):
+    def __init__(self, update_interval=10, cleanup_interval=60, stale_while_revalidate=False, jitter=0.0):
         self.idx = 0
         self.lock = Lock()
         self.cache_dict = {}
         self.update_interval = datetime.timedelta(minutes=update_interval)
         self.cleanup_interval = datetime.timedelta(minutes=cleanup_interval)
         self.last_cleanup = naive_utcnow()
+        # return the previous object while one background thread is updating it, instead of blocking readers
+        self.stale_while_revalidate = stale_while_revalidate
+        # fraction of random jitter added to the update interval
+        self.jitter = jitter
+        # metrics
+        self.n_refreshes = 0
+        self.refresh_time_sum = 0.0
+        self.refresh_time_max = 0.0
 
     def cleanup(self, tmp_log):
         """
@@ -253,6 +342,53 @@ class CacheDict:
                         del self.cache_dict[name]
                 self.last_cleanup = current
 
+    def call_update_func(self, obj):
+        """
+        Call the update function of a cache and record the duration
+        :param obj: cache
+        :return: updated object
+        """
+        start_time = time.monotonic()
+        try:
+            return obj["update_func"](*obj["update_args"], **obj["update_kwargs"])
+        finally:
+            duration = time.monotonic() - start_time
+            with self.lock:
+                self.n_refreshes += 1
+                self.refresh_time_sum += duration
+                self.refresh_time_max = max(self.refresh_time_max, duration)
+
+    def refresh_in_background(self, obj, tmp_log):
+        """
+        Update a cache in background
+        :param obj: cache
+        :param tmp_log: logger
+        """
+        try:
+            current = naive_utcnow()
+            new_obj = self.call_update_func(obj)
+            with self.lock:
+                obj["obj"] = new_obj
+                obj["last_updated"] = current
+                obj["expiry"] = current + get_jittered_interval(self.update_interval, self.jitter)
+        except Exception as e:
+            tmp_log.error(f"""failed to update cache #{obj["idx"]} due to {str(e)}""")
+        finally:
+            with self.lock:
+                obj["refreshing"] = False
+
+    def get_metrics(self):
+        """
+        Get metrics of updates
+        :return: a dictionary of the number of updates, and the total and max update durations in seconds
+        """
+        with self.lock:
+            return {
+                "n_refreshes": self.n_refreshes,
+                "refresh_time_sum": self.refresh_time_sum,
+                "refresh_time_max": self.refresh_time_max,
+            }
+
     def get(self, name, tmp_log, update_func, *update_args, **update_kwargs):
         """
         Get updated object
@@ -264,31 +400,76 @@ class CacheDict:
         :return: object or None
         """
         self.cleanup(tmp_log)
-        with self.lock:
-            obj = self.cache_dict.get(name)
-            current = naive_utcnow()
-            if not obj:
-                tmp_log.debug(f"creating new cache #{self.idx}")
-                # create new cache
-                obj = {
-                    "obj": update_func(*update_args, **update_kwargs),
-                    "last_updated": current,
-                    "update_func": update_func,
-                    "update_args": update_args,
-                    "update_kwargs": update_kwargs,
-                    "idx": self.idx,
-                }
-                self.cache_dict[name] = obj
-                self.idx += 1
-            else:
-                # update if old
-                if current - obj["last_updated"] > self.update_interval:
-                    tmp_log.debug(f"""updating cache #{obj["idx"]}""")
-                    obj["obj"] = obj["update_func"](*obj["update_args"], **obj["update_kwargs"])
-                    obj["last_updated"] = current
-                else:
+        while True:
+            with self.lock:
+                obj = self.cache_dict.get(name)
+                current = naive_utcnow()
+                if obj and obj["in_flight"] is not None:
+                    # another thread is creating or updating the cache
+                    in_flight = obj["in_flight"]
+                    is_owner = False
+                elif not obj:
+                    tmp_log.debug(f"creating new cache #{self.idx}")
+                    # create new cache
+                    obj = {
+                        "update_func": update_func,
+                        "update_args": update_args,
+                        "update_kwargs": update_kwargs,
+                        "idx": self.idx,
+                        "last_updated": current,
+                        "refreshing": False,
+                        "in_flight": {"event": Event(), "succeeded": False},
+                    }
+                    self.cache_dict[name] = obj
+                    self.idx += 1
+                    in_flight = obj["in_flight"]
+                    is_owner = True
+                elif current <= obj["expiry"]:
                     tmp_log.debug(f"""reusing cache #{obj["idx"]}""")
-            return obj["obj"]
+                    return obj["obj"]
+                elif self.stale_while_revalidate:
+                    if not obj["refreshing"]:
+                        tmp_log.debug(f"""updating cache #{obj["idx"]} in background""")
+                        obj["refreshing"] = True
+                        thr = Thread(target=self.refresh_in_background, args=(obj, tmp_log))
+                        thr.daemon = True
+                        thr.start()
+                    else:
+                        tmp_log.debug(f"""reusing stale cache #{obj["idx"]}""")
+                    return obj["obj"]
+                else:
+                    # update if old
+                    tmp_log.debug(f"""updating cache #{obj["idx"]}""")
+                    obj["in_flight"] = {"event": Event(), "succeeded": False}
+                    in_flight = obj["in_flight"]
+                    is_owner = True
+            if not is_owner:
+                # wait for the other thread and take its result, or retry if it failed
+                tmp_log.debug(f"""waiting for update of cache #{obj["idx"]}""")
+                in_flight["event"].wait()
+                if in_flight["succeeded"]:
+                    with self.lock:
+                        return obj["obj"]
+                continue
+            # only one thread calls the update function outside the lock
+            try:
+                new_obj = self.call_update_func(obj)
+            except Exception:
+                with self.lock:
+                    obj["in_flight"] = None
+                    # drop the cache which was never filled so that the next caller retries
+                    if "obj" not in obj and self.cache_dict.get(name) is obj:
+                        del self.cache_dict[name]
+                in_flight["event"].set()
+                raise
+            with self.lock:
+                obj["obj"] = new_obj
+                obj["last_updated"] = current
+                obj["expiry"] = current + get_jittered_interval(self.update_interval, self.jitter)
+                obj["in_flight"] = None
+                in_flight["succeeded"] = True
+            in_flight["event"].set()
+            return new_obj
 
 
 # convert datetime to string
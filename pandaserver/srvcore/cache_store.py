@@ -0,0 +1,149 @@
+"""
+utilities to store files in the cache directory with streaming and content-addressed deduplication
+
+"""
+
+import gzip
+import hashlib
+import os
+import struct
+import time
+import uuid
+
+# size of chunks to read uploaded files
+CHUNK_SIZE = 1024 * 1024
+
+# directory in the cache directory to keep unique contents
+STORE_DIR_NAME = ".content"
+
+
+# exception for files exceeding the size limit while being streamed
+class SizeLimitExceeded(Exception):
+    pass
+
+
+# file object to calculate digest, size, and trailing bytes of written data
+class DigestWriter:
+    def __init__(self, file_object):
+        self.file_object = file_object
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.tail = b""
+
+    def write(self, data):
+        self.file_object.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+        self.tail = (self.tail + bytes(data[-8:]))[-8:]
+        return len(data)
+
+    def flush(self):
+        self.file_object.flush()
+
+    # CRC in the gzip footer, i.e. the last 8 bytes. None if the data is too short
+    def get_footer_crc(self):
+        if len(self.tail) < 8:
+            return None
+        checksum, _ = struct.unpack("II", self.tail)
+        return checksum
+
+
+# get the path of a unique content in the store
+def get_blob_path(cache_dir, digest):
+    return os.path.join(cache_dir, STORE_DIR_NAME, digest[:2], digest)
+
+
+# make a hard link to the content in the store, adding the content to the store if missing
+def _link_to_store(tmp_path, blob_path, link_path):
+    # reuse the content if already stored
+    try:
+        os.link(blob_path, link_path)
+        os.remove(tmp_path)
+        return True
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    os.replace(tmp_path, blob_path)
+    os.link(blob_path, link_path)
+    return False
+
+
+# write a stream to a file in the cache directory
+def store_file(in_stream, full_path, compress=False, size_limit=None, deduplicate=False, chunk_size=CHUNK_SIZE):
+    """
+    Write a stream to a file chunk by chunk, with optional gzip compression and deduplication.
+    The file is replaced atomically. With deduplication, the file is a hard link to the unique content in the store,
+    so that the file must not be modified in place
+
+    :param in_stream: file-like object to read
+    :param full_path: path of the file
+    :param compress: True to compress with gzip
+    :param size_limit: max number of bytes to read. SizeLimitExceeded is raised when exceeded
+    :param deduplicate: True to store identical contents once
+    :param chunk_size: number of bytes to read at once
+    :return: dict of size (bytes written), crc (CRC in the gzip footer or None), digest (sha256 of bytes written), and deduplicated
+    """
+    cache_dir = os.path.dirname(full_path)
+    tmp_path = os.path.join(cache_dir, f".upload.{uuid.uuid4()}")
+    link_path = None
+    try:
+        n_read = 0
+        with open(tmp_path, "wb") as file_object:
+            writer = DigestWriter(file_object)
+            # no timestamp in the gzip header to get the same bytes for the same content
+            out_object = gzip.GzipFile(filename="", mode="wb", fileobj=writer, mtime=0) if compress else writer
+            while True:
+                chunk = in_stream.read(chunk_size)
+                if not chunk:
+                    break
+                n_read += len(chunk)
+                if size_limit is not None and n_read > size_limit:
+                    raise SizeLimitExceeded(f"more than {size_limit} bytes")
+                out_object.write(chunk)
+            if compress:
+                out_object.close()
+        deduplicated = False
+        if deduplicate:
+            link_path = os.path.join(cache_dir, f".link.{uuid.uuid4()}")
+            deduplicated = _link_to_store(tmp_path, get_blob_path(cache_dir, writer.digest.hexdigest()), link_path)
+            os.replace(link_path, full_path)
+            # refresh the modification time shared by all links for cleanup
+            os.utime(full_path, None)
+        else:
+            os.replace(tmp_path, full_path)
+        return {"size": writer.size, "crc": writer.get_footer_crc(), "digest": writer.digest.hexdigest(), "deduplicated": deduplicated}
+    except Exception:
+        for tmp_file in [tmp_path, link_path]:
+            if tmp_file and os.path.exists(tmp_file):
+                os.remove(tmp_file)
+        raise
+
+
+# delete contents in the store which are no longer linked from the cache directory
+def cleanup_store(cache_dir, grace_period=3600):
+    """
+    Delete unique contents without links from the cache directory
+
+    :param cache_dir: cache directory
+    :param grace_period: seconds to keep contents after modification, to avoid deleting contents being linked
+    :return: number of deleted contents
+    """
+    store_dir = os.path.join(cache_dir, STORE_DIR_NAME)
+    if not os.path.isdir(store_dir):
+        return 0
+    time_limit = time.time() - grace_period
+    n_deleted = 0
+    for sub_dir in os.listdir(store_dir):
+        sub_dir_path = os.path.join(store_dir, sub_dir)
+        if not os.path.isdir(sub_dir_path):
+            continue
+        for blob_name in os.listdir(sub_dir_path):
+            blob_path = os.path.join(sub_dir_path, blob_name)
+            try:
+                stat = os.stat(blob_path)
+                if stat.st_nlink <= 1 and stat.st_mtime < time_limit:
+                    os.remove(blob_path)
+                    n_deleted += 1
+            except FileNotFoundError:
+                pass
+    return n_deleted
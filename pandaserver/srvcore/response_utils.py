@@ -0,0 +1,204 @@
+"""
+utilities to encode and compress responses
+
+"""
+
+import datetime
+import decimal
+import gzip
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# compression levels
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+
+
+# Encoder: convert datetime → ISO string with a marker
+def encode_special_cases(obj):
+    if isinstance(obj, datetime.datetime):
+        return {"__datetime__": obj.isoformat()}
+    if isinstance(obj, decimal.Decimal):
+        if obj == obj.to_integral_value():
+            return int(obj)
+        else:
+            return float(obj)
+    raise TypeError(f"Type not serializable for {obj} ({type(obj)})")
+
+
+# serialize to JSON bytes
+def dump_json(obj, encoder="json"):
+    """
+    Serialize an object to JSON with datetime and Decimal handled by encode_special_cases
+
+    :param obj: object to serialize
+    :param encoder: "orjson" to use orjson if installed, otherwise the standard json module
+    :return: JSON bytes
+    """
+    if encoder == "orjson" and orjson is not None:
+        try:
+            return orjson.dumps(
+                obj,
+                default=encode_special_cases,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            # fall back for what orjson doesn't support, such as integers larger than 64 bits
+            pass
+    return json.dumps(obj, default=encode_special_cases).encode()
+
+
+# get acceptable content encodings
+def get_accepted_encodings(accept_encoding):
+    """
+    Parse the Accept-Encoding header
+
+    :param accept_encoding: value of the Accept-Encoding header
+    :return: set of acceptable encodings in lowercase, excluding ones with q=0
+    """
+    encodings = set()
+    if not accept_encoding:
+        return encodings
+    for item in accept_encoding.split(","):
+        fields = item.strip().split(";")
+        name = fields[0].strip().lower()
+        if not name:
+            continue
+        rejected = False
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    rejected = float(value) == 0
+                except ValueError:
+                    rejected = True
+        if not rejected:
+            encodings.add(name)
+    return encodings
+
+
+# compress response
+def compress_response(data, accept_encoding, threshold):
+    """
+    Compress response data according to the Accept-Encoding header
+
+    :param data: response bytes
+    :param accept_encoding: value of the Accept-Encoding header
+    :param threshold: minimum size in bytes to compress. 0 to disable compression
+    :return: tuple of (data, content encoding or None if not compressed)
+    """
+    if threshold <= 0 or len(data) < threshold:
+        return data, None
+    encodings = get_accepted_encodings(accept_encoding)
+    if zstandard is not None and "zstd" in encodings:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data), "zstd"
+    if "gzip" in encodings or "*" in encodings:
+        return gzip.compress(data, compresslevel=GZIP_LEVEL), "gzip"
+    return data, None
+
+
+# parse the Range header
+def parse_range_header(range_header, file_size):
+    """
+    Parse the Range header with a single byte range
+
+    :param range_header: value of the Range header
+    :param file_size: size of the file
+    :return: tuple of (first byte, number of bytes), None if the header is missing or not supported, or False if unsatisfiable
+    """
+    if not range_header:
+        return None
+    unit, _, ranges = range_header.strip().partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if not first:
+            # suffix range
+            n_bytes = min(int(last), file_size)
+            if n_bytes <= 0:
+                return False
+            return file_size - n_bytes, n_bytes
+        first = int(first)
+        last = int(last) if last else None
+    except ValueError:
+        return None
+    if last is not None and first > last:
+        return None
+    if first >= file_size:
+        return False
+    if last is None:
+        last = file_size - 1
+    return first, min(last, file_size - 1) - first + 1
+
+
+# response to send a part of a file
+class FileResponse:
+    """
+    Response to send a file from an offset. The file is sent with wsgi.file_wrapper (i.e. sendfile if the server supports it)
+    when it is sent up to the end, otherwise in chunks
+    """
+
+    # size of chunks to send
+    chunk_size = 1024 * 1024
+
+    # constructor
+    def __init__(self, file_object, offset, length, status="200 OK", prefix=b"", content_type="text/plain", headers=None):
+        """
+        :param file_object: file object opened in binary mode, which is closed after being sent
+        :param offset: first byte to send
+        :param length: number of bytes to send
+        :param status: HTTP status
+        :param prefix: bytes to send before the file
+        :param content_type: content type
+        :param headers: list of additional headers
+        """
+        self.file_object = file_object
+        self.offset = offset
+        self.length = length
+        self.status = status
+        self.prefix = prefix
+        self.content_type = content_type
+        self.headers = headers or []
+
+    # get the number of bytes in the body
+    def get_content_length(self):
+        return len(self.prefix) + self.length
+
+    # iterate over chunks
+    def iterate(self):
+        try:
+            if self.prefix:
+                yield self.prefix
+            self.file_object.seek(self.offset)
+            n_remaining = self.length
+            while n_remaining > 0:
+                chunk = self.file_object.read(min(self.chunk_size, n_remaining))
+                if not chunk:
+                    break
+                n_remaining -= len(chunk)
+                yield chunk
+        finally:
+            self.file_object.close()
+
+    # start the response and get the iterable for WSGI
+    def serve(self, environ, start_response):
+        headers = [("Content-Type", self.content_type), ("Content-Length", str(self.get_content_length())), ("Accept-Ranges", "bytes")] + self.headers
+        start_response(self.status, headers)
+        file_wrapper = environ.get("wsgi.file_wrapper")
+        if file_wrapper is not None and not self.prefix and self.offset + self.length == os.fstat(self.file_object.fileno()).st_size:
+            self.file_object.seek(self.offset)
+            return file_wrapper(self.file_object, self.chunk_size)
+        return self.iterate()
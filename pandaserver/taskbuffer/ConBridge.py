@@ -8,11 +8,13 @@ import pickle
 import random
 import signal
 import socket
+import struct
 import sys
 import threading
 import time
 import traceback
 import types
+import zlib
 
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 
@@ -26,6 +28,35 @@ from pandaserver.taskbuffer.JobSpec import JobSpec
 _logger = PandaLogger().getLogger("ConBridge")
 
 
+# frame header : magic, version, flags, body size, the number of out-of-band buffers
+FRAME_MAGIC = b"PCB"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("!3sBBQI")
+FRAME_BUFFER_SIZE = struct.Struct("!Q")
+# flags
+FLAG_COMPRESSED = 0x01
+
+
+# serialize an object into a frame header, a body, and out-of-band buffers
+def encode_frame(val, compress_threshold=0):
+    buffers = []
+    body = pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL, buffer_callback=buffers.append)
+    flags = 0
+    if 0 < compress_threshold <= len(body):
+        body = zlib.compress(body, 1)
+        flags |= FLAG_COMPRESSED
+    buffers = [buf.raw() for buf in buffers]
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, flags, len(body), len(buffers))
+    return header, body, buffers
+
+
+# deserialize an object from a frame body and out-of-band buffers
+def decode_frame(flags, body, buffers):
+    if flags & FLAG_COMPRESSED:
+        body = zlib.decompress(body)
+    return pickle.loads(body, buffers=buffers)
+
+
 # exception for normal termination
 class HarmlessEx(Exception):
     pass
@@ -79,6 +110,11 @@ class ConBridge(object):
             self.verbose = panda_config.dbbridgeverbose
         else:
             self.verbose = False
+        # minimum size of serialized data to be compressed
+        if hasattr(panda_config, "dbbridge_compress_threshold"):
+            self.compress_threshold = int(panda_config.dbbridge_compress_threshold)
+        else:
+            self.compress_threshold = 0
 
     # destructor
     def __del__(self):
@@ -165,12 +201,14 @@ class ConBridge(object):
             if self.isMaster:
                 self.mysock.settimeout(self.timeout)
             # serialize
-            tmpStr = pickle.dumps(val, protocol=0)
-            # send size
-            sizeStr = "%50s" % len(tmpStr)
-            self.mysock.sendall(sizeStr.encode())
-            # send body
-            self.mysock.sendall(tmpStr)
+            header, body, buffers = encode_frame(val, self.compress_threshold)
+            # send header and body
+            self.mysock.sendall(header)
+            self.mysock.sendall(body)
+            # send out-of-band buffers without copying
+            for buf in buffers:
+                self.mysock.sendall(FRAME_BUFFER_SIZE.pack(buf.nbytes))
+                self.mysock.sendall(buf)
             # set timeout back
             if self.isMaster:
                 self.mysock.settimeout(None)
@@ -185,61 +223,44 @@ class ConBridge(object):
                 self.bridge_childExit()
             raise e
 
+    # receive exactly size bytes
+    def bridge_recvExactly(self, size):
+        buf = bytearray(size)
+        view = memoryview(buf)
+        n_read = 0
+        while n_read < size:
+            tmp_size = self.mysock.recv_into(view[n_read:], size - n_read)
+            if tmp_size == 0:
+                if self.isMaster:
+                    raise socket.error("empty packet")
+                else:
+                    # master closed socket
+                    raise HarmlessEx("empty packet")
+            n_read += tmp_size
+        return buf
+
     # receive packet
     def bridge_recv(self):
         try:
             # set timeout
             if self.isMaster:
                 self.mysock.settimeout(self.timeout)
-            # get size
-            strSize = None
-            headSize = 50
-            while strSize is None or len(strSize) < headSize:
-                if strSize is None:
-                    tmpSize = headSize
-                else:
-                    tmpSize = headSize - len(strSize)
-                tmpStr = self.mysock.recv(tmpSize)
-                if len(tmpStr) == 0:
-                    if self.isMaster:
-                        raise socket.error("empty packet")
-                    else:
-                        # master closed socket
-                        raise HarmlessEx("empty packet")
-                if strSize is None:
-                    strSize = tmpStr
-                else:
-                    strSize += tmpStr
-            if strSize is None:
-                strSize = ""
-            else:
-                strSize = strSize.decode()
+            # get header
+            magic, version, flags, body_size, n_buffers = FRAME_HEADER.unpack(self.bridge_recvExactly(FRAME_HEADER.size))
+            if magic != FRAME_MAGIC or version != FRAME_VERSION:
+                raise RuntimeError(f"unsupported frame magic={magic} version={version}")
             # get body
-            strBody = None
-            bodySize = int(strSize)
-            while strBody is None or len(strBody) < bodySize:
-                if strBody is None:
-                    tmpSize = bodySize
-                else:
-                    tmpSize = bodySize - len(strBody)
-                tmpStr = self.mysock.recv(tmpSize)
-                if len(tmpStr) == 0:
-                    if self.isMaster:
-                        raise socket.error("empty packet")
-                    else:
-                        # master closed socket
-                        raise HarmlessEx("empty packet")
-                if strBody is None:
-                    strBody = tmpStr
-                else:
-                    strBody += tmpStr
-            if strBody is None:
-                strBody = "".encode()
+            body = self.bridge_recvExactly(body_size)
+            # get out-of-band buffers
+            buffers = []
+            for i in range(n_buffers):
+                (buf_size,) = FRAME_BUFFER_SIZE.unpack(self.bridge_recvExactly(FRAME_BUFFER_SIZE.size))
+                buffers.append(self.bridge_recvExactly(buf_size))
             # set timeout back
             if self.isMaster:
                 self.mysock.settimeout(None)
             # deserialize
-            retVal = pickle.loads(strBody)
+            retVal = decode_frame(flags, body, buffers)
             return True, retVal
         except Exception as e:
             if self.isMaster:
@@ -264,7 +285,7 @@ class ConBridge(object):
         self.bridge_send("NG")
         # check if pickle-able
         try:
-            pickle.dumps(val, protocol=0)
+            pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL)
         except Exception:
             # use RuntimeError
             val = (RuntimeError, str(val[-1]))
@@ -0,0 +1,337 @@
+"""
+ConBridgePool keeps pre-forked and pre-connected ConBridge workers in a single process per host, and leases them
+to httpd processes through a UNIX socket. This avoids every httpd process re-forking and re-authenticating
+database sessions at once when interactions are stalled.
+"""
+
+import bisect
+import os
+import random
+import socket
+import struct
+import threading
+import time
+import traceback
+from queue import Empty, Queue
+
+from pandacommon.pandalogger.PandaLogger import PandaLogger
+
+from pandaserver.config import panda_config
+from pandaserver.taskbuffer.ConBridge import ConBridge
+
+# logger
+_logger = PandaLogger().getLogger("ConBridgePool")
+
+# commands from clients
+CMD_LEASE = b"L"
+CMD_RELEASE = b"R"
+CMD_KILL = b"K"
+
+# worker ID and child PID sent together with the file descriptor of the worker
+LEASE_INFO = struct.Struct("!QQ")
+# worker ID sent with release and kill commands
+WORKER_ID = struct.Struct("!Q")
+
+# upper edges of lease wait time buckets in seconds
+WAIT_TIME_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60)
+
+
+# receive exactly size bytes
+def recv_exactly(sock, size):
+    buf = b""
+    while len(buf) < size:
+        tmp_buf = sock.recv(size - len(buf))
+        if len(tmp_buf) == 0:
+            raise socket.error("empty packet")
+        buf += tmp_buf
+    return buf
+
+
+# pool of workers
+class ConBridgePool:
+    # constructor
+    def __init__(self, socket_path, n_workers, lease_timeout=60, health_interval=60, stats_interval=600):
+        self.socket_path = socket_path
+        self.n_workers = n_workers
+        # max time in seconds to wait for a free worker. the client is told to retry after that
+        self.lease_timeout = lease_timeout
+        self.health_interval = health_interval
+        self.stats_interval = stats_interval
+        self.lock = threading.Lock()
+        # worker ID -> ConBridge
+        self.workers = {}
+        self.free_workers = Queue()
+        self.next_worker_id = 0
+        # metrics
+        self.lease_wait_counts = [0] * (len(WAIT_TIME_BUCKETS) + 1)
+        self.lease_wait_sum = 0.0
+        self.n_lease_timeouts = 0
+        self.n_timeout_kills = 0
+        self.n_orphan_kills = 0
+        self.n_health_kills = 0
+        self.n_replacements = 0
+
+    # fork and connect a new worker, and make it available
+    def spawn_worker(self):
+        with self.lock:
+            worker_id = self.next_worker_id
+            self.next_worker_id += 1
+        worker = ConBridge()
+        iTry = 0
+        while not worker.connect():
+            iTry += 1
+            _logger.debug(f"failed to connect worker={worker_id} : try {iTry}")
+            time.sleep(random.randint(60, 90))
+        with self.lock:
+            self.workers[worker_id] = worker
+        self.free_workers.put(worker_id)
+        _logger.debug(f"worker={worker_id} child={worker.child_pid} is ready")
+
+    # kill a worker and spawn a replacement in background
+    def replace_worker(self, worker_id):
+        def _run():
+            with self.lock:
+                worker = self.workers.pop(worker_id, None)
+            if worker is not None:
+                _logger.debug(f"killing worker={worker_id} child={worker.child_pid}")
+                worker.bridge_killChild()
+            with self.lock:
+                self.n_replacements += 1
+            self.spawn_worker()
+
+        thr = threading.Thread(target=_run)
+        thr.daemon = True
+        thr.start()
+
+    # check if an idle worker is alive and its database connection is working
+    def is_healthy(self, worker):
+        try:
+            pid, _ = os.waitpid(worker.child_pid, os.WNOHANG)
+            if pid != 0:
+                return False
+            worker.bridge_send("wakeUp")
+            worker.bridge_send(((), {}))
+            worker.bridge_getResponse()
+            return True
+        except Exception:
+            return False
+
+    # record lease wait time
+    def record_lease_wait(self, wait_time):
+        with self.lock:
+            self.lease_wait_counts[bisect.bisect_left(WAIT_TIME_BUCKETS, wait_time)] += 1
+            self.lease_wait_sum += wait_time
+
+    # get metrics
+    def get_metrics(self):
+        with self.lock:
+            return {
+                "n_workers": len(self.workers),
+                "n_free_workers": self.free_workers.qsize(),
+                "lease_wait_buckets": dict(zip(WAIT_TIME_BUCKETS + (float("inf"),), self.lease_wait_counts)),
+                "lease_wait_count": sum(self.lease_wait_counts),
+                "lease_wait_sum": self.lease_wait_sum,
+                "n_lease_timeouts": self.n_lease_timeouts,
+                "n_timeout_kills": self.n_timeout_kills,
+                "n_orphan_kills": self.n_orphan_kills,
+                "n_health_kills": self.n_health_kills,
+                "n_replacements": self.n_replacements,
+            }
+
+    # check idle workers and dump metrics periodically
+    def supervise(self):
+        last_stats_dump = time.time()
+        while True:
+            time.sleep(self.health_interval)
+            for i in range(self.free_workers.qsize()):
+                try:
+                    worker_id = self.free_workers.get_nowait()
+                except Empty:
+                    break
+                with self.lock:
+                    worker = self.workers.get(worker_id)
+                if worker is None:
+                    continue
+                if self.is_healthy(worker):
+                    self.free_workers.put(worker_id)
+                else:
+                    _logger.error(f"worker={worker_id} child={worker.child_pid} is unhealthy")
+                    with self.lock:
+                        self.n_health_kills += 1
+                    self.replace_worker(worker_id)
+            if time.time() - last_stats_dump > self.stats_interval:
+                last_stats_dump = time.time()
+                _logger.debug(f"metrics {self.get_metrics()}")
+
+    # serve a client
+    def handle_client(self, conn):
+        leased = set()
+        try:
+            while True:
+                cmd = conn.recv(1)
+                if len(cmd) == 0:
+                    break
+                if cmd == CMD_LEASE:
+                    start_time = time.time()
+                    try:
+                        worker_id = self.free_workers.get(timeout=self.lease_timeout)
+                    except Empty:
+                        # empty lease without file descriptor
+                        with self.lock:
+                            self.n_lease_timeouts += 1
+                        conn.sendall(LEASE_INFO.pack(0, 0))
+                        continue
+                    self.record_lease_wait(time.time() - start_time)
+                    with self.lock:
+                        worker = self.workers[worker_id]
+                    try:
+                        socket.send_fds(conn, [LEASE_INFO.pack(worker_id, worker.child_pid)], [worker.mysock.fileno()])
+                    except Exception:
+                        self.free_workers.put(worker_id)
+                        raise
+                    leased.add(worker_id)
+                    continue
+                (worker_id,) = WORKER_ID.unpack(recv_exactly(conn, WORKER_ID.size))
+                if worker_id not in leased:
+                    continue
+                leased.discard(worker_id)
+                if cmd == CMD_RELEASE:
+                    self.free_workers.put(worker_id)
+                elif cmd == CMD_KILL:
+                    with self.lock:
+                        self.n_timeout_kills += 1
+                    self.replace_worker(worker_id)
+        except Exception as e:
+            _logger.error(f"client error : {str(e)} {traceback.format_exc()}")
+        finally:
+            # workers leased by a gone client are in unknown state
+            for worker_id in leased:
+                with self.lock:
+                    self.n_orphan_kills += 1
+                self.replace_worker(worker_id)
+            conn.close()
+
+    # main
+    def run(self):
+        _logger.debug(f"start with {self.n_workers} workers on {self.socket_path}")
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        os.chmod(self.socket_path, 0o600)
+        server.listen()
+        # spawn workers concurrently
+        for i in range(self.n_workers):
+            thr = threading.Thread(target=self.spawn_worker)
+            thr.daemon = True
+            thr.start()
+        # supervisor
+        thr = threading.Thread(target=self.supervise)
+        thr.daemon = True
+        thr.start()
+        # accept clients
+        while True:
+            conn, _ = server.accept()
+            thr = threading.Thread(target=self.handle_client, args=(conn,))
+            thr.daemon = True
+            thr.start()
+
+
+# ConBridge using a worker leased from ConBridgePool instead of forking its own child
+class LeasedConBridge(ConBridge):
+    # constructor
+    def __init__(self, socket_path=None):
+        ConBridge.__init__(self)
+        if socket_path is None:
+            socket_path = panda_config.dbbridge_pool_socket
+        self.socket_path = socket_path
+        self.lease_sock = None
+        self.worker_id = None
+        self.isMaster = True
+
+    # connect to the pool. the previous worker is given up since it is in unknown state when reconnecting
+    def connect(self, *args, **kwargs):
+        self.bridge_killChild()
+        if self.lease_sock is None:
+            try:
+                lease_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                lease_sock.connect(self.socket_path)
+                self.lease_sock = lease_sock
+            except Exception as e:
+                _logger.error(f"master {self.pid} failed to connect to {self.socket_path} : {str(e)}")
+                return False
+        return True
+
+    # lease a worker. socket.timeout is raised when no worker is available in time, so that the method wrapper retries
+    def bridge_lease(self):
+        if self.lease_sock is None:
+            raise socket.error("not connected to the pool")
+        try:
+            self.lease_sock.settimeout(self.timeout)
+            self.lease_sock.sendall(CMD_LEASE)
+            msg, fds, _, _ = socket.recv_fds(self.lease_sock, LEASE_INFO.size, 1)
+            self.lease_sock.settimeout(None)
+        except Exception:
+            # close the connection since a worker might come later. the pool kills workers leased to closed connections
+            self.close()
+            raise
+        if len(msg) != LEASE_INFO.size:
+            self.close()
+            raise socket.error("failed to lease a worker")
+        if not fds:
+            raise socket.timeout("no free worker in the pool")
+        self.worker_id, self.child_pid = LEASE_INFO.unpack(msg)
+        self.mysock = socket.socket(fileno=fds[0])
+
+    # give back the worker
+    def bridge_return(self, cmd):
+        try:
+            self.lease_sock.sendall(cmd + WORKER_ID.pack(self.worker_id))
+        except Exception as e:
+            _logger.error(f"master {self.pid} failed to give back worker={self.worker_id} : {str(e)}")
+        try:
+            self.mysock.close()
+        except Exception:
+            pass
+        self.mysock = None
+        self.worker_id = None
+        self.child_pid = 0
+
+    # release the worker to be used by others
+    def bridge_release(self):
+        if self.worker_id is not None:
+            self.bridge_return(CMD_RELEASE)
+
+    # let the pool kill and replace the worker
+    def bridge_killChild(self):
+        if self.worker_id is not None:
+            self.bridge_return(CMD_KILL)
+
+    # close the connection to the pool after giving back the worker
+    def close(self):
+        self.bridge_killChild()
+        if self.lease_sock is not None:
+            try:
+                self.lease_sock.close()
+            except Exception:
+                pass
+            self.lease_sock = None
+
+    # send packet with a leased worker
+    def bridge_send(self, val):
+        if self.worker_id is None:
+            self.bridge_lease()
+        ConBridge.bridge_send(self, val)
+
+
+# main
+def main():
+    ConBridgePool(
+        panda_config.dbbridge_pool_socket,
+        panda_config.dbbridge_pool_size,
+        lease_timeout=panda_config.dbbridge_pool_lease_timeout,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,79 +4,196 @@ pool for DBProxies
 """
 
 try:
-    from Queue import Queue
+    from Queue import Empty, Queue
 except ImportError:
-    from queue import Queue
+    from queue import Empty, Queue
 
+import bisect
 import os
 import random
 import time
 from contextlib import contextmanager
-from threading import Lock
+from threading import Event, Lock, Thread
 
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 
 from pandaserver.config import panda_config
 from pandaserver.taskbuffer import OraDBProxy as DBProxy
 from pandaserver.taskbuffer.ConBridge import ConBridge
+from pandaserver.taskbuffer.ConBridgePool import LeasedConBridge
 
 # logger
 _logger = PandaLogger().getLogger("DBProxyPool")
 
+# upper edges of wait time buckets in seconds
+WAIT_TIME_BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60)
+
 
 class DBProxyPool:
-    def __init__(self, dbhost, dbpasswd, nConnection, useTimeout=False, dbProxyClass=None):
+    def __init__(self, dbhost, dbpasswd, nConnection, useTimeout=False, dbProxyClass=None, minConnection=None):
         # crate lock for callers
         self.lock = Lock()
         self.callers = []
-        # create Proxies
-        _logger.debug("init")
-        self.proxyList = Queue(nConnection)
+        self.dbhost = dbhost
+        self.dbpasswd = dbpasswd
+        self.useTimeout = useTimeout
+        self.dbProxyClass = dbProxyClass
+        # pool size. the pool is elastic when the min size is smaller than the max size
+        self.max_size = nConnection
+        if minConnection is None:
+            minConnection = panda_config.db_pool_min_size
+        if minConnection <= 0 or minConnection > nConnection:
+            minConnection = nConnection
+        self.min_size = minConnection
+        self.grow_wait = panda_config.db_pool_grow_wait
+        self.shrink_idle = panda_config.db_pool_shrink_idle
+        self.last_contention = time.time()
+        self.last_resize = time.time()
+        # wait time histogram
+        self.stats_lock = Lock()
+        self.wait_time_counts = [0] * (len(WAIT_TIME_BUCKETS) + 1)
+        self.wait_time_sum = 0.0
+        self.stats_interval = panda_config.db_pool_stats_interval
+        self.last_stats_dump = time.time()
+        # create Proxies concurrently and get ready as soon as the first one is connected
+        _logger.debug(f"init with min={self.min_size} max={self.max_size}")
+        self.proxyList = Queue()
         self.connList = []
-        for i in range(nConnection):
-            _logger.debug(f"connect -> {i} ")
-            if dbProxyClass is not None:
-                proxy = dbProxyClass()
-            elif useTimeout and hasattr(panda_config, "usedbtimeout") and panda_config.usedbtimeout is True:
-                """
-                ConBridge allows having database interactions in separate processes and killing them independently when interactions are stalled.
-                This avoids clogged httpd processes due to stalled database accesses.
-                """
-                proxy = ConBridge()
-            else:
-                proxy = DBProxy.DBProxy()
-                self.connList.append(proxy)
-            iTry = 0
-            while True:
-                if proxy.connect(dbhost, dbpasswd, dbtimeout=60):
-                    break
-                iTry += 1
-                _logger.debug(f"failed -> {i} : try {iTry}")
-                time.sleep(random.randint(60, 90))
-            self.proxyList.put(proxy)
-            time.sleep(1)
+        self.first_ready = Event()
+        self.size = self.min_size
+        for i in range(self.min_size):
+            self._start_connecting(i)
+        self.first_ready.wait()
         # get PID
         self.pid = os.getpid()
         _logger.debug("ready")
 
+    # make a proxy and connect it in a background thread
+    def _start_connecting(self, index):
+        thr = Thread(target=self._connect_proxy, args=(index,))
+        thr.daemon = True
+        thr.start()
+
+    # connect a proxy and put it into the pool
+    def _connect_proxy(self, index):
+        _logger.debug(f"connect -> {index} ")
+        if self.dbProxyClass is not None:
+            proxy = self.dbProxyClass()
+        elif self.useTimeout and hasattr(panda_config, "usedbtimeout") and panda_config.usedbtimeout is True:
+            """
+            ConBridge allows having database interactions in separate processes and killing them independently when interactions are stalled.
+            This avoids clogged httpd processes due to stalled database accesses.
+            """
+            if panda_config.dbbridge_pool_socket:
+                # lease workers from the shared pool
+                proxy = LeasedConBridge()
+            else:
+                proxy = ConBridge()
+        else:
+            proxy = DBProxy.DBProxy()
+            with self.lock:
+                self.connList.append(proxy)
+        iTry = 0
+        while True:
+            if proxy.connect(self.dbhost, self.dbpasswd, dbtimeout=60):
+                break
+            iTry += 1
+            _logger.debug(f"failed -> {index} : try {iTry}")
+            time.sleep(random.randint(60, 90))
+        self.proxyList.put(proxy)
+        self.first_ready.set()
+        _logger.debug(f"connected -> {index} ")
+
+    # close a proxy removed from the pool
+    def _close_proxy(self, proxy):
+        if isinstance(proxy, LeasedConBridge):
+            # the worker was already released in putProxy
+            proxy.close()
+        elif isinstance(proxy, ConBridge):
+            proxy.bridge_killChild()
+        else:
+            with self.lock:
+                if proxy in self.connList:
+                    self.connList.remove(proxy)
+            proxy.cleanup()
+
+    # record wait time
+    def _record_wait_time(self, wait_time):
+        with self.stats_lock:
+            self.wait_time_counts[bisect.bisect_left(WAIT_TIME_BUCKETS, wait_time)] += 1
+            self.wait_time_sum += wait_time
+            # dump periodically instead of every call
+            now = time.time()
+            if now - self.last_stats_dump < self.stats_interval:
+                return
+            self.last_stats_dump = now
+            n_calls = sum(self.wait_time_counts)
+            buckets = " ".join(f"<={edge}s:{count}" for edge, count in zip(WAIT_TIME_BUCKETS, self.wait_time_counts))
+            _logger.debug(
+                f"wait time n_calls={n_calls} avg={self.wait_time_sum / n_calls:.4f}s {buckets} >{WAIT_TIME_BUCKETS[-1]}s:{self.wait_time_counts[-1]} size={self.size}"
+            )
+
+    # get wait time histogram
+    def get_wait_time_histogram(self):
+        """
+        Get the histogram of time spent waiting for a free proxy
+
+        :return: a dictionary with upper bucket edges in seconds as keys and the number of calls as values, plus the total number and sum of wait times
+        """
+        with self.stats_lock:
+            histogram = dict(zip(WAIT_TIME_BUCKETS + (float("inf"),), self.wait_time_counts))
+            return {"buckets": histogram, "count": sum(self.wait_time_counts), "sum": self.wait_time_sum, "size": self.size}
+
     # return a free proxy. this method blocks until a proxy is available
     def getProxy(self):
         # time how long it took to get a proxy
         start_time = time.time()
 
         # get proxy
-        proxy = self.proxyList.get()
+        try:
+            proxy = self.proxyList.get(timeout=self.grow_wait)
+        except Empty:
+            # grow the pool when callers have to wait for a long time
+            with self.lock:
+                self.last_contention = time.time()
+                to_grow = self.size < self.max_size
+                if to_grow:
+                    self.size += 1
+                    new_size = self.size
+            if to_grow:
+                _logger.debug(f"growing pool to size={new_size}")
+                self._start_connecting(new_size - 1)
+            proxy = self.proxyList.get()
         # wake up connection
         proxy.wakeUp()
 
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        _logger.debug(f"Getting proxy took: {elapsed_time} seconds")
+        self._record_wait_time(time.time() - start_time)
 
         return proxy
 
     # put back a proxy
     def putProxy(self, proxy):
+        # release the leased worker so that other processes can use it
+        if isinstance(proxy, LeasedConBridge):
+            proxy.bridge_release()
+        # shrink the pool when proxies have been idle for a while
+        with self.lock:
+            now = time.time()
+            to_shrink = (
+                self.size > self.min_size
+                and not self.proxyList.empty()
+                and now - self.last_contention > self.shrink_idle
+                and now - self.last_resize > self.shrink_idle
+            )
+            if to_shrink:
+                self.size -= 1
+                self.last_resize = now
+        if to_shrink:
+            _logger.debug(f"shrinking pool with size={self.size}")
+            thr = Thread(target=self._close_proxy, args=(proxy,))
+            thr.daemon = True
+            thr.start()
+            return
         self.proxyList.put(proxy)
 
     # context manager for getting DBProxy
@@ -4,6 +4,7 @@ file specification
 """
 
 import datetime
+import operator
 
 reserveChangedState = False
 
@@ -34,13 +35,19 @@ class FileSpec(object):
         "fileID",
         "attemptNr",
     )
-    # slots
-    __slots__ = _attributes + (
+    # slots. PandaID is not a slot since it is taken from the owner
+    __slots__ = tuple(attr for attr in _attributes if attr != "PandaID") + (
         "_owner",
         "_changedAttrs",
         "_oldPandaID",
         "_reserveChangedState",
     )
+    # set of attributes for fast lookup
+    _attributeSet = frozenset(_attributes)
+    # function to get values of all attributes at once
+    _valuesGetter = operator.attrgetter(*_attributes)
+    # cache of SQL expressions and conversion rules, which are made at the first use
+    _cache = {}
     # attributes which have 0 by default
     _zeroAttrs = ("fsize",)
     # mapping between sequence and attr
@@ -48,9 +55,9 @@ class FileSpec(object):
 
     # constructor
     def __init__(self):
-        # install attributes
+        # install attributes. None is stored as NULL so that attributes are read from slots as they are
         for attr in self._attributes:
-            object.__setattr__(self, attr, None)
+            object.__setattr__(self, attr, "NULL")
         # set owner to synchronize PandaID
         object.__setattr__(self, "_owner", None)
         # map of changed attributes
@@ -60,26 +67,28 @@ class FileSpec(object):
         # reserve changed state at instance level
         object.__setattr__(self, "_reserveChangedState", False)
 
-    # override __getattribute__ for SQL and PandaID
-    def __getattribute__(self, name):
-        # PandaID
-        if name == "PandaID":
-            if self._owner is None:
-                return "NULL"
-            return self._owner.PandaID
-        # others
-        ret = object.__getattribute__(self, name)
-        if ret is None:
+    # PandaID is taken from the owner
+    @property
+    def PandaID(self):
+        if self._owner is None:
             return "NULL"
-        return ret
+        return self._owner.PandaID
+
+    # PandaID is not set since it is synchronized with the owner
+    @PandaID.setter
+    def PandaID(self, value):
+        pass
 
-    # override __setattr__ to collect the changed attributes
+    # override __setattr__ to store None as NULL for SQL and to collect the changed attributes
     def __setattr__(self, name, value):
         oldVal = getattr(self, name)
-        object.__setattr__(self, name, value)
-        newVal = getattr(self, name)
+        if value is None and name in self._attributeSet:
+            newVal = "NULL"
+        else:
+            newVal = value
+        object.__setattr__(self, name, newVal)
         # collect changed attributes
-        if oldVal != newVal:
+        if oldVal != getattr(self, name):
             self._changedAttrs[name] = value
 
     # set owner
@@ -92,48 +101,70 @@ class FileSpec(object):
         self._oldPandaID = self.PandaID
         object.__setattr__(self, "_changedAttrs", {})
 
+    # check if PandaID is changed since the owner was set. Old PandaID can be None when restored from pickle
+    def _isPandaIDChanged(self):
+        oldPandaID = self._oldPandaID
+        if oldPandaID is None:
+            oldPandaID = "NULL"
+        return self.PandaID != oldPandaID
+
+    # get functions to set attributes in the order of _attributes, bypassing __setattr__
+    def _getAttributeSetters(cls):
+        if "setters" not in cls._cache:
+            cls._cache["setters"] = tuple(getattr(cls, attr).__set__ for attr in cls._attributes)
+        return cls._cache["setters"]
+
+    _getAttributeSetters = classmethod(_getAttributeSetters)
+
+    # get conversion rules of attributes to make maps of bind values
+    def _getValuesMapRules(cls, useSeq):
+        key = ("valuesMap", useSeq)
+        if key not in cls._cache:
+            rules = []
+            for attr in cls._attributes:
+                if useSeq and attr in cls._seqAttrMap:
+                    continue
+                # value for NULL
+                if attr in cls._zeroAttrs:
+                    nullVal = 0
+                else:
+                    nullVal = None
+                rules.append((attr, f":{attr}", nullVal))
+            cls._cache[key] = tuple(rules)
+        return cls._cache[key]
+
+    _getValuesMapRules = classmethod(_getValuesMapRules)
+
     # return a tuple of values
     def values(self):
-        ret = []
-        for attr in self._attributes:
-            val = getattr(self, attr)
-            ret.append(val)
-        return tuple(ret)
+        return self._valuesGetter(self)
 
     # return map of values
     def valuesMap(self, useSeq=False, onlyChanged=False):
         ret = {}
-        for attr in self._attributes:
-            if useSeq and attr in self._seqAttrMap:
-                continue
+        for attr, bindName, nullVal in self._getValuesMapRules(useSeq):
             if onlyChanged:
                 if attr == "PandaID":
-                    if self.PandaID == self._oldPandaID:
+                    if not self._isPandaIDChanged():
                         continue
                 elif attr not in self._changedAttrs:
                     continue
             val = getattr(self, attr)
             if val == "NULL":
-                if attr in self._zeroAttrs:
-                    val = 0
-                else:
-                    val = None
-            ret[f":{attr}"] = val
+                val = nullVal
+            ret[bindName] = val
         return ret
 
     # pack tuple into FileSpec
     def pack(self, values):
-        for i in range(len(self._attributes)):
-            attr = self._attributes[i]
-            val = values[i]
-            object.__setattr__(self, attr, val)
+        for setter, val in zip(self._getAttributeSetters(), values):
+            if val is None:
+                val = "NULL"
+            setter(self, val)
 
     # return state values to be pickled
     def __getstate__(self):
-        state = []
-        for attr in self._attributes:
-            val = getattr(self, attr)
-            state.append(val)
+        state = list(self._valuesGetter(self))
         if reserveChangedState or self._reserveChangedState:
             state.append(self._changedAttrs)
         # append owner info
@@ -142,14 +173,16 @@ class FileSpec(object):
 
     # restore state from the unpickled state values
     def __setstate__(self, state):
+        nState = len(state)
         pandaID = "NULL"
-        for i in range(len(self._attributes)):
-            if i + 1 < len(state):
-                object.__setattr__(self, self._attributes[i], state[i])
+        for i, (attr, setter) in enumerate(zip(self._attributes, self._getAttributeSetters())):
+            if i + 1 < nState:
+                # keep the pickled value of PandaID as it is
+                if attr == "PandaID":
+                    pandaID = state[i]
+                setter(self, "NULL" if state[i] is None else state[i])
             else:
-                object.__setattr__(self, self._attributes[i], "NULL")
-            if self._attributes[i] == "PandaID":
-                pandaID = state[i]
+                setter(self, "NULL")
         object.__setattr__(self, "_owner", state[-1])
         object.__setattr__(self, "_oldPandaID", pandaID)
         if not hasattr(self, "_reserveChangedState"):
@@ -159,29 +192,109 @@ class FileSpec(object):
         else:
             object.__setattr__(self, "_changedAttrs", {})
 
+    # make FileSpecs from rows of a result set
+    def pack_rows(cls, rows):
+        """
+        Make FileSpecs from rows of a result set in one pass. Equivalent to calling pack() for new FileSpecs without owners
+
+        :param rows: list of tuples of values in the order of _attributes, e.g. rows fetched with columnNames()
+        :return: list of FileSpecs
+        """
+        setters = cls._getAttributeSetters()
+        setOwner, setChangedAttrs, setOldPandaID, setReserveChangedState = (
+            getattr(cls, attr).__set__ for attr in ("_owner", "_changedAttrs", "_oldPandaID", "_reserveChangedState")
+        )
+        # instance-level flag depends on the class
+        reserveState = cls()._reserveChangedState
+        specs = []
+        for row in rows:
+            spec = object.__new__(cls)
+            for setter, val in zip(setters, row):
+                if val is None:
+                    val = "NULL"
+                setter(spec, val)
+            setOwner(spec, None)
+            setChangedAttrs(spec, {})
+            setOldPandaID(spec, "NULL")
+            setReserveChangedState(spec, reserveState)
+            specs.append(spec)
+        return specs
+
+    pack_rows = classmethod(pack_rows)
+
+    # convert FileSpecs to columns
+    def to_columns(cls, specs, attributes=None):
+        """
+        Convert FileSpecs to a columnar format where NULL is converted to None
+
+        :param specs: list of FileSpecs
+        :param attributes: list of attributes to convert. None to convert all attributes
+        :return: dictionary of attribute name and list of values
+        """
+        if attributes is None:
+            attributes = cls._attributes
+        if not specs:
+            return {attr: [] for attr in attributes}
+        if attributes == cls._attributes:
+            rows = [cls._valuesGetter(spec) for spec in specs]
+        elif len(attributes) == 1:
+            rows = [(getattr(spec, attributes[0]),) for spec in specs]
+        else:
+            getter = operator.attrgetter(*attributes)
+            rows = [getter(spec) for spec in specs]
+        columns = {}
+        for attr, column in zip(attributes, zip(*rows)):
+            columns[attr] = [None if val == "NULL" else val for val in column]
+        return columns
+
+    to_columns = classmethod(to_columns)
+
+    # make FileSpecs from columns
+    def from_columns(cls, columns):
+        """
+        Make FileSpecs without owners from a columnar format. Attributes missing in the columns are set to NULL
+
+        :param columns: dictionary of attribute name and list of values. All lists must have the same length
+        :return: list of FileSpecs
+        """
+        nRows = max([len(column) for column in columns.values()], default=0)
+        nullColumn = [None] * nRows
+        return cls.pack_rows(zip(*[columns.get(attr, nullColumn) for attr in cls._attributes]))
+
+    from_columns = classmethod(from_columns)
+
+    # return maps of bind values for FileSpecs
+    def values_maps(cls, specs, useSeq=False, onlyChanged=False):
+        """
+        Make maps of bind values for FileSpecs, e.g. for executemany
+
+        :param specs: list of FileSpecs
+        :param useSeq: True to skip attributes taken from sequences
+        :param onlyChanged: True to include only changed attributes
+        :return: list of maps of bind values
+        """
+        return [spec.valuesMap(useSeq=useSeq, onlyChanged=onlyChanged) for spec in specs]
+
+    values_maps = classmethod(values_maps)
+
     # return column names for INSERT
     def columnNames(cls, withMod=False):
-        ret = ""
-        for attr in cls._attributes:
-            if ret != "":
-                ret += ","
-            ret += attr
-        # add modificationTime
-        if withMod:
-            ret += ",modificationTime"
-        return ret
+        key = ("columnNames", withMod)
+        if key not in cls._cache:
+            ret = ",".join(cls._attributes)
+            # add modificationTime
+            if withMod:
+                ret += ",modificationTime"
+            cls._cache[key] = ret
+        return cls._cache[key]
 
     columnNames = classmethod(columnNames)
 
     # return expression of values for INSERT
     def valuesExpression(cls):
-        ret = "VALUES("
-        for attr in cls._attributes:
-            ret += "%s"
-            if attr != cls._attributes[len(cls._attributes) - 1]:
-                ret += ","
-        ret += ")"
-        return ret
+        if "valuesExpression" not in cls._cache:
+            cls._cache["valuesExpression"] = "VALUES(" + ",".join(["%s"] * len(cls._attributes)) + ")"
+        return cls._cache["valuesExpression"]
 
     valuesExpression = classmethod(valuesExpression)
 
@@ -189,57 +302,50 @@ class FileSpec(object):
     def bindValuesExpression(cls, useSeq=False, withMod=False):
         from pandaserver.config import panda_config
 
-        ret = "VALUES("
-        for attr in cls._attributes:
-            if useSeq and attr in cls._seqAttrMap:
-                if panda_config.backend == "mysql":
-                    # mysql
-                    ret += f"NULL,"
+        key = ("bindValuesExpression", useSeq, withMod, panda_config.backend)
+        if key not in cls._cache:
+            items = []
+            for attr in cls._attributes:
+                if useSeq and attr in cls._seqAttrMap:
+                    if panda_config.backend == "mysql":
+                        # mysql
+                        items.append("NULL")
+                    else:
+                        # oracle
+                        items.append(cls._seqAttrMap[attr])
                 else:
-                    # oracle
-                    ret += f"{cls._seqAttrMap[attr]},"
-            else:
-                ret += f":{attr},"
-        ret = ret[:-1]
-        # add modificationTime
-        if withMod:
-            ret += ",:modificationTime"
-        ret += ")"
-        return ret
+                    items.append(f":{attr}")
+            # add modificationTime
+            if withMod:
+                items.append(":modificationTime")
+            cls._cache[key] = "VALUES(" + ",".join(items) + ")"
+        return cls._cache[key]
 
     bindValuesExpression = classmethod(bindValuesExpression)
 
     # return an expression for UPDATE
     def updateExpression(cls):
-        ret = ""
-        for attr in cls._attributes:
-            ret = ret + attr + "=%s"
-            if attr != cls._attributes[len(cls._attributes) - 1]:
-                ret += ","
-        return ret
+        if "updateExpression" not in cls._cache:
+            cls._cache["updateExpression"] = ",".join([f"{attr}=%s" for attr in cls._attributes])
+        return cls._cache["updateExpression"]
 
     updateExpression = classmethod(updateExpression)
 
     # return an expression of bind variables for UPDATE
     def bindUpdateExpression(cls):
-        ret = ""
-        for attr in cls._attributes:
-            ret += f"{attr}=:{attr},"
-        ret = ret[:-1]
-        ret += " "
-        return ret
+        if "bindUpdateExpression" not in cls._cache:
+            cls._cache["bindUpdateExpression"] = ",".join([f"{attr}=:{attr}" for attr in cls._attributes]) + " "
+        return cls._cache["bindUpdateExpression"]
 
     bindUpdateExpression = classmethod(bindUpdateExpression)
 
     # return an expression of bind variables for UPDATE to update only changed attributes
     def bindUpdateChangesExpression(self):
-        ret = ""
+        items = []
         for attr in self._attributes:
-            if attr in self._changedAttrs or (attr == "PandaID" and self.PandaID != self._oldPandaID):
-                ret += f"{attr}=:{attr},"
-        ret = ret[:-1]
-        ret += " "
-        return ret
+            if attr in self._changedAttrs or (attr == "PandaID" and self._isPandaIDChanged()):
+                items.append(f"{attr}=:{attr}")
+        return ",".join(items) + " "
 
     # check if unmerged input
     def isUnMergedInput(self):
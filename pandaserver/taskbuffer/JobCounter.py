@@ -0,0 +1,209 @@
+"""
+in-memory cache of job statistics
+
+"""
+
+import threading
+import time
+
+from pandaserver.config import panda_config
+
+
+# immutable snapshot of job statistics
+class JobCounterSnapshot:
+    """
+    Consistent view of job statistics at a version. Aggregated maps are made once for each set of arguments and shared,
+    so that they must not be modified by callers. Filters follow the SQL of the statistics methods, e.g. rows with NULL
+    work queue are dropped by NOT IN
+    """
+
+    # constructor
+    def __init__(self, version, defined_counts, active_counts, defined_share_counts, active_share_counts, resource_queue_ids):
+        self.version = version
+        # (vo, prodSourceLabel, computingSite, cloud, workQueue_ID, jobStatus) -> n_jobs in jobsDefined4
+        self.definedCounts = defined_counts
+        # (vo, prodSourceLabel, computingSite, cloud, workQueue_ID, jobStatus) -> (n_jobs, n_cores) in MV_JOBSACTIVE4_STATS
+        self.activeCounts = active_counts
+        # (vo, computingSite, gshare, resource_type, workqueue_id, nucleus, jobStatus) -> n_jobs in JOBSDEFINED_SHARE_STATS
+        self.definedShareCounts = defined_share_counts
+        # (vo, computingSite, gshare, resource_type, workqueue_id, nucleus, jobStatus) -> n_jobs in JOBS_SHARE_STATS
+        self.activeShareCounts = active_share_counts
+        # IDs of work queues with queue_function=Resource
+        self.resourceQueueIDs = resource_queue_ids
+        self.lock = threading.Lock()
+        self.viewMap = {}
+
+    # get an aggregated map
+    def get_view(self, view_key, make_view):
+        with self.lock:
+            if view_key not in self.viewMap:
+                self.viewMap[view_key] = make_view()
+            return self.viewMap[view_key]
+
+    # check if a work queue passes NOT IN resource queues. NULL never passes as in SQL
+    def is_not_in_resource_queues(self, workqueue_id):
+        return workqueue_id is not None and workqueue_id not in self.resourceQueueIDs
+
+    # loop over share statistics of both tables
+    def iterate_share_counts(self):
+        for share_counts in [self.activeShareCounts, self.definedShareCounts]:
+            yield from share_counts.items()
+
+    # the number of jobs per site, cloud, status and work queue in jobsActive4 and jobsDefined4, in the same format as rows of
+    # the queries in getJobStatisticsWithWorkQueue_JEDI
+    def get_job_statistics_with_work_queue(self, vo, prod_source_label, cloud=None):
+        def make_view():
+            ret = []
+            for counts in [{key: n_jobs for key, (n_jobs, _) in self.activeCounts.items()}, self.definedCounts]:
+                for (tmp_vo, tmp_label, site, tmp_cloud, workqueue_id, status), n_jobs in counts.items():
+                    if tmp_vo != vo or tmp_label != prod_source_label or (cloud is not None and tmp_cloud != cloud):
+                        continue
+                    ret.append((site, tmp_cloud, status, workqueue_id, n_jobs))
+            return tuple(ret)
+
+        return self.get_view(("work_queue", vo, prod_source_label, cloud), make_view)
+
+    # the number of cores in jobsActive4 per site and status as in get_core_statistics
+    def get_core_statistics(self, vo, prod_source_label):
+        def make_view():
+            ret = {}
+            for (tmp_vo, tmp_label, site, _, _, status), (_, n_cores) in self.activeCounts.items():
+                if tmp_vo != vo or tmp_label != prod_source_label:
+                    continue
+                ret.setdefault(site, {}).setdefault(status, 0)
+                ret[site][status] += n_cores
+            return ret
+
+        return self.get_view(("core", vo, prod_source_label), make_view)
+
+    # the number of jobs per site, global share and status as in getJobStatisticsByGlobalShare
+    def get_job_statistics_by_global_share(self, vo, exclude_rwq):
+        def make_view():
+            ret = {}
+            for (tmp_vo, site, gshare, _, workqueue_id, _, status), n_jobs in self.iterate_share_counts():
+                if tmp_vo != vo or (exclude_rwq and not self.is_not_in_resource_queues(workqueue_id)):
+                    continue
+                ret.setdefault(site, {}).setdefault(gshare, {}).setdefault(status, 0)
+                ret[site][gshare][status] += n_jobs
+            return ret
+
+        return self.get_view(("global_share", vo, bool(exclude_rwq)), make_view)
+
+    # the number of jobs per status and resource type as in getJobStatisticsByResourceType, where numbers in
+    # JOBSDEFINED_SHARE_STATS overwrite those in JOBS_SHARE_STATS
+    def get_job_statistics_by_resource_type(self, vo, gshare=None, workqueue_id=None):
+        def make_view():
+            ret = {}
+            for share_counts in [self.activeShareCounts, self.definedShareCounts]:
+                tmp_ret = {}
+                for (tmp_vo, _, tmp_gshare, resource_type, tmp_workqueue_id, _, status), n_jobs in share_counts.items():
+                    if tmp_vo != vo:
+                        continue
+                    if gshare is not None and (tmp_gshare != gshare or not self.is_not_in_resource_queues(tmp_workqueue_id)):
+                        continue
+                    if gshare is None and (tmp_workqueue_id is None or tmp_workqueue_id != workqueue_id):
+                        continue
+                    tmp_ret.setdefault(status, {}).setdefault(resource_type, 0)
+                    tmp_ret[status][resource_type] += n_jobs
+                for status, tmp_map in tmp_ret.items():
+                    ret.setdefault(status, {}).update(tmp_map)
+            return ret
+
+        return self.get_view(("resource_type", vo, gshare, workqueue_id), make_view)
+
+    # the number of jobs with a status per site and nucleus in one of the tables as in get_num_jobs_with_status_by_nucleus
+    def get_num_jobs_with_status_by_nucleus(self, vo, job_status, from_active):
+        def make_view():
+            ret = {}
+            share_counts = self.activeShareCounts if from_active else self.definedShareCounts
+            for (tmp_vo, site, _, _, _, nucleus, status), n_jobs in share_counts.items():
+                if tmp_vo != vo or status != job_status or not n_jobs:
+                    continue
+                ret.setdefault(site, {}).setdefault(nucleus, 0)
+                ret[site][nucleus] += n_jobs
+            return ret
+
+        return self.get_view(("nucleus", vo, job_status, from_active), make_view)
+
+
+# cache of job statistics in a process
+class JobCounter:
+    """
+    Cache of job statistics read from the statistics tables, which are already aggregated in the database, and the numbers
+    of jobs in jobsDefined4. Statistics calls read memoised views instead of querying the tables every time. The cache is
+    refreshed periodically by one thread in the process while other threads keep using the previous snapshot, so that
+    the numbers are as fresh as the statistics tables plus the refresh interval
+    """
+
+    # constructor
+    def __init__(self, refresh_interval):
+        # interval in seconds to refresh the cache. 0 to disable the cache
+        self.refreshInterval = refresh_interval
+        self.lock = threading.Lock()
+        self.refreshing = False
+        self.refreshedAt = None
+        self.version = 0
+        self.snapshot = None
+
+    # check if enabled
+    def is_enabled(self):
+        return self.refreshInterval > 0
+
+    # start refresh if needed. return True if the caller has to refresh
+    def start_refresh(self):
+        with self.lock:
+            if self.refreshing:
+                # another thread is refreshing
+                return False
+            if self.refreshedAt is not None and time.monotonic() - self.refreshedAt < self.refreshInterval:
+                return False
+            self.refreshing = True
+            return True
+
+    # finish refresh with rows of the tables
+    def finish_refresh(self, defined_rows, active_rows, defined_share_rows, active_share_rows, resource_queue_ids):
+        """
+        :param defined_rows: list of (vo, prodSourceLabel, computingSite, cloud, workQueue_ID, jobStatus, n_jobs) in jobsDefined4
+        :param active_rows: list of (vo, prodSourceLabel, computingSite, cloud, workQueue_ID, jobStatus, n_jobs, n_cores)
+                            in MV_JOBSACTIVE4_STATS
+        :param defined_share_rows: list of (vo, computingSite, gshare, resource_type, workqueue_id, nucleus, jobStatus, n_jobs)
+                                   in JOBSDEFINED_SHARE_STATS
+        :param active_share_rows: list of (vo, computingSite, gshare, resource_type, workqueue_id, nucleus, jobStatus, n_jobs)
+                                  in JOBS_SHARE_STATS
+        :param resource_queue_ids: IDs of work queues with queue_function=Resource
+        """
+        defined_counts = {}
+        for row in defined_rows:
+            key = tuple(row[:6])
+            defined_counts[key] = defined_counts.get(key, 0) + (row[6] or 0)
+        active_counts = {}
+        for row in active_rows:
+            key = tuple(row[:6])
+            n_jobs, n_cores = active_counts.get(key, (0, 0))
+            active_counts[key] = (n_jobs + (row[6] or 0), n_cores + (row[7] or 0))
+        share_counts_list = []
+        for share_rows in [defined_share_rows, active_share_rows]:
+            share_counts = {}
+            for row in share_rows:
+                key = tuple(row[:7])
+                share_counts[key] = share_counts.get(key, 0) + (row[7] or 0)
+            share_counts_list.append(share_counts)
+        with self.lock:
+            self.version += 1
+            self.snapshot = JobCounterSnapshot(self.version, defined_counts, active_counts, *share_counts_list, frozenset(resource_queue_ids))
+            self.refreshing = False
+            self.refreshedAt = time.monotonic()
+
+    # abort refresh
+    def abort_refresh(self):
+        with self.lock:
+            self.refreshing = False
+
+    # get the latest snapshot. None if the cache is not filled yet
+    def get_snapshot(self):
+        with self.lock:
+            return self.snapshot
+
+
+# cache shared by DB proxies in the process
+job_counter = JobCounter(getattr(panda_config, "job_counter_refresh_interval", 60))
@@ -5,6 +5,7 @@ job specification
 
 import datetime
 import json
+import operator
 import re
 
 from pandacommon.pandautils.PandaUtils import naive_utcnow
@@ -146,6 +147,12 @@ class JobSpec(object):
     )
     # slots
     __slots__ = _attributes + ("Files", "_changedAttrs", "_reserveChangedState")
+    # set of attributes for fast lookup
+    _attributeSet = frozenset(_attributes)
+    # function to get values of all attributes at once
+    _valuesGetter = operator.attrgetter(*_attributes)
+    # cache of SQL expressions and conversion rules, which are made at the first use
+    _cache = {}
     # attributes which have 0 by default
     _zeroAttrs = (
         "assignedPriority",
@@ -230,9 +237,9 @@ class JobSpec(object):
 
     # constructor
     def __init__(self):
-        # install attributes
+        # install attributes. None is stored as NULL so that attributes are read from slots as they are
         for attr in self._attributes:
-            object.__setattr__(self, attr, None)
+            object.__setattr__(self, attr, "NULL")
         # files list
         object.__setattr__(self, "Files", [])
         # map of changed attributes
@@ -240,24 +247,20 @@ class JobSpec(object):
         # reserve changed state at instance level
         object.__setattr__(self, "_reserveChangedState", False)
 
-    # override __getattribute__ for SQL
-    def __getattribute__(self, name):
-        ret = object.__getattribute__(self, name)
-        if ret is None:
-            return "NULL"
-        return ret
-
-    # override __setattr__ to collecte the changed attributes
+    # override __setattr__ to store None as NULL for SQL and to collect the changed attributes
     def __setattr__(self, name, value):
         oldVal = getattr(self, name)
-        object.__setattr__(self, name, value)
-        newVal = getattr(self, name)
-        if name == "jobStatus":
-            if oldVal != newVal:
+        if value is None and name in self._attributeSet:
+            newVal = "NULL"
+        else:
+            newVal = value
+        object.__setattr__(self, name, newVal)
+        if oldVal != newVal:
+            if name == "jobStatus":
                 self.stateChangeTime = naive_utcnow()
-        # collect changed attributes
-        if oldVal != newVal and name not in self._suppAttrs:
-            self._changedAttrs[name] = value
+            # collect changed attributes
+            if name not in self._suppAttrs:
+                self._changedAttrs[name] = value
 
     # reset changed attribute list
     def resetChangedList(self):
@@ -270,52 +273,67 @@ class JobSpec(object):
         # append
         self.Files.append(file)
 
+    # get functions to set attributes in the order of _attributes, bypassing __setattr__
+    def _getAttributeSetters(cls):
+        if "setters" not in cls._cache:
+            cls._cache["setters"] = tuple(getattr(cls, attr).__set__ for attr in cls._attributes)
+        return cls._cache["setters"]
+
+    _getAttributeSetters = classmethod(_getAttributeSetters)
+
+    # get conversion rules of attributes to make maps of bind values
+    def _getValuesMapRules(cls, useSeq):
+        key = ("valuesMap", useSeq)
+        if key not in cls._cache:
+            rules = []
+            for attr in cls._attributes:
+                if useSeq and attr in cls._seqAttrMap:
+                    continue
+                # value for NULL
+                if attr in cls._zeroAttrs:
+                    nullVal = 0
+                else:
+                    nullVal = None
+                rules.append((attr, f":{attr}", nullVal, cls._limitLength.get(attr), attr in cls._suppAttrs))
+            cls._cache[key] = tuple(rules)
+        return cls._cache[key]
+
+    _getValuesMapRules = classmethod(_getValuesMapRules)
+
     # pack tuple into JobSpec
     def pack(self, values):
-        for i in range(len(self._attributes)):
-            attr = self._attributes[i]
-            val = values[i]
-            object.__setattr__(self, attr, val)
+        for setter, val in zip(self._getAttributeSetters(), values):
+            if val is None:
+                val = "NULL"
+            setter(self, val)
 
     # return a tuple of values
     def values(self):
-        ret = []
-        for attr in self._attributes:
-            val = getattr(self, attr)
-            ret.append(val)
-        return tuple(ret)
+        return self._valuesGetter(self)
 
     # return map of values
     def valuesMap(self, useSeq=False, onlyChanged=False):
         ret = {}
-        for attr in self._attributes:
-            if useSeq and attr in self._seqAttrMap:
-                continue
+        for attr, bindName, nullVal, limitLength, isSupp in self._getValuesMapRules(useSeq):
             if onlyChanged:
                 if attr not in self._changedAttrs:
                     continue
+            # jobParameters/metadata go to another table
+            if isSupp:
+                ret[bindName] = None
+                continue
             val = getattr(self, attr)
             if val == "NULL":
-                if attr in self._zeroAttrs:
-                    val = 0
-                else:
-                    val = None
-            # jobParameters/metadata go to another table
-            if attr in self._suppAttrs:
-                val = None
-            # truncate too long values
-            if attr in self._limitLength:
-                if val is not None:
-                    val = val[: self._limitLength[attr]]
-            ret[f":{attr}"] = val
+                val = nullVal
+            elif limitLength is not None:
+                # truncate too long values
+                val = val[:limitLength]
+            ret[bindName] = val
         return ret
 
     # return state values to be pickled
     def __getstate__(self):
-        state = []
-        for attr in self._attributes:
-            val = getattr(self, attr)
-            state.append(val)
+        state = list(self._valuesGetter(self))
         if reserveChangedState or self._reserveChangedState:
             state.append(self._changedAttrs)
         # append File info
@@ -324,12 +342,13 @@ class JobSpec(object):
 
     # restore state from the unpickled state values
     def __setstate__(self, state):
-        for i in range(len(self._attributes)):
+        nState = len(state)
+        for i, setter in enumerate(self._getAttributeSetters()):
             # schema evolution is supported only when adding attributes
-            if i + 1 < len(state):
-                object.__setattr__(self, self._attributes[i], state[i])
+            if i + 1 < nState and state[i] is not None:
+                setter(self, state[i])
             else:
-                object.__setattr__(self, self._attributes[i], "NULL")
+                setter(self, "NULL")
         object.__setattr__(self, "Files", state[-1])
         if not hasattr(self, "_reserveChangedState"):
             object.__setattr__(self, "_reserveChangedState", False)
@@ -338,26 +357,101 @@ class JobSpec(object):
         else:
             object.__setattr__(self, "_changedAttrs", {})
 
+    # make JobSpecs from rows of a result set
+    def pack_rows(cls, rows):
+        """
+        Make JobSpecs from rows of a result set in one pass. Equivalent to calling pack() for new JobSpecs
+
+        :param rows: list of tuples of values in the order of _attributes, e.g. rows fetched with columnNames()
+        :return: list of JobSpecs
+        """
+        setters = cls._getAttributeSetters()
+        setFiles, setChangedAttrs, setReserveChangedState = (getattr(cls, attr).__set__ for attr in ("Files", "_changedAttrs", "_reserveChangedState"))
+        # instance-level flag depends on the class
+        reserveState = cls()._reserveChangedState
+        specs = []
+        for row in rows:
+            spec = object.__new__(cls)
+            for setter, val in zip(setters, row):
+                if val is None:
+                    val = "NULL"
+                setter(spec, val)
+            setFiles(spec, [])
+            setChangedAttrs(spec, {})
+            setReserveChangedState(spec, reserveState)
+            specs.append(spec)
+        return specs
+
+    pack_rows = classmethod(pack_rows)
+
+    # convert JobSpecs to columns
+    def to_columns(cls, specs, attributes=None):
+        """
+        Convert JobSpecs to a columnar format where NULL is converted to None
+
+        :param specs: list of JobSpecs
+        :param attributes: list of attributes to convert. None to convert all attributes
+        :return: dictionary of attribute name and list of values
+        """
+        if attributes is None:
+            attributes = cls._attributes
+        if not specs:
+            return {attr: [] for attr in attributes}
+        if attributes == cls._attributes:
+            rows = [cls._valuesGetter(spec) for spec in specs]
+        elif len(attributes) == 1:
+            rows = [(getattr(spec, attributes[0]),) for spec in specs]
+        else:
+            getter = operator.attrgetter(*attributes)
+            rows = [getter(spec) for spec in specs]
+        columns = {}
+        for attr, column in zip(attributes, zip(*rows)):
+            columns[attr] = [None if val == "NULL" else val for val in column]
+        return columns
+
+    to_columns = classmethod(to_columns)
+
+    # make JobSpecs from columns
+    def from_columns(cls, columns):
+        """
+        Make JobSpecs from a columnar format. Attributes missing in the columns are set to NULL
+
+        :param columns: dictionary of attribute name and list of values. All lists must have the same length
+        :return: list of JobSpecs
+        """
+        nRows = max([len(column) for column in columns.values()], default=0)
+        nullColumn = [None] * nRows
+        return cls.pack_rows(zip(*[columns.get(attr, nullColumn) for attr in cls._attributes]))
+
+    from_columns = classmethod(from_columns)
+
+    # return maps of bind values for JobSpecs
+    def values_maps(cls, specs, useSeq=False, onlyChanged=False):
+        """
+        Make maps of bind values for JobSpecs, e.g. for executemany
+
+        :param specs: list of JobSpecs
+        :param useSeq: True to skip attributes taken from sequences
+        :param onlyChanged: True to include only changed attributes
+        :return: list of maps of bind values
+        """
+        return [spec.valuesMap(useSeq=useSeq, onlyChanged=onlyChanged) for spec in specs]
+
+    values_maps = classmethod(values_maps)
+
     # return column names for INSERT or full SELECT
     def columnNames(cls):
-        ret = ""
-        for attr in cls._attributes:
-            if ret != "":
-                ret += ","
-            ret += attr
-        return ret
+        if "columnNames" not in cls._cache:
+            cls._cache["columnNames"] = ",".join(cls._attributes)
+        return cls._cache["columnNames"]
 
     columnNames = classmethod(columnNames)
 
     # return expression of values for INSERT
     def valuesExpression(cls):
-        ret = "VALUES("
-        for attr in cls._attributes:
-            ret += "%s"
-            if attr != cls._attributes[len(cls._attributes) - 1]:
-                ret += ","
-        ret += ")"
-        return ret
+        if "valuesExpression" not in cls._cache:
+            cls._cache["valuesExpression"] = "VALUES(" + ",".join(["%s"] * len(cls._attributes)) + ")"
+        return cls._cache["valuesExpression"]
 
     valuesExpression = classmethod(valuesExpression)
 
@@ -365,42 +459,37 @@ class JobSpec(object):
     def bindValuesExpression(cls, useSeq=False):
         from pandaserver.config import panda_config
 
-        ret = "VALUES("
-        for attr in cls._attributes:
-            if useSeq and attr in cls._seqAttrMap:
-                if panda_config.backend == "mysql":
-                    # mysql
-                    ret += f"NULL,"
+        key = ("bindValuesExpression", useSeq, panda_config.backend)
+        if key not in cls._cache:
+            items = []
+            for attr in cls._attributes:
+                if useSeq and attr in cls._seqAttrMap:
+                    if panda_config.backend == "mysql":
+                        # mysql
+                        items.append("NULL")
+                    else:
+                        # oracle
+                        items.append(cls._seqAttrMap[attr])
                 else:
-                    # oracle
-                    ret += f"{cls._seqAttrMap[attr]},"
-            else:
-                ret += f":{attr},"
-        ret = ret[:-1]
-        ret += ")"
-        return ret
+                    items.append(f":{attr}")
+            cls._cache[key] = "VALUES(" + ",".join(items) + ")"
+        return cls._cache[key]
 
     bindValuesExpression = classmethod(bindValuesExpression)
 
     # return an expression for UPDATE
     def updateExpression(cls):
-        ret = ""
-        for attr in cls._attributes:
-            ret = ret + attr + "=%s"
-            if attr != cls._attributes[len(cls._attributes) - 1]:
-                ret += ","
-        return ret
+        if "updateExpression" not in cls._cache:
+            cls._cache["updateExpression"] = ",".join([f"{attr}=%s" for attr in cls._attributes])
+        return cls._cache["updateExpression"]
 
     updateExpression = classmethod(updateExpression)
 
     # return an expression of bind variables for UPDATE
     def bindUpdateExpression(cls):
-        ret = ""
-        for attr in cls._attributes:
-            ret += f"{attr}=:{attr},"
-        ret = ret[:-1]
-        ret += " "
-        return ret
+        if "bindUpdateExpression" not in cls._cache:
+            cls._cache["bindUpdateExpression"] = ",".join([f"{attr}=:{attr}" for attr in cls._attributes]) + " "
+        return cls._cache["bindUpdateExpression"]
 
     bindUpdateExpression = classmethod(bindUpdateExpression)
 
@@ -424,13 +513,7 @@ class JobSpec(object):
 
     # return an expression of bind variables for UPDATE to update only changed attributes
     def bindUpdateChangesExpression(self):
-        ret = ""
-        for attr in self._attributes:
-            if attr in self._changedAttrs:
-                ret += f"{attr}=:{attr},"
-        ret = ret[:-1]
-        ret += " "
-        return ret
+        return ",".join([f"{attr}=:{attr}" for attr in self._attributes if attr in self._changedAttrs]) + " "
 
     # check if goint to merging
     def produceUnMerge(self):
@@ -967,7 +1050,7 @@ class JobSpec(object):
         # Add files
         for file_data in job_dict.get("Files", []):
             file_spec = FileSpec()
-            file_spec.__setstate__([file_data.get(s, None) for s in file_spec.__slots__])
+            file_spec.__setstate__([file_data.get(s, None) for s in file_spec._attributes] + [None])
             self.addFile(file_spec)
 
     # set input and output file types
@@ -1,6 +1,8 @@
 import json
 import re
 
+import numpy as np
+
 from pandaserver.srvcore.CoreUtils import NonJsonObjectEncoder, as_python_object
 from pandaserver.taskbuffer.JobSpec import JobSpec
 
@@ -173,6 +175,11 @@ def compensate_ram_count(ram_count):
     return ram_count
 
 
+# compensate memory counts in an array, e.g. for all candidate sites. The same as compensate_ram_count for each element
+def compensate_ram_counts(ram_counts):
+    return np.trunc(np.asarray(ram_counts, dtype=np.float64) * MEMORY_COMPENSATION)
+
+
 # undo the memory count compensation
 def decompensate_ram_count(ram_count):
     if ram_count in ("NULL", None):
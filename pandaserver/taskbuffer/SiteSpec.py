@@ -27,6 +27,16 @@ catchall_keys = {
     ]
 }
 
+# converters of catchall values. None is given when the conversion fails
+catchall_types = {
+    "nSimEvents": int,
+    "minEventsForJumbo": int,
+    "maxDiskPerCore": int,
+    "jobChunkSize": int,
+    "allowed_processing": lambda v: tuple(v.split("|")) if v else None,
+    "excluded_processing": lambda v: tuple(v.split("|")) if v else None,
+}
+
 
 class SiteSpec(object):
     # attributes
@@ -109,43 +119,71 @@ class SiteSpec(object):
             return "std"
         return tmpVal
 
+    # parse catchall and extra queue parameters
+    def parse_catchall(self):
+        """
+        Parse catchall and extra queue parameters once into a dict of known keys, so that helpers called per site
+        in every brokerage pass only look up the dict. It is called when SiteMapper is built, and automatically again
+        when catchall or extra_queue_params is replaced.
+        Each entry is (has_value, value, typed_value) where value is the raw string given by getValueFromCatchall and
+        typed_value is converted by catchall_types
+        """
+        items = self.catchall.split(",") if self.catchall is not None else []
+        index = {}
+        for key, name in catchall_keys.items():
+            # extra queue parameters take precedence over the catchall field
+            has_value, value = self.get_extra_queue_param(name)
+            if not has_value:
+                for tmpItem in items:
+                    if tmpItem.startswith(name):
+                        has_value = True
+                        break
+                if has_value:
+                    for tmpItem in items:
+                        tmpMatch = re.search(f"^{name}=(.+)", tmpItem)
+                        if tmpMatch is not None:
+                            value = tmpMatch.group(1)
+                            break
+            typed_value = value
+            if key in catchall_types:
+                try:
+                    typed_value = catchall_types[key](value)
+                except Exception:
+                    typed_value = None
+            index[key] = (has_value, value, typed_value)
+        self._catchall_index = index
+        self._catchall_source = (self.catchall, self.extra_queue_params)
+        self._derived_cache = {}
+        return index
+
+    # get parsed catchall and extra queue parameters
+    def get_catchall_index(self):
+        # use __dict__ for SiteSpecs unpickled from old versions or made without parse_catchall
+        source = self.__dict__.get("_catchall_source")
+        if source is None or source[0] is not self.catchall or source[1] is not self.extra_queue_params:
+            return self.parse_catchall()
+        return self._catchall_index
+
     # get value from catchall
     def getValueFromCatchall(self, key):
         # check if the key is valid
         if key not in catchall_keys:
             return None
-        key = catchall_keys[key]
-        # first get the value if the key is defined as an extra queue parameter
-        has_value, value = self.get_extra_queue_param(key)
-        if has_value:
-            return value
-        # next get the value if the key is defined in the catchall field
-        if self.catchall is None:
-            return None
-        for tmpItem in self.catchall.split(","):
-            tmpMatch = re.search(f"^{key}=(.+)", tmpItem)
-            if tmpMatch is not None:
-                return tmpMatch.group(1)
-        return None
+        return self.get_catchall_index()[key][1]
 
     # has value in catchall
     def hasValueInCatchall(self, key):
         # check if the key is valid
         if key not in catchall_keys:
             return False
-        key = catchall_keys[key]
-        # first check if the key is defined as an extra queue parameter
-        has_value, _ = self.get_extra_queue_param(key)
-        if has_value:
-            return True
-        # next check if the key is defined in the catchall field
-        if self.catchall is None:
-            return False
-        for tmpItem in self.catchall.split(","):
-            tmpMatch = re.search(f"^{key}(=|)*", tmpItem)
-            if tmpMatch is not None:
-                return True
-        return False
+        return self.get_catchall_index()[key][0]
+
+    # get typed value from catchall
+    def get_typed_value_from_catchall(self, key):
+        # check if the key is valid
+        if key not in catchall_keys:
+            return None
+        return self.get_catchall_index()[key][2]
 
     # get extra queue parameter
     def get_extra_queue_param(self, name: str) -> tuple[bool, None | Any]:
@@ -195,17 +233,11 @@ class SiteSpec(object):
 
     # get number of simulated events for dynamic number of events
     def get_n_sim_events(self):
-        tmpVal = self.getValueFromCatchall("nSimEvents")
-        if tmpVal is None:
-            return None
-        return int(tmpVal)
+        return self.get_typed_value_from_catchall("nSimEvents")
 
     # get minimum of remaining events for jumbo jobs
     def getMinEventsForJumbo(self):
-        tmpVal = self.getValueFromCatchall("minEventsForJumbo")
-        if tmpVal is None:
-            return None
-        return int(tmpVal)
+        return self.get_typed_value_from_catchall("minEventsForJumbo")
 
     # check if opportunistic
     def is_opportunistic(self):
@@ -232,12 +264,7 @@ class SiteSpec(object):
 
     # get max disk per core
     def get_max_disk_per_core(self):
-        tmpVal = self.getValueFromCatchall("maxDiskPerCore")
-        try:
-            return int(tmpVal)
-        except Exception:
-            pass
-        return None
+        return self.get_typed_value_from_catchall("maxDiskPerCore")
 
     # use local data only
     def use_only_local_data(self):
@@ -245,13 +272,20 @@ class SiteSpec(object):
 
     # check if use VP
     def use_vp(self, scope):
+        # cached for each scope since endpoints are fixed once SiteMapper is built
+        cache_key = ("use_vp", scope, id(self.ddm_endpoints_input))
+        derived_cache = self.__dict__.setdefault("_derived_cache", {})
+        if cache_key in derived_cache:
+            return derived_cache[cache_key]
+        ret = False
         # use default scope if missing
         if scope not in self.ddm_endpoints_input:
             scope = "default"
         # check if VP_DISK is associated
         if scope in self.ddm_endpoints_input and [i for i in self.ddm_endpoints_input[scope].getAllEndPoints() if i.endswith("_VP_DISK")]:
-            return True
-        return False
+            ret = True
+        derived_cache[cache_key] = ret
+        return ret
 
     # check if always uses direct IO
     def always_use_direct_io(self):
@@ -265,10 +299,7 @@ class SiteSpec(object):
 
     # get job chunk size
     def get_job_chunk_size(self):
-        try:
-            return int(self.getValueFromCatchall("jobChunkSize"))
-        except Exception:
-            return None
+        return self.get_typed_value_from_catchall("jobChunkSize")
 
     # get WN connectivity
     def get_wn_connectivity(self):
@@ -309,22 +340,18 @@ class SiteSpec(object):
         """
         Get allowed processing types for processing type-based job brokerage to access only tasks with specific processing types.
         They are defined in the catchall field as a pipe-separated list with the key "allowed_processing".
+        The tuple is shared by all callers.
         """
-        n = self.getValueFromCatchall("allowed_processing")
-        if n:
-            return n.split("|")
-        return None
+        return self.get_typed_value_from_catchall("allowed_processing")
 
     # get excluded process types
     def get_excluded_processing_types(self):
         """
         Get excluded processing types for processing type-based job brokerage to exclude tasks with specific processing types.
         They are defined in the catchall field as a pipe-separated list with the key "excluded_processing".
+        The tuple is shared by all callers.
         """
-        n = self.getValueFromCatchall("excluded_processing")
-        if n:
-            return n.split("|")
-        return None
+        return self.get_typed_value_from_catchall("excluded_processing")
 
     # use per-core attributes
     def use_per_core_attr(self):
@@ -11,6 +11,7 @@ from pandacommon.pandalogger.LogWrapper import LogWrapper
 from pandacommon.pandalogger.PandaLogger import PandaLogger
 from pandacommon.pandautils.PandaUtils import naive_utcnow
 
+from pandaserver.brokerage import site_mapper_snapshot
 from pandaserver.brokerage.SiteMapper import SiteMapper
 from pandaserver.config import panda_config
 from pandaserver.dataservice.closer import Closer
@@ -89,6 +90,11 @@ class TaskBuffer:
 
     # get SiteMapper
     def get_site_mapper(self):
+        # use the shared snapshot if available
+        if panda_config.site_mapper_snapshot:
+            site_mapper = site_mapper_snapshot.snapshot_reader.get()
+            if site_mapper is not None:
+                return site_mapper
         time_now = naive_utcnow()
         if self.last_update_site_mapper is None or datetime.datetime.now(datetime.timezone.utc).replace(
             tzinfo=None
@@ -1000,6 +1006,18 @@ class TaskBuffer:
                     retJobs.append(None)
         return retJobs
 
+    # peek at jobs in jobsActive4 in bulk
+    def peek_active_jobs_in_bulk(self, panda_ids):
+        with self.proxyPool.get() as proxy:
+            ret = proxy.peek_active_jobs_in_bulk(panda_ids)
+        return ret
+
+    # peek at jobs in jobsArchived4 in bulk
+    def peek_archived_jobs_in_bulk(self, panda_ids):
+        with self.proxyPool.get() as proxy:
+            ret = proxy.peek_archived_jobs_in_bulk(panda_ids)
+        return ret
+
     # get PandaIDs with TaskID
     def getPandaIDsWithTaskID(self, jediTaskID: int, scout_only: bool = False, unsuccessful_only: bool = False) -> list[int]:
         """Get PanDA job IDs associated with a JEDI task.
@@ -2407,6 +2425,12 @@ class TaskBuffer:
             ret = proxy.getWorkersForJob(PandaID)
         return ret
 
+    # get workers for jobs
+    def get_workers_for_jobs(self, panda_ids):
+        with self.proxyPool.get() as proxy:
+            ret = proxy.get_workers_for_jobs(panda_ids)
+        return ret
+
     # get user job metadata
     def getUserJobMetadata(self, jediTaskID):
         # get DBproxy
@@ -2511,6 +2535,12 @@ class TaskBuffer:
             ret = proxy.lockJobOutputReport(panda_id, attempt_nr, pid, time_limit, take_over_from)
         return ret
 
+    # lock job output reports in bulk
+    def lockJobOutputReports(self, reports, pid, time_limit):
+        with self.proxyPool.get() as proxy:
+            ret = proxy.lockJobOutputReports(reports, pid, time_limit)
+        return ret
+
     # unlock job output report
     def unlockJobOutputReport(self, panda_id, attempt_nr, pid, lock_offset):
         with self.proxyPool.get() as proxy:
@@ -1,6 +1,10 @@
+import itertools
 import multiprocessing
 import os
 import pickle
+import select
+import socket
+import struct
 import sys
 import threading
 import time
@@ -8,6 +12,8 @@ from concurrent.futures import ThreadPoolExecutor
 
 from pandacommon.pandalogger.LogWrapper import LogWrapper
 from pandacommon.pandalogger.PandaLogger import PandaLogger
+
+from pandaserver.config import panda_config
 from pandaserver.taskbuffer import FileSpec, JobSpec
 
 JobSpec.reserveChangedState = True
@@ -16,6 +22,47 @@ FileSpec.reserveChangedState = True
 
 _logger = PandaLogger().getLogger("TaskBufferInterface")
 
+# frame header: request ID and payload length
+FRAME_HEADER = struct.Struct("!QQ")
+
+# request ID counter in each process
+_request_id_counter = itertools.count(1)
+
+
+# send a frame
+def send_frame(sock, request_id, obj):
+    payload = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(FRAME_HEADER.pack(request_id, len(payload)) + payload)
+
+
+# receive exactly size bytes
+def recv_exactly(sock, size):
+    buf = bytearray(size)
+    view = memoryview(buf)
+    pos = 0
+    while pos < size:
+        n_bytes = sock.recv_into(view[pos:], size - pos)
+        if n_bytes == 0:
+            raise socket.error("connection closed")
+        pos += n_bytes
+    return buf
+
+
+# receive a frame
+def recv_frame(sock):
+    request_id, size = FRAME_HEADER.unpack(recv_exactly(sock, FRAME_HEADER.size))
+    return request_id, pickle.loads(recv_exactly(sock, size))
+
+
+# make a picklable error
+def make_error():
+    errtype, errvalue = sys.exc_info()[:2]
+    try:
+        pickle.dumps(errvalue)
+    except Exception:
+        errvalue = str(errvalue)
+    return errtype, errvalue
+
 
 # method class
 class TaskBufferMethod:
@@ -73,14 +120,161 @@ class TaskBufferInterfaceChild:
         return TaskBufferMethod(attrName, self.commDict, self.childlock, self.comLock, self.resLock)
 
 
+# pool of slots shared by children with semaphores, which is lighter than passing slot numbers through a queue
+class SlotPool:
+    # constructor
+    def __init__(self, n_slots):
+        self.semaphore = multiprocessing.Semaphore(n_slots)
+        self.locks = [multiprocessing.Lock() for i in range(n_slots)]
+
+    # get a free slot
+    def get(self):
+        self.semaphore.acquire()
+        # start from different slots to reduce collisions
+        offset = os.getpid() + threading.get_ident()
+        while True:
+            for i in range(len(self.locks)):
+                index = (offset + i) % len(self.locks)
+                if self.locks[index].acquire(block=False):
+                    return index
+
+    # release a slot
+    def put(self, index):
+        self.locks[index].release()
+        self.semaphore.release()
+
+
+# call through a socket of slot
+def call_with_socket(childlock, sockets, request):
+    # get lock among children
+    i = childlock.get()
+    try:
+        sock = sockets[i]
+        request_id = (os.getpid() << 32) + next(_request_id_counter)
+        send_frame(sock, request_id, request)
+        # skip stale responses left by a caller which died in the middle of a call
+        while True:
+            res_id, res = recv_frame(sock)
+            if res_id == request_id:
+                break
+    finally:
+        # release lock to children
+        childlock.put(i)
+    return res
+
+
+# convert response to return value
+def unpack_response(method_name, response):
+    status_code, res = response
+    if status_code == 0:
+        return res
+    else:
+        errtype, errvalue = res
+        raise RuntimeError(f"{method_name}: {errtype.__name__} {errvalue}")
+
+
+# method class with sockets
+class TaskBufferSocketMethod:
+    def __init__(self, methodName, sockets, childlock):
+        self.methodName = methodName
+        self.sockets = sockets
+        self.childlock = childlock
+
+    def __call__(self, *args, **kwargs):
+        log = LogWrapper(
+            _logger,
+            f"pid={os.getpid()} thr={threading.current_thread().ident} {self.methodName}",
+        )
+        log.debug("start")
+        # serialize once and send it to master
+        response = call_with_socket(self.childlock, self.sockets, (self.methodName, args, kwargs))
+        log.debug("end")
+        return unpack_response(self.methodName, response)
+
+
+# child class with sockets
+class TaskBufferSocketInterfaceChild:
+    # constructor
+    def __init__(self, sockets, childlock):
+        self.sockets = sockets
+        self.childlock = childlock
+
+    # execute multiple methods in one round trip
+    def batch_call(self, calls):
+        """
+        Execute multiple methods in one round trip. The methods are executed sequentially in the master
+
+        :param calls: list of (method name, args, kwargs)
+        :return: list of return values in the same order. exceptions are returned as RuntimeError instead of being raised
+        """
+        log = LogWrapper(_logger, f"pid={os.getpid()} thr={threading.current_thread().ident} batch_call")
+        log.debug(f"start with {len(calls)} calls")
+        responses = call_with_socket(self.childlock, self.sockets, [tuple(call) for call in calls])
+        ret_list = []
+        for (method_name, _, _), response in zip(calls, responses):
+            try:
+                ret_list.append(unpack_response(method_name, response))
+            except RuntimeError as e:
+                ret_list.append(e)
+        log.debug("end")
+        return ret_list
+
+    # method emulation
+    def __getattr__(self, attrName):
+        return TaskBufferSocketMethod(attrName, self.sockets, self.childlock)
+
+
 # master class
 class TaskBufferInterface:
     # constructor
-    def __init__(self):
+    def __init__(self, transport=None):
+        # socket to send each call with a single serialization through socketpairs, or manager to use shared dicts
+        if transport is None:
+            transport = panda_config.tbif_transport
+        self.transport = transport
         # make manager to create shared objects
-        self.manager = multiprocessing.Manager()
+        if self.transport == "manager":
+            self.manager = multiprocessing.Manager()
         self.taskBuffer = None
 
+    # execute a method
+    def execute(self, taskBuffer, methodName, args, kwargs):
+        try:
+            method = getattr(taskBuffer, methodName)
+            return 0, method(*args, **kwargs)
+        except Exception:
+            return 1, make_error()
+
+    # main loop with sockets
+    def run_with_sockets(self, taskBuffer, sockets, to_stop):
+        with ThreadPoolExecutor(max_workers=len(sockets)) as pool:
+            [pool.submit(self.socket_thread_run, taskBuffer, sock, to_stop) for sock in sockets]
+
+    # main loop of each slot with socket
+    def socket_thread_run(self, taskBuffer, sock, to_stop):
+        while True:
+            # stop sign
+            if to_stop.value:
+                break
+            # wait for command
+            readable, _, _ = select.select([sock], [], [], 0.25)
+            if not readable:
+                continue
+            try:
+                request_id, request = recv_frame(sock)
+            except Exception as e:
+                _logger.error(f"failed to receive a request : {str(e)}")
+                break
+            # execute a method or a batch of methods
+            if isinstance(request, list):
+                response = [self.execute(taskBuffer, *call) for call in request]
+            else:
+                response = self.execute(taskBuffer, *request)
+            try:
+                send_frame(sock, request_id, response)
+            except Exception:
+                send_frame(sock, request_id, (1, make_error()))
+
     # main loop
     def run(self, taskBuffer, commDict, comLock, resLock, to_stop):
         with ThreadPoolExecutor(max_workers=taskBuffer.get_num_connections()) as pool:
@@ -126,6 +320,9 @@ class TaskBufferInterface:
 
     # launcher
     def launch(self, taskBuffer):
+        if self.transport != "manager":
+            self.launch_with_sockets(taskBuffer)
+            return
         # shared objects
         self.childlock = multiprocessing.Queue()
         self.commDict = dict()
@@ -146,8 +343,32 @@ class TaskBufferInterface:
         )
         self.process.start()
 
+    # launcher with sockets
+    def launch_with_sockets(self, taskBuffer):
+        self.childlock = SlotPool(taskBuffer.get_num_connections())
+        self.taskBuffer = taskBuffer
+        self.to_stop = multiprocessing.Value("i", 0)
+        # a socketpair per slot. children use one end and master uses the other
+        self.child_sockets = []
+        master_sockets = []
+        for i in range(taskBuffer.get_num_connections()):
+            child_sock, master_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.child_sockets.append(child_sock)
+            master_sockets.append(master_sock)
+
+        # run
+        self.process = multiprocessing.Process(
+            target=self.run_with_sockets,
+            args=(taskBuffer, master_sockets, self.to_stop),
+        )
+        self.process.start()
+        # master ends are used only in the master process
+        [sock.close() for sock in master_sockets]
+
     # get interface for child
     def getInterface(self):
+        if self.transport != "manager":
+            return TaskBufferSocketInterfaceChild(self.child_sockets, self.childlock)
         return TaskBufferInterfaceChild(self.commDict, self.childlock, self.comLock, self.resLock)
 
     # stop the loop
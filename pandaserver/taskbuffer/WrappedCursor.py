@@ -3,8 +3,13 @@ WrappedCursor for a generic database connection proxy
 
 """
 
+import ast
+import collections
+import glob
+import json
 import os
 import re
+import threading
 import warnings
 
 from pandacommon.pandalogger.PandaLogger import PandaLogger
@@ -28,140 +33,318 @@ def extract_table_names(sql):
     return table_names
 
 
-# convert SQL and parameters in_printf format
-def convert_query_in_printf_format(sql, var_dict_list, sql_conv_map):
-    if sql in sql_conv_map:
-        sql = sql_conv_map[sql]
-    else:
-        old_sql = sql
-        if var_dict_list:
-            var_dict = var_dict_list[0]
-        else:
-            var_dict = {}
-        # %
-        sql = re.sub(r"%", r"%%", sql)
-        # current date except for being used for interval
-        if re.search(r"CURRENT_DATE\s*[\+-]", sql, flags=re.IGNORECASE) is None:
-            sql = re.sub(r"CURRENT_DATE", r"CURRENT_TIMESTAMP", sql, flags=re.IGNORECASE)
-        # sequence
-        sql = re.sub(r"""([^ $,()]+).currval""", r"currval('\1')", sql, flags=re.IGNORECASE)
-        sql = re.sub(r"""([^ $,()]+).nextval""", r"nextval('\1')", sql, flags=re.IGNORECASE)
-        # returning
-        sql = re.sub(r"(RETURNING\s+\S+\s+)INTO\s+\S+", r"\1", sql, flags=re.IGNORECASE)
-        # sub query + rownum
-        sql = re.sub(r"\)\s+WHERE\s+rownum", r") tmp_sub WHERE rownum", sql, flags=re.IGNORECASE)
-        # sub query + GROUP BY
-        if re.search(r"FROM\s+\(\s*SELECT", sql, flags=re.IGNORECASE):
-            sql = re.sub(r"\)\s+GROUP\s+BY", r") tmp_sub GROUP BY", sql, flags=re.IGNORECASE)
-        # rownum
-        sql = re.sub(
-            r"(WHERE|AND)\s+rownum[^\d:]+(\d+|:[^ \)]+)",
-            r" LIMIT \2",
-            sql,
-            flags=re.IGNORECASE,
-        )
-        # NVL
-        sql = re.sub(r"NVL\(", r"COALESCE(", sql, flags=re.IGNORECASE)
-        # INSTR
-        sql = re.sub(r"INSTR\(", r"STRPOS(", sql, flags=re.IGNORECASE)
-        # random
-        sql = re.sub(r"DBMS_RANDOM.value", r"RANDOM()", sql, flags=re.IGNORECASE)
-        # MINUS
-        sql = re.sub(r" MINUS ", r" EXCEPT ", sql, flags=re.IGNORECASE)
-        # GENERATE_SERIES
-        sql = re.sub(
-            r"\(SELECT\s+level\s+FROM\s+dual\s+CONNECT\s+BY\s+level\s*<=\s*(:[^ \)]+)\)*",
-            r"GENERATE_SERIES(1,\1)",
-            sql,
-            flags=re.IGNORECASE,
-        )
-        # dual
-        sql = re.sub(r"FROM dual", "", sql, flags=re.IGNORECASE)
-        # NOWAIT
-        sql = re.sub(r"FOR UPDATE NOWAIT", "FOR UPDATE SKIP LOCKED", sql, flags=re.IGNORECASE)
-        # json
-        if "/* use_json_type */" in sql:
-            # remove \n to make regexp easier
-            sql = re.sub(r"\n", r" ", sql)
-            # collect table names
-            table_names = set(extract_table_names(sql))
-            checked_items = set()
-            # look for a.b(.c)*
-            for item in re.findall(r"(\w+\.\w+\.*\w*)", sql):
-                # skip if already checked
-                if item in checked_items:
-                    continue
-                checked_items.add(item)
-                item_l = item.lower()
-                # ignore tables
-                if item_l in table_names:
-                    continue
-                # ignore float
-                if item.replace(".", "", 1).isdigit():
-                    continue
-                to_skip = False
-                new_pat = None
-                # check if table.column.field
-                for table_name in table_names:
-                    if item_l.startswith(f"{table_name}."):
-                        item_body = re.sub(f"^{table_name}" + r"\.", "", item, flags=re.IGNORECASE)
-                        # no json field
-                        if item_body.count(".") == 0:
-                            to_skip = True
-                            break
-                        # convert . to ->>''
-                        new_body = re.sub(r"\.(?P<pat>\w+)", r"->>'\1'", item_body)
-                        # prepend the table name
-                        new_pat = ".".join(item.split(".")[: -(1 + item_body.count("."))]) + "." + new_body
-                        break
-                # ignore table.column
-                if to_skip:
-                    continue
-                old_pat = item
-                # column.field
-                if not new_pat:
-                    new_pat = re.sub(r"\.(?P<pat>\w+)", r"->>'\1'", item)
-                # guess type
-                right_vals = re.findall(old_pat + r"\s*[=<>!*]+\s*([\w:\']+)", sql)
-                for right_val in right_vals:
-                    # string
-                    if "'" in right_val:
+# version of SQL translation to invalidate translation tables built by older versions
+TRANSLATION_VERSION = 2
+
+# savepoint to roll back failed NOWAIT locks in postgres
+NOWAIT_SAVEPOINT = "panda_nowait_lock"
+
+# precompiled patterns for SQL conversion
+_re_current_date_interval = re.compile(r"CURRENT_DATE\s*[\+-]", flags=re.IGNORECASE)
+_re_current_date = re.compile(r"CURRENT_DATE", flags=re.IGNORECASE)
+_re_currval = re.compile(r"""([^ $,()]+).currval""", flags=re.IGNORECASE)
+_re_nextval = re.compile(r"""([^ $,()]+).nextval""", flags=re.IGNORECASE)
+_re_returning = re.compile(r"(RETURNING\s+\S+\s+)INTO\s+\S+", flags=re.IGNORECASE)
+_re_sub_query_rownum = re.compile(r"\)\s+WHERE\s+rownum", flags=re.IGNORECASE)
+_re_from_sub_query = re.compile(r"FROM\s+\(\s*SELECT", flags=re.IGNORECASE)
+_re_sub_query_group_by = re.compile(r"\)\s+GROUP\s+BY", flags=re.IGNORECASE)
+_re_rownum = re.compile(r"(WHERE|AND)\s+rownum[^\d:]+(\d+|:[^ \)]+)", flags=re.IGNORECASE)
+_re_nvl = re.compile(r"NVL\(", flags=re.IGNORECASE)
+_re_instr = re.compile(r"INSTR\(", flags=re.IGNORECASE)
+_re_random = re.compile(r"DBMS_RANDOM.value", flags=re.IGNORECASE)
+_re_minus = re.compile(r" MINUS ", flags=re.IGNORECASE)
+_re_level = re.compile(r"\(SELECT\s+level\s+FROM\s+dual\s+CONNECT\s+BY\s+level\s*<=\s*(:[^ \)]+)\)*", flags=re.IGNORECASE)
+_re_dual = re.compile(r"FROM dual", flags=re.IGNORECASE)
+_re_nowait = re.compile(r"FOR\s+UPDATE\s+NOWAIT", flags=re.IGNORECASE)
+_re_json_item = re.compile(r"(\w+\.\w+\.*\w*)")
+_re_json_field = re.compile(r"\.(?P<pat>\w+)")
+_re_placeholder = re.compile(r":[^ $,)\+\-\n]+")
+_re_placeholder_printf = re.compile(r":[^ $,)\+\-]+")
+_re_trailing_comment = re.compile(r"\s*(/\*\s*[\w.]+\s*\*/)?\s*$")
+_re_schema_panda = re.compile(r"ATLAS_PANDA\.")
+_re_schema_meta = re.compile(r"ATLAS_PANDAMETA\.")
+_re_schema_grisli = re.compile(r"ATLAS_GRISLI\.")
+_re_schema_arch = re.compile(r"ATLAS_PANDAARCH\.")
+
+
+# change schema names
+def change_schema(sql):
+    if panda_config.schemaPANDA != "ATLAS_PANDA":
+        sql = _re_schema_panda.sub(panda_config.schemaPANDA + ".", sql)
+    if panda_config.schemaMETA != "ATLAS_PANDAMETA":
+        sql = _re_schema_meta.sub(panda_config.schemaMETA + ".", sql)
+    if panda_config.schemaGRISLI != "ATLAS_GRISLI":
+        sql = _re_schema_grisli.sub(panda_config.schemaGRISLI + ".", sql)
+    if panda_config.schemaPANDAARCH != "ATLAS_PANDAARCH":
+        sql = _re_schema_arch.sub(panda_config.schemaPANDAARCH + ".", sql)
+    return sql
+
+
+# convert Oracle SQL to Postgres SQL
+def convert_query(sql, var_dict):
+    # %
+    sql = sql.replace("%", "%%")
+    # current date except for being used for interval
+    if _re_current_date_interval.search(sql) is None:
+        sql = _re_current_date.sub(r"CURRENT_TIMESTAMP", sql)
+    # sequence
+    sql = _re_currval.sub(r"currval('\1')", sql)
+    sql = _re_nextval.sub(r"nextval('\1')", sql)
+    # returning
+    sql = _re_returning.sub(r"\1", sql)
+    # sub query + rownum
+    sql = _re_sub_query_rownum.sub(r") tmp_sub WHERE rownum", sql)
+    # sub query + GROUP BY
+    if _re_from_sub_query.search(sql):
+        sql = _re_sub_query_group_by.sub(r") tmp_sub GROUP BY", sql)
+    # rownum
+    sql = _re_rownum.sub(r" LIMIT \2", sql)
+    # NVL
+    sql = _re_nvl.sub(r"COALESCE(", sql)
+    # INSTR
+    sql = _re_instr.sub(r"STRPOS(", sql)
+    # random
+    sql = _re_random.sub(r"RANDOM()", sql)
+    # MINUS
+    sql = _re_minus.sub(r" EXCEPT ", sql)
+    # GENERATE_SERIES
+    sql = _re_level.sub(r"GENERATE_SERIES(1,\1)", sql)
+    # dual
+    sql = _re_dual.sub("", sql)
+    # json
+    if "/* use_json_type */" in sql:
+        # remove \n to make regexp easier
+        sql = sql.replace("\n", " ")
+        # collect table names
+        table_names = set(extract_table_names(sql))
+        checked_items = set()
+        # look for a.b(.c)*
+        for item in _re_json_item.findall(sql):
+            # skip if already checked
+            if item in checked_items:
+                continue
+            checked_items.add(item)
+            item_l = item.lower()
+            # ignore tables
+            if item_l in table_names:
+                continue
+            # ignore float
+            if item.replace(".", "", 1).isdigit():
+                continue
+            to_skip = False
+            new_pat = None
+            # check if table.column.field
+            for table_name in table_names:
+                if item_l.startswith(f"{table_name}."):
+                    item_body = re.sub(f"^{table_name}" + r"\.", "", item, flags=re.IGNORECASE)
+                    # no json field
+                    if item_body.count(".") == 0:
+                        to_skip = True
                         break
-                    # integer
-                    if right_val.isdigit():
+                    # convert . to ->>''
+                    new_body = _re_json_field.sub(r"->>'\1'", item_body)
+                    # prepend the table name
+                    new_pat = ".".join(item.split(".")[: -(1 + item_body.count("."))]) + "." + new_body
+                    break
+            # ignore table.column
+            if to_skip:
+                continue
+            old_pat = item
+            # column.field
+            if not new_pat:
+                new_pat = _re_json_field.sub(r"->>'\1'", item)
+            # guess type
+            right_vals = re.findall(old_pat + r"\s*[=<>!*]+\s*([\w:\']+)", sql)
+            for right_val in right_vals:
+                # string
+                if "'" in right_val:
+                    break
+                # integer
+                if right_val.isdigit():
+                    new_pat = f"CAST({new_pat} AS integer)"
+                    break
+                # float
+                if right_val.replace(".", "", 1).isdigit():
+                    new_pat = f"CAST({new_pat} AS float)"
+                    break
+                # bind variable
+                if right_val.startswith(":"):
+                    if right_val not in var_dict:
+                        raise KeyError(f"{right_val} is missing to guess data type")
+                    if isinstance(var_dict[right_val], int):
                         new_pat = f"CAST({new_pat} AS integer)"
                         break
-                    # float
-                    if right_val.replace(".", "", 1).isdigit():
+                    if isinstance(var_dict[right_val], float):
                         new_pat = f"CAST({new_pat} AS float)"
                         break
-                    # bind variable
-                    if right_val.startswith(":"):
-                        if right_val not in var_dict:
-                            raise KeyError(f"{right_val} is missing to guess data type")
-                        if isinstance(var_dict[right_val], int):
-                            new_pat = f"CAST({new_pat} AS integer)"
-                            break
-                        if isinstance(var_dict[right_val], float):
-                            new_pat = f"CAST({new_pat} AS float)"
-                            break
-                # replace
-                print(old_pat, new_pat)
-                sql = sql.replace(old_pat, new_pat)
-            # cache
-            sql_conv_map[old_sql] = sql
+            # replace
+            sql = sql.replace(old_pat, new_pat)
+    return sql
+
+
+# translate SQL into the printf style syntax with the list of placeholders
+def translate_query(sql, var_dict):
+    sql = change_schema(sql)
+    sql = sql.replace("`", "")
+    sql = convert_query(sql, var_dict)
+    placeholders = tuple(_re_placeholder.findall(sql))
+    sql = _re_placeholder_printf.sub("%s", sql)
+    return sql, placeholders
+
+
+# process-wide LRU cache of translated SQL
+class SQLTranslationCache:
+    # constructor
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.cache = collections.OrderedDict()
+        # read-only table loaded from disk
+        self.table = {}
+        self.hits = 0
+        self.misses = 0
+
+    # get translated SQL and placeholders
+    def translate(self, sql, var_dict):
+        # strip trailing comment and spaces so that the same statement called from different methods shares the entry
+        comment = ""
+        match = _re_trailing_comment.search(sql)
+        if "use_json_type" not in match.group(0):
+            comment = match.group(0)
+            sql = sql[: match.start()]
+        # data types of bind variables matter for json
+        if "/* use_json_type */" in sql:
+            key = (sql, tuple(sorted((k, type(v).__name__) for k, v in var_dict.items())))
+        else:
+            key = sql
+        with self.lock:
+            value = self.table.get(key)
+            if value is None:
+                value = self.cache.get(key)
+                if value is not None:
+                    self.cache.move_to_end(key)
+            if value is not None:
+                self.hits += 1
+        if value is None:
+            value = translate_query(sql, var_dict)
+            with self.lock:
+                self.misses += 1
+                self.cache[key] = value
+                if len(self.cache) > self.max_size:
+                    self.cache.popitem(last=False)
+        return value[0] + comment, value[1]
+
+    # get statistics
+    def get_stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.cache), "table_size": len(self.table)}
+
+    # load translation table
+    def load_table(self, path):
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != TRANSLATION_VERSION or data.get("schemas") != _get_schemas():
+            raise ValueError("translation table was built by a different version or for different schemas")
+        with self.lock:
+            self.table = {k: (v[0], tuple(v[1])) for k, v in data["entries"].items()}
+
+
+# get schema names which translation depends on
+def _get_schemas():
+    return [panda_config.schemaPANDA, panda_config.schemaMETA, panda_config.schemaGRISLI, panda_config.schemaPANDAARCH]
+
+
+# extract complete SQL statements from string literals
+def extract_sql_literals(path):
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    statements = set()
+
+    def _is_str(node):
+        return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+    def _flush(sql):
+        if sql.lstrip().upper().startswith(("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")):
+            statements.add(sql)
+
+    for node in ast.walk(tree):
+        body = getattr(node, "body", None)
+        if not isinstance(body, list):
+            continue
+        # accumulate statements built by assignment and += of constant strings
+        accumulated = {}
+        for stmt in body:
+            if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 and isinstance(stmt.targets[0], ast.Name):
+                name = stmt.targets[0].id
+                if name in accumulated:
+                    _flush(accumulated.pop(name))
+                if _is_str(stmt.value):
+                    accumulated[name] = stmt.value.value
+            elif isinstance(stmt, ast.AugAssign) and isinstance(stmt.target, ast.Name) and stmt.target.id in accumulated:
+                name = stmt.target.id
+                if isinstance(stmt.op, ast.Add) and _is_str(stmt.value):
+                    accumulated[name] += stmt.value.value
+                else:
+                    accumulated.pop(name)
+        for sql in accumulated.values():
+            _flush(sql)
+    return statements
+
+
+# build translation table by scanning SQL literals in db_proxy_mods
+def build_translation_table(path):
+    mod_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "db_proxy_mods")
+    entries = {}
+    for mod_path in sorted(glob.glob(os.path.join(mod_dir, "*.py"))):
+        for sql in extract_sql_literals(mod_path):
+            # json conversion depends on bind variables
+            if "use_json_type" in sql:
+                continue
+            sql = sql.rstrip()
+            try:
+                entries[sql] = translate_query(sql, {})
+            except Exception:
+                pass
+    # write into a temporary file and rename it to avoid partial reads by other processes
+    tmp_path = f"{path}.{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump({"version": TRANSLATION_VERSION, "schemas": _get_schemas(), "entries": entries}, f)
+    os.replace(tmp_path, path)
+    return len(entries)
+
+
+# process-wide cache
+sql_translation_cache = SQLTranslationCache(panda_config.sql_translation_cache_size)
+if panda_config.backend == "postgres" and panda_config.sql_translation_table:
+    try:
+        if not os.path.exists(panda_config.sql_translation_table):
+            build_translation_table(panda_config.sql_translation_table)
+        sql_translation_cache.load_table(panda_config.sql_translation_table)
+    except Exception:
+        # rebuild with the current schemas
+        try:
+            build_translation_table(panda_config.sql_translation_table)
+            sql_translation_cache.load_table(panda_config.sql_translation_table)
+        except Exception as e:
+            _logger.error(f"failed to load SQL translation table : {str(e)}")
+
+
+# convert SQL and parameters in_printf format
+def convert_query_in_printf_format(sql, var_dict_list, sql_conv_map=None):
+    if var_dict_list:
+        var_dict = var_dict_list[0]
+    else:
+        var_dict = {}
+    sql, placeholders = sql_translation_cache.translate(sql, var_dict)
     # extract placeholders
     params_list = []
-    items = re.findall(r":[^ $,)\+\-\n]+", sql)
     for var_dict in var_dict_list:
         params = []
-        for item in items:
+        for item in placeholders:
             if item not in var_dict:
                 raise KeyError(f"{item} is missing in SQL parameters")
             params.append(var_dict[item])
         params_list.append(params)
-    # using the printf style syntax
-    sql = re.sub(":[^ $,)\+\-]+", "%s", sql)
     return sql, params_list
 
 
@@ -182,8 +365,6 @@ class WrappedCursor(object):
             self.dump = True
         else:
             self.dump = False
-        # SQL conversion map
-        self.sql_conv_map = {}
         # executemany
         if self.backend == "postgres":
             from psycopg2.extras import execute_batch
@@ -247,32 +428,37 @@ class WrappedCursor(object):
         if cur is None:
             cur = self.cur
         ret = None
-        # schema names
-        sql = self.change_schema(sql)
-        # remove `
-        sql = re.sub("`", "", sql)
-        if self.backend == "oracle":
-            ret = cur.execute(sql, varDict)
-        elif self.backend == "postgres":
+        if self.backend == "postgres":
             if self.dump:
                 _logger.debug(f"OLD: {sql} {str(varDict)}")
-            sql, vars_list = convert_query_in_printf_format(sql, [varDict], self.sql_conv_map)
+            # schema names and conversion are cached
+            sql, vars_list = convert_query_in_printf_format(sql, [varDict])
             varList = vars_list[0]
             if self.dump:
                 _logger.debug(f"NEW: {sql} {str(varList)}")
-            # mimic Oracle NOWAIT: raise only when rows exist but are all locked, not when no rows match
-            if "FOR UPDATE SKIP LOCKED" in sql:
-                cur.execute(f"SELECT COUNT(*) FROM ({sql}) t", varList)
-                if cur.fetchone()[0] == 0:
-                    sql_no_lock = re.sub(r"\s*FOR UPDATE SKIP LOCKED", "", sql, flags=re.IGNORECASE)
-                    cur.execute(f"SELECT COUNT(*) FROM ({sql_no_lock}) t", varList)
-                    if cur.fetchone()[0] > 0:
-                        from psycopg2.errors import LockNotAvailable
-
-                        raise LockNotAvailable("could not obtain lock on row")
-                    else:
-                        return None
+            # lock with NOWAIT in a savepoint, so that lock failure doesn't abort the whole transaction as in Oracle.
+            # the savepoint is released in any case since savepoints with the same name are nested as subtransactions.
+            # another cursor is used to release it, so that the result set of the query is kept
+            if _re_nowait.search(sql):
+                from psycopg2.errors import LockNotAvailable
+
+                try:
+                    ret = cur.execute(f"SAVEPOINT {NOWAIT_SAVEPOINT};{sql}", varList)
+                except LockNotAvailable:
+                    with self.conn.cursor() as tmp_cur:
+                        tmp_cur.execute(f"ROLLBACK TO SAVEPOINT {NOWAIT_SAVEPOINT};RELEASE SAVEPOINT {NOWAIT_SAVEPOINT}")
+                    raise
+                with self.conn.cursor() as tmp_cur:
+                    tmp_cur.execute(f"RELEASE SAVEPOINT {NOWAIT_SAVEPOINT}")
+                return ret
             ret = cur.execute(sql, varList)
+            return ret
+        # schema names
+        sql = self.change_schema(sql)
+        # remove `
+        sql = re.sub("`", "", sql)
+        if self.backend == "oracle":
+            ret = cur.execute(sql, varDict)
         elif self.backend == "mysql":
             print(f"DEBUG execute : original SQL     {sql} ")
             print(f"DEBUG execute : original varDict {varDict} ")
@@ -453,11 +639,11 @@ class WrappedCursor(object):
     def executemany(self, sql, params):
         if sql is None:
             sql = self.statement
-        sql = self.change_schema(sql)
         if self.backend == "postgres":
-            sql, vars_list = convert_query_in_printf_format(sql, params, self.sql_conv_map)
+            sql, vars_list = convert_query_in_printf_format(sql, params)
             self.alt_executemany(self.cur, sql, vars_list)
         else:
+            sql = self.change_schema(sql)
             self.cur.executemany(sql, params)
 
     # get_description
@@ -481,12 +667,4 @@ class WrappedCursor(object):
 
     # change schema
     def change_schema(self, sql):
-        if panda_config.schemaPANDA != "ATLAS_PANDA":
-            sql = re.sub("ATLAS_PANDA\.", panda_config.schemaPANDA + ".", sql)
-        if panda_config.schemaMETA != "ATLAS_PANDAMETA":
-            sql = re.sub("ATLAS_PANDAMETA\.", panda_config.schemaMETA + ".", sql)
-        if panda_config.schemaGRISLI != "ATLAS_GRISLI":
-            sql = re.sub("ATLAS_GRISLI\.", panda_config.schemaGRISLI + ".", sql)
-        if panda_config.schemaPANDAARCH != "ATLAS_PANDAARCH":
-            sql = re.sub("ATLAS_PANDAARCH\.", panda_config.schemaPANDAARCH + ".", sql)
-        return sql
+        return change_schema(sql)
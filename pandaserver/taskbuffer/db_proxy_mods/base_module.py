@@ -667,6 +667,37 @@ class BaseModule:
         }
         self.cur.execute(sqlI + comment, varMap)
 
+    # lock rows
+    def lock_rows(self, sql: str, var_map: dict, mode: str = "nowait", comment: str = "") -> list:
+        """
+        Lock rows selected by a SELECT statement, and return the selected rows.
+
+        The FOR UPDATE clause is appended according to the mode. Both backends run a single statement natively;
+        in Postgres a NOWAIT failure is rolled back to a savepoint by WrappedCursor so that the transaction is
+        still usable after the exception, as in Oracle.
+
+        :param sql: SELECT statement without FOR UPDATE clause
+        :param var_map: bind variables
+        :param mode: "nowait" to raise an exception when any selected row is locked by others, which is checked
+                     with is_no_wait_exception, "skip" to silently skip rows locked by others, or "wait" to wait
+                     until the rows are released
+        :param comment: comment appended to the statement
+        :return: list of locked rows
+        """
+        if mode == "nowait":
+            sql = f"{sql.rstrip()} FOR UPDATE NOWAIT "
+        elif mode == "skip":
+            sql = f"{sql.rstrip()} FOR UPDATE SKIP LOCKED "
+        elif mode == "wait":
+            sql = f"{sql.rstrip()} FOR UPDATE "
+        else:
+            raise ValueError(f"unknown lock mode {mode}")
+        self.cur.execute(sql + comment, var_map)
+        res = self.cur.fetchall()
+        if res is None:
+            return []
+        return res
+
     # check if exception is from NOWAIT
     def is_no_wait_exception(self, err_value: BaseException) -> bool:
         """
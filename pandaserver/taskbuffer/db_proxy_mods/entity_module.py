@@ -1345,7 +1345,7 @@ class EntityModule(BaseModule):
             "WHERE HOURS = :HOURS AND LASTMOD < :LASTMOD"
         )
 
-        sqlCh = "SELECT * FROM ATLAS_PANDAMETA.SiteData WHERE FLAG = :FLAG AND HOURS = :HOURS AND SITE = :SITE FOR UPDATE NOWAIT "
+        sqlCh = "SELECT * FROM ATLAS_PANDAMETA.SiteData WHERE FLAG = :FLAG AND HOURS = :HOURS AND SITE = :SITE "
 
         sqlIn = (
             "INSERT INTO ATLAS_PANDAMETA.SiteData "
@@ -1402,15 +1402,14 @@ class EntityModule(BaseModule):
                 locked = True
                 try:
                     # lock individual row
-                    self.cur.execute(sqlCh + comment, varMap)
+                    res = self.lock_rows(sqlCh, varMap, comment=comment)
                 except Exception as e:
                     # skip since it is being locked by another
                     tmp_log.debug(f"skip to update {str(varMap)} due to {str(e)}")
                     locked = False
                 if locked:
-                    res = self.cur.fetchone()
                     # row exists or not
-                    if res is None:
+                    if not res:
                         sql = sqlIn
                     else:
                         sql = sqlUp
@@ -1543,7 +1542,7 @@ class EntityModule(BaseModule):
                         var_map = {k: varMap[k] for k in [":FLAG", ":SITE", ":HOURS"]}
                         try:
                             # lock it
-                            self.cur.execute(sqlCh + comment, var_map)
+                            self.lock_rows(sqlCh, var_map, comment=comment)
                         except Exception as e:
                             # skip since it is being locked by another
                             tmp_log.debug(f"skip to update {str(var_map)} due to {str(e)}")
@@ -1989,6 +1988,8 @@ class EntityModule(BaseModule):
 
                         # extra parameters for the queue
                         ret.extra_queue_params = queue_data.get("params", {})
+                        # parse catchall and extra parameters once for helpers used in brokerage
+                        ret.parse_catchall()
 
                         # append
                         retList[ret.nickname] = ret
@@ -7,7 +7,11 @@ import traceback
 import uuid
 
 from pandacommon.pandalogger.LogWrapper import LogWrapper
-from pandacommon.pandautils.PandaUtils import get_sql_IN_bind_variables, naive_utcnow
+from pandacommon.pandautils.PandaUtils import (
+    batched,
+    get_sql_IN_bind_variables,
+    naive_utcnow,
+)
 
 from pandaserver.config import panda_config
 from pandaserver.srvcore import CoreUtils, srv_msg_utils
@@ -245,7 +249,6 @@ class JobComplexModule(BaseModule):
                             sqlUEA = "SELECT PandaID FROM ATLAS_PANDA.jobsActive4 "
                             sqlUEA += "WHERE jediTaskID=:jediTaskID AND jobsetID=:jobsetID AND jobStatus=:jobStatus "
                             sqlUEL = "SELECT modificationTime FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID "
-                            sqlUEL += "FOR UPDATE NOWAIT "
                             sqlUE = "UPDATE ATLAS_PANDA.jobsActive4 SET modificationTime=CURRENT_DATE "
                             sqlUE += "WHERE PandaID=:PandaID "
                             varMap = {}
@@ -260,9 +263,8 @@ class JobComplexModule(BaseModule):
                                 varMap[":PandaID"] = ueaPandaID
                                 try:
                                     # lock with NOWAIT
-                                    self.cur.execute(sqlUEL + comment, varMap)
-                                    resUEL = self.cur.fetchone()
-                                    if resUEL is None:
+                                    resUEL = self.lock_rows(sqlUEL, varMap, comment=comment)
+                                    if not resUEL:
                                         continue
                                 except Exception:
                                     tmp_log.debug(f"skip to update associated ES={ueaPandaID}")
@@ -275,7 +277,6 @@ class JobComplexModule(BaseModule):
                             # sql to update fake co-jumbo
                             sqlIFL = "SELECT PandaID FROM ATLAS_PANDA.jobsDefined4 "
                             sqlIFL += "WHERE jediTaskID=:jediTaskID AND eventService=:eventService AND jobStatus=:jobStatus "
-                            sqlIFL += "FOR UPDATE NOWAIT "
                             sqlIF = "UPDATE ATLAS_PANDA.jobsDefined4 SET modificationTime=CURRENT_DATE "
                             sqlIF += "WHERE jediTaskID=:jediTaskID AND eventService=:eventService AND jobStatus=:jobStatus "
                             varMap = {}
@@ -284,8 +285,7 @@ class JobComplexModule(BaseModule):
                             varMap[":jobStatus"] = "waiting"
                             try:
                                 # lock with NOWAIT
-                                self.cur.execute(sqlIFL + comment, varMap)
-                                resIFL = self.cur.fetchall()
+                                self.lock_rows(sqlIFL, varMap, comment=comment)
                                 self.cur.execute(sqlIF + comment, varMap)
                                 nUE = self.cur.rowcount
                                 tmp_log.debug(f"updated {nUE} fake co-jumbo jobs")
@@ -348,12 +348,11 @@ class JobComplexModule(BaseModule):
                                 # SQL to lock
                                 sqlJediDL = "SELECT nFilesOnHold FROM ATLAS_PANDA.JEDI_Datasets "
                                 sqlJediDL += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
-                                sqlJediDL += "FOR UPDATE NOWAIT "
                                 varMap = {}
                                 varMap[":jediTaskID"] = jediTaskID
                                 varMap[":datasetID"] = tmpDatasetID
                                 tmp_log.debug(sqlJediDL + comment + str(varMap))
-                                self.cur.execute(sqlJediDL + comment, varMap)
+                                self.lock_rows(sqlJediDL, varMap, comment=comment)
                                 # SQL to update
                                 sqlJediDU = "UPDATE ATLAS_PANDA.JEDI_Datasets SET "
                                 if diffNum > 0:
@@ -374,9 +373,7 @@ class JobComplexModule(BaseModule):
                         if oldJobStatus in ("starting", "sent") and jobStatus == "running":
                             # update lastStart
                             sql_last_start_lock = (
-                                "SELECT lastStart FROM ATLAS_PANDAMETA.siteData "
-                                "WHERE site=:site AND hours=:hours AND flag IN (:flag1,:flag2) "
-                                "FOR UPDATE NOWAIT "
+                                "SELECT lastStart FROM ATLAS_PANDAMETA.siteData WHERE site=:site AND hours=:hours AND flag IN (:flag1,:flag2) "
                             )
                             sqlLS = "UPDATE ATLAS_PANDAMETA.siteData SET lastStart=CURRENT_DATE "
                             sqlLS += "WHERE site=:site AND hours=:hours AND flag IN (:flag1,:flag2) "
@@ -386,7 +383,7 @@ class JobComplexModule(BaseModule):
                             varMap[":flag1"] = "production"
                             varMap[":flag2"] = "analysis"
                             try:
-                                self.cur.execute(sql_last_start_lock + comment, varMap)
+                                self.lock_rows(sql_last_start_lock, varMap, comment=comment)
                                 self.cur.execute(sqlLS + comment, varMap)
                                 tmp_log.debug("updated lastStart")
                             except Exception:
@@ -676,9 +673,8 @@ class JobComplexModule(BaseModule):
                         varMap[":datasetID"] = tmpDatasetID
                         sqlJediCL = "SELECT nFilesTobeUsed,nFilesOnHold,status FROM ATLAS_PANDA.JEDI_Datasets "
                         sqlJediCL += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
-                        sqlJediCL += "FOR UPDATE NOWAIT "
                         tmp_log.debug(sqlJediCL + comment + str(varMap))
-                        self.cur.execute(sqlJediCL + comment, varMap)
+                        self.lock_rows(sqlJediCL, varMap, comment=comment)
                         # SQL to update dataset
                         varMap = {}
                         varMap[":jediTaskID"] = job.jediTaskID
@@ -837,7 +833,6 @@ class JobComplexModule(BaseModule):
 
         sql0 = "SELECT prodUserID,prodSourceLabel,jobDefinitionID,jobsetID,workingGroup,specialHandling,jobStatus,taskBufferErrorCode,eventService FROM %s "
         sql0 += "WHERE PandaID=:PandaID "
-        sql0 += "FOR UPDATE NOWAIT "
         sql1 = "UPDATE %s SET commandToPilot=:commandToPilot,taskBufferErrorDiag=:taskBufferErrorDiag WHERE PandaID=:PandaID "
         sql1 += "AND (commandToPilot IS NULL OR commandToPilot<>'tobekilled') "
         sql1F = "UPDATE %s SET commandToPilot=:commandToPilot,taskBufferErrorDiag=:taskBufferErrorDiag WHERE PandaID=:PandaID "
@@ -876,11 +871,11 @@ class JobComplexModule(BaseModule):
                 varMap = {}
                 varMap[":PandaID"] = pandaID
                 self.cur.arraysize = 10
-                self.cur.execute((sql0 + comment) % table, varMap)
-                res = self.cur.fetchone()
+                res = self.lock_rows(sql0 % table, varMap, comment=comment)
                 # not found
-                if res is None:
+                if not res:
                     continue
+                res = res[0]
 
                 # prevent prod proxy from killing analysis jobs
                 (
@@ -2247,9 +2242,45 @@ class JobComplexModule(BaseModule):
         nSent = 0
         getValMapOrig = copy.copy(getValMap)
 
+        # SQL to get PandaIDs
+        sqlP = "SELECT /*+ INDEX_RS_ASC(tab (PRODSOURCELABEL COMPUTINGSITE JOBSTATUS) ) */ PandaID,currentPriority,specialHandling FROM ATLAS_PANDA.jobsActive4 tab "
+        sqlP += sql_where_clause
+
+        if sorting_sql:
+            sqlP = "SELECT * FROM (" + sqlP
+            sqlP += sorting_sql
+
         try:
             timeLimit = datetime.timedelta(seconds=timeout - 10)
 
+            # claim all jobs in one go
+            if nJobs > 1 and panda_config.bulk_get_jobs:
+                if (naive_utcnow() - timeStart) < timeLimit:
+                    pandaIDs, nSent = self._claim_jobs_in_bulk(
+                        sqlP,
+                        getValMapOrig,
+                        nJobs,
+                        maxAttemptIDx,
+                        siteName,
+                        prodSourceLabel,
+                        node,
+                        computingElement,
+                        schedulerID,
+                        background,
+                        harvester_id,
+                        worker_id,
+                        timeStart,
+                        comment,
+                        tmp_log,
+                    )
+                    tmp_log.debug(f"claimed {len(pandaIDs)} jobs in bulk - {prodSourceLabel}")
+                    if pandaIDs:
+                        retJobs = self._read_jobs_for_dispatch(pandaIDs, comment)
+                else:
+                    tmp_log.debug("do nothing")
+                self._post_process_dispatched_jobs(retJobs, via_topic, tmp_log)
+                return retJobs, nSent
+
             # get nJobs
             for iJob in range(nJobs):
                 getValMap = copy.copy(getValMapOrig)
@@ -2268,13 +2299,6 @@ class JobComplexModule(BaseModule):
 
                         if toGetPandaIDs:
                             # get PandaIDs
-                            sqlP = "SELECT /*+ INDEX_RS_ASC(tab (PRODSOURCELABEL COMPUTINGSITE JOBSTATUS) ) */ PandaID,currentPriority,specialHandling FROM ATLAS_PANDA.jobsActive4 tab "
-                            sqlP += sql_where_clause
-
-                            if sorting_sql:
-                                sqlP = "SELECT * FROM (" + sqlP
-                                sqlP += sorting_sql
-
                             tmp_log.debug(sqlP + comment + str(getValMap))
                             # start transaction
                             self.conn.begin()
@@ -2304,7 +2328,7 @@ class JobComplexModule(BaseModule):
                                 if indexID > maxAttemptIDx:
                                     break
                                 # lock first
-                                sqlPL = "SELECT jobStatus FROM ATLAS_PANDA.jobsActive4 " "WHERE PandaID=:PandaID FOR UPDATE NOWAIT "
+                                sqlPL = "SELECT jobStatus FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID "
                                 # update
                                 sqlJ = "UPDATE ATLAS_PANDA.jobsActive4 "
                                 sqlJ += "SET jobStatus=:newJobStatus,modificationTime=CURRENT_DATE,modificationHost=:modificationHost,startTime=CURRENT_DATE"
@@ -2346,7 +2370,7 @@ class JobComplexModule(BaseModule):
                                 try:
                                     varMapPL = {":PandaID": tmpPandaID}
                                     tmp_log.debug(sqlPL + comment + str(varMapPL))
-                                    self.cur.execute(sqlPL + comment, varMapPL)
+                                    self.lock_rows(sqlPL, varMapPL, mode="nowait", comment=comment)
                                     prelocked = True
                                 except Exception:
                                     tmp_log.debug("cannot pre-lock")
@@ -2444,331 +2468,515 @@ class JobComplexModule(BaseModule):
                 if pandaID == 0:
                     break
 
-                # start transaction
-                self.conn.begin()
-                # query to get the DB entry for a specific PanDA ID
-                sql_select_job = f"SELECT {JobSpec.columnNames()} FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID"
-                varMap = {}
-                varMap[":PandaID"] = pandaID
-                self.cur.arraysize = 10
-                self.cur.execute(sql_select_job + comment, varMap)
-                res = self.cur.fetchone()
-                if len(res) == 0:
-                    # commit
-                    if not self._commit():
-                        raise RuntimeError("Commit error")
+                # read the job
+                tmpJobs = self._read_jobs_for_dispatch([pandaID], comment)
+                if not tmpJobs:
                     break
-                # instantiate Job
-                job = JobSpec()
-                job.pack(res)
-
-                # sql to read range
-                sqlRR = "SELECT /*+ INDEX_RS_ASC(tab JEDI_EVENTS_FILEID_IDX) NO_INDEX_FFS(tab JEDI_EVENTS_PK) NO_INDEX_SS(tab JEDI_EVENTS_PK) */ "
-                sqlRR += "PandaID,job_processID,attemptNr,objStore_ID,zipRow_ID,path_convention "
-                sqlRR += f"FROM {panda_config.schemaJEDI}.JEDI_Events tab "
-                sqlRR += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID AND status=:eventStatus "
-                # sql to read log bucket IDs
-                sqlLBK = "SELECT jobMetrics FROM ATLAS_PANDA.jobsArchived4 WHERE PandaID=:PandaID "
-                sqlLBK += "UNION "
-                sqlLBK += "SELECT jobMetrics FROM ATLAS_PANDAARCH.jobsArchived WHERE PandaID=:PandaID AND modificationTime>(CURRENT_DATE-30) "
-                # read files
-                sqlFile = f"SELECT {FileSpec.columnNames()} FROM ATLAS_PANDA.filesTable4 "
-                sqlFile += "WHERE PandaID=:PandaID ORDER BY row_ID "
-                # read LFN and dataset name for output files
-                sqlFileOut = "SELECT lfn,dataset FROM ATLAS_PANDA.filesTable4 "
-                sqlFileOut += "WHERE PandaID=:PandaID AND type=:type "
-                # read files from JEDI for jumbo jobs
-                sqlFileJEDI = "SELECT lfn,GUID,fsize,checksum "
-                sqlFileJEDI += f"FROM {panda_config.schemaJEDI}.JEDI_Dataset_Contents "
-                sqlFileJEDI += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
-                sqlFileJEDI += "ORDER BY lfn "
-                # read zip file
-                sqlZipFile = "SELECT lfn,destinationSE,fsize,checksum FROM ATLAS_PANDA.filesTable4 "
-                sqlZipFile += "WHERE row_ID=:row_ID "
-                sqlZipFile += "UNION "
-                sqlZipFile += "SELECT lfn,destinationSE,fsize,checksum FROM ATLAS_PANDAARCH.filesTable_ARCH "
-                sqlZipFile += "WHERE row_ID=:row_ID "
-                self.cur.arraysize = 10000
-                self.cur.execute(sqlFile + comment, varMap)
-                resFs = self.cur.fetchall()
-                eventRangeIDs = {}
-                esDonePandaIDs = []
-                esOutputZipMap = {}
-                esZipRow_IDs = set()
-                esOutputFileMap = {}
-                # use new file format for ES
-                useNewFileFormatForES = False
-                if job.AtlasRelease is not None:
-                    try:
-                        tmpMajorVer = job.AtlasRelease.split("-")[-1].split(".")[0]
-                        if int(tmpMajorVer) == 20:
-                            useNewFileFormatForES = True
-                    except Exception:
-                        pass
-                for resF in resFs:
-                    file = FileSpec()
-                    file.pack(resF)
-                    # add files except event service merge or jumbo
-                    if (not EventServiceUtils.isEventServiceMerge(job) and not EventServiceUtils.isJumboJob(job)) or file.type in ["output", "log"]:
-                        job.addFile(file)
-                    # read real input files for jumbo jobs
-                    elif EventServiceUtils.isJumboJob(job):
-                        # get files
-                        varMap = {}
-                        varMap[":jediTaskID"] = file.jediTaskID
-                        varMap[":datasetID"] = file.datasetID
-                        self.cur.execute(sqlFileJEDI + comment, varMap)
-                        resFileJEDI = self.cur.fetchall()
-                        for tmpLFN, tmpGUID, tmpFsize, tmpChecksum in resFileJEDI:
-                            newFileSpec = FileSpec()
-                            newFileSpec.pack(resF)
-                            newFileSpec.lfn = tmpLFN
-                            newFileSpec.GUID = tmpGUID
-                            newFileSpec.fsize = tmpFsize
-                            newFileSpec.checksum = tmpChecksum
-                            # add file
-                            job.addFile(newFileSpec)
-                        continue
-                    # construct input files from event ranges for event service merge
-                    if EventServiceUtils.isEventServiceMerge(job):
-                        # only for input
-                        if file.type not in ["output", "log"]:
-                            # get ranges
-                            varMap = {}
-                            varMap[":jediTaskID"] = file.jediTaskID
-                            varMap[":datasetID"] = file.datasetID
-                            varMap[":fileID"] = file.fileID
-                            varMap[":eventStatus"] = EventServiceUtils.ST_done
-                            self.cur.execute(sqlRR + comment, varMap)
-                            resRR = self.cur.fetchall()
-                            for (
-                                esPandaID,
-                                job_processID,
-                                attemptNr,
-                                objStoreID,
-                                zipRow_ID,
-                                pathConvention,
-                            ) in resRR:
-                                tmpEventRangeID = get_task_event_module(self).makeEventRangeID(
-                                    file.jediTaskID,
-                                    esPandaID,
-                                    file.fileID,
-                                    job_processID,
-                                    attemptNr,
-                                )
-                                if file.fileID not in eventRangeIDs:
-                                    eventRangeIDs[file.fileID] = {}
-                                addFlag = False
-                                if job_processID not in eventRangeIDs[file.fileID]:
-                                    addFlag = True
-                                else:
-                                    oldEsPandaID = eventRangeIDs[file.fileID][job_processID]["pandaID"]
-                                    if esPandaID > oldEsPandaID:
-                                        addFlag = True
-                                        if oldEsPandaID in esDonePandaIDs:
-                                            esDonePandaIDs.remove(oldEsPandaID)
-                                if addFlag:
-                                    # append
-                                    if pathConvention is not None:
-                                        objStoreID = f"{objStoreID}/{pathConvention}"
-                                    eventRangeIDs[file.fileID][job_processID] = {
-                                        "pandaID": esPandaID,
-                                        "eventRangeID": tmpEventRangeID,
-                                        "objStoreID": objStoreID,
-                                    }
-                                    # zip file in jobMetrics
-                                    if esPandaID not in esDonePandaIDs:
-                                        esDonePandaIDs.append(esPandaID)
-                                        # get jobMetrics
-                                        varMap = {}
-                                        varMap[":PandaID"] = esPandaID
-                                        self.cur.execute(sqlLBK + comment, varMap)
-                                        resLBK = self.cur.fetchone()
-                                        if resLBK is not None and resLBK[0] is not None:
-                                            outputZipBucketID = None
-                                            tmpPatch = re.search("outputZipBucketID=(\d+)", resLBK[0])
-                                            if tmpPatch is not None:
-                                                outputZipBucketID = tmpPatch.group(1)
-                                            outputZipName = None
-                                            tmpPatch = re.search("outputZipName=([^ ]+)", resLBK[0])
-                                            if tmpPatch is not None:
-                                                outputZipName = tmpPatch.group(1)
-                                            if outputZipBucketID is not None and outputZipName is not None:
-                                                if esPandaID not in esOutputZipMap:
-                                                    esOutputZipMap[esPandaID] = []
-                                                esOutputZipMap[esPandaID].append(
-                                                    {
-                                                        "name": outputZipName,
-                                                        "osid": outputZipBucketID,
-                                                    }
-                                                )
-                                    # output LFN and dataset
-                                    if esPandaID not in esOutputFileMap:
-                                        esOutputFileMap[esPandaID] = dict()
-                                        varMap = {}
-                                        varMap[":PandaID"] = esPandaID
-                                        varMap[":type"] = "output"
-                                        self.cur.execute(sqlFileOut + comment, varMap)
-                                        resFileOut = self.cur.fetchall()
-                                        for tmpOutLFN, tmpOutDataset in resFileOut:
-                                            esOutputFileMap[esPandaID][tmpOutDataset] = tmpOutLFN
-                                # zip file in fileTable
-                                if zipRow_ID is not None and zipRow_ID not in esZipRow_IDs:
-                                    esZipRow_IDs.add(zipRow_ID)
-                                    varMap = {}
-                                    varMap[":row_ID"] = zipRow_ID
-                                    self.cur.execute(sqlZipFile + comment, varMap)
-                                    resZip = self.cur.fetchone()
-                                    if resZip is not None:
-                                        (
-                                            outputZipName,
-                                            outputZipBucketID,
-                                            outputZipFsize,
-                                            outputZipChecksum,
-                                        ) = resZip
+                # append the job to the returned list
+                retJobs.append(tmpJobs[0])
+                # record the job right after it is committed as sent so that it is not lost if a later job fails
+                self._post_process_dispatched_jobs(tmpJobs[:1], via_topic, tmp_log)
+            return retJobs, nSent
+        except Exception as e:
+            self.dump_error_message(tmp_log)
+            # roll back
+            self._rollback()
+            return [], 0
+
+    # claim jobs in bulk
+    def _claim_jobs_in_bulk(
+        self,
+        sql_candidates,
+        var_map_candidates,
+        n_jobs,
+        max_attempts,
+        site_name,
+        prod_source_label,
+        node,
+        computing_element,
+        scheduler_id,
+        background,
+        harvester_id,
+        worker_id,
+        time_start,
+        comment,
+        tmp_log,
+    ):
+        """
+        Claim activated jobs with a bounded candidate batch, a single lock statement and an array-bound update
+
+        :param sql_candidates: SQL to get candidate PandaIDs sorted by priority
+        :param var_map_candidates: bind variables for sql_candidates
+        :param n_jobs: the number of jobs to claim
+        :param max_attempts: the number of extra candidates to tolerate jobs taken by other requests
+        :return: a tuple of the list of claimed PandaIDs in priority order and the number of recently sent jobs
+        """
+        n_sent = 0
+        # start transaction
+        self.conn.begin()
+        # get a bounded batch of candidates
+        n_candidates = n_jobs + max_attempts
+        var_map_candidates = copy.copy(var_map_candidates)
+        if ":njobs" in var_map_candidates:
+            var_map_candidates[":njobs"] = n_candidates
+        tmp_log.debug(sql_candidates + comment + str(var_map_candidates))
+        self.cur.execute(sql_candidates + comment, var_map_candidates)
+        candidate_ids = [tmp_panda_id for tmp_panda_id, _, _ in self.cur.fetchmany(n_candidates)]
+        if not candidate_ids:
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            tmp_log.debug("no PandaIDs")
+            return [], n_sent
+        # lock candidates which are not taken by other requests
+        var_names_str, var_map = get_sql_IN_bind_variables(candidate_ids, prefix=":PandaID")
+        var_map[":oldJobStatus"] = "activated"
+        sql_lock = f"SELECT PandaID FROM ATLAS_PANDA.jobsActive4 WHERE PandaID IN ({var_names_str}) AND jobStatus=:oldJobStatus "
+        try:
+            locked_ids = set(tmp_panda_id for tmp_panda_id, in self.lock_rows(sql_lock, var_map, mode="skip", comment=comment))
+        except Exception:
+            tmp_log.debug("cannot lock")
+            self._rollback()
+            return [], n_sent
+        panda_ids = [tmp_panda_id for tmp_panda_id in candidate_ids if tmp_panda_id in locked_ids][:n_jobs]
+        if not panda_ids:
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            tmp_log.debug("all candidates are locked")
+            return [], n_sent
+        # update
+        sql_update = "UPDATE ATLAS_PANDA.jobsActive4 "
+        sql_update += "SET jobStatus=:newJobStatus,modificationTime=CURRENT_DATE,modificationHost=:modificationHost,startTime=CURRENT_DATE"
+        if computing_element is not None:
+            sql_update += ",computingElement=:computingElement"
+        if scheduler_id is not None:
+            sql_update += ",schedulerID=:schedulerID"
+        if background is not True:
+            sql_update += ",jobExecutionID=0"
+        sql_update += " WHERE PandaID=:PandaID AND jobStatus=:oldJobStatus"
+        var_maps = []
+        for tmp_panda_id in panda_ids:
+            var_map = {
+                ":PandaID": tmp_panda_id,
+                ":newJobStatus": "sent",
+                ":oldJobStatus": "activated",
+                ":modificationHost": node,
+            }
+            if computing_element is not None:
+                var_map[":computingElement"] = computing_element
+            if scheduler_id is not None:
+                var_map[":schedulerID"] = scheduler_id
+            var_maps.append(var_map)
+        tmp_log.debug(f"{sql_update}{comment} for {len(var_maps)} jobs")
+        self.cur.executemany(sql_update + comment, var_maps)
+        # get nSent for production jobs
+        if prod_source_label in [None, "managed"]:
+            sql_sent = "SELECT count(*) FROM ATLAS_PANDA.jobsActive4 WHERE jobStatus=:jobStatus "
+            sql_sent += "AND prodSourceLabel IN (:prodSourceLabel1,:prodSourceLabel2) "
+            sql_sent += "AND computingSite=:computingSite "
+            sql_sent += "AND modificationTime>:modificationTime "
+            var_map = {
+                ":jobStatus": "sent",
+                ":computingSite": site_name,
+                ":modificationTime": time_start - datetime.timedelta(seconds=60),
+                ":prodSourceLabel1": "managed",
+                ":prodSourceLabel2": "test",
+            }
+            self.cur.execute(sql_sent + comment, var_map)
+            res_sent = self.cur.fetchone()
+            if res_sent is not None:
+                (n_sent,) = res_sent
+        # insert job and worker mapping
+        if harvester_id is not None and worker_id is not None:
+            # insert worker if missing
+            get_worker_module(self).updateWorkers(
+                harvester_id,
+                [
+                    {
+                        "workerID": worker_id,
+                        "nJobs": 1,
+                        "status": "running",
+                        "lastUpdate": naive_utcnow(),
+                    }
+                ],
+                useCommit=False,
+            )
+            sql_check_harvester = "SELECT 1 FROM ATLAS_PANDA.Harvester_Instances WHERE harvester_ID=:harvesterID "
+            self.cur.execute(sql_check_harvester + comment, {":harvesterID": harvester_id})
+            if self.cur.fetchone() is None:
+                tmp_log.debug(f"getJobs : Site {site_name} harvester_id={harvester_id} not found")
+            else:
+                # get existing mapping
+                var_names_str, var_map = get_sql_IN_bind_variables(panda_ids, prefix=":PandaID")
+                var_map[":harvesterID"] = harvester_id
+                var_map[":workerID"] = worker_id
+                sql_check_mapping = "SELECT PandaID FROM ATLAS_PANDA.Harvester_Rel_Jobs_Workers "
+                sql_check_mapping += f"WHERE harvesterID=:harvesterID AND workerID=:workerID AND PandaID IN ({var_names_str}) "
+                self.cur.execute(sql_check_mapping + comment, var_map)
+                mapped_ids = set(tmp_panda_id for tmp_panda_id, in self.cur.fetchall())
+                # insert or update mapping
+                sql_insert_mapping = "INSERT INTO ATLAS_PANDA.Harvester_Rel_Jobs_Workers (harvesterID,workerID,PandaID,lastUpdate) "
+                sql_insert_mapping += "VALUES (:harvesterID,:workerID,:PandaID,:lastUpdate) "
+                sql_update_mapping = "UPDATE ATLAS_PANDA.Harvester_Rel_Jobs_Workers SET lastUpdate=:lastUpdate "
+                sql_update_mapping += "WHERE harvesterID=:harvesterID AND workerID=:workerID AND PandaID=:PandaID "
+                var_maps_insert = []
+                var_maps_update = []
+                for tmp_panda_id in panda_ids:
+                    var_map = {
+                        ":harvesterID": harvester_id,
+                        ":workerID": worker_id,
+                        ":PandaID": tmp_panda_id,
+                        ":lastUpdate": naive_utcnow(),
+                    }
+                    if tmp_panda_id in mapped_ids:
+                        var_maps_update.append(var_map)
+                    else:
+                        var_maps_insert.append(var_map)
+                if var_maps_insert:
+                    self.cur.executemany(sql_insert_mapping + comment, var_maps_insert)
+                if var_maps_update:
+                    self.cur.executemany(sql_update_mapping + comment, var_maps_update)
+        # commit
+        if not self._commit():
+            raise RuntimeError("Commit error")
+        return panda_ids, n_sent
+
+    # read jobs to be dispatched
+    def _read_jobs_for_dispatch(self, panda_ids, comment):
+        """
+        Read job, file and parameter records of claimed jobs with array-bound queries
+
+        :param panda_ids: list of PandaIDs
+        :param comment: comment for SQL
+        :return: list of JobSpecs in the same order as panda_ids
+        """
+        job_map = {}
+        file_rows_map = {}
+        job_params_map = {}
+        task_attr_map = {}
+        # start transaction
+        self.conn.begin()
+        idx_file_panda_id = FileSpec._attributes.index("PandaID")
+        self.cur.arraysize = 10000
+        for tmp_panda_ids in batched(panda_ids, 1000):
+            var_names_str, var_map = get_sql_IN_bind_variables(tmp_panda_ids, prefix=":PandaID")
+            # jobs
+            sql_job = f"SELECT {JobSpec.columnNames()} FROM ATLAS_PANDA.jobsActive4 WHERE PandaID IN ({var_names_str}) "
+            self.cur.execute(sql_job + comment, var_map)
+            for job in JobSpec.pack_rows(self.cur.fetchall()):
+                job_map[job.PandaID] = job
+            # files
+            sql_file = f"SELECT {FileSpec.columnNames()} FROM ATLAS_PANDA.filesTable4 "
+            sql_file += f"WHERE PandaID IN ({var_names_str}) ORDER BY row_ID "
+            self.cur.execute(sql_file + comment, var_map)
+            for res in self.cur.fetchall():
+                file_rows_map.setdefault(res[idx_file_panda_id], []).append(res)
+            # job parameters
+            sql_job_params = f"SELECT PandaID,jobParameters FROM ATLAS_PANDA.jobParamsTable WHERE PandaID IN ({var_names_str}) "
+            self.cur.execute(sql_job_params + comment, var_map)
+            for tmp_panda_id, clob_job_params in self.cur:
+                try:
+                    job_params_map[tmp_panda_id] = clob_job_params.read()
+                except AttributeError:
+                    job_params_map[tmp_panda_id] = str(clob_job_params)
+        # task parameters
+        task_ids = sorted(set(job.jediTaskID for job in job_map.values() if job.lockedby == "jedi"))
+        for tmp_task_ids in batched(task_ids, 1000):
+            var_names_str, var_map = get_sql_IN_bind_variables(tmp_task_ids, prefix=":jediTaskID")
+            sql_task = f"SELECT jediTaskID,ioIntensity,ioIntensityUnit FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID IN ({var_names_str}) "
+            self.cur.execute(sql_task + comment, var_map)
+            for tmp_task_id, io_intensity, io_intensity_unit in self.cur.fetchall():
+                task_attr_map[tmp_task_id] = (io_intensity, io_intensity_unit)
+        # make jobs
+        ret_jobs = []
+        for tmp_panda_id in panda_ids:
+            if tmp_panda_id not in job_map:
+                continue
+            job = job_map[tmp_panda_id]
+            self._prepare_job_for_dispatch(job, file_rows_map.get(tmp_panda_id, []), job_params_map.get(tmp_panda_id), comment)
+            if job.lockedby == "jedi" and job.jediTaskID in task_attr_map:
+                io_intensity, io_intensity_unit = task_attr_map[job.jediTaskID]
+                job.set_task_attribute("ioIntensity", io_intensity)
+                job.set_task_attribute("ioIntensityUnit", io_intensity_unit)
+            ret_jobs.append(job)
+        # commit
+        if not self._commit():
+            raise RuntimeError("Commit error")
+        return ret_jobs
+
+    # add files and job parameters to a job to be dispatched
+    def _prepare_job_for_dispatch(self, job, file_rows, job_parameters, comment):
+        # sql to read range
+        sqlRR = "SELECT /*+ INDEX_RS_ASC(tab JEDI_EVENTS_FILEID_IDX) NO_INDEX_FFS(tab JEDI_EVENTS_PK) NO_INDEX_SS(tab JEDI_EVENTS_PK) */ "
+        sqlRR += "PandaID,job_processID,attemptNr,objStore_ID,zipRow_ID,path_convention "
+        sqlRR += f"FROM {panda_config.schemaJEDI}.JEDI_Events tab "
+        sqlRR += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID AND status=:eventStatus "
+        # sql to read log bucket IDs
+        sqlLBK = "SELECT jobMetrics FROM ATLAS_PANDA.jobsArchived4 WHERE PandaID=:PandaID "
+        sqlLBK += "UNION "
+        sqlLBK += "SELECT jobMetrics FROM ATLAS_PANDAARCH.jobsArchived WHERE PandaID=:PandaID AND modificationTime>(CURRENT_DATE-30) "
+        # read LFN and dataset name for output files
+        sqlFileOut = "SELECT lfn,dataset FROM ATLAS_PANDA.filesTable4 "
+        sqlFileOut += "WHERE PandaID=:PandaID AND type=:type "
+        # read files from JEDI for jumbo jobs
+        sqlFileJEDI = "SELECT lfn,GUID,fsize,checksum "
+        sqlFileJEDI += f"FROM {panda_config.schemaJEDI}.JEDI_Dataset_Contents "
+        sqlFileJEDI += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
+        sqlFileJEDI += "ORDER BY lfn "
+        # read zip file
+        sqlZipFile = "SELECT lfn,destinationSE,fsize,checksum FROM ATLAS_PANDA.filesTable4 "
+        sqlZipFile += "WHERE row_ID=:row_ID "
+        sqlZipFile += "UNION "
+        sqlZipFile += "SELECT lfn,destinationSE,fsize,checksum FROM ATLAS_PANDAARCH.filesTable_ARCH "
+        sqlZipFile += "WHERE row_ID=:row_ID "
+        eventRangeIDs = {}
+        esDonePandaIDs = []
+        esOutputZipMap = {}
+        esZipRow_IDs = set()
+        esOutputFileMap = {}
+        # use new file format for ES
+        useNewFileFormatForES = False
+        if job.AtlasRelease is not None:
+            try:
+                tmpMajorVer = job.AtlasRelease.split("-")[-1].split(".")[0]
+                if int(tmpMajorVer) == 20:
+                    useNewFileFormatForES = True
+            except Exception:
+                pass
+        for resF in file_rows:
+            file = FileSpec()
+            file.pack(resF)
+            # add files except event service merge or jumbo
+            if (not EventServiceUtils.isEventServiceMerge(job) and not EventServiceUtils.isJumboJob(job)) or file.type in ["output", "log"]:
+                job.addFile(file)
+            # read real input files for jumbo jobs
+            elif EventServiceUtils.isJumboJob(job):
+                # get files
+                varMap = {}
+                varMap[":jediTaskID"] = file.jediTaskID
+                varMap[":datasetID"] = file.datasetID
+                self.cur.execute(sqlFileJEDI + comment, varMap)
+                resFileJEDI = self.cur.fetchall()
+                for tmpLFN, tmpGUID, tmpFsize, tmpChecksum in resFileJEDI:
+                    newFileSpec = FileSpec()
+                    newFileSpec.pack(resF)
+                    newFileSpec.lfn = tmpLFN
+                    newFileSpec.GUID = tmpGUID
+                    newFileSpec.fsize = tmpFsize
+                    newFileSpec.checksum = tmpChecksum
+                    # add file
+                    job.addFile(newFileSpec)
+                continue
+            # construct input files from event ranges for event service merge
+            if EventServiceUtils.isEventServiceMerge(job):
+                # only for input
+                if file.type not in ["output", "log"]:
+                    # get ranges
+                    varMap = {}
+                    varMap[":jediTaskID"] = file.jediTaskID
+                    varMap[":datasetID"] = file.datasetID
+                    varMap[":fileID"] = file.fileID
+                    varMap[":eventStatus"] = EventServiceUtils.ST_done
+                    self.cur.execute(sqlRR + comment, varMap)
+                    resRR = self.cur.fetchall()
+                    for (
+                        esPandaID,
+                        job_processID,
+                        attemptNr,
+                        objStoreID,
+                        zipRow_ID,
+                        pathConvention,
+                    ) in resRR:
+                        tmpEventRangeID = get_task_event_module(self).makeEventRangeID(
+                            file.jediTaskID,
+                            esPandaID,
+                            file.fileID,
+                            job_processID,
+                            attemptNr,
+                        )
+                        if file.fileID not in eventRangeIDs:
+                            eventRangeIDs[file.fileID] = {}
+                        addFlag = False
+                        if job_processID not in eventRangeIDs[file.fileID]:
+                            addFlag = True
+                        else:
+                            oldEsPandaID = eventRangeIDs[file.fileID][job_processID]["pandaID"]
+                            if esPandaID > oldEsPandaID:
+                                addFlag = True
+                                if oldEsPandaID in esDonePandaIDs:
+                                    esDonePandaIDs.remove(oldEsPandaID)
+                        if addFlag:
+                            # append
+                            if pathConvention is not None:
+                                objStoreID = f"{objStoreID}/{pathConvention}"
+                            eventRangeIDs[file.fileID][job_processID] = {
+                                "pandaID": esPandaID,
+                                "eventRangeID": tmpEventRangeID,
+                                "objStoreID": objStoreID,
+                            }
+                            # zip file in jobMetrics
+                            if esPandaID not in esDonePandaIDs:
+                                esDonePandaIDs.append(esPandaID)
+                                # get jobMetrics
+                                varMap = {}
+                                varMap[":PandaID"] = esPandaID
+                                self.cur.execute(sqlLBK + comment, varMap)
+                                resLBK = self.cur.fetchone()
+                                if resLBK is not None and resLBK[0] is not None:
+                                    outputZipBucketID = None
+                                    tmpPatch = re.search("outputZipBucketID=(\d+)", resLBK[0])
+                                    if tmpPatch is not None:
+                                        outputZipBucketID = tmpPatch.group(1)
+                                    outputZipName = None
+                                    tmpPatch = re.search("outputZipName=([^ ]+)", resLBK[0])
+                                    if tmpPatch is not None:
+                                        outputZipName = tmpPatch.group(1)
+                                    if outputZipBucketID is not None and outputZipName is not None:
                                         if esPandaID not in esOutputZipMap:
                                             esOutputZipMap[esPandaID] = []
                                         esOutputZipMap[esPandaID].append(
                                             {
                                                 "name": outputZipName,
                                                 "osid": outputZipBucketID,
-                                                "fsize": outputZipFsize,
-                                                "checksum": outputZipChecksum,
                                             }
                                         )
-                # make input for event service output merging
-                mergeInputOutputMap = {}
-                mergeInputFiles = []
-                mergeFileObjStoreMap = {}
-                mergeZipPandaIDs = []
-                for tmpFileID in eventRangeIDs:
-                    tmpMapEventRangeID = eventRangeIDs[tmpFileID]
-                    jobProcessIDs = sorted(tmpMapEventRangeID)
-                    # make input
-                    for jobProcessID in jobProcessIDs:
-                        for tmpFileSpec in job.Files:
-                            if tmpFileSpec.type not in ["output"]:
-                                continue
-                            esPandaID = tmpMapEventRangeID[jobProcessID]["pandaID"]
-                            tmpInputFileSpec = copy.copy(tmpFileSpec)
-                            tmpInputFileSpec.type = "input"
-                            outLFN = tmpInputFileSpec.lfn
-                            # change LFN
-                            if esPandaID in esOutputFileMap and tmpInputFileSpec.dataset in esOutputFileMap[esPandaID]:
-                                tmpInputFileSpec.lfn = esOutputFileMap[esPandaID][tmpInputFileSpec.dataset]
-                            # change attemptNr back to the original, which could have been changed by ES merge retry
-                            if not useNewFileFormatForES:
-                                origLFN = re.sub("\.\d+$", ".1", tmpInputFileSpec.lfn)
-                                outLFN = re.sub("\.\d+$", ".1", outLFN)
-                            else:
-                                origLFN = re.sub("\.\d+$", ".1_000", tmpInputFileSpec.lfn)
-                                outLFN = re.sub("\.\d+$", ".1_000", outLFN)
-                            # append eventRangeID as suffix
-                            tmpInputFileSpec.lfn = origLFN + "." + tmpMapEventRangeID[jobProcessID]["eventRangeID"]
-                            # make input/output map
-                            if outLFN not in mergeInputOutputMap:
-                                mergeInputOutputMap[outLFN] = []
-                            mergeInputOutputMap[outLFN].append(tmpInputFileSpec.lfn)
-                            # add file
-                            if esPandaID not in esOutputZipMap:
-                                # no zip
-                                mergeInputFiles.append(tmpInputFileSpec)
-                                # mapping for ObjStore
-                                mergeFileObjStoreMap[tmpInputFileSpec.lfn] = tmpMapEventRangeID[jobProcessID]["objStoreID"]
-                            elif esPandaID not in mergeZipPandaIDs:
-                                # zip
-                                mergeZipPandaIDs.append(esPandaID)
-                                for tmpEsOutZipFile in esOutputZipMap[esPandaID]:
-                                    # copy for zip
-                                    tmpZipInputFileSpec = copy.copy(tmpInputFileSpec)
-                                    # add prefix
-                                    tmpZipInputFileSpec.lfn = "zip://" + tmpEsOutZipFile["name"]
-                                    if "fsize" in tmpEsOutZipFile:
-                                        tmpZipInputFileSpec.fsize = tmpEsOutZipFile["fsize"]
-                                    if "checksum" in tmpEsOutZipFile:
-                                        tmpZipInputFileSpec.checksum = tmpEsOutZipFile["checksum"]
-                                    mergeInputFiles.append(tmpZipInputFileSpec)
-                                    # mapping for ObjStore
-                                    mergeFileObjStoreMap[tmpZipInputFileSpec.lfn] = tmpEsOutZipFile["osid"]
-                for tmpInputFileSpec in mergeInputFiles:
-                    job.addFile(tmpInputFileSpec)
-
-                # job parameters
-                sqlJobP = "SELECT jobParameters FROM ATLAS_PANDA.jobParamsTable WHERE PandaID=:PandaID"
-                varMap = {}
-                varMap[":PandaID"] = job.PandaID
-                self.cur.execute(sqlJobP + comment, varMap)
-                for (clobJobP,) in self.cur:
-                    try:
-                        job.jobParameters = clobJobP.read()
-                    except AttributeError:
-                        job.jobParameters = str(clobJobP)
-                    break
-
-                # remove or extract parameters for merge
-                if EventServiceUtils.isEventServiceJob(job) or EventServiceUtils.isJumboJob(job) or EventServiceUtils.isCoJumboJob(job):
-                    try:
-                        job.jobParameters = re.sub(
-                            "<PANDA_ESMERGE_.+>.*</PANDA_ESMERGE_.+>",
-                            "",
-                            job.jobParameters,
-                        )
-                    except Exception:
-                        pass
-                    # sort files since file order is important for positional event number
-                    job.sortFiles()
-                elif EventServiceUtils.isEventServiceMerge(job):
-                    try:
-                        origJobParameters = job.jobParameters
-                        tmpMatch = re.search(
-                            "<PANDA_ESMERGE_JOBP>(.*)</PANDA_ESMERGE_JOBP>",
-                            origJobParameters,
-                        )
-                        job.jobParameters = tmpMatch.group(1)
-                        tmpMatch = re.search(
-                            "<PANDA_ESMERGE_TRF>(.*)</PANDA_ESMERGE_TRF>",
-                            origJobParameters,
-                        )
-                        job.transformation = tmpMatch.group(1)
-                    except Exception:
-                        pass
-                    # pass in/out map for merging via metadata
-                    job.metadata = [mergeInputOutputMap, mergeFileObjStoreMap]
-
-                # read task parameters
-                if job.lockedby == "jedi":
-                    sqlTP = f"SELECT ioIntensity,ioIntensityUnit FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID "
-                    varMap = {}
-                    varMap[":jediTaskID"] = job.jediTaskID
-                    self.cur.execute(sqlTP + comment, varMap)
-                    resTP = self.cur.fetchone()
-                    if resTP is not None:
-                        ioIntensity, ioIntensityUnit = resTP
-                        job.set_task_attribute("ioIntensity", ioIntensity)
-                        job.set_task_attribute("ioIntensityUnit", ioIntensityUnit)
+                            # output LFN and dataset
+                            if esPandaID not in esOutputFileMap:
+                                esOutputFileMap[esPandaID] = dict()
+                                varMap = {}
+                                varMap[":PandaID"] = esPandaID
+                                varMap[":type"] = "output"
+                                self.cur.execute(sqlFileOut + comment, varMap)
+                                resFileOut = self.cur.fetchall()
+                                for tmpOutLFN, tmpOutDataset in resFileOut:
+                                    esOutputFileMap[esPandaID][tmpOutDataset] = tmpOutLFN
+                        # zip file in fileTable
+                        if zipRow_ID is not None and zipRow_ID not in esZipRow_IDs:
+                            esZipRow_IDs.add(zipRow_ID)
+                            varMap = {}
+                            varMap[":row_ID"] = zipRow_ID
+                            self.cur.execute(sqlZipFile + comment, varMap)
+                            resZip = self.cur.fetchone()
+                            if resZip is not None:
+                                (
+                                    outputZipName,
+                                    outputZipBucketID,
+                                    outputZipFsize,
+                                    outputZipChecksum,
+                                ) = resZip
+                                if esPandaID not in esOutputZipMap:
+                                    esOutputZipMap[esPandaID] = []
+                                esOutputZipMap[esPandaID].append(
+                                    {
+                                        "name": outputZipName,
+                                        "osid": outputZipBucketID,
+                                        "fsize": outputZipFsize,
+                                        "checksum": outputZipChecksum,
+                                    }
+                                )
+        # make input for event service output merging
+        mergeInputOutputMap = {}
+        mergeInputFiles = []
+        mergeFileObjStoreMap = {}
+        mergeZipPandaIDs = []
+        for tmpFileID in eventRangeIDs:
+            tmpMapEventRangeID = eventRangeIDs[tmpFileID]
+            jobProcessIDs = sorted(tmpMapEventRangeID)
+            # make input
+            for jobProcessID in jobProcessIDs:
+                for tmpFileSpec in job.Files:
+                    if tmpFileSpec.type not in ["output"]:
+                        continue
+                    esPandaID = tmpMapEventRangeID[jobProcessID]["pandaID"]
+                    tmpInputFileSpec = copy.copy(tmpFileSpec)
+                    tmpInputFileSpec.type = "input"
+                    outLFN = tmpInputFileSpec.lfn
+                    # change LFN
+                    if esPandaID in esOutputFileMap and tmpInputFileSpec.dataset in esOutputFileMap[esPandaID]:
+                        tmpInputFileSpec.lfn = esOutputFileMap[esPandaID][tmpInputFileSpec.dataset]
+                    # change attemptNr back to the original, which could have been changed by ES merge retry
+                    if not useNewFileFormatForES:
+                        origLFN = re.sub("\.\d+$", ".1", tmpInputFileSpec.lfn)
+                        outLFN = re.sub("\.\d+$", ".1", outLFN)
+                    else:
+                        origLFN = re.sub("\.\d+$", ".1_000", tmpInputFileSpec.lfn)
+                        outLFN = re.sub("\.\d+$", ".1_000", outLFN)
+                    # append eventRangeID as suffix
+                    tmpInputFileSpec.lfn = origLFN + "." + tmpMapEventRangeID[jobProcessID]["eventRangeID"]
+                    # make input/output map
+                    if outLFN not in mergeInputOutputMap:
+                        mergeInputOutputMap[outLFN] = []
+                    mergeInputOutputMap[outLFN].append(tmpInputFileSpec.lfn)
+                    # add file
+                    if esPandaID not in esOutputZipMap:
+                        # no zip
+                        mergeInputFiles.append(tmpInputFileSpec)
+                        # mapping for ObjStore
+                        mergeFileObjStoreMap[tmpInputFileSpec.lfn] = tmpMapEventRangeID[jobProcessID]["objStoreID"]
+                    elif esPandaID not in mergeZipPandaIDs:
+                        # zip
+                        mergeZipPandaIDs.append(esPandaID)
+                        for tmpEsOutZipFile in esOutputZipMap[esPandaID]:
+                            # copy for zip
+                            tmpZipInputFileSpec = copy.copy(tmpInputFileSpec)
+                            # add prefix
+                            tmpZipInputFileSpec.lfn = "zip://" + tmpEsOutZipFile["name"]
+                            if "fsize" in tmpEsOutZipFile:
+                                tmpZipInputFileSpec.fsize = tmpEsOutZipFile["fsize"]
+                            if "checksum" in tmpEsOutZipFile:
+                                tmpZipInputFileSpec.checksum = tmpEsOutZipFile["checksum"]
+                            mergeInputFiles.append(tmpZipInputFileSpec)
+                            # mapping for ObjStore
+                            mergeFileObjStoreMap[tmpZipInputFileSpec.lfn] = tmpEsOutZipFile["osid"]
+        for tmpInputFileSpec in mergeInputFiles:
+            job.addFile(tmpInputFileSpec)
 
-                if not self._commit():
-                    raise RuntimeError("Commit error")
+        # job parameters
+        if job_parameters is not None:
+            job.jobParameters = job_parameters
 
-                # append the job to the returned list
-                retJobs.append(job)
+        # remove or extract parameters for merge
+        if EventServiceUtils.isEventServiceJob(job) or EventServiceUtils.isJumboJob(job) or EventServiceUtils.isCoJumboJob(job):
+            try:
+                job.jobParameters = re.sub(
+                    "<PANDA_ESMERGE_.+>.*</PANDA_ESMERGE_.+>",
+                    "",
+                    job.jobParameters,
+                )
+            except Exception:
+                pass
+            # sort files since file order is important for positional event number
+            job.sortFiles()
+        elif EventServiceUtils.isEventServiceMerge(job):
+            try:
+                origJobParameters = job.jobParameters
+                tmpMatch = re.search(
+                    "<PANDA_ESMERGE_JOBP>(.*)</PANDA_ESMERGE_JOBP>",
+                    origJobParameters,
+                )
+                job.jobParameters = tmpMatch.group(1)
+                tmpMatch = re.search(
+                    "<PANDA_ESMERGE_TRF>(.*)</PANDA_ESMERGE_TRF>",
+                    origJobParameters,
+                )
+                job.transformation = tmpMatch.group(1)
+            except Exception:
+                pass
+            # pass in/out map for merging via metadata
+            job.metadata = [mergeInputOutputMap, mergeFileObjStoreMap]
 
-                # record status change
-                try:
-                    self.recordStatusChange(job.PandaID, job.jobStatus, jobInfo=job)
-                except Exception:
-                    tmp_log.error("recordStatusChange in getJobs")
-                self.push_job_status_message(job, job.PandaID, job.jobStatus)
-                if via_topic and job.is_push_job():
-                    tmp_log.debug("delete job message")
-                    mb_proxy_queue = self.get_mb_proxy("panda_pilot_queue")
-                    srv_msg_utils.delete_job_message(mb_proxy_queue, job.PandaID)
-            return retJobs, nSent
-        except Exception as e:
-            self.dump_error_message(tmp_log)
-            # roll back
-            self._rollback()
-            return [], 0
+    # post-process dispatched jobs
+    def _post_process_dispatched_jobs(self, jobs, via_topic, tmp_log):
+        for job in jobs:
+            # record status change
+            try:
+                self.recordStatusChange(job.PandaID, job.jobStatus, jobInfo=job)
+            except Exception:
+                tmp_log.error("recordStatusChange in getJobs")
+            self.push_job_status_message(job, job.PandaID, job.jobStatus)
+            if via_topic and job.is_push_job():
+                tmp_log.debug("delete job message")
+                mb_proxy_queue = self.get_mb_proxy("panda_pilot_queue")
+                srv_msg_utils.delete_job_message(mb_proxy_queue, job.PandaID)
 
     # record retry history
     def recordRetryHistoryJEDI(self, jediTaskID, newPandaID, oldPandaIDs, relationType, no_late_bulk_exec=True, extracted_sqls=None):
@@ -4167,22 +4375,18 @@ class JobComplexModule(BaseModule):
             sqlFileStat += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID "
             if not (jobSpec.isCancelled() and fileSpec.isUnMergedOutput()):
                 sqlFileStat += "AND attemptNr=:attemptNr "
-            sqlFileStat += "FOR UPDATE "
-            if not waitLock:
-                sqlFileStat += "NOWAIT "
             n_try = 5
             for i_try in range(n_try):
                 try:
                     tmp_log.debug(f"Trying to lock file {i_try+1}/{n_try} sql:{sqlFileStat} var:{str(varMap)}")
-                    cur.execute(sqlFileStat + comment, varMap)
+                    resFileStat = self.lock_rows(sqlFileStat, varMap, mode="wait" if waitLock else "nowait", comment=comment)
                     break
                 except Exception as e:
                     if i_try + 1 == n_try:
                         raise e
                     time.sleep(1)
-            resFileStat = self.cur.fetchone()
-            if resFileStat is not None:
-                oldFileStatus, oldIsWaiting = resFileStat
+            if resFileStat:
+                oldFileStatus, oldIsWaiting = resFileStat[0]
             else:
                 oldFileStatus, oldIsWaiting = None, None
             # skip if already cancelled
@@ -4318,17 +4522,18 @@ class JobComplexModule(BaseModule):
                 if updateNumEvents:
                     sqlEVT = "SELECT nEvents,startEvent,endEvent,keepTrack FROM ATLAS_PANDA.JEDI_Dataset_Contents "
                     sqlEVT += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID "
-                    if not waitLock:
-                        sqlEVT += "FOR UPDATE NOWAIT "
                     varMap = {}
                     varMap[":fileID"] = fileSpec.fileID
                     varMap[":datasetID"] = fileSpec.datasetID
                     varMap[":jediTaskID"] = jobSpec.jediTaskID
                     tmp_log.debug(sqlEVT + comment + str(varMap))
-                    cur.execute(sqlEVT + comment, varMap)
-                    resEVT = self.cur.fetchone()
-                    if resEVT is not None:
-                        tmpNumEvents, tmpStartEvent, tmpEndEvent, tmpKeepTrack = resEVT
+                    if not waitLock:
+                        resEVT = self.lock_rows(sqlEVT, varMap, comment=comment)
+                    else:
+                        cur.execute(sqlEVT + comment, varMap)
+                        resEVT = self.cur.fetchall()
+                    if resEVT:
+                        tmpNumEvents, tmpStartEvent, tmpEndEvent, tmpKeepTrack = resEVT[0]
                         if tmpNumEvents is not None:
                             try:
                                 if fileSpec.type in ["input", "pseudo_input"]:
@@ -4450,18 +4655,15 @@ class JobComplexModule(BaseModule):
                 tmpContentsStat = datasetContentsStat[tmpDatasetID]
                 sqlJediDL = "SELECT nFilesUsed,nFilesFailed,nFilesTobeUsed,nFilesFinished," "nFilesOnHold,type,masterID,status FROM ATLAS_PANDA.JEDI_Datasets "
                 sqlJediDL += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
-                sqlJediDLnoL = sqlJediDL
-                sqlJediDL += "FOR UPDATE "
-                if not waitLock:
-                    sqlJediDL += "NOWAIT "
                 varMap = {}
                 varMap[":jediTaskID"] = jobSpec.jediTaskID
                 varMap[":datasetID"] = tmpDatasetID
                 if async_params is None:
-                    cur.execute(sqlJediDL + comment, varMap)
+                    tmpResJediDL = self.lock_rows(sqlJediDL, varMap, mode="wait" if waitLock else "nowait", comment=comment)
+                    tmpResJediDL = tmpResJediDL[0] if tmpResJediDL else None
                 else:
-                    cur.execute(sqlJediDLnoL + comment, varMap)
-                tmpResJediDL = self.cur.fetchone()
+                    cur.execute(sqlJediDL + comment, varMap)
+                    tmpResJediDL = self.cur.fetchone()
                 (
                     t_nFilesUsed,
                     t_nFilesFailed,
@@ -4967,13 +5169,12 @@ class JobComplexModule(BaseModule):
                 # sql to lock the file
                 sqlLIF = f"SELECT status FROM {panda_config.schemaJEDI}.JEDI_Dataset_Contents "
                 sqlLIF += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID "
-                sqlLIF += "FOR UPDATE NOWAIT "
                 varMap = dict()
                 varMap[":jediTaskID"] = lockFileSpec.jediTaskID
                 varMap[":datasetID"] = lockFileSpec.datasetID
                 varMap[":fileID"] = lockFileSpec.fileID
                 tmp_log.debug(f"locking {str(varMap)}")
-                self.cur.execute(sqlLIF + comment, varMap)
+                self.lock_rows(sqlLIF, varMap, comment=comment)
                 tmp_log.debug(f"locked")
             # change event status processed by jumbo jobs
             nRowDoneJumbo = 0
@@ -5,7 +5,11 @@ import re
 import time
 
 from pandacommon.pandalogger.LogWrapper import LogWrapper
-from pandacommon.pandautils.PandaUtils import get_sql_IN_bind_variables, naive_utcnow
+from pandacommon.pandautils.PandaUtils import (
+    batched,
+    get_sql_IN_bind_variables,
+    naive_utcnow,
+)
 
 from pandaserver.config import panda_config
 from pandaserver.srvcore import CoreUtils, srv_msg_utils
@@ -574,6 +578,98 @@ class JobStandaloneModule(BaseModule):
                 job.jobStatus = "unknown"
                 return job
 
+    # peek at jobs in jobsActive4 in bulk
+    def peek_active_jobs_in_bulk(self, panda_ids):
+        """
+        Read jobs in jobsActive4 with their files and job parameters using array-bound queries
+
+        :param panda_ids: list of PandaIDs
+        :return: list of JobSpecs in the same order as panda_ids. jobs not in jobsActive4 are omitted. None on failure
+        """
+        comment = " /* DBProxy.peek_active_jobs_in_bulk */"
+        tmp_log = self.create_tagged_logger(comment)
+        tmp_log.debug(f"start for {len(panda_ids)} jobs")
+        try:
+            job_map = {}
+            # start transaction
+            self.conn.begin()
+            idx_file_panda_id = FileSpec._attributes.index("PandaID")
+            self.cur.arraysize = 10000
+            for tmp_panda_ids in batched(panda_ids, 1000):
+                var_names_str, var_map = get_sql_IN_bind_variables(tmp_panda_ids, prefix=":PandaID")
+                # jobs
+                sql_job = f"SELECT {JobSpec.columnNames()} FROM ATLAS_PANDA.jobsActive4 WHERE PandaID IN ({var_names_str}) "
+                self.cur.execute(sql_job + comment, var_map)
+                for job in JobSpec.pack_rows(self.cur.fetchall()):
+                    job.jobParameters = None
+                    job_map[job.PandaID] = job
+                # files
+                sql_file = f"SELECT {FileSpec.columnNames()} FROM ATLAS_PANDA.filesTable4 WHERE PandaID IN ({var_names_str}) ORDER BY row_ID "
+                self.cur.execute(sql_file + comment, var_map)
+                for res in self.cur.fetchall():
+                    # PandaID of FileSpec is taken from the owner, so the column value is used to find the job
+                    tmp_panda_id = res[idx_file_panda_id]
+                    if tmp_panda_id in job_map:
+                        file_spec = FileSpec()
+                        file_spec.pack(res)
+                        job_map[tmp_panda_id].addFile(file_spec)
+                # job parameters
+                sql_job_params = f"SELECT PandaID,jobParameters FROM ATLAS_PANDA.jobParamsTable WHERE PandaID IN ({var_names_str}) "
+                self.cur.execute(sql_job_params + comment, var_map)
+                for tmp_panda_id, clob_job_params in self.cur:
+                    if tmp_panda_id not in job_map or clob_job_params is None:
+                        continue
+                    try:
+                        job_map[tmp_panda_id].jobParameters = clob_job_params.read()
+                    except AttributeError:
+                        job_map[tmp_panda_id].jobParameters = str(clob_job_params)
+            # commit
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            ret_jobs = [job_map[tmp_panda_id] for tmp_panda_id in panda_ids if tmp_panda_id in job_map]
+            tmp_log.debug(f"got {len(ret_jobs)} jobs")
+            return ret_jobs
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dump_error_message(tmp_log)
+            return None
+
+    # peek at jobs in jobsArchived4 in bulk
+    def peek_archived_jobs_in_bulk(self, panda_ids):
+        """
+        Read jobs in jobsArchived4 using array-bound queries. Files and job parameters are not read
+
+        :param panda_ids: list of PandaIDs
+        :return: dictionary of PandaID and JobSpec. jobs not in jobsArchived4 are omitted. None on failure
+        """
+        comment = " /* DBProxy.peek_archived_jobs_in_bulk */"
+        tmp_log = self.create_tagged_logger(comment)
+        tmp_log.debug(f"start for {len(panda_ids)} jobs")
+        try:
+            job_map = {}
+            # start transaction
+            self.conn.begin()
+            self.cur.arraysize = 10000
+            for tmp_panda_ids in batched(panda_ids, 1000):
+                var_names_str, var_map = get_sql_IN_bind_variables(tmp_panda_ids, prefix=":PandaID")
+                sql_job = f"SELECT {JobSpec.columnNames()} FROM ATLAS_PANDA.jobsArchived4 WHERE PandaID IN ({var_names_str}) "
+                self.cur.execute(sql_job + comment, var_map)
+                for job in JobSpec.pack_rows(self.cur.fetchall()):
+                    job_map[job.PandaID] = job
+            # commit
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            tmp_log.debug(f"got {len(job_map)} jobs")
+            return job_map
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dump_error_message(tmp_log)
+            return None
+
     # get express jobs
     def getExpressJobs(self, dn):
         comment = " /* DBProxy.getExpressJobs */"
@@ -2374,7 +2470,6 @@ class JobStandaloneModule(BaseModule):
                 "FROM {0}.Job_Output_Report "
                 "WHERE PandaID=:PandaID AND attemptNr=:attemptNr "
                 "AND (lockedBy IS NULL OR lockedBy=:lockedBy OR lockedTime<:lockedTime) "
-                "FOR UPDATE NOWAIT "
             ).format(panda_config.schemaPANDA)
             # sql to update lock
             sqlUL = (
@@ -2393,8 +2488,7 @@ class JobStandaloneModule(BaseModule):
             varMap[":lockedTime"] = naive_utcnow() - datetime.timedelta(minutes=time_limit)
             utc_now = naive_utcnow()
             try:
-                self.cur.execute(sqlGL + comment, varMap)
-                resGL = self.cur.fetchall()
+                resGL = self.lock_rows(sqlGL, varMap, comment=comment)
                 if not resGL:
                     tmp_log.debug("record already locked by other thread, skipped")
             except Exception:
@@ -2427,6 +2521,64 @@ class JobStandaloneModule(BaseModule):
             self.dump_error_message(tmp_log)
             return retVal
 
+    # lock job output reports in bulk
+    def lockJobOutputReports(self, reports, pid, time_limit):
+        """
+        Lock job output reports with a single lock statement and an array-bound update. Reports locked by others are skipped
+
+        :param reports: list of (PandaID, attemptNr)
+        :param pid: ID of the locker
+        :param time_limit: lifetime of locks in minutes. expired locks are taken over
+        :return: list of (PandaID, attemptNr) locked by the locker
+        """
+        comment = " /* DBProxy.lockJobOutputReports */"
+        tmp_log = self.create_tagged_logger(comment, f"pid={pid}")
+        tmp_log.debug(f"start for {len(reports)} reports")
+        try:
+            retVal = []
+            if not reports:
+                return retVal
+            # start transaction
+            self.conn.begin()
+            # lock records which are unlocked or have expired locks
+            var_names_str, varMap = get_sql_IN_bind_variables(sorted(set(panda_id for panda_id, _ in reports)), prefix=":PandaID")
+            varMap[":lockedBy"] = pid
+            varMap[":lockedTime"] = naive_utcnow() - datetime.timedelta(minutes=time_limit)
+            sqlGL = (
+                f"SELECT PandaID,attemptNr FROM {panda_config.schemaPANDA}.Job_Output_Report "
+                f"WHERE PandaID IN ({var_names_str}) "
+                "AND (lockedBy IS NULL OR lockedBy=:lockedBy OR lockedTime<:lockedTime) "
+            )
+            try:
+                resGL = self.lock_rows(sqlGL, varMap, mode="skip", comment=comment)
+            except Exception:
+                tmp_log.debug("cannot lock")
+                self._rollback()
+                return retVal
+            # only requested attempts
+            requested = set((panda_id, attempt_nr) for panda_id, attempt_nr in reports)
+            retVal = [(panda_id, attempt_nr) for panda_id, attempt_nr in resGL if (panda_id, attempt_nr) in requested]
+            if retVal:
+                # sql to update lock
+                sqlUL = (
+                    f"UPDATE {panda_config.schemaPANDA}.Job_Output_Report SET lockedBy=:lockedBy, lockedTime=:lockedTime "
+                    "WHERE PandaID=:PandaID AND attemptNr=:attemptNr "
+                )
+                utc_now = naive_utcnow()
+                varMaps = [{":PandaID": panda_id, ":attemptNr": attempt_nr, ":lockedBy": pid, ":lockedTime": utc_now} for panda_id, attempt_nr in retVal]
+                self.cur.executemany(sqlUL + comment, varMaps)
+            # commit
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            tmp_log.debug(f"locked {len(retVal)} reports")
+            return retVal
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dump_error_message(tmp_log)
+            return []
+
     # unlock job output report
     def unlockJobOutputReport(self, panda_id, attempt_nr, pid, lock_offset):
         comment = " /* DBProxy.unlockJobOutputReport */"
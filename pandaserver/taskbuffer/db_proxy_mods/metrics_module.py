@@ -10,6 +10,7 @@ from pandacommon.pandautils.PandaUtils import naive_utcnow
 from pandaserver.config import panda_config
 from pandaserver.srvcore import CoreUtils
 from pandaserver.taskbuffer.db_proxy_mods.base_module import BaseModule
+from pandaserver.taskbuffer.JobCounter import job_counter
 from pandaserver.taskbuffer.JobSpec import JobSpec, get_task_queued_time
 
 
@@ -546,11 +547,75 @@ class MetricsModule(BaseModule):
             self.dump_error_message(tmp_log)
             return None
 
+    # get a snapshot of cached job statistics after refreshing it if needed
+    def get_job_counter_snapshot(self):
+        """
+        Get a snapshot of job statistics cached in memory. They are copied from MV_JOBSACTIVE4_STATS, JOBS_SHARE_STATS,
+        JOBSDEFINED_SHARE_STATS, and an aggregation of jobsDefined4 by one thread in the process every refresh interval,
+        so that they are as fresh as the statistics tables plus the interval
+
+        :return: JobCounterSnapshot, or None if the cache is disabled or unavailable
+        """
+        if not job_counter.is_enabled():
+            return None
+        if job_counter.start_refresh():
+            comment = " /* DBProxy.get_job_counter_snapshot */"
+            tmp_log = self.create_tagged_logger(comment)
+            tmp_log.debug("start refresh")
+            sql_active = (
+                "SELECT /*+ RESULT_CACHE */ vo,prodSourceLabel,computingSite,cloud,workQueue_ID,jobStatus,SUM(num_of_jobs),SUM(num_of_cores) "
+                f"FROM {panda_config.schemaPANDA}.MV_JOBSACTIVE4_STATS "
+                "GROUP BY vo,prodSourceLabel,computingSite,cloud,workQueue_ID,jobStatus "
+            )
+            sql_defined = (
+                "SELECT vo,prodSourceLabel,computingSite,cloud,workQueue_ID,jobStatus,COUNT(*) "
+                f"FROM {panda_config.schemaPANDA}.jobsDefined4 "
+                "GROUP BY vo,prodSourceLabel,computingSite,cloud,workQueue_ID,jobStatus "
+            )
+            sql_share = (
+                "SELECT /*+ RESULT_CACHE */ vo,computingSite,gshare,resource_type,workqueue_id,nucleus,jobStatus,SUM(njobs) FROM %s "
+                "GROUP BY vo,computingSite,gshare,resource_type,workqueue_id,nucleus,jobStatus "
+            )
+            sql_rwq = f"SELECT queue_id FROM {panda_config.schemaPANDA}.jedi_work_queue WHERE queue_function=:queue_function "
+            try:
+                self.conn.begin()
+                self.cur.arraysize = 100000
+                self.cur.execute(sql_defined + comment, {})
+                defined_rows = self.cur.fetchall()
+                self.cur.execute(sql_active + comment, {})
+                active_rows = self.cur.fetchall()
+                self.cur.execute((sql_share + comment) % f"{panda_config.schemaPANDA}.JOBSDEFINED_SHARE_STATS", {})
+                defined_share_rows = self.cur.fetchall()
+                self.cur.execute((sql_share + comment) % f"{panda_config.schemaPANDA}.JOBS_SHARE_STATS", {})
+                active_share_rows = self.cur.fetchall()
+                self.cur.execute(sql_rwq + comment, {":queue_function": "Resource"})
+                resource_queue_ids = [queue_id for queue_id, in self.cur.fetchall()]
+                if not self._commit():
+                    raise RuntimeError("Commit error")
+                job_counter.finish_refresh(defined_rows, active_rows, defined_share_rows, active_share_rows, resource_queue_ids)
+                n_rows = len(defined_rows) + len(active_rows) + len(defined_share_rows) + len(active_share_rows)
+                tmp_log.debug(f"done with {n_rows} rows version={job_counter.version}")
+            except Exception:
+                self._rollback()
+                job_counter.abort_refresh()
+                self.dump_error_message(tmp_log)
+        return job_counter.get_snapshot()
+
     # get job statistics with work queue
     def getJobStatisticsWithWorkQueue_JEDI(self, vo, prodSourceLabel, minPriority=None, cloud=None):
         comment = " /* DBProxy.getJobStatisticsWithWorkQueue_JEDI */"
         tmpLog = self.create_tagged_logger(comment, f"vo={vo} label={prodSourceLabel} cloud={cloud}")
         tmpLog.debug(f"start minPriority={minPriority}")
+        # use cached statistics unless priority is specified
+        if minPriority is None:
+            snapshot = self.get_job_counter_snapshot()
+            if snapshot is not None:
+                returnMap = {}
+                for computingSite, _, jobStatus, workQueue_ID, nCount in snapshot.get_job_statistics_with_work_queue(vo, prodSourceLabel, cloud):
+                    returnMap.setdefault(computingSite, {}).setdefault(workQueue_ID, {}).setdefault(jobStatus, 0)
+                    returnMap[computingSite][workQueue_ID][jobStatus] += nCount
+                tmpLog.debug(f"done with cached statistics version={snapshot.version}")
+                return True, returnMap
         sql0 = "SELECT computingSite,cloud,jobStatus,workQueue_ID,COUNT(*) FROM %s "
         sql0 += "WHERE vo=:vo AND prodSourceLabel=:prodSourceLabel "
         if cloud is not None:
@@ -638,6 +703,11 @@ class MetricsModule(BaseModule):
         comment = " /* DBProxy.get_core_statistics */"
         tmpLog = self.create_tagged_logger(comment, f"vo={vo} label={prod_source_label}")
         tmpLog.debug("start")
+        # use cached statistics
+        snapshot = self.get_job_counter_snapshot()
+        if snapshot is not None:
+            tmpLog.debug(f"done with cached statistics version={snapshot.version}")
+            return True, snapshot.get_core_statistics(vo, prod_source_label)
         sql0 = f"SELECT /*+ RESULT_CACHE */ computingSite,jobStatus,SUM(num_of_cores) FROM {panda_config.schemaPANDA}.MV_JOBSACTIVE4_STATS "
         sql0 += "WHERE vo=:vo AND prodSourceLabel=:prodSourceLabel "
         sql0 += "GROUP BY computingSite,cloud,prodSourceLabel,jobStatus "
@@ -679,6 +749,11 @@ class MetricsModule(BaseModule):
         comment = " /* DBProxy.getJobStatisticsByGlobalShare */"
         tmpLog = self.create_tagged_logger(comment, f" vo={vo}")
         tmpLog.debug("start")
+        # use cached statistics
+        snapshot = self.get_job_counter_snapshot()
+        if snapshot is not None:
+            tmpLog.debug(f"done with cached statistics version={snapshot.version}")
+            return True, snapshot.get_job_statistics_by_global_share(vo, exclude_rwq)
 
         # define the var map of query parameters
         var_map = {":vo": vo}
@@ -736,6 +811,14 @@ class MetricsModule(BaseModule):
         tmpLog = self.create_tagged_logger(comment, f"workqueue={workqueue}")
         tmpLog.debug("start")
 
+        # use cached statistics
+        snapshot = self.get_job_counter_snapshot()
+        if snapshot is not None:
+            tmpLog.debug(f"done with cached statistics version={snapshot.version}")
+            if workqueue.is_global_share:
+                return True, snapshot.get_job_statistics_by_resource_type(workqueue.VO, gshare=workqueue.queue_name)
+            return True, snapshot.get_job_statistics_by_resource_type(workqueue.VO, workqueue_id=workqueue.queue_id)
+
         # define the var map of query parameters
         var_map = {":vo": workqueue.VO}
 
@@ -834,6 +917,17 @@ class MetricsModule(BaseModule):
         tmp_log = self.create_tagged_logger(comment, f" vo={vo} status={job_status}")
         tmp_log.debug("start")
 
+        if job_status in ["transferring", "running", "activated" "holding"]:
+            from_active = True
+        else:
+            from_active = False
+
+        # use cached statistics
+        snapshot = self.get_job_counter_snapshot()
+        if snapshot is not None:
+            tmp_log.debug(f"done with cached statistics version={snapshot.version}")
+            return True, snapshot.get_num_jobs_with_status_by_nucleus(vo, job_status, from_active)
+
         # define the var map of query parameters
         var_map = {":vo": vo, ":job_status": job_status}
 
@@ -843,7 +937,7 @@ class MetricsModule(BaseModule):
                WHERE vo=:vo AND jobStatus=:job_status GROUP BY computingSite, nucleus
                """
 
-        if job_status in ["transferring", "running", "activated" "holding"]:
+        if from_active:
             table = f"{panda_config.schemaPANDA}.JOBS_SHARE_STATS"
         else:
             table = f"{panda_config.schemaPANDA}.JOBSDEFINED_SHARE_STATS"
@@ -3360,9 +3360,7 @@ class MiscStandaloneModule(BaseModule):
             # loop over all IDs
             for tmp_id in panda_id_list:
                 tmp_log = self.create_tagged_logger(comment, f"PandaID={tmp_id}")
-                sqlL = "SELECT data FROM {0}.SQL_QUEUE WHERE topic=:topic AND PandaID=:PandaID ORDER BY " "execution_order FOR UPDATE NOWAIT ".format(
-                    panda_config.schemaPANDA
-                )
+                sqlL = "SELECT data FROM {0}.SQL_QUEUE WHERE topic=:topic AND PandaID=:PandaID ORDER BY execution_order ".format(panda_config.schemaPANDA)
                 sqlD = f"DELETE FROM {panda_config.schemaPANDA}.SQL_QUEUE WHERE PandaID=:PandaID "
                 n_try = 5
                 all_ok = True
@@ -3379,8 +3377,7 @@ class MiscStandaloneModule(BaseModule):
                             ":topic": SQL_QUEUE_TOPIC_async_dataset_update,
                             ":PandaID": tmp_id,
                         }
-                        self.cur.execute(sqlL + comment, var_map)
-                        tmp_data_list = self.cur.fetchall()
+                        tmp_data_list = self.lock_rows(sqlL, var_map, comment=comment)
                     except Exception:
                         tmp_log.debug("cannot lock queries")
                         all_ok = False
@@ -579,7 +579,7 @@ class TaskComplexModule(BaseModule):
             missingFileList = []
             tmpLog.debug(f"{len(missingFileList)} files missing while {len(uniqueFileKeyList)} unique files")
             # sql to check if task is locked
-            sqlTL = f"SELECT status,lockedBy FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID FOR UPDATE NOWAIT "
+            sqlTL = f"SELECT status,lockedBy FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID "
             # sql to check dataset status
             sqlDs = f"SELECT status,nFilesToBeUsed-nFilesUsed,state,nFilesToBeUsed,nFilesUsed FROM {panda_config.schemaJEDI}.JEDI_Datasets "
             sqlDs += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID FOR UPDATE "
@@ -647,8 +647,7 @@ class TaskComplexModule(BaseModule):
             try:
                 varMap = {}
                 varMap[":jediTaskID"] = datasetSpec.jediTaskID
-                self.cur.execute(sqlTL + comment, varMap)
-                resTask = self.cur.fetchone()
+                resTask = self.lock_rows(sqlTL, varMap, comment=comment)
             except Exception as e:
                 if self.is_no_wait_exception(e):
                     # resource busy and acquire with NOWAIT specified
@@ -659,10 +658,10 @@ class TaskComplexModule(BaseModule):
                 else:
                     # failed with something else
                     raise
-            if resTask is None:
+            if not resTask:
                 tmpLog.debug("task not found in Task table")
             else:
-                taskStatus, taskLockedBy = resTask
+                taskStatus, taskLockedBy = resTask[0]
                 if taskLockedBy != pid:
                     # task is locked
                     tmpLog.debug(f"task is locked by {taskLockedBy}")
@@ -1618,7 +1617,7 @@ class TaskComplexModule(BaseModule):
             sqlRT += "AND (lockedBy IS NULL OR lockedTime<:timeLimit) "
             sqlRT += f"AND rownum<{nTasks} "
             sqlNW = f"SELECT jediTaskID FROM {panda_config.schemaJEDI}.JEDI_Tasks "
-            sqlNW += "WHERE jediTaskID=:jediTaskID FOR UPDATE NOWAIT"
+            sqlNW += "WHERE jediTaskID=:jediTaskID "
             sqlLK = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks SET lockedBy=:lockedBy,lockedTime=CURRENT_DATE "
             sqlLK += "WHERE jediTaskID=:jediTaskID AND (lockedBy IS NULL OR lockedTime<:timeLimit) AND status=:status "
             sqlTS = f"SELECT {JediTaskSpec.columnNames()} "
@@ -1653,7 +1652,7 @@ class TaskComplexModule(BaseModule):
                 try:
                     varMap = {}
                     varMap[":jediTaskID"] = jediTaskID
-                    self.cur.execute(sqlNW + comment, varMap)
+                    self.lock_rows(sqlNW, varMap, comment=comment)
                 except Exception:
                     tmpLog.debug(f"skip locked jediTaskID={jediTaskID}")
                     # commit
@@ -2041,14 +2040,10 @@ class TaskComplexModule(BaseModule):
         sql_read_task += "WHERE jediTaskID=:jediTaskID AND status=:statusInDB "
         if not ignore_lock:
             sql_read_task += "AND lockedBy IS NULL "
-        if not is_dry_run:
-            sql_read_task += "FOR UPDATE NOWAIT "
         # sql to read a locked task
         sql_read_locked_task = f"SELECT {JediTaskSpec.columnNames()} "
         sql_read_locked_task += f"FROM {panda_config.schemaJEDI}.JEDI_Tasks "
         sql_read_locked_task += "WHERE jediTaskID=:jediTaskID AND status=:statusInDB AND lockedBy=:newLockedBy "
-        if not is_dry_run:
-            sql_read_locked_task += "FOR UPDATE NOWAIT "
         # sql to lock task
         sql_to_lock_task = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks  "
         sql_to_lock_task += "SET lockedBy=:newLockedBy,lockedTime=CURRENT_DATE,modificationTime=CURRENT_DATE "
@@ -2066,13 +2061,17 @@ class TaskComplexModule(BaseModule):
             var_map[":jediTaskID"] = jedi_task_id
             var_map[":statusInDB"] = task_status_map[jedi_task_id]
             if jedi_task_id not in locked_tasks:
-                tmp_log.debug(sql_read_task + comment + str(var_map))
-                self.cur.execute(sql_read_task + comment, var_map)
+                tmp_sql = sql_read_task
             else:
                 var_map[":newLockedBy"] = pid
-                tmp_log.debug(sql_read_locked_task + comment + str(var_map))
-                self.cur.execute(sql_read_locked_task + comment, var_map)
-            tmp_res = self.cur.fetchone()
+                tmp_sql = sql_read_locked_task
+            tmp_log.debug(tmp_sql + comment + str(var_map))
+            if not is_dry_run:
+                tmp_res = self.lock_rows(tmp_sql, var_map, comment=comment)
+            else:
+                self.cur.execute(tmp_sql + comment, var_map)
+                tmp_res = self.cur.fetchall()
+            tmp_res = tmp_res[0] if tmp_res else None
             # locked by another
             if tmp_res is None:
                 to_skip = True
@@ -2529,8 +2528,6 @@ class TaskComplexModule(BaseModule):
         sql_read_datasets = f"SELECT {JediDatasetSpec.columnNames()} "
         sql_read_datasets += f"FROM {panda_config.schemaJEDI}.JEDI_Datasets "
         sql_read_datasets += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID "
-        if not is_dry_run:
-            sql_read_datasets += "FOR UPDATE NOWAIT "
         # append secondary dataset IDs
         var_map = {}
         if dataset_type not in JediDatasetSpec.getMergeProcessTypes():
@@ -2563,8 +2560,12 @@ class TaskComplexModule(BaseModule):
             try:
                 for input_chunk in input_chunk_list:
                     # select
-                    self.cur.execute(sql_read_datasets + comment, var_map)
-                    tmp_res = self.cur.fetchone()
+                    if not is_dry_run:
+                        tmp_res = self.lock_rows(sql_read_datasets, var_map, comment=comment)
+                    else:
+                        self.cur.execute(sql_read_datasets + comment, var_map)
+                        tmp_res = self.cur.fetchall()
+                    tmp_res = tmp_res[0] if tmp_res else None
                     dataset_spec = JediDatasetSpec()
                     dataset_spec.pack(tmp_res)
                     # change stream name for merging
@@ -3738,7 +3739,7 @@ class TaskComplexModule(BaseModule):
             # sql to read task
             sqlRT = f"SELECT {JediTaskSpec.columnNames()} "
             sqlRT += f"FROM {panda_config.schemaJEDI}.JEDI_Tasks "
-            sqlRT += "WHERE jediTaskID=:jediTaskID AND status=:statusInDB AND lockedBy IS NULL FOR UPDATE NOWAIT "
+            sqlRT += "WHERE jediTaskID=:jediTaskID AND status=:statusInDB AND lockedBy IS NULL "
             # sql to lock task
             sqlLK = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks SET lockedBy=:newLockedBy "
             sqlLK += "WHERE jediTaskID=:jediTaskID AND status=:status AND lockedBy IS NULL "
@@ -3801,8 +3802,8 @@ class TaskComplexModule(BaseModule):
                     varMap = {}
                     varMap[":jediTaskID"] = jediTaskID
                     varMap[":statusInDB"] = taskStatus
-                    self.cur.execute(sqlRT + comment, varMap)
-                    resRT = self.cur.fetchone()
+                    resRT = self.lock_rows(sqlRT, varMap, comment=comment)
+                    resRT = resRT[0] if resRT else None
                     # locked by another
                     if resRT is None:
                         tmpLog.debug(f"skip jediTaskID={jediTaskID} since status has changed")
@@ -4502,7 +4503,7 @@ class TaskComplexModule(BaseModule):
                 if not self._commit():
                     raise RuntimeError("Commit error")
                 # update modtime to avoid immediate reattempts
-                sql_orphaned_lock = f"SELECT modificationtime FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID FOR UPDATE NOWAIT "
+                sql_orphaned_lock = f"SELECT modificationtime FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID "
                 sqlOrpU = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks SET modificationtime=CURRENT_DATE "
                 sqlOrpU += "WHERE jediTaskID=:jediTaskID "
                 for jediTaskID, comComment, oldStatus in resList:
@@ -4511,7 +4512,7 @@ class TaskComplexModule(BaseModule):
                     try:
                         varMap = {}
                         varMap[":jediTaskID"] = jediTaskID
-                        self.cur.execute(sql_orphaned_lock + comment, varMap)
+                        self.lock_rows(sql_orphaned_lock, varMap, comment=comment)
                     except Exception as e:
                         tmpLog.debug(f"skip locked jediTaskID={jediTaskID} due to {str(e)}")
                         # commit
@@ -753,7 +753,6 @@ class TaskEventModule(BaseModule):
             # kill consumers
             sqlDJS = f"SELECT {JobSpec.columnNames()} "
             sqlDJS += "FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID "
-            sqlDJS += "FOR UPDATE NOWAIT "
             sqlDJD = "DELETE FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID"
             sqlDJI = f"INSERT INTO ATLAS_PANDA.jobsArchived4 ({JobSpec.columnNames()}) "
             sqlDJI += JobSpec.bindValuesExpression()
@@ -775,8 +774,7 @@ class TaskEventModule(BaseModule):
                 varMap = {}
                 varMap[":PandaID"] = pandaID
                 self.cur.arraysize = 10
-                self.cur.execute(sqlDJS + comment, varMap)
-                resJob = self.cur.fetchall()
+                resJob = self.lock_rows(sqlDJS, varMap, comment=comment)
                 if len(resJob) == 0:
                     continue
                 # instantiate JobSpec
@@ -1413,7 +1411,6 @@ class TaskEventModule(BaseModule):
             sqlPL = "SELECT 1 FROM ATLAS_PANDA.{0} "
             sqlPL += "WHERE PandaID=:PandaID "
             sqlPL += "AND (prodDBUpdateTime IS NULL OR prodDBUpdateTime<:timeLimit) "
-            sqlPL += "FOR UPDATE NOWAIT "
             sqlLK = "UPDATE ATLAS_PANDA.{0} "
             sqlLK += "SET prodDBUpdateTime=CURRENT_DATE "
             sqlLK += "WHERE PandaID=:PandaID "
@@ -1472,11 +1469,10 @@ class TaskEventModule(BaseModule):
                     resPL = None
                     try:
                         # lock with NOWAIT
-                        self.cur.execute(sqlPL.format(tableName) + comment, varMap)
-                        resPL = self.cur.fetchone()
+                        resPL = self.lock_rows(sqlPL.format(tableName), varMap, comment=comment)
                     except Exception:
                         toSkip = True
-                    if resPL is None:
+                    if not resPL:
                         toSkip = True
                     if toSkip:
                         tmp_log.debug(f"skipped PandaID={pandaID} jediTaskID={jediTaskID} in {tableName} since locked by another")
@@ -2977,8 +2973,6 @@ class TaskEventModule(BaseModule):
             # sql to check file status
             sqlFileStat = "SELECT PandaID,status,attemptNr,keepTrack,is_waiting FROM ATLAS_PANDA.JEDI_Dataset_Contents "
             sqlFileStat += "WHERE jediTaskID=:jediTaskID AND datasetID=:datasetID AND fileID=:fileID "
-            if withLock:
-                sqlFileStat += "FOR UPDATE NOWAIT "
             # begin transaction
             if useCommit:
                 self.conn.begin()
@@ -3020,14 +3014,17 @@ class TaskEventModule(BaseModule):
                 varMap[":jediTaskID"] = fileSpec.jediTaskID
                 varMap[":datasetID"] = fileSpec.datasetID
                 varMap[":fileID"] = fileSpec.fileID
-                self.cur.execute(sqlFileStat + comment, varMap)
-                resFileStat = self.cur.fetchone()
-                if resFileStat is None:
+                if withLock:
+                    resFileStat = self.lock_rows(sqlFileStat, varMap, comment=comment)
+                else:
+                    self.cur.execute(sqlFileStat + comment, varMap)
+                    resFileStat = self.cur.fetchall()
+                if not resFileStat:
                     tmp_log.debug(f"jediTaskID={fileSpec.jediTaskID} datasetID={fileSpec.datasetID} fileID={fileSpec.fileID} is not found")
                     allOK = False
                     break
                 else:
-                    input_panda_id, fileStatus, attemptNr, keepTrack, is_waiting = resFileStat
+                    input_panda_id, fileStatus, attemptNr, keepTrack, is_waiting = resFileStat[0]
                     if attemptNr is None:
                         continue
                     if keepTrack != 1:
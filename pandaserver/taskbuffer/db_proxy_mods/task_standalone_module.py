@@ -160,7 +160,7 @@ class TaskStandaloneModule(BaseModule):
             sql = f"SELECT {JediTaskSpec.columnNames()} "
             sql += f"FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID "
             if lockTask:
-                sql += "AND lockedBy IS NULL FOR UPDATE NOWAIT"
+                sql += "AND lockedBy IS NULL "
             sqlLK = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks SET lockedBy=:lockedBy,lockedTime=CURRENT_DATE "
             sqlLK += "WHERE jediTaskID=:jediTaskID "
             sqlDS = f"SELECT {JediDatasetSpec.columnNames()} "
@@ -174,8 +174,12 @@ class TaskStandaloneModule(BaseModule):
                 # read task
                 varMap = {}
                 varMap[":jediTaskID"] = jediTaskID
-                self.cur.execute(sql + comment, varMap)
-                res = self.cur.fetchone()
+                if lockTask:
+                    resList = self.lock_rows(sql, varMap, comment=comment)
+                else:
+                    self.cur.execute(sql + comment, varMap)
+                    resList = self.cur.fetchall()
+                res = resList[0] if resList else None
                 if res is None:
                     taskSpec = None
                 else:
@@ -585,7 +589,6 @@ class TaskStandaloneModule(BaseModule):
             # sql to re-lock task with nowait
             sqlNW = f"SELECT jediTaskID FROM {panda_config.schemaJEDI}.JEDI_Tasks "
             sqlNW += "WHERE jediTaskID=:jediTaskID AND lockedBy=:lockedBy AND lockedTime<:timeLimit "
-            sqlNW += "FOR UPDATE NOWAIT "
             # begin transaction
             self.conn.begin()
             self.cur.arraysize = 10000
@@ -618,7 +621,7 @@ class TaskStandaloneModule(BaseModule):
                 varMap[":timeLimit"] = timeLimit
                 toSkip = False
                 try:
-                    self.cur.execute(sqlNW + comment, varMap)
+                    self.lock_rows(sqlNW, varMap, comment=comment)
                 except Exception as e:
                     if self.is_no_wait_exception(e):
                         tmpLog.debug(f"[jediTaskID={jediTaskID}] skip to rescue since locked by another")
@@ -729,7 +732,6 @@ class TaskStandaloneModule(BaseModule):
             sqlNW = f"SELECT jediTaskID FROM {panda_config.schemaJEDI}.JEDI_Tasks "
             sqlNW += "WHERE jediTaskID=:jediTaskID AND lockedBy IS NULL AND lockedTime IS NULL "
             sqlNW += "AND (rescueTime IS NULL OR rescueTime<:timeLimit) "
-            sqlNW += "FOR UPDATE NOWAIT "
             # begin transaction
             self.conn.begin()
             self.cur.arraysize = 10000
@@ -755,9 +757,8 @@ class TaskStandaloneModule(BaseModule):
                     varMap = {}
                     varMap[":jediTaskID"] = jediTaskID
                     varMap[":timeLimit"] = timeToCheck
-                    self.cur.execute(sqlNW + comment, varMap)
-                    resNW = self.cur.fetchone()
-                    if resNW is None:
+                    resNW = self.lock_rows(sqlNW, varMap, comment=comment)
+                    if not resNW:
                         tmpLog.debug(f"[jediTaskID={jediTaskID} datasetID={datasetID}] skip since checked by another")
                         toSkip = True
                 except Exception as e:
@@ -4268,11 +4269,7 @@ class TaskStandaloneModule(BaseModule):
         tmp_log.debug("start")
         try:
             # sql to lock task
-            sql_lock = (
-                f"SELECT lockedBy,lockedTime FROM {panda_config.schemaJEDI}.JEDI_Tasks "
-                "WHERE jediTaskID=:jediTaskID AND lockedBy IS NULL "
-                "FOR UPDATE NOWAIT "
-            )
+            sql_lock = f"SELECT lockedBy,lockedTime FROM {panda_config.schemaJEDI}.JEDI_Tasks WHERE jediTaskID=:jediTaskID AND lockedBy IS NULL "
             # sql to get datasets
             sql_get_datasets = (
                 f"SELECT datasetID FROM {panda_config.schemaJEDI}.JEDI_Datasets "
@@ -4303,7 +4300,7 @@ class TaskStandaloneModule(BaseModule):
                 var_map = dict()
                 var_map[":jediTaskID"] = jediTaskID
                 try:
-                    self.cur.execute(sql_lock + comment, var_map)
+                    self.lock_rows(sql_lock, var_map, comment=comment)
                 except Exception as e:
                     tmp_log.debug(f"cannot lock task due to {str(e)}")
                     # commit
@@ -1778,7 +1778,7 @@ class TaskUtilsModule(BaseModule):
             if lockInterval is not None:
                 sql += "AND (lockedTime IS NULL OR lockedTime<:timeLimit) "
             if lockTask:
-                sql += "AND lockedBy IS NULL FOR UPDATE NOWAIT"
+                sql += "AND lockedBy IS NULL "
             sqlLock = f"UPDATE {panda_config.schemaJEDI}.JEDI_Tasks SET lockedBy=:lockedBy,lockedTime=CURRENT_DATE"
             if clearError:
                 sqlLock += ",errorDialog=NULL"
@@ -1792,8 +1792,12 @@ class TaskUtilsModule(BaseModule):
             # select
             res = None
             try:
-                self.cur.execute(sql + comment, varMap)
-                res = self.cur.fetchone()
+                if lockTask:
+                    resList = self.lock_rows(sql, varMap, comment=comment)
+                else:
+                    self.cur.execute(sql + comment, varMap)
+                    resList = self.cur.fetchall()
+                res = resList[0] if resList else None
                 if res is not None:
                     # template to generate job parameters
                     jobParamsTemplate = None
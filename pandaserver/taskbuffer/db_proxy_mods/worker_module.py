@@ -4,7 +4,11 @@ import os
 import sys
 
 from pandacommon.pandalogger.LogWrapper import LogWrapper
-from pandacommon.pandautils.PandaUtils import get_sql_IN_bind_variables, naive_utcnow
+from pandacommon.pandautils.PandaUtils import (
+    batched,
+    get_sql_IN_bind_variables,
+    naive_utcnow,
+)
 
 from pandaserver.config import panda_config
 from pandaserver.srvcore import CoreUtils
@@ -40,12 +44,9 @@ class WorkerModule(BaseModule):
 
             # lock the site data rows
             var_map = {":harvesterID": harvesterID, ":siteName": siteName}
-            sql_lock = (
-                "SELECT harvester_ID, computingSite FROM ATLAS_PANDA.Harvester_Worker_Stats "
-                "WHERE harvester_ID=:harvesterID AND computingSite=:siteName FOR UPDATE NOWAIT "
-            )
+            sql_lock = "SELECT harvester_ID, computingSite FROM ATLAS_PANDA.Harvester_Worker_Stats WHERE harvester_ID=:harvesterID AND computingSite=:siteName "
             try:
-                self.cur.execute(sql_lock + comment, var_map)
+                self.lock_rows(sql_lock, var_map, comment=comment)
             except Exception:
                 self._rollback()
                 message = "rows locked by another update"
@@ -1136,15 +1137,9 @@ class WorkerModule(BaseModule):
             # Select the worker node to see if it exists in the database
             var_map = {":site": site, ":host_name": host_name, ":cpu_model": cpu_model}
 
-            sql = (
-                "SELECT site, host_name, cpu_model "
-                "FROM ATLAS_PANDA.worker_node "
-                "WHERE site=:site AND host_name=:host_name AND cpu_model=:cpu_model "
-                "FOR UPDATE NOWAIT"
-            )
+            sql = "SELECT site, host_name, cpu_model FROM ATLAS_PANDA.worker_node WHERE site=:site AND host_name=:host_name AND cpu_model=:cpu_model "
 
-            self.cur.execute((sql + comment), var_map)
-            res = self.cur.fetchone()
+            res = self.lock_rows(sql, var_map, comment=comment)
             locked_site = False  # If the row was locked, the NOWAIT clause will make the query except and go to the end
 
             # The worker node entry exists, we update the worker node's last_seen timestamp
@@ -1202,10 +1197,8 @@ class WorkerModule(BaseModule):
                     "SELECT site, host_name, panda_queue "
                     "FROM ATLAS_PANDA.worker_node_queue "
                     "WHERE site=:site AND host_name=:host_name AND panda_queue=:panda_queue "
-                    "FOR UPDATE NOWAIT"
                 )
-                self.cur.execute((sql + comment), var_map)
-                res = self.cur.fetchone()
+                res = self.lock_rows(sql, var_map, comment=comment)
                 locked_queue = False  # If the row was locked, the NOWAIT clause will make the query except and go to the end
 
                 # The worker node entry exists at queue level, we update the worker node's last_seen timestamp
@@ -1296,11 +1289,9 @@ class WorkerModule(BaseModule):
                 "SELECT site, host_name, vendor, model "
                 "FROM ATLAS_PANDA.worker_node_gpus "
                 "WHERE site=:site AND host_name=:host_name AND vendor=:vendor AND model=:model "
-                "FOR UPDATE NOWAIT"
             )
 
-            self.cur.execute((sql + comment), var_map)
-            res = self.cur.fetchone()
+            res = self.lock_rows(sql, var_map, comment=comment)
             locked = False  # If the row was locked, the NOWAIT clause will make the query except and go to the end
 
             # The worker node GPU entry exists, we update the worker node's last_seen timestamp, count, framework, and framework_version
@@ -1471,6 +1462,45 @@ class WorkerModule(BaseModule):
             self.dump_error_message(tmp_log)
             return []
 
+    # get workers for jobs
+    def get_workers_for_jobs(self, panda_ids):
+        """
+        Get workers for jobs with array-bound queries
+
+        :param panda_ids: list of PandaIDs
+        :return: dict of PandaID to list of WorkerSpecs
+        """
+        comment = " /* DBProxy.get_workers_for_jobs */"
+        tmp_log = self.create_tagged_logger(comment)
+        tmp_log.debug(f"start for {len(panda_ids)} jobs")
+        try:
+            ret_map = {}
+            # start transaction
+            self.conn.begin()
+            self.cur.arraysize = 10000
+            for tmp_panda_ids in batched(panda_ids, 1000):
+                var_names_str, var_map = get_sql_IN_bind_variables(tmp_panda_ids, prefix=":PandaID")
+                sql_get_workers = (
+                    f"SELECT r.PandaID,{WorkerSpec.columnNames(prefix='w')} FROM ATLAS_PANDA.Harvester_Workers w, ATLAS_PANDA.Harvester_Rel_Jobs_Workers r "
+                    f"WHERE w.harvesterID=r.harvesterID AND w.workerID=r.workerID AND r.PandaID IN ({var_names_str}) "
+                )
+                self.cur.execute(sql_get_workers + comment, var_map)
+                for worker_row in self.cur.fetchall():
+                    worker_spec = WorkerSpec()
+                    worker_spec.pack(worker_row[1:])
+                    ret_map.setdefault(worker_row[0], []).append(worker_spec)
+            # commit
+            if not self._commit():
+                raise RuntimeError("Commit error")
+            tmp_log.debug(f"got workers for {len(ret_map)} jobs")
+            return ret_map
+        except Exception:
+            # roll back
+            self._rollback()
+            # error
+            self.dump_error_message(tmp_log)
+            return {}
+
     # get workers with stale harvester states and newer pilot state
     def get_workers_to_synchronize(self):
         comment = " /* DBProxy.get_workers_to_synchronize */"
@@ -0,0 +1,102 @@
+import datetime
+import pickle
+import socket
+import threading
+import time
+
+from pandaserver.taskbuffer.ConBridge import (
+    FRAME_BUFFER_SIZE,
+    FRAME_HEADER,
+    decode_frame,
+    encode_frame,
+)
+from pandaserver.taskbuffer.FileSpec import FileSpec
+from pandaserver.taskbuffer.JobSpec import JobSpec
+
+
+# make a getJobs-like payload
+def make_jobs(n_jobs, n_files):
+    jobs = []
+    for i in range(n_jobs):
+        job = JobSpec()
+        job.PandaID = 4000000000 + i
+        job.jobStatus = "sent"
+        job.computingSite = "CERN-PROD"
+        job.prodSourceLabel = "managed"
+        job.jobParameters = "--inputHITSFile=${IN} --outputRDOFile=${OUT} --maxEvents=1000 " * 10
+        for j in range(n_files):
+            file = FileSpec()
+            file.lfn = f"HITS.{i:08d}._{j:06d}.pool.root.1"
+            file.GUID = "7B5D2C1A-3E4F-4A5B-9C8D-0E1F2A3B4C5D"
+            file.fsize = 123456789
+            file.checksum = "ad:12345678"
+            file.type = "input"
+            job.addFile(file)
+        jobs.append(job)
+    return jobs
+
+
+# make a querySQL-like payload
+def make_rows(n_rows):
+    now = datetime.datetime(2024, 1, 1)
+    return [(4000000000 + i, "running", "CERN-PROD", now, 12.5, None) for i in range(n_rows)]
+
+
+# the legacy framing with the ASCII protocol and a 50-byte text header
+def legacy_roundtrip(sender, receiver, val):
+    body = pickle.dumps(val, protocol=0)
+    sender.sendall(("%50s" % len(body)).encode())
+    sender.sendall(body)
+    size = int(receiver.recv(50, socket.MSG_WAITALL).decode())
+    data = b""
+    while len(data) < size:
+        data += receiver.recv(size - len(data))
+    return pickle.loads(data), len(body)
+
+
+# the binary framing
+def binary_roundtrip(sender, receiver, val, compress_threshold):
+    header, body, buffers = encode_frame(val, compress_threshold)
+    sender.sendall(header)
+    sender.sendall(body)
+    for buf in buffers:
+        sender.sendall(FRAME_BUFFER_SIZE.pack(buf.nbytes))
+        sender.sendall(buf)
+    magic, version, flags, body_size, n_buffers = FRAME_HEADER.unpack(receiver.recv(FRAME_HEADER.size, socket.MSG_WAITALL))
+    body = receiver.recv(body_size, socket.MSG_WAITALL)
+    buffers = []
+    for i in range(n_buffers):
+        (buf_size,) = FRAME_BUFFER_SIZE.unpack(receiver.recv(FRAME_BUFFER_SIZE.size, socket.MSG_WAITALL))
+        buffers.append(receiver.recv(buf_size, socket.MSG_WAITALL))
+    return decode_frame(flags, body, buffers), len(body)
+
+
+# run in a thread to avoid deadlock when payloads exceed the socket buffer
+def measure(func, val, n_loops, *args):
+    sender, receiver = socket.socketpair()
+    t_start = time.time()
+    for i in range(n_loops):
+        result = {}
+        thr = threading.Thread(target=lambda: result.update(ret=func(sender, receiver, val, *args)))
+        thr.start()
+        thr.join()
+    t_total = time.time() - t_start
+    sender.close()
+    receiver.close()
+    return t_total / n_loops, result["ret"][1]
+
+
+if __name__ == "__main__":
+    payloads = {
+        "getJobs 100 jobs x 50 files": make_jobs(100, 50),
+        "querySQL 100k rows": make_rows(100000),
+    }
+    n_loops = 10
+    for name, val in payloads.items():
+        t_legacy, s_legacy = measure(legacy_roundtrip, val, n_loops)
+        t_binary, s_binary = measure(binary_roundtrip, val, n_loops, 0)
+        t_comp, s_comp = measure(binary_roundtrip, val, n_loops, 1)
+        print(f"{name}")
+        print(f"  legacy     : {t_legacy * 1000:.1f} ms/call {s_legacy} bytes")
+        print(f"  binary     : {t_binary * 1000:.1f} ms/call {s_binary} bytes")
+        print(f"  compressed : {t_comp * 1000:.1f} ms/call {s_comp} bytes")
@@ -0,0 +1,57 @@
+import argparse
+import socket
+import time
+
+from pandaserver.config import panda_config
+from pandaserver.taskbuffer.OraDBProxy import DBProxy
+
+if __name__ == "__main__":
+    """
+    Compare jobs/sec of getJobs between the one-by-one and bulk claim modes.
+    Jobs are really dispatched, so this must be used only against a test database with enough activated jobs.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("site", help="computingSite of activated jobs")
+    parser.add_argument("--n_jobs", type=int, default=500, help="the number of jobs per request")
+    parser.add_argument("--n_requests", type=int, default=5, help="the number of requests per mode")
+    parser.add_argument("--label", default="managed", help="prodSourceLabel")
+    args = parser.parse_args()
+
+    proxyS = DBProxy()
+    proxyS.connect(
+        panda_config.dbhost,
+        panda_config.dbpasswd,
+        panda_config.dbuser,
+        panda_config.dbname,
+    )
+
+    for bulk_mode in [False, True]:
+        panda_config.bulk_get_jobs = bulk_mode
+        n_total = 0
+        t_start = time.time()
+        for i in range(args.n_requests):
+            jobs, n_sent = proxyS.getJobs(
+                args.n_jobs,
+                args.site,
+                args.label,
+                0,
+                0,
+                socket.getfqdn(),
+                600,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                None,
+                False,
+                False,
+                None,
+            )
+            n_total += len(jobs)
+        t_total = time.time() - t_start
+        rate = n_total / t_total if t_total > 0 else 0
+        print(f"bulk_get_jobs={bulk_mode} : got {n_total} jobs in {t_total:.2f} sec -> {rate:.1f} jobs/sec")
@@ -0,0 +1,53 @@
+import argparse
+import datetime
+import time
+
+from pandacommon.pandautils.PandaUtils import naive_utcnow
+
+from pandaserver.config import panda_config
+from pandaserver.jobdispatcher.Watcher import HeartbeatSweeper, Watcher
+from pandaserver.taskbuffer.TaskBuffer import taskBuffer
+
+if __name__ == "__main__":
+    """
+    Compare jobs/sec to fail jobs with lost heartbeats between per-job Watcher threads and HeartbeatSweeper.
+    Half of stale running jobs at the site are given to each. Jobs are really failed, so this must be used only
+    against a test database such as a local Postgres with enough running jobs whose modificationTime is old enough.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("site", help="computingSite of running jobs")
+    parser.add_argument("--n_jobs", type=int, default=2000, help="the number of jobs in total")
+    parser.add_argument("--timeout", type=int, default=1, help="heartbeat timeout in minutes")
+    parser.add_argument("--batch_size", type=int, default=500, help="batch size of the sweeper")
+    args = parser.parse_args()
+
+    taskBuffer.init(panda_config.dbhost, panda_config.dbpasswd, nDBConnection=1)
+
+    sql = "SELECT PandaID FROM ATLAS_PANDA.jobsActive4 WHERE computingSite=:computingSite AND jobStatus=:jobStatus AND modificationTime<:modificationTime "
+    var_map = {
+        ":computingSite": args.site,
+        ":jobStatus": "running",
+        ":modificationTime": naive_utcnow() - datetime.timedelta(minutes=args.timeout),
+    }
+    status, res = taskBuffer.querySQLS(sql, var_map)
+    panda_ids = [panda_id for panda_id, in res][: args.n_jobs]
+    n_half = len(panda_ids) // 2
+    print(f"got {len(panda_ids)} stale jobs")
+
+    # per-job Watcher threads as copyArchive used to do
+    t_start = time.time()
+    for panda_id in panda_ids[:n_half]:
+        thr = Watcher(taskBuffer, panda_id, single=True, sleepTime=args.timeout)
+        thr.start()
+        thr.join()
+    t_watcher = time.time() - t_start
+
+    # sweeper
+    sweeper = HeartbeatSweeper(taskBuffer, batch_size=args.batch_size)
+    t_start = time.time()
+    n_failed = sweeper.sweep(panda_ids[n_half:], args.timeout)
+    t_sweeper = time.time() - t_start
+
+    print(f"Watcher : {n_half} jobs in {t_watcher:.2f} sec -> {n_half / t_watcher if t_watcher else 0:.1f} jobs/sec")
+    n_rest = len(panda_ids) - n_half
+    print(f"Sweeper : {n_failed}/{n_rest} jobs in {t_sweeper:.2f} sec -> {n_rest / t_sweeper if t_sweeper else 0:.1f} jobs/sec")
@@ -0,0 +1,61 @@
+import argparse
+import datetime
+import decimal
+import random
+import time
+
+from pandaserver.srvcore.response_utils import (
+    compress_response,
+    dump_json,
+    orjson,
+    zstandard,
+)
+
+if __name__ == "__main__":
+    """
+    Compare time and size to encode and compress large responses, such as job descriptions or statistics.
+    No server or database is needed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=20000, help="the number of rows in the response")
+    parser.add_argument("--n_loops", type=int, default=5, help="the number of repetitions")
+    args = parser.parse_args()
+
+    # job-description-like rows with datetime and Decimal
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    data = [
+        {
+            "PandaID": 4000000000 + i,
+            "jediTaskID": 30000000 + i // 100,
+            "jobStatus": random.choice(["running", "finished", "failed", "activated"]),
+            "computingSite": f"SITE_{i % 300}",
+            "creationTime": now - datetime.timedelta(seconds=i),
+            "modificationTime": now,
+            "currentPriority": decimal.Decimal(i % 1000),
+            "cpuConsumptionTime": decimal.Decimal(f"{i}.5"),
+            "jobParameters": f"--inputFile=EVNT.{i:08d}.pool.root --outputFile=HITS.{i:08d}.pool.root --maxEvents=1000",
+            "files": [{"lfn": f"file.{i}.{j}", "fsize": 1024 * j, "checksum": f"ad:{i:08x}"} for j in range(3)],
+        }
+        for i in range(args.n_rows)
+    ]
+
+    encoders = ["json"]
+    if orjson is not None:
+        encoders.append("orjson")
+    encoded = None
+    for encoder in encoders:
+        t_start = time.time()
+        for i in range(args.n_loops):
+            encoded = dump_json(data, encoder)
+        t_total = (time.time() - t_start) / args.n_loops
+        print(f"encoder={encoder} : {t_total * 1000:.1f} ms, {len(encoded)} B")
+
+    accept_encodings = ["gzip"]
+    if zstandard is not None:
+        accept_encodings.append("zstd")
+    for accept_encoding in accept_encodings:
+        t_start = time.time()
+        for i in range(args.n_loops):
+            compressed, content_encoding = compress_response(encoded, accept_encoding, 1)
+        t_total = (time.time() - t_start) / args.n_loops
+        print(f"compression={content_encoding} : {t_total * 1000:.1f} ms, {len(compressed)} B ({len(compressed) / len(encoded) * 100:.1f}%)")
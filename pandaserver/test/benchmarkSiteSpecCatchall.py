@@ -0,0 +1,154 @@
+import argparse
+import json
+import random
+import re
+import time
+
+from pandaserver.taskbuffer.SiteSpec import SiteSpec, catchall_keys
+
+
+# regex-based lookups as in SiteSpec before pre-parsing
+def get_value_with_regex(site_spec, key):
+    has_value, value = site_spec.get_extra_queue_param(key)
+    if has_value:
+        return value
+    if site_spec.catchall is None:
+        return None
+    for tmpItem in site_spec.catchall.split(","):
+        tmpMatch = re.search(f"^{key}=(.+)", tmpItem)
+        if tmpMatch is not None:
+            return tmpMatch.group(1)
+    return None
+
+
+def has_value_with_regex(site_spec, key):
+    has_value, _ = site_spec.get_extra_queue_param(key)
+    if has_value:
+        return True
+    if site_spec.catchall is None:
+        return False
+    for tmpItem in site_spec.catchall.split(","):
+        if re.search(f"^{key}(=|)*", tmpItem) is not None:
+            return True
+    return False
+
+
+# catchall-based helpers called per site in a brokerage pass
+def brokerage_pass_with_regex(site_specs):
+    ret = []
+    for site_spec in site_specs:
+        try:
+            job_chunk_size = int(get_value_with_regex(site_spec, "jobChunkSize"))
+        except Exception:
+            job_chunk_size = None
+        ret.append(
+            (
+                has_value_with_regex(site_spec, "useJumboJobs"),
+                has_value_with_regex(site_spec, "grandly_unified") or site_spec.type == "unified",
+                has_value_with_regex(site_spec, "use_only_local_data"),
+                has_value_with_regex(site_spec, "per_core_attr"),
+                job_chunk_size,
+                get_value_with_regex(site_spec, "bareNucleus"),
+                get_value_with_regex(site_spec, "allowed_processing"),
+                get_value_with_regex(site_spec, "excluded_processing"),
+            )
+        )
+    return ret
+
+
+def brokerage_pass_with_index(site_specs):
+    ret = []
+    for site_spec in site_specs:
+        ret.append(
+            (
+                site_spec.useJumboJobs(),
+                site_spec.is_grandly_unified(),
+                site_spec.use_only_local_data(),
+                site_spec.use_per_core_attr(),
+                site_spec.get_job_chunk_size(),
+                site_spec.getValueFromCatchall("bareNucleus"),
+                site_spec.getValueFromCatchall("allowed_processing"),
+                site_spec.getValueFromCatchall("excluded_processing"),
+            )
+        )
+    return ret
+
+
+# make SiteSpecs from a schedconfig dump as done in getSiteInfo
+def make_site_specs(queue_data_map):
+    site_specs = []
+    for queue_name, queue_data in queue_data_map.items():
+        site_spec = SiteSpec()
+        site_spec.sitename = queue_name
+        site_spec.type = queue_data.get("type")
+        site_spec.catchall = queue_data.get("catchall")
+        site_spec.extra_queue_params = queue_data.get("params", {})
+        site_specs.append(site_spec)
+    return site_specs
+
+
+# synthetic schedconfig dump
+def make_synthetic_dump(n_queues):
+    samples = [
+        "useJumboJobs",
+        "jobChunkSize=5",
+        "use_only_local_data",
+        "per_core_attr",
+        "bareNucleus=allow",
+        "allowed_processing=simul|reprocessing",
+        "skip_2nd_copy",
+        "allowfax",
+        "nSimEvents=100",
+    ]
+    queue_data_map = {}
+    for i in range(n_queues):
+        queue_data = {"type": random.choice(["production", "analysis", "unified"])}
+        items = random.sample(samples, random.randint(0, 4))
+        queue_data["catchall"] = ",".join(items) if items else None
+        if i % 5 == 0:
+            queue_data["params"] = {"jobChunkSize": 10}
+        queue_data_map[f"QUEUE_{i}"] = queue_data
+    return queue_data_map
+
+
+if __name__ == "__main__":
+    """
+    Compare regex-based catchall lookups and the pre-parsed index for helpers called per site in a brokerage pass.
+    A schedconfig dump in JSON (a dict of queue name to queue data) can be given, or synthetic queues are used.
+    No server or database is needed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dump", default=None, help="path to schedconfig JSON dump")
+    parser.add_argument("--n_queues", type=int, default=1000, help="the number of synthetic queues when no dump is given")
+    parser.add_argument("--n_passes", type=int, default=50, help="the number of brokerage passes")
+    args = parser.parse_args()
+
+    if args.dump:
+        with open(args.dump) as f:
+            queue_data_map = json.load(f)
+    else:
+        queue_data_map = make_synthetic_dump(args.n_queues)
+    site_specs = make_site_specs(queue_data_map)
+
+    t_start = time.time()
+    for i in range(args.n_passes):
+        regex_results = brokerage_pass_with_regex(site_specs)
+    t_regex = (time.time() - t_start) / args.n_passes
+
+    t_start = time.time()
+    for site_spec in site_specs:
+        site_spec.parse_catchall()
+    t_parse = time.time() - t_start
+    t_start = time.time()
+    for i in range(args.n_passes):
+        index_results = brokerage_pass_with_index(site_specs)
+    t_index = (time.time() - t_start) / args.n_passes
+
+    assert regex_results == index_results, "results are different"
+    for site_spec in site_specs:
+        for key in catchall_keys:
+            assert site_spec.getValueFromCatchall(key) == get_value_with_regex(site_spec, key), f"different value for {key} at {site_spec.sitename}"
+            assert site_spec.hasValueInCatchall(key) == has_value_with_regex(site_spec, key), f"different flag for {key} at {site_spec.sitename}"
+    print(f"{len(site_specs)} queues")
+    print(f"regex : {t_regex * 1000:.2f} ms/pass")
+    print(f"index : {t_index * 1000:.2f} ms/pass after parsing once in {t_parse * 1000:.1f} ms")
@@ -0,0 +1,75 @@
+import argparse
+import datetime
+import random
+import time
+
+from pandaserver.taskbuffer.FileSpec import FileSpec
+from pandaserver.taskbuffer.JobSpec import JobSpec
+
+
+# make a synthetic row where a third of values are NULL
+def make_row(spec_class, index):
+    row = []
+    for i_attr, attr in enumerate(spec_class._attributes):
+        if (index + i_attr) % 3 == 0:
+            row.append(None)
+        elif attr in getattr(spec_class, "_limitLength", {}):
+            row.append("x" * 10)
+        elif i_attr % 3 == 1:
+            row.append(index + i_attr)
+        else:
+            row.append(f"{attr}.{index}")
+    return tuple(row)
+
+
+# measure and print elapsed time
+def measure(label, n_rows, func):
+    t_start = time.time()
+    ret = func()
+    t_elapsed = time.time() - t_start
+    print(f"{label:<40} : {t_elapsed:6.2f} sec -> {n_rows / t_elapsed if t_elapsed else 0:10.0f} rows/sec")
+    return ret
+
+
+if __name__ == "__main__":
+    """
+    Measure rows/sec to convert synthetic result sets to and from JobSpecs and FileSpecs.
+    No database is needed
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_rows", type=int, default=100000, help="the number of rows in each result set")
+    args = parser.parse_args()
+
+    random.seed(0)
+    for spec_class in [JobSpec, FileSpec]:
+        name = spec_class.__name__
+        rows = [make_row(spec_class, i) for i in range(args.n_rows)]
+        print(f"{name} with {len(spec_class._attributes)} attributes")
+
+        # one by one
+        def pack_one_by_one():
+            specs = []
+            for row in rows:
+                spec = spec_class()
+                spec.pack(row)
+                specs.append(spec)
+            return specs
+
+        measure(f"{name}.pack", args.n_rows, pack_one_by_one)
+        # in one pass
+        specs = measure(f"{name}.pack_rows", args.n_rows, lambda: spec_class.pack_rows(rows))
+        # attribute access
+        attrs = [random.choice(spec_class._attributes) for _ in range(10)]
+        measure("read 10 attributes", args.n_rows, lambda: [getattr(spec, attr) for spec in specs for attr in attrs])
+        measure("write 10 attributes", args.n_rows, lambda: [setattr(spec, attr, datetime.datetime(2024, 1, 1)) for spec in specs for attr in attrs])
+        # bind values
+        measure(f"{name}.valuesMap", args.n_rows, lambda: spec_class.values_maps(specs))
+        measure(f"{name}.valuesMap(onlyChanged=True)", args.n_rows, lambda: spec_class.values_maps(specs, onlyChanged=True))
+        measure(f"{name}.values", args.n_rows, lambda: [spec.values() for spec in specs])
+        # columns
+        columns = measure(f"{name}.to_columns", args.n_rows, lambda: spec_class.to_columns(specs))
+        new_specs = measure(f"{name}.from_columns", args.n_rows, lambda: spec_class.from_columns(columns))
+        assert [spec.values() for spec in new_specs] == [spec.values() for spec in specs]
+        # SQL expressions
+        measure(f"{name}.columnNames+bindValuesExpression", args.n_rows, lambda: [spec_class.columnNames() + spec_class.bindValuesExpression() for _ in rows])
+        print()
@@ -0,0 +1,71 @@
+import argparse
+import multiprocessing
+import time
+
+from pandaserver.taskbuffer.JobSpec import JobSpec
+from pandaserver.taskbuffer.TaskBufferInterface import TaskBufferInterface
+
+
+# dummy TaskBuffer to measure only the transport
+class DummyTaskBuffer:
+    def __init__(self, n_connections):
+        self.n_connections = n_connections
+
+    def get_num_connections(self):
+        return self.n_connections
+
+    def cleanup(self, requester=None):
+        pass
+
+    def echo(self, obj):
+        return obj
+
+
+# make a payload similar to what adder sends
+def make_payload(n_jobs):
+    jobs = []
+    for i in range(n_jobs):
+        job = JobSpec()
+        job.PandaID = i
+        job.jobStatus = "finished"
+        job.computingSite = "SITE"
+        jobs.append(job)
+    return jobs
+
+
+# call methods in a child process
+def child_run(tbif, n_calls, n_batch, payloads):
+    if n_batch > 1:
+        for i in range(n_calls // n_batch):
+            tbif.batch_call([("echo", (payload,), {}) for payload in payloads])
+    else:
+        for i in range(n_calls):
+            tbif.echo(payloads[i % len(payloads)])
+
+
+if __name__ == "__main__":
+    """
+    Compare calls/sec of TaskBufferInterface between the Manager-based and socket-based transports.
+    No database is needed.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n_procs", type=int, default=10, help="the number of child processes")
+    parser.add_argument("--n_conn", type=int, default=4, help="the number of slots")
+    parser.add_argument("--n_calls", type=int, default=1000, help="the number of calls per child")
+    parser.add_argument("--n_jobs", type=int, default=1, help="the number of JobSpecs in each payload")
+    parser.add_argument("--n_batch", type=int, default=10, help="the number of calls per round trip in batch mode")
+    args = parser.parse_args()
+
+    # distinct payloads to avoid pickle memoization in batches
+    payloads = [make_payload(args.n_jobs) for i in range(args.n_batch)]
+    for transport, n_batch in [("manager", 1), ("socket", 1), ("socket", args.n_batch)]:
+        tbif = TaskBufferInterface(transport=transport)
+        tbif.launch(DummyTaskBuffer(args.n_conn))
+        procs = [multiprocessing.Process(target=child_run, args=(tbif.getInterface(), args.n_calls, n_batch, payloads)) for i in range(args.n_procs)]
+        start_time = time.time()
+        [proc.start() for proc in procs]
+        [proc.join() for proc in procs]
+        t_total = time.time() - start_time
+        tbif.stop()
+        n_total = args.n_procs * (args.n_calls // n_batch) * n_batch
+        print(f"transport={transport} batch={n_batch} : {n_total} calls in {t_total:.2f} sec -> {n_total / t_total:.1f} calls/sec")
@@ -0,0 +1,86 @@
+import gzip
+import io
+import os
+import struct
+import sys
+import tempfile
+
+from pandaserver.srvcore import cache_store
+from pandaserver.srvcore.response_utils import FileResponse, parse_range_header
+
+if __name__ == "__main__":
+    """
+    Check streaming upload, deduplication, and ranged download of cache files against a temporary cache directory.
+    No server or database is needed.
+    """
+    results = []
+
+    def check(label, ok):
+        results.append(ok)
+        print(f"{'OK' if ok else 'NG'} : {label}")
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        content = os.urandom(3 * 1024 * 1024 + 123)
+        sandbox = gzip.compress(content)
+
+        # checksum is the same as the gzip footer of the whole file
+        path_a = os.path.join(cache_dir, "sources.a.tar.gz")
+        stored_a = cache_store.store_file(io.BytesIO(sandbox), path_a, deduplicate=True, chunk_size=64 * 1024)
+        with open(path_a, "rb") as f:
+            check("file content", f.read() == sandbox)
+        check("crc from footer", stored_a["crc"] == struct.unpack("II", sandbox[-8:])[0])
+        check("size", stored_a["size"] == len(sandbox))
+        check("new content", not stored_a["deduplicated"])
+
+        # identical file is stored once
+        path_b = os.path.join(cache_dir, "sources.b.tar.gz")
+        stored_b = cache_store.store_file(io.BytesIO(sandbox), path_b, deduplicate=True, chunk_size=64 * 1024)
+        check("deduplicated", stored_b["deduplicated"] and os.stat(path_a).st_ino == os.stat(path_b).st_ino)
+        check("links", os.stat(path_a).st_nlink == 3)
+
+        # incremental compression
+        path_c = os.path.join(cache_dir, "log.c.out")
+        stored_c = cache_store.store_file(io.BytesIO(content), path_c, compress=True, chunk_size=64 * 1024)
+        with open(path_c, "rb") as f:
+            check("compressed", gzip.decompress(f.read()) == content)
+        check("crc of compressed", stored_c["crc"] == struct.unpack("II", gzip.compress(content)[-8:])[0])
+
+        # size limit
+        path_d = os.path.join(cache_dir, "sources.d.tar.gz")
+        try:
+            cache_store.store_file(io.BytesIO(sandbox), path_d, size_limit=1024, deduplicate=True, chunk_size=512)
+            check("size limit", False)
+        except cache_store.SizeLimitExceeded:
+            check("size limit", not os.path.exists(path_d) and not [f for f in os.listdir(cache_dir) if f.startswith(".upload")])
+
+        # cleanup of unlinked contents
+        os.remove(path_a)
+        check("cleanup of linked content", cache_store.cleanup_store(cache_dir, grace_period=0) == 0)
+        os.remove(path_b)
+        check("cleanup of unlinked content", cache_store.cleanup_store(cache_dir, grace_period=0) == 1)
+
+        # ranges
+        check("range", parse_range_header("bytes=10-19", 100) == (10, 10))
+        check("open range", parse_range_header("bytes=90-", 100) == (90, 10))
+        check("suffix range", parse_range_header("bytes=-5", 100) == (95, 5))
+        check("range beyond end", parse_range_header("bytes=95-200", 100) == (95, 5))
+        check("unsatisfiable range", parse_range_header("bytes=100-", 100) is False)
+        check("multiple ranges", parse_range_header("bytes=0-1,5-6", 100) is None)
+
+        # partial content with and without file_wrapper
+        log_data = os.urandom(5000)
+        log_path = os.path.join(cache_dir, "task.log")
+        with open(log_path, "wb") as f:
+            f.write(log_data)
+        for label, environ in [("chunks", {}), ("file_wrapper", {"wsgi.file_wrapper": lambda f, size: iter(lambda: f.read(size), b"")})]:
+            status_headers = []
+            response = FileResponse(open(log_path, "rb"), 1000, 4000, status="206 Partial Content")
+            response.chunk_size = 700
+            body = b"".join(response.serve(environ, lambda status, headers: status_headers.append((status, dict(headers)))))
+            status, headers = status_headers[0]
+            check(f"partial content with {label}", body == log_data[1000:] and headers["Content-Length"] == "4000" and status.startswith("206"))
+        response = FileResponse(open(log_path, "rb"), 10, 20, prefix=b" ")
+        check("middle range with prefix", b"".join(response.serve({}, lambda status, headers: None)) == b" " + log_data[10:30])
+
+    print(f"{results.count(True)}/{len(results)} passed")
+    sys.exit(0 if all(results) else 1)
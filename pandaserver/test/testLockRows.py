@@ -0,0 +1,95 @@
+import argparse
+import sys
+
+from pandaserver.config import panda_config
+from pandaserver.taskbuffer.OraDBProxy import DBProxy
+from pandaserver.taskbuffer.WrappedCursor import NOWAIT_SAVEPOINT
+
+if __name__ == "__main__":
+    """
+    Check that lock_rows behaves the same in Oracle and Postgres with two sessions competing for a row.
+    Run it with both backends and compare the outputs.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pandaID", type=int, help="PandaID of a job in jobsActive4")
+    args = parser.parse_args()
+
+    proxies = []
+    for i in range(2):
+        proxy = DBProxy()
+        proxy.connect(
+            panda_config.dbhost,
+            panda_config.dbpasswd,
+            panda_config.dbuser,
+            panda_config.dbname,
+        )
+        proxies.append(proxy)
+    holder, competitor = proxies
+
+    sql = "SELECT PandaID FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID "
+    var_map = {":PandaID": args.pandaID}
+    var_map_none = {":PandaID": -1}
+    comment = " /* testLockRows */"
+    results = []
+
+    def check(label, ok):
+        results.append(ok)
+        print(f"{'OK' if ok else 'NG'} : {label}")
+
+    # lock unlocked rows
+    for mode in ["nowait", "skip", "wait"]:
+        competitor.conn.begin()
+        res = competitor.lock_rows(sql, var_map, mode=mode, comment=comment)
+        competitor._rollback()
+        check(f"{mode} gets an unlocked row", len(res) == 1)
+        competitor.conn.begin()
+        res = competitor.lock_rows(sql, var_map_none, mode=mode, comment=comment)
+        competitor._rollback()
+        check(f"{mode} gets nothing without exception when no rows match", len(res) == 0)
+
+    # many NOWAIT locks in one transaction
+    n_locks = 100
+    competitor.conn.begin()
+    try:
+        for i in range(n_locks):
+            competitor.lock_rows(sql, var_map, mode="nowait", comment=comment)
+        check(f"nowait takes {n_locks} locks in one transaction", True)
+        if panda_config.backend == "postgres":
+            # savepoints are released after each lock
+            try:
+                competitor.cur.execute(f"ROLLBACK TO SAVEPOINT {NOWAIT_SAVEPOINT}")
+                check("no savepoint is left after nowait locks", False)
+            except Exception:
+                check("no savepoint is left after nowait locks", True)
+    except Exception as e:
+        check(f"nowait takes {n_locks} locks in one transaction : {str(e)}", False)
+    competitor._rollback()
+
+    # lock the row in another session
+    holder.conn.begin()
+    holder.lock_rows(sql, var_map, mode="nowait", comment=comment)
+
+    # NOWAIT fails and the transaction is still usable
+    competitor.conn.begin()
+    try:
+        competitor.lock_rows(sql, var_map, mode="nowait", comment=comment)
+        check("nowait raises an exception for a locked row", False)
+    except Exception as e:
+        check("nowait raises an exception for a locked row", competitor.is_no_wait_exception(e))
+    try:
+        competitor.cur.execute("SELECT PandaID FROM ATLAS_PANDA.jobsActive4 WHERE PandaID=:PandaID " + comment, var_map)
+        res = competitor.cur.fetchall()
+        check("transaction is usable after nowait failure", len(res) == 1)
+    except Exception as e:
+        check(f"transaction is usable after nowait failure : {str(e)}", False)
+    competitor._rollback()
+
+    # SKIP LOCKED skips the row
+    competitor.conn.begin()
+    res = competitor.lock_rows(sql, var_map, mode="skip", comment=comment)
+    competitor._rollback()
+    check("skip skips a locked row", len(res) == 0)
+
+    holder._rollback()
+    print(f"backend={panda_config.backend} : {results.count(True)}/{len(results)} passed")
+    sys.exit(0 if all(results) else 1)